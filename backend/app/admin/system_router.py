@@ -6,16 +6,27 @@ import signal
 import threading
 import time
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
 from sqlmodel import Session
 
 from app.audit.service import log_audit
+from app.events.hub import event_hub
+from app.jobs.adaptive import adaptive_limiters
+from app.jobs.deadline import deadline_stats
+from app.jobs.engine import job_engine
+from app.jobs.leader import leader_elector
+from app.providers.hyperv.winrm_pool import winrm_pool
 from app.auth.user_model import User
 from app.db import get_engine
 from app.dependencies import AuditRequestContext, get_request_audit_context, require_permission
 from app.permissions.models import PermissionCode
+from app.snapshots.encoded import encoded_snapshots
+from app.snapshots.shared import shared_snapshots
+from app.snapshots.writer import snapshot_writer
 from app.system_state import is_restarting, set_restarting
+from app.vms.hyperv_router import hyperv_vm_batch_stats
+from app.vms.vm_service import cache_stats, vcenter_sessions
 
 router = APIRouter(prefix="/api/admin/system", tags=["system"])
 logger = logging.getLogger(__name__)
@@ -72,3 +83,85 @@ def restart_system(
     )
     threading.Thread(target=_restart_worker, args=(current_user, ctx), daemon=True).start()
     return {"status": "accepted", "message": "Restart scheduled"}
+
+
+@router.get("/vcenter-session")
+def vcenter_session_stats(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Counters of the shared vCenter REST/SOAP session (logins, reuses, reauths)."""
+    return vcenter_sessions.stats()
+
+
+@router.get("/cache-stats")
+def cache_stats_endpoint(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Hit/miss/coalesced/stale-served counters of the single-flight caches."""
+    return cache_stats()
+
+
+@router.get("/job-engine")
+def job_engine_stats(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Queue depth and per-provider running/budget counters of the shared job engine."""
+    return {**job_engine.stats(), "deadlines": deadline_stats()}
+
+
+@router.get("/concurrency")
+def concurrency_stats(
+    history: bool = Query(True, description="Incluir el historial de cambios de límite"),
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Current limit, in-flight calls, error/latency counters and limit history of each adaptive limiter."""
+    return adaptive_limiters.stats(history=history)
+
+
+@router.get("/snapshot-writer")
+def snapshot_writer_stats(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Enqueued/coalesced/written counters of the snapshot write-behind queue."""
+    return snapshot_writer.stats()
+
+
+@router.get("/snapshot-encoding")
+def snapshot_encoding_stats(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Encodes/hits/304 counters of the pre-serialized snapshot responses (local and shared)."""
+    return {**encoded_snapshots.stats(), "shared": shared_snapshots.stats()}
+
+
+@router.get("/events")
+def event_hub_stats(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """SSE subscribers per topic, queued events and publish/delivery counters."""
+    return event_hub.stats()
+
+
+@router.get("/leader")
+def leader_stats(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Whether this process owns background collection, lock backend and failover counters."""
+    return leader_elector.stats()
+
+
+@router.get("/winrm-pool")
+def winrm_pool_stats(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Open/idle WinRM shells per Hyper-V host, reuses vs handshakes and health-check counters."""
+    winrm_pool.reap()
+    return winrm_pool.stats()
+
+
+@router.get("/hyperv-batches")
+def hyperv_batches_stats(
+    current_user: User = Depends(require_permission(PermissionCode.SYSTEM_SETTINGS_VIEW)),
+):
+    """Hyper-V detail/deep lookups served from cache vs coalesced into shared collector runs."""
+    return hyperv_vm_batch_stats()
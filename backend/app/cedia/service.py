@@ -8,6 +8,8 @@ from typing import Any, Dict, Optional
 
 import requests
 from fastapi import HTTPException, status
+from app.jobs.adaptive import adaptive_limiters
+from app.jobs.deadline import budget_timeout
 from app.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -76,7 +78,7 @@ def _ensure_token() -> str:
     headers["Authorization"] = _auth_header_basic(cfg.user, cfg.password)
 
     try:
-        resp = requests.post(url, headers=headers, timeout=10)
+        resp = requests.post(url, headers=headers, timeout=budget_timeout(10))
     except requests.RequestException as exc:
         logger.exception("Error conectando a CEDIA /sessions")
         raise HTTPException(status_code=502, detail=f"Error conectando a CEDIA: {exc}") from exc
@@ -105,6 +107,16 @@ def reset_token() -> None:
     _token_state = None
 
 
+def _limited_get(url: str, **kwargs) -> requests.Response:
+    """GET con timeout acotado al presupuesto del job y cupo del limitador ``cedia.rest``."""
+    timeout = budget_timeout(15)
+    with adaptive_limiters.get("cedia.rest", initial=4).slot(timeout=timeout) as slot:
+        resp = requests.get(url, timeout=timeout, **kwargs)
+        if resp.status_code >= 500 or resp.status_code == 429:
+            slot.fail()
+    return resp
+
+
 def _cedia_get(path: str, *, params: Optional[Dict[str, Any]] = None, accept_variant: str = "application/*+json"):
     token = _ensure_token()
     cfg = _resolve_config()
@@ -112,7 +124,7 @@ def _cedia_get(path: str, *, params: Optional[Dict[str, Any]] = None, accept_var
     headers = _build_headers(accept_variant=accept_variant)
     headers["Authorization"] = f"Bearer {token}"
     try:
-        resp = requests.get(url, headers=headers, params=params, timeout=15)
+        resp = _limited_get(url, headers=headers, params=params)
     except requests.RequestException as exc:
         logger.exception("Error conectando a CEDIA %s", path)
         raise HTTPException(status_code=502, detail=f"Error conectando a CEDIA: {exc}") from exc
@@ -123,7 +135,7 @@ def _cedia_get(path: str, *, params: Optional[Dict[str, Any]] = None, accept_var
         token = _ensure_token()
         headers["Authorization"] = f"Bearer {token}"
         try:
-            resp = requests.get(url, headers=headers, params=params, timeout=15)
+            resp = _limited_get(url, headers=headers, params=params)
         except requests.RequestException as exc:
             logger.exception("Error conectando a CEDIA %s tras reintento", path)
             raise HTTPException(status_code=502, detail=f"Error conectando a CEDIA: {exc}") from exc
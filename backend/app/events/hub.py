@@ -0,0 +1,167 @@
+"""Pub/sub en proceso para empujar eventos por SSE.
+
+Los ``JobStore``/``SnapshotStore`` publican desde hilos de worker; cada
+suscriptor (un stream ``/api/events``) tiene una cola acotada que coalesce por
+clave (el último estado de un job o la última versión de un snapshot reemplaza
+al anterior) y, si aun así se llena, descarta lo más viejo y marca ``dropped``
+para que el stream le pida al cliente resincronizar.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    topic: str
+    type: str
+    data: Any
+
+
+class Subscription:
+    """Cola acotada de un suscriptor; ``_offer`` es thread-safe, ``next_batch`` corre en su event loop."""
+
+    def __init__(self, topics: Iterable[str], *, max_queue: int, loop: asyncio.AbstractEventLoop) -> None:
+        self.topics = frozenset(topics)
+        self._max_queue = max(int(max_queue), 1)
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[Tuple[str, Hashable], Event]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self.coalesced = 0
+        self.dropped = 0
+        self.closed = False
+
+    def _offer(self, key: Hashable, event: Event) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            slot = (event.topic, key)
+            if slot in self._pending:
+                self._pending.pop(slot)
+                self.coalesced += 1
+            elif len(self._pending) >= self._max_queue:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[slot] = event
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # El loop del stream ya cerró: el cliente se fue.
+            self.closed = True
+
+    async def next_batch(self, timeout: float) -> Tuple[List[Event], int]:
+        """Espera hasta ``timeout`` segundos; devuelve (eventos, descartados desde la última llamada)."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+        with self._lock:
+            events = list(self._pending.values())
+            self._pending.clear()
+            dropped, self.dropped = self.dropped, 0
+        return events, dropped
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+class EventHub:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: Set[Subscription] = set()
+        self._topics: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._stats = {"published": 0, "delivered": 0}
+
+    def subscribe(
+        self,
+        topics: Iterable[str],
+        *,
+        max_queue: int,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> Subscription:
+        sub = Subscription(topics, max_queue=max_queue, loop=loop or asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(sub)
+            for topic in sub.topics:
+                self._topics[topic] = self._topics.get(topic, 0) + 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        sub.closed = True
+        with self._lock:
+            if sub not in self._subscribers:
+                return
+            self._subscribers.discard(sub)
+            for topic in sub.topics:
+                remaining = self._topics.get(topic, 0) - 1
+                if remaining > 0:
+                    self._topics[topic] = remaining
+                else:
+                    self._topics.pop(topic, None)
+
+    def has_subscribers(self, topic: str) -> bool:
+        # Lectura sin lock: los publicadores la usan para no serializar payloads sin oyentes.
+        return topic in self._topics
+
+    def publish(self, topic: str, event_type: str, data: Any, *, key: Hashable = None) -> int:
+        """Entrega a los suscriptores del topic; ``key`` define qué eventos se coalescen."""
+        with self._lock:
+            targets = [sub for sub in self._subscribers if topic in sub.topics]
+            event = Event(id=next(self._ids), topic=topic, type=event_type, data=data)
+            self._stats["published"] += 1
+            self._stats["delivered"] += len(targets)
+        for sub in targets:
+            sub._offer(key, event)
+        return len(targets)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                **self._stats,
+                "subscribers": len(self._subscribers),
+                "topics": dict(self._topics),
+                "queued": sum(sub.pending() for sub in self._subscribers),
+            }
+
+
+event_hub = EventHub()
+
+
+def publish_job(provider: str, job) -> None:
+    """Estado completo del job a ``<provider>.jobs`` (solo se serializa si hay oyentes)."""
+    topic = f"{provider}.jobs"
+    if event_hub.has_subscribers(topic):
+        event_hub.publish(topic, "job", jsonable_encoder(job), key=job.job_id)
+
+
+def publish_snapshot(provider: str, snapshot, *, scope: str, hosts_key: str, level: str) -> None:
+    """Aviso de nueva version; el cliente trae los cambios con ``/snapshot?since=``."""
+    topic = f"{provider}.snapshot"
+    if not event_hub.has_subscribers(topic):
+        return
+    generated_at = getattr(snapshot, "generated_at", None)
+    event_hub.publish(
+        topic,
+        "snapshot",
+        {
+            "scope": scope,
+            "hosts_key": hosts_key,
+            "level": level,
+            "version": getattr(snapshot, "version", 0),
+            "generated_at": generated_at.isoformat() if generated_at else None,
+        },
+        key=(scope, hosts_key, level),
+    )
@@ -0,0 +1,97 @@
+"""Stream SSE de progreso de jobs y cambios de version de snapshots."""
+
+from __future__ import annotations
+
+import json
+from typing import AsyncIterator, Set
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from app.db import get_engine
+from app.dependencies import get_current_user, oauth2_scheme
+from app.events.hub import Event, event_hub
+from app.permissions.models import PermissionCode
+from app.permissions.service import user_has_permission
+from app.settings import settings
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+TOPIC_PERMISSIONS = {
+    "hyperv": PermissionCode.HYPERV_VIEW,
+    "vmware": PermissionCode.VMS_VIEW,
+    "vmware_hosts": PermissionCode.VMS_VIEW,
+    "cedia": PermissionCode.CEDIA_VIEW,
+}
+TOPIC_KINDS = {"jobs", "snapshot"}
+
+
+def _parse_topics(raw: str) -> Set[str]:
+    topics = {item.strip().lower() for item in (raw or "").split(",") if item.strip()}
+    if not topics:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="topics es requerido")
+    for topic in topics:
+        provider, _, kind = topic.partition(".")
+        if provider not in TOPIC_PERMISSIONS or kind not in TOPIC_KINDS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Topic inválido: {topic}")
+    return topics
+
+
+def _format(event_type: str, data, event_id=None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":"), default=str))
+    return "\n".join(lines) + "\n\n"
+
+
+def _format_event(event: Event) -> str:
+    return _format(event.type, {"topic": event.topic, "data": event.data}, event.id)
+
+
+async def _stream(topics: Set[str]) -> AsyncIterator[str]:
+    sub = event_hub.subscribe(topics, max_queue=settings.events_queue_size)
+    try:
+        yield "retry: 5000\n" + _format("ready", {"topics": sorted(topics)})
+        while not sub.closed:
+            events, dropped = await sub.next_batch(settings.events_heartbeat_seconds)
+            if dropped:
+                # Cola llena: el cliente debe volver a pedir jobs/snapshots completos.
+                yield _format("resync", {"dropped": dropped})
+            if not events and not dropped:
+                yield ": keepalive\n\n"
+            for event in events:
+                yield _format_event(event)
+    finally:
+        event_hub.unsubscribe(sub)
+
+
+@router.get("")
+def stream_events(
+    topics: str = Query(..., description="Lista separada por comas, p.ej. hyperv.jobs,vmware.snapshot"),
+    token: str = Depends(oauth2_scheme),
+):
+    """
+    Server-Sent Events para ``<provider>.jobs`` y ``<provider>.snapshot``.
+    Autentica y valida permisos una sola vez al abrir el stream; la sesión de DB
+    se cierra antes de empezar a emitir.
+    """
+    # Una desconexión del cliente cancela el generador (StreamingResponse) o hace
+    # fallar el siguiente keepalive; en ambos casos ``finally`` libera la suscripción.
+    requested = _parse_topics(topics)
+    with Session(get_engine()) as session:
+        user = get_current_user(token=token, session=session)
+        for provider in sorted({topic.partition(".")[0] for topic in requested}):
+            permission = TOPIC_PERMISSIONS[provider]
+            if not user_has_permission(user, permission, session):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail=f"Permiso requerido: {permission.value}",
+                )
+    return StreamingResponse(
+        _stream(requested),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
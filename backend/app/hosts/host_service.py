@@ -3,24 +3,24 @@ from __future__ import annotations
 import logging
 from typing import Any, Dict, Iterable, List, Optional
 
-import requests
 from fastapi import HTTPException
 from pyVmomi import vim
 
 from app.hosts.host_models import HostDeep, HostDetail, HostSummary
+from app.vms.moref_index import moref_index
 from app.vms.vm_service import (
-    ThreadSafeTTLCache,
+    SingleFlightTTLCache,
     _network_endpoint,
-    _soap_connect,
     get_session_token,
+    vcenter_sessions,
 )
 
 logger = logging.getLogger(__name__)
 
-# TTL caches
-_SUMMARY_CACHE = ThreadSafeTTLCache(maxsize=4, ttl=30)
-_DETAIL_CACHE = ThreadSafeTTLCache(maxsize=32, ttl=120)
-_DEEP_CACHE = ThreadSafeTTLCache(maxsize=32, ttl=600)
+# TTL caches (soft_ttl = fresco; hasta ttl se sirve stale mientras refresca en background)
+_SUMMARY_CACHE = SingleFlightTTLCache(maxsize=4, ttl=120, soft_ttl=30, name="hosts_summary")
+_DETAIL_CACHE = SingleFlightTTLCache(maxsize=32, ttl=600, soft_ttl=120, name="hosts_detail")
+_DEEP_CACHE = SingleFlightTTLCache(maxsize=32, ttl=1800, soft_ttl=600, name="hosts_deep")
 
 
 def _safe_int(value: Any, divisor: Optional[int] = None) -> Optional[int]:
@@ -61,7 +61,7 @@ def _rest_host_map() -> Dict[str, dict]:
     headers = {"vmware-api-session-id": token}
     url = _network_endpoint("/rest/vcenter/host")
     try:
-        resp = requests.get(url, headers=headers, verify=False, timeout=10)
+        resp = vcenter_sessions.get(url, headers=headers, timeout=10)
         resp.raise_for_status()
         data = resp.json().get("value", []) if resp.headers.get("content-type", "").startswith("application/json") else []
     except Exception as exc:
@@ -76,8 +76,7 @@ def _rest_host_map() -> Dict[str, dict]:
     return mapping
 
 
-def _iter_hosts() -> Iterable[vim.HostSystem]:
-    si, content = _soap_connect()
+def _iter_hosts(content) -> Iterable[vim.HostSystem]:
     view = None
     try:
         view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
@@ -89,62 +88,16 @@ def _iter_hosts() -> Iterable[vim.HostSystem]:
                 view.Destroy()
             except Exception:
                 logger.debug("Error destroying host view", exc_info=True)
-        try:
-            from pyVim.connect import Disconnect
-
-            Disconnect(si)
-        except Exception:
-            logger.debug("Error disconnecting SOAP session", exc_info=True)
-
-
-def _find_host(host_id: str) -> Optional[vim.HostSystem]:
-    si, content = _soap_connect()
-    view = None
-    try:
-        view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-        for host in view.view:
-            if getattr(host, "_moId", None) == host_id:
-                return host
-    finally:
-        if view:
-            try:
-                view.Destroy()
-            except Exception:
-                logger.debug("Error destroying host view", exc_info=True)
-        try:
-            from pyVim.connect import Disconnect
-
-            Disconnect(si)
-        except Exception:
-            logger.debug("Error disconnecting SOAP session", exc_info=True)
-    return None
 
 
 def _with_host(host_id: str, handler):
-    si, content = _soap_connect()
-    view = None
-    try:
-        view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-        target = None
-        for host in view.view:
-            if getattr(host, "_moId", None) == host_id:
-                target = host
-                break
+    def _run(content):
+        target = moref_index.get_host(content, host_id)
         if target is None:
             raise HTTPException(status_code=404, detail="Host no encontrado")
         return handler(target, content)
-    finally:
-        if view:
-            try:
-                view.Destroy()
-            except Exception:
-                logger.debug("Error destroying host view", exc_info=True)
-        try:
-            from pyVim.connect import Disconnect
 
-            Disconnect(si)
-        except Exception:
-            logger.debug("Error disconnecting SOAP session", exc_info=True)
+    return vcenter_sessions.run_soap(_run)
 
 
 def _cluster_name(host: vim.HostSystem) -> Optional[str]:
@@ -286,42 +239,46 @@ def _health_sensors(host: vim.HostSystem) -> List[Dict[str, Any]]:
 
 
 def get_hosts_summary(*, refresh: bool = False) -> List[HostSummary]:
-    if not refresh and "hosts" in _SUMMARY_CACHE:
-        return _SUMMARY_CACHE["hosts"]
+    return _SUMMARY_CACHE.get_or_load("hosts", _load_hosts_summary, refresh=refresh)
+
 
+def _load_hosts_summary() -> List[HostSummary]:
     rest_map = _rest_host_map()
-    hosts: List[HostSummary] = []
     try:
-        for host in _iter_hosts():
-            summary = getattr(host, "summary", None)
-            runtime = getattr(summary, "runtime", None) if summary else None
-            hardware = getattr(summary, "hardware", None) if summary else None
-            config = getattr(summary, "config", None) if summary else None
-            quick = getattr(summary, "quickStats", None) if summary else None
-            host_id = getattr(host, "_moId", None)
-            rest_info = rest_map.get(host_id, {})
-            hosts.append(
-                HostSummary(
-                    id=host_id,
-                    name=rest_info.get("name") or getattr(host, "name", None),
-                    connection_state=rest_info.get("connection_state") or getattr(runtime, "connectionState", None),
-                    power_state=rest_info.get("power_state") or getattr(runtime, "powerState", None),
-                    cluster=_cluster_name(host),
-                    cpu_cores=_safe_int(getattr(hardware, "numCpuCores", None)),
-                    cpu_threads=_safe_int(getattr(hardware, "numCpuThreads", None)),
-                    memory_total_mb=_safe_int(getattr(hardware, "memorySize", None), divisor=1024 * 1024),
-                    overall_cpu_usage_mhz=_safe_int(getattr(quick, "overallCpuUsage", None)),
-                    overall_memory_usage_mb=_safe_int(getattr(quick, "overallMemoryUsage", None)),
-                    version=rest_info.get("version") or getattr(getattr(config, "product", None), "version", None),
-                    build=rest_info.get("build") or getattr(getattr(config, "product", None), "build", None),
-                    total_vms=len(getattr(host, "vm", []) or []),
-                )
-            )
+        # Las propiedades de pyVmomi se leen al accederlas: todo dentro de run_soap.
+        return vcenter_sessions.run_soap(lambda content: _build_summaries(content, rest_map))
     except Exception:
         logger.exception("Error fetching hosts summary")
         raise HTTPException(status_code=500, detail="Error al obtener hosts")
 
-    _SUMMARY_CACHE["hosts"] = hosts
+
+def _build_summaries(content, rest_map: Dict[str, dict]) -> List[HostSummary]:
+    hosts: List[HostSummary] = []
+    for host in _iter_hosts(content):
+        summary = getattr(host, "summary", None)
+        runtime = getattr(summary, "runtime", None) if summary else None
+        hardware = getattr(summary, "hardware", None) if summary else None
+        config = getattr(summary, "config", None) if summary else None
+        quick = getattr(summary, "quickStats", None) if summary else None
+        host_id = getattr(host, "_moId", None)
+        rest_info = rest_map.get(host_id, {})
+        hosts.append(
+            HostSummary(
+                id=host_id,
+                name=rest_info.get("name") or getattr(host, "name", None),
+                connection_state=rest_info.get("connection_state") or getattr(runtime, "connectionState", None),
+                power_state=rest_info.get("power_state") or getattr(runtime, "powerState", None),
+                cluster=_cluster_name(host),
+                cpu_cores=_safe_int(getattr(hardware, "numCpuCores", None)),
+                cpu_threads=_safe_int(getattr(hardware, "numCpuThreads", None)),
+                memory_total_mb=_safe_int(getattr(hardware, "memorySize", None), divisor=1024 * 1024),
+                overall_cpu_usage_mhz=_safe_int(getattr(quick, "overallCpuUsage", None)),
+                overall_memory_usage_mb=_safe_int(getattr(quick, "overallMemoryUsage", None)),
+                version=rest_info.get("version") or getattr(getattr(config, "product", None), "version", None),
+                build=rest_info.get("build") or getattr(getattr(config, "product", None), "build", None),
+                total_vms=len(getattr(host, "vm", []) or []),
+            )
+        )
     return hosts
 
 
@@ -615,29 +572,23 @@ def _to_plain(obj: Any, *, depth: int = 0, max_depth: int = 3) -> Any:
 
 
 def get_host_detail(host_id: str, *, refresh: bool = False) -> HostDetail:
-    if not refresh and host_id in _DETAIL_CACHE:
-        cached = _DETAIL_CACHE.get(host_id)
-        if cached:
-            return cached
-
-    detail = _with_host(host_id, lambda host, _content: _build_detail(host))
-    _DETAIL_CACHE[host_id] = detail
-    return detail
+    return _DETAIL_CACHE.get_or_load(
+        host_id,
+        lambda: _with_host(host_id, lambda host, _content: _build_detail(host)),
+        refresh=refresh,
+    )
 
 
 def get_host_deep(host_id: str, *, refresh: bool = False) -> HostDeep:
-    if not refresh and host_id in _DEEP_CACHE:
-        cached = _DEEP_CACHE.get(host_id)
-        if cached:
-            return cached
-
-    payload = _with_host(
+    return _DEEP_CACHE.get_or_load(
         host_id,
-        lambda host, _content: HostDeep(
-            id=getattr(host, "_moId", None),
-            name=getattr(host, "name", None),
-            **_collect_deep_sections(host),
+        lambda: _with_host(
+            host_id,
+            lambda host, _content: HostDeep(
+                id=getattr(host, "_moId", None),
+                name=getattr(host, "name", None),
+                **_collect_deep_sections(host),
+            ),
         ),
+        refresh=refresh,
     )
-    _DEEP_CACHE[host_id] = payload
-    return payload
@@ -2,12 +2,11 @@ from __future__ import annotations
 
 import logging
 import threading
-import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Response, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, Request
 from sqlmodel import Session
 from pydantic import BaseModel
 
@@ -17,6 +16,21 @@ from app.db import get_session
 from app.permissions.models import PermissionCode
 from app.hosts import host_service
 from app.vms import vm_service
+from app.jobs.adaptive import LimiterTimeout, host_collection_limiter
+from app.jobs.deadline import (
+    CANCELLED_STATUS,
+    Deadline,
+    DeadlineExceeded,
+    JobCancelled,
+    job_cancellations,
+    request_cancel,
+    run_with_deadline,
+    start_job,
+)
+from app.jobs.engine import job_engine
+from app.jobs.leader import ensure_leader, leader_elector
+from app.snapshots.encoded import delta_response, encoded_snapshots
+from app.snapshots.shared import shared_snapshots
 from app.settings import settings
 from app.hosts.vmware_host_jobs import (
     HostHealthStore,
@@ -41,16 +55,13 @@ _SNAPSHOT_STORE = SnapshotStore()
 _HEALTH_STORE = HostHealthStore()
 _GLOBAL_HOST_LOCKS: Dict[str, threading.RLock] = {}
 _GLOBAL_LOCKS_LOCK = threading.RLock()
-_GLOBAL_CONCURRENCY = threading.Semaphore(settings.vmware_job_max_global)
 MAX_CONCURRENCY_PER_SCOPE = settings.vmware_job_max_per_scope
+_HOST_LIMITER = host_collection_limiter("vmware_hosts", MAX_CONCURRENCY_PER_SCOPE)
 HOST_TIMEOUT_SECONDS = settings.vmware_hosts_job_host_timeout
 JOB_MAX_DURATION_SECONDS = settings.vmware_hosts_job_max_duration
 REFRESH_INTERVAL_MINUTES = settings.vmware_hosts_refresh_interval_minutes
-_SCHEDULER_CV = threading.Condition()
-_SCHEDULER_STARTED = False
-_SCHEDULER_STOP = False
 _WARMUP_STARTED = False
-_WARMUP_STOP = False
+_WARMUP_STOP = threading.Event()
 
 _REQUIRE_SUPERADMIN = require_permission(PermissionCode.JOBS_TRIGGER)
 
@@ -70,22 +81,25 @@ def _get_host_lock(host: str) -> threading.RLock:
 
 
 def _kick_scheduler() -> None:
-    global _SCHEDULER_STARTED
-    with _SCHEDULER_CV:
-        if not _SCHEDULER_STARTED:
-            t = threading.Thread(
-                target=_scheduler_loop, name="vmware-host-job-scheduler", daemon=True
-            )
-            t.start()
-            _SCHEDULER_STARTED = True
-        _SCHEDULER_CV.notify_all()
+    # En un seguidor los jobs quedan pendientes: los corre el líder (ver ensure_leader).
+    if not leader_elector.is_leader:
+        return
+    job_engine.register(
+        "vmware_hosts",
+        runner=_run_job_scope_hosts,
+        pending=lambda: _JOB_STORE.list_jobs_by_status({"pending"}),
+        max_concurrency=settings.vmware_job_max_global,
+    )
+    job_engine.kick("vmware_hosts")
 
 
 def _kick_warmup() -> None:
-    global _WARMUP_STARTED
+    global _WARMUP_STARTED, _WARMUP_STOP
     if _WARMUP_STARTED:
         return
-    t = threading.Thread(target=_warmup_loop, name="vmware-host-warmup", daemon=True)
+    # Evento nuevo por arranque: un loop detenido (p.ej. al perder el liderazgo) no revive.
+    _WARMUP_STOP = threading.Event()
+    t = threading.Thread(target=_warmup_loop, args=(_WARMUP_STOP,), name="vmware-host-warmup", daemon=True)
     t.start()
     _WARMUP_STARTED = True
     logger.info("VMware hosts warmup thread started")
@@ -113,19 +127,32 @@ def _get_existing_host_data(scope_key: ScopeKey, host: str):
     return None
 
 
-def _job_deadline(start: datetime) -> datetime:
-    return start + timedelta(seconds=JOB_MAX_DURATION_SECONDS)
+def _job_budget(job_id: str) -> Deadline:
+    """Presupuesto total del job; los hosts corren con ``budget.narrow(HOST_TIMEOUT_SECONDS)``."""
+    return Deadline.after(JOB_MAX_DURATION_SECONDS, cancel_event=job_cancellations.event(job_id))
 
 
 @router.get("/snapshot")
-def get_vmware_hosts_snapshot():
+def get_vmware_hosts_snapshot(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0, description="Version conocida por el cliente; devuelve solo los cambios"),
+):
     if not settings.vmware_enabled or not settings.vmware_configured:
         return Response(status_code=204)
     scope_key = _scope_key()
+    if since is None:
+        # Worker no líder: bytes publicados por el líder, sin cargar el snapshot en este proceso.
+        shared = shared_snapshots.response(request, "vmware", scope_key)
+        if shared is not None:
+            return shared
     snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
     if snap is None:
         return Response(status_code=204)
-    return snap
+    if since is not None:
+        delta = _SNAPSHOT_STORE.get_delta(scope_key, since)
+        if delta is not None:
+            return delta_response(delta)
+    return encoded_snapshots.response(request, "vmware_hosts", scope_key, snap)
 
 
 @router.get("/jobs/{job_id}")
@@ -139,6 +166,17 @@ def get_vmware_hosts_job(
     return job
 
 
+@router.post("/jobs/{job_id}/cancel")
+def cancel_vmware_hosts_job(
+    job_id: str,
+    _user: User = Depends(require_permission(PermissionCode.JOBS_TRIGGER)),
+):
+    job = request_cancel(_JOB_STORE, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job
+
+
 @router.post("/refresh")
 def trigger_vmware_hosts_refresh(
     payload: RefreshRequest,
@@ -162,6 +200,8 @@ def trigger_vmware_hosts_refresh(
     _REQUIRE_SUPERADMIN(current_user=current_user, session=session)
     scope_key = _scope_key()
 
+    ensure_leader()
+
     # dedupe: si hay job activo, devolverlo
     active = _JOB_STORE.get_active_for_scope(scope_key)
     if active:
@@ -202,29 +242,6 @@ def trigger_vmware_hosts_refresh(
     return job
 
 
-def _scheduler_loop() -> None:
-    """
-    Hilo liviano que toma jobs pendientes y los arranca si hay cupo global.
-    """
-    while not _SCHEDULER_STOP:
-        with _SCHEDULER_CV:
-            pending_jobs = _JOB_STORE.list_jobs_by_status({"pending"})
-            if not pending_jobs:
-                _SCHEDULER_CV.wait(timeout=1.0)
-                continue
-        for job in pending_jobs:
-            # Intento tomar un slot global sin bloquear para no saturar
-            if not _GLOBAL_CONCURRENCY.acquire(blocking=False):
-                break
-            threading.Thread(
-                target=_run_job_scope_hosts,
-                args=(job,),
-                daemon=True,
-                name=f"vmware-host-job-{job.job_id[:6]}",
-            ).start()
-        time.sleep(0.1)
-
-
 def _run_job_scope_hosts(job: JobStatus) -> None:
     """
     Runner de jobs scope=hosts (summary).
@@ -232,25 +249,19 @@ def _run_job_scope_hosts(job: JobStatus) -> None:
     try:
         _run_job_scope_hosts_inner(job)
     finally:
-        _GLOBAL_CONCURRENCY.release()
+        job_cancellations.discard(job.job_id)
 
 
 def _run_job_scope_hosts_inner(job: JobStatus) -> None:
     scope_key = _scope_key()
     start_ts = datetime.utcnow()
-    deadline = _job_deadline(start_ts)
+    if start_job(_JOB_STORE, job.job_id, start_ts) is None:
+        return  # cancelado mientras esperaba en la cola
+    budget = _job_budget(job.job_id)
 
     def update_job(fn):
         return _JOB_STORE.update_job(job.job_id, fn)
 
-    update_job(
-        lambda j: (
-            setattr(j, "status", "running"),
-            setattr(j, "started_at", start_ts),
-            setattr(j, "last_heartbeat_at", datetime.utcnow()),
-        )
-    )
-
     snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
     if snap is None:
         _SNAPSHOT_STORE.init_snapshot(scope_key)
@@ -262,7 +273,7 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
     def _worker(host: str):
         nonlocal hosts_ok_this_job, hosts_error_this_job
         now = datetime.utcnow()
-        if now >= deadline:
+        if budget.expired or budget.cancelled:
             return
 
         health = _HEALTH_STORE.get(host)
@@ -308,21 +319,33 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
         state = SnapshotHostState.ERROR
         data = existing_data
         error_msg = None
+        cancelled = False
 
         with lock:
             try:
-                summary = host_service.get_hosts_summary(refresh=True)
+                with _HOST_LIMITER.slot(deadline=budget):
+                    summary = run_with_deadline(
+                        lambda: host_service.get_hosts_summary(refresh=True),
+                        budget.narrow(HOST_TIMEOUT_SECONDS),
+                        name=f"vmware-hosts-{host}",
+                    )
                 data = [item.model_dump() for item in summary]
-                elapsed = (datetime.utcnow() - started).total_seconds()
-                if elapsed > HOST_TIMEOUT_SECONDS:
-                    state = SnapshotHostState.TIMEOUT
-                    error_msg = "host_timeout_exceeded"
-                    hosts_error_this_job += 1
-                    _HEALTH_STORE.record_failure(host, error_type="timeout", error_message=error_msg)
-                else:
-                    state = SnapshotHostState.OK
-                    hosts_ok_this_job += 1
-                    _HEALTH_STORE.record_success(host)
+                state = SnapshotHostState.OK
+                hosts_ok_this_job += 1
+                _HEALTH_STORE.record_success(host)
+            except LimiterTimeout:
+                # sin cupo en un limitador: el host no llegó a consultarse (sin timeout ni cooldown)
+                state = SnapshotHostState.ERROR
+                error_msg = "concurrency_limit_timeout"
+                hosts_error_this_job += 1
+            except DeadlineExceeded:
+                # el hilo de la llamada queda huérfano; el slot se libera ya
+                state = SnapshotHostState.TIMEOUT
+                error_msg = "host_timeout_exceeded"
+                hosts_error_this_job += 1
+                _HEALTH_STORE.record_failure(host, error_type="timeout", error_message=error_msg)
+            except JobCancelled:
+                cancelled = True
             except Exception as exc:
                 error_msg = str(exc)
                 hosts_error_this_job += 1
@@ -331,6 +354,9 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
             finally:
                 finished = datetime.utcnow()
 
+        if cancelled:
+            return
+
         health_after = _HEALTH_STORE.get(host)
         if state == SnapshotHostState.ERROR and health_after.last_success_at:
             if (datetime.utcnow() - health_after.last_success_at) > timedelta(minutes=REFRESH_INTERVAL_MINUTES):
@@ -371,7 +397,8 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
 
         update_job(mutator)
 
-    max_workers = max(1, min(MAX_CONCURRENCY_PER_SCOPE, len(hosts_pending)))
+    # el limitador adaptativo decide cuántos hosts corren a la vez; el pool solo pone el techo
+    max_workers = max(1, min(_HOST_LIMITER.max_limit, len(hosts_pending)))
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
         fut_map = {ex.submit(_worker, h): h for h in hosts_pending}
         for fut in as_completed(fut_map):
@@ -384,7 +411,10 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
     finished_ts = datetime.utcnow()
     final_status = "succeeded"
     message = None
-    if finished_ts >= deadline:
+    if budget.cancelled:
+        final_status = CANCELLED_STATUS
+        message = "cancelled_by_user"
+    elif budget.expired:
         final_status = "expired"
         message = "job_max_duration_reached"
     elif hosts_ok_this_job == 0:
@@ -428,13 +458,13 @@ def _should_warm() -> bool:
     return True
 
 
-def _warmup_loop() -> None:
+def _warmup_loop(stop: threading.Event) -> None:
     """
     Tarea interna periodica para asegurar que exista snapshot (hosts) sin requerir clicks.
     No depende de permisos HTTP.
     """
     interval = max(REFRESH_INTERVAL_MINUTES, 10)
-    while not _WARMUP_STOP:
+    while not stop.is_set():
         try:
             if _should_warm():
                 scope_key = _scope_key()
@@ -443,9 +473,10 @@ def _warmup_loop() -> None:
                 _kick_scheduler()
         except Exception as exc:
             logger.warning("VMware hosts warmup loop error: %s", exc)
-        time.sleep(interval * 60)
+        stop.wait(interval * 60)
 
 
 def _stop_warmup() -> None:
-    global _WARMUP_STOP
-    _WARMUP_STOP = True
+    global _WARMUP_STARTED
+    _WARMUP_STOP.set()
+    _WARMUP_STARTED = False
@@ -0,0 +1,251 @@
+"""Limitadores de concurrencia adaptativos (AIMD) por endpoint.
+
+Cada ``AdaptiveLimiter`` controla cuántas llamadas a un mismo destino pueden
+estar en vuelo (recolecciones por host de un proveedor, REST de vCenter/CEDIA,
+SOAP, sesiones WinRM de un host). Sube el límite de a ``1/limit`` por llamada
+exitosa mientras esté saturado (aumento aditivo) y lo multiplica por
+``backoff`` ante un error, timeout o latencia por encima de
+``tolerance`` × la latencia base (disminución multiplicativa, como mucho una vez
+por ventana para no desplomarse con una ráfaga de fallos). Los cambios de límite
+quedan en un historial acotado para observarlos desde el panel de sistema.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque, Dict, Iterator, List, Optional
+
+from app.jobs.deadline import Deadline, DeadlineExceeded, JobCancelled, current_deadline
+from app.settings import settings
+
+_WAIT_SLICE_SECONDS = 0.2
+_MIN_DECREASE_WINDOW_SECONDS = 1.0
+
+
+class LimiterTimeout(Exception):
+    """
+    No se consiguió cupo en el limitador dentro del tiempo disponible.
+    No es un ``DeadlineExceeded``: el destino no llegó a consultarse, así que no
+    debe contar como timeout del host (ni activar su cooldown).
+    """
+
+
+class _Slot:
+    """Marca el resultado de una llamada que no terminó en excepción (p.ej. HTTP 503)."""
+
+    __slots__ = ("ok",)
+
+    def __init__(self) -> None:
+        self.ok: Optional[bool] = True
+
+    def fail(self) -> None:
+        self.ok = False
+
+
+class AdaptiveLimiter:
+    """Semáforo con límite variable (AIMD) + contadores e historial de cambios."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial: int,
+        max_limit: int,
+        min_limit: int = 1,
+        tolerance: Optional[float] = None,
+        backoff: float = 0.7,
+        history_size: int = 120,
+        enabled: bool = True,
+    ) -> None:
+        self.name = name
+        self.min_limit = max(int(min_limit), 1)
+        self.max_limit = max(int(max_limit), self.min_limit)
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.enabled = enabled
+        self._limit = float(min(max(int(initial), self.min_limit), self.max_limit))
+        self._cv = threading.Condition()
+        self._in_flight = 0
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._counters = {"successes": 0, "errors": 0, "congested": 0, "timeouts": 0}
+        self._history: Deque[Dict[str, object]] = deque(maxlen=max(int(history_size), 1))
+        self._record("initial", None)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _record(self, reason: str, latency: Optional[float]) -> None:
+        self._history.append(
+            {
+                "at": datetime.utcnow().isoformat(),
+                "limit": int(self._limit),
+                "reason": reason,
+                "latency_ms": None if latency is None else round(latency * 1000, 1),
+            }
+        )
+
+    def acquire(self, *, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> None:
+        """
+        Espera cupo. Sin ``timeout`` usa el deadline del job en curso (si lo hay);
+        respeta la cancelación del job y lanza ``LimiterTimeout`` si se agota el tiempo.
+        """
+        deadline = deadline or current_deadline()
+        until = None if timeout is None else time.monotonic() + timeout
+        with self._cv:
+            while self._in_flight >= int(self._limit):
+                if deadline is not None:
+                    try:
+                        deadline.check()
+                    except DeadlineExceeded as exc:
+                        self._counters["timeouts"] += 1
+                        raise LimiterTimeout(f"{self.name}: sin cupo antes del deadline") from exc
+                wait_for = _WAIT_SLICE_SECONDS
+                if until is not None:
+                    left = until - time.monotonic()
+                    if left <= 0:
+                        self._counters["timeouts"] += 1
+                        raise LimiterTimeout(f"{self.name}: sin cupo de concurrencia")
+                    wait_for = min(wait_for, left)
+                self._cv.wait(wait_for)
+            self._in_flight += 1
+
+    def release(self, latency: float, *, ok: Optional[bool]) -> None:
+        """``ok=None``: resultado neutro (job cancelado), solo libera el cupo."""
+        with self._cv:
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+            self._cv.notify()
+            if ok is None:
+                return
+            congested = False
+            if ok:
+                self._counters["successes"] += 1
+                congested = self._observe_latency(latency)
+            else:
+                self._counters["errors"] += 1
+            if self.enabled:
+                if not ok or congested:
+                    self._decrease(latency, "error" if not ok else "latency")
+                elif saturated and self._limit < self.max_limit:
+                    self._increase(latency)
+
+    def _observe_latency(self, latency: float) -> bool:
+        if self.tolerance is None:
+            return False
+        baseline = self._baseline
+        if baseline is None:
+            self._baseline = latency
+            return False
+        # base sesgada al mínimo: baja rápido, sube muy despacio
+        if latency < baseline:
+            self._baseline = (baseline + latency) / 2
+        else:
+            self._baseline = baseline * 0.99 + latency * 0.01
+        if latency > baseline * self.tolerance:
+            self._counters["congested"] += 1
+            return True
+        return False
+
+    def _increase(self, latency: float) -> None:
+        before = int(self._limit)
+        self._limit = min(self._limit + 1.0 / self._limit, float(self.max_limit))
+        if int(self._limit) != before:
+            self._record("increase", latency)
+
+    def _decrease(self, latency: float, reason: str) -> None:
+        now = time.monotonic()
+        window = max(self._baseline or 0.0, _MIN_DECREASE_WINDOW_SECONDS)
+        if now - self._last_decrease < window:
+            return
+        self._last_decrease = now
+        before = int(self._limit)
+        self._limit = max(self._limit * self.backoff, float(self.min_limit))
+        if int(self._limit) != before:
+            self._record(reason, latency)
+
+    @contextmanager
+    def slot(self, *, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Iterator[_Slot]:
+        """Cupo para una llamada; una excepción o ``slot.fail()`` cuentan como error."""
+        self.acquire(timeout=timeout, deadline=deadline)
+        started = time.monotonic()
+        marker = _Slot()
+        try:
+            yield marker
+        except (JobCancelled, LimiterTimeout):
+            # cancelado o sin cupo en un limitador anidado: no dice nada de este destino
+            marker.ok = None
+            raise
+        except BaseException:
+            marker.ok = False
+            raise
+        finally:
+            self.release(time.monotonic() - started, ok=marker.ok)
+
+    def stats(self, *, history: bool = True) -> Dict[str, object]:
+        with self._cv:
+            data: Dict[str, object] = {
+                **self._counters,
+                "limit": int(self._limit),
+                "limit_exact": round(self._limit, 2),
+                "in_flight": self._in_flight,
+                "min": self.min_limit,
+                "max": self.max_limit,
+                "adaptive": self.enabled,
+                "baseline_ms": None if self._baseline is None else round(self._baseline * 1000, 1),
+            }
+            if history:
+                data["history"] = list(self._history)
+            return data
+
+
+class LimiterRegistry:
+    """Limitadores por nombre; el primero que pide uno fija sus parámetros."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+
+    def get(self, name: str, *, initial: int, max_limit: Optional[int] = None, latency_aware: bool = True) -> AdaptiveLimiter:
+        with self._lock:
+            limiter = self._limiters.get(name)
+            if limiter is None:
+                cap = settings.adaptive_concurrency_max
+                limiter = AdaptiveLimiter(
+                    name,
+                    initial=min(initial, cap),
+                    max_limit=min(max_limit or cap, cap),
+                    tolerance=settings.adaptive_latency_tolerance if latency_aware else None,
+                    history_size=settings.adaptive_history_size,
+                    enabled=settings.adaptive_concurrency_enabled,
+                )
+                if not limiter.enabled:
+                    limiter.max_limit = limiter.limit
+                self._limiters[name] = limiter
+            return limiter
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._limiters)
+
+    def stats(self, *, history: bool = True) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {name: limiters[name].stats(history=history) for name in sorted(limiters)}
+
+
+adaptive_limiters = LimiterRegistry()
+
+
+def host_collection_limiter(provider: str, initial: int) -> AdaptiveLimiter:
+    """
+    Recolecciones por host simultáneas de un proveedor (entre todos sus jobs).
+    La duración de un host depende de cuántas VMs tiene: solo cuentan errores y
+    timeouts, no la latencia.
+    """
+    return adaptive_limiters.get(f"{provider}.hosts", initial=initial, latency_aware=False)
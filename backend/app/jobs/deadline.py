@@ -0,0 +1,262 @@
+"""Deadlines y cancelación cooperativa para los runners de jobs.
+
+Cada host de un job corre con un ``Deadline`` (presupuesto del host acotado por
+el del job, más el evento de cancelación del job). ``run_with_deadline`` ejecuta
+la llamada bloqueante en un hilo aparte y devuelve el control apenas vence el
+presupuesto o se cancela el job: el slot del pool queda libre aunque el socket
+siga colgado. El hilo abandonado termina solo, porque los clientes HTTP/WinRM/SOAP
+leen el presupuesto restante del contexto (``budget_timeout``) y usan timeouts
+cada vez más cortos en lugar de sus valores fijos.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+_POLL_SECONDS = 0.2
+
+CANCELLED_STATUS = "cancelled"
+ACTIVE_STATUSES = {"pending", "running"}
+
+
+class DeadlineExceeded(TimeoutError):
+    """El host (o el job) agotó su presupuesto de tiempo."""
+
+
+class JobCancelled(Exception):
+    """El job fue cancelado mientras corría."""
+
+
+class Deadline:
+    """Instante límite (``time.monotonic``) + evento de cancelación opcional."""
+
+    __slots__ = ("expires_at", "cancel_event")
+
+    def __init__(self, expires_at: float, cancel_event: Optional[threading.Event] = None) -> None:
+        self.expires_at = expires_at
+        self.cancel_event = cancel_event
+
+    @classmethod
+    def after(cls, seconds: float, *, cancel_event: Optional[threading.Event] = None) -> "Deadline":
+        return cls(time.monotonic() + max(float(seconds), 0.0), cancel_event)
+
+    def narrow(self, seconds: float) -> "Deadline":
+        """Deadline hijo: el menor entre este y ``seconds`` desde ahora, misma cancelación."""
+        return Deadline(min(self.expires_at, time.monotonic() + max(float(seconds), 0.0)), self.cancel_event)
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise JobCancelled("job_cancelled")
+        if self.expired:
+            raise DeadlineExceeded("host_timeout_exceeded")
+
+
+_CURRENT: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("job_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def use_deadline(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    token = _CURRENT.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _CURRENT.reset(token)
+
+
+def check_deadline() -> None:
+    """Punto de cancelación: no hace nada fuera de un job."""
+    deadline = _CURRENT.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def budget_timeout(default: float, *, minimum: float = 1.0) -> float:
+    """
+    Timeout para una llamada de red: ``default`` fuera de un job, o el menor entre
+    ``default`` y el presupuesto restante (nunca menos que ``minimum``).
+    Lanza si el deadline ya venció o el job fue cancelado.
+    """
+    deadline = _CURRENT.get()
+    if deadline is None:
+        return default
+    deadline.check()
+    return max(min(float(default), deadline.remaining()), minimum)
+
+
+def sleep(seconds: float) -> None:
+    """``time.sleep`` que se despierta al cancelar el job y no duerme más allá del deadline."""
+    deadline = _CURRENT.get()
+    if deadline is None:
+        time.sleep(seconds)
+        return
+    wait_for = min(float(seconds), deadline.remaining())
+    if deadline.cancel_event is not None:
+        deadline.cancel_event.wait(wait_for)
+    else:
+        time.sleep(wait_for)
+    deadline.check()
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.abandoned_running = 0
+
+    def bump(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+                "abandoned_running": self.abandoned_running,
+            }
+
+
+_stats = _Stats()
+
+
+def run_with_deadline(fn: Callable[[], T], deadline: Deadline, *, name: str = "job-host-call") -> T:
+    """
+    Ejecuta ``fn()`` con ``deadline`` en su contexto y espera como mucho hasta que
+    venza o se cancele. En ese caso lanza ``DeadlineExceeded``/``JobCancelled`` sin
+    esperar al hilo, que queda huérfano hasta que su propio timeout lo corte.
+    """
+    deadline.check()
+    done = threading.Event()
+    guard = threading.Lock()
+    outcome: Dict[str, object] = {"abandoned": False}
+
+    def _target() -> None:
+        with use_deadline(deadline):
+            try:
+                outcome["result"] = fn()
+            except BaseException as exc:  # se relanza en el hilo que espera
+                outcome["error"] = exc
+            finally:
+                with guard:
+                    done.set()
+                    if outcome["abandoned"]:
+                        _stats.bump("abandoned_running", -1)
+
+    _stats.bump("calls")
+    threading.Thread(target=_target, name=name, daemon=True).start()
+    while not done.wait(min(_POLL_SECONDS, max(deadline.remaining(), 0.001))):
+        if not (deadline.cancelled or deadline.expired):
+            continue
+        with guard:
+            if not done.is_set():
+                outcome["abandoned"] = True
+                _stats.bump("abandoned_running")
+                _stats.bump("cancelled" if deadline.cancelled else "timeouts")
+        if outcome["abandoned"]:
+            deadline.check()
+        break
+    if "error" in outcome:
+        raise outcome["error"]  # type: ignore[misc]
+    return outcome.get("result")  # type: ignore[return-value]
+
+
+def deadline_stats() -> Dict[str, int]:
+    return _stats.snapshot()
+
+
+class JobCancellations:
+    """Eventos de cancelación por job_id (solo para jobs en ejecución)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._events: Dict[str, threading.Event] = {}
+
+    def event(self, job_id: str) -> threading.Event:
+        with self._lock:
+            return self._events.setdefault(job_id, threading.Event())
+
+    def cancel(self, job_id: str) -> None:
+        self.event(job_id).set()
+
+    def is_cancelled(self, job_id: str) -> bool:
+        with self._lock:
+            event = self._events.get(job_id)
+        return event is not None and event.is_set()
+
+    def discard(self, job_id: str) -> None:
+        with self._lock:
+            self._events.pop(job_id, None)
+
+
+job_cancellations = JobCancellations()
+
+
+def start_job(store, job_id: str, started_at) -> Optional[object]:
+    """
+    Pasa el job a ``running`` salvo que lo hayan cancelado mientras estaba en cola.
+    Devuelve el JobStatus publicado o None si no hay que correrlo.
+    """
+    def mark_running(job) -> None:
+        if job.status != "pending":
+            return
+        job.status = "running"
+        job.started_at = started_at
+        job.last_heartbeat_at = datetime.utcnow()
+
+    job = store.update_job(job_id, mark_running)
+    if job is None or job.status != "running":
+        job_cancellations.discard(job_id)
+        return None
+    return job
+
+
+def request_cancel(store, job_id: str) -> Optional[object]:
+    """
+    Cancela un job: si sigue en cola queda ``cancelled`` de inmediato; si está
+    corriendo se marca ``cancel_requested`` y el runner lo cierra como ``cancelled``
+    cuando sus hosts sueltan el slot. Jobs terminados se devuelven sin cambios.
+    """
+    running = False
+
+    def mutator(job) -> None:
+        nonlocal running
+        now = datetime.utcnow()
+        if job.status == "pending":
+            job.status = CANCELLED_STATUS
+            job.message = "cancelled_by_user"
+            job.finished_at = now
+            job.last_heartbeat_at = now
+        elif job.status == "running":
+            running = True
+            job.message = "cancel_requested"
+            job.last_heartbeat_at = now
+
+    job = store.update_job(job_id, mutator)
+    if running:
+        job_cancellations.cancel(job_id)
+    return job
@@ -0,0 +1,200 @@
+"""Shared job engine for the provider refresh jobs (VMware, Hyper-V, VMware hosts, CEDIA).
+
+Each provider registers a runner, a ``pending`` callback (its ``JobStore``) and a
+concurrency budget. ``kick(provider)`` pulls the pending jobs once and enqueues
+the ones not already queued/running; a fixed worker pool takes jobs in priority
+order as long as the provider still has budget. Workers only wake up on
+enqueue/completion (condition variable), there is no polling loop.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 10
+
+
+@dataclass
+class _Provider:
+    name: str
+    runner: Callable[[object], None]
+    pending: Callable[[], Iterable[object]]
+    max_concurrency: int
+    priority: int = DEFAULT_PRIORITY
+    running: int = 0
+    started: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    inflight: Set[str] = field(default_factory=set)
+
+
+class JobEngine:
+    """Cola de prioridad + pool de workers con presupuesto de concurrencia por proveedor."""
+
+    def __init__(self, *, workers: int, name: str = "job-engine") -> None:
+        self._workers = max(int(workers), 1)
+        self._name = name
+        self._cv = threading.Condition()
+        self._providers: Dict[str, _Provider] = {}
+        # (priority, seq, provider, job_id, job)
+        self._queue: List[Tuple[int, int, str, str, object]] = []
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        # Cada arranque del pool es una generación; ``stop()`` la cierra y el siguiente
+        # ``submit()`` levanta workers nuevos (los jobs en cola se conservan).
+        self._generation = 0
+
+    def register(
+        self,
+        provider: str,
+        *,
+        runner: Callable[[object], None],
+        pending: Callable[[], Iterable[object]],
+        max_concurrency: int,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> None:
+        with self._cv:
+            existing = self._providers.get(provider)
+            if existing is not None:
+                existing.runner = runner
+                existing.pending = pending
+                existing.max_concurrency = max(int(max_concurrency), 1)
+                existing.priority = priority
+                return
+            self._providers[provider] = _Provider(
+                name=provider,
+                runner=runner,
+                pending=pending,
+                max_concurrency=max(int(max_concurrency), 1),
+                priority=priority,
+            )
+
+    def _ensure_workers_locked(self) -> None:
+        if self._threads:
+            return
+        for idx in range(self._workers):
+            thread = threading.Thread(
+                target=self._worker_loop, args=(self._generation,), name=f"{self._name}-{idx}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, provider: str, job, *, priority: Optional[int] = None) -> bool:
+        """Encola ``job`` (con ``job_id``) si no esta ya en cola o en ejecucion."""
+        job_id = str(getattr(job, "job_id", id(job)))
+        with self._cv:
+            entry = self._providers[provider]
+            if job_id in entry.inflight:
+                # Ya en cola: tras un stop() puede no haber workers que la atiendan.
+                if self._queue:
+                    self._ensure_workers_locked()
+                return False
+            entry.inflight.add(job_id)
+            heapq.heappush(
+                self._queue,
+                (entry.priority if priority is None else priority, next(self._seq), provider, job_id, job),
+            )
+            self._ensure_workers_locked()
+            self._cv.notify()
+        return True
+
+    def kick(self, provider: str) -> int:
+        """Toma los jobs pendientes del proveedor y encola los nuevos. Devuelve cuantos se encolaron."""
+        with self._cv:
+            entry = self._providers.get(provider)
+        if entry is None:
+            logger.warning("Job engine: provider '%s' not registered", provider)
+            return 0
+        queued = 0
+        for job in entry.pending() or []:
+            if self.submit(provider, job):
+                queued += 1
+        with self._cv:
+            if self._queue:
+                self._ensure_workers_locked()
+                self._cv.notify_all()
+        return queued
+
+    def _next_locked(self) -> Optional[Tuple[_Provider, str, object]]:
+        skipped = []
+        found = None
+        while self._queue:
+            item = heapq.heappop(self._queue)
+            entry = self._providers[item[2]]
+            if entry.running < entry.max_concurrency:
+                found = (entry, item[3], item[4])
+                break
+            skipped.append(item)
+        for item in skipped:
+            heapq.heappush(self._queue, item)
+        return found
+
+    def _worker_loop(self, generation: int) -> None:
+        while True:
+            with self._cv:
+                next_item = None
+                while next_item is None:
+                    # Generación antes de sacar de la cola: un worker detenido no se lleva jobs.
+                    if generation != self._generation:
+                        return
+                    next_item = self._next_locked()
+                    if next_item is None:
+                        self._cv.wait()
+                entry, job_id, job = next_item
+                entry.running += 1
+                entry.started += 1
+            started = time.monotonic()
+            try:
+                entry.runner(job)
+            except Exception:
+                with self._cv:
+                    entry.failed += 1
+                logger.exception("Job engine: %s job %s failed", entry.name, job_id)
+            finally:
+                with self._cv:
+                    entry.running -= 1
+                    entry.inflight.discard(job_id)
+                    entry.busy_seconds += time.monotonic() - started
+                    self._cv.notify_all()
+
+    def stop(self) -> None:
+        """Detiene los workers actuales; un ``submit()``/``kick()`` posterior los vuelve a levantar."""
+        with self._cv:
+            self._generation += 1
+            self._threads = []
+            self._cv.notify_all()
+
+    def stats(self) -> Dict[str, object]:
+        with self._cv:
+            queued: Dict[str, int] = {}
+            for item in self._queue:
+                queued[item[2]] = queued.get(item[2], 0) + 1
+            return {
+                "workers": self._workers,
+                "queued": len(self._queue),
+                "providers": {
+                    name: {
+                        "max_concurrency": entry.max_concurrency,
+                        "priority": entry.priority,
+                        "running": entry.running,
+                        "queued": queued.get(name, 0),
+                        "started": entry.started,
+                        "failed": entry.failed,
+                        "busy_seconds": round(entry.busy_seconds, 3),
+                    }
+                    for name, entry in sorted(self._providers.items())
+                },
+            }
+
+
+job_engine = JobEngine(workers=settings.job_engine_workers)
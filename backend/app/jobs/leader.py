@@ -0,0 +1,263 @@
+"""Elección de líder para la recolección en segundo plano.
+
+Solo un proceso (worker uvicorn o réplica) corre warmups, change feed, perf
+sampler y el scan de notificaciones. El lock es un advisory lock de Postgres
+(atado a una conexión dedicada: si el líder muere, Postgres lo libera) o un
+``flock`` sobre un archivo local cuando la base es SQLite. Los seguidores
+reintentan cada ``retry_seconds`` y toman el rol si el líder desaparece; mientras
+tanto sirven lecturas desde los snapshots persistidos. Los refresh on-demand
+también son del líder: los job stores viven en su memoria, así que un seguidor
+los rechaza (``ensure_leader``) en lugar de correrlos y pisar sus snapshots.
+Jobs y eventos SSE no se comparten entre procesos: el despliegue soportado es
+un solo worker; la elección cubre solapamientos (p.ej. un rolling update).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+try:
+    import fcntl
+except ImportError:  # Windows (desarrollo local)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_NAME = "vm-inventory:background-collection"
+DEFAULT_LOCK_FILE = os.path.join(tempfile.gettempdir(), "vm-inventory-leader.lock")
+
+
+class FileLeaderLock:
+    """``flock`` exclusivo y no bloqueante; el SO lo libera si el proceso muere."""
+
+    backend = "file"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._handle = None
+
+    def try_acquire(self) -> bool:
+        if self._handle is not None:
+            return True
+        handle = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(str(os.getpid()))
+        handle.flush()
+        self._handle = handle
+        return True
+
+    def check(self) -> bool:
+        return self._handle is not None
+
+    def release(self) -> None:
+        handle, self._handle = self._handle, None
+        if handle is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        finally:
+            handle.close()
+
+
+class PostgresAdvisoryLock:
+    """``pg_try_advisory_lock`` de sesión sobre una conexión que el líder mantiene abierta."""
+
+    backend = "postgres"
+
+    def __init__(self, engine: Engine, key: int) -> None:
+        self.engine = engine
+        self.key = key
+        self._conn = None
+
+    def try_acquire(self) -> bool:
+        if self._conn is not None:
+            return True
+        conn = self.engine.connect()
+        try:
+            acquired = bool(conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar())
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def check(self) -> bool:
+        """Si la conexión se cayó, el lock se perdió con ella."""
+        if self._conn is None:
+            return False
+        try:
+            self._conn.execute(text("SELECT 1"))
+            self._conn.commit()
+            return True
+        except Exception as exc:
+            logger.warning("Leader lock connection lost: %s", exc)
+            conn, self._conn = self._conn, None
+            try:
+                conn.invalidate()
+                conn.close()
+            except Exception:
+                pass
+            return False
+
+    def release(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            conn.commit()
+        except Exception as exc:
+            logger.warning("Failed to release leader lock: %s", exc)
+        finally:
+            conn.close()
+
+
+def build_leader_lock(engine: Engine, lock_file: Optional[str] = None):
+    if engine.dialect.name == "postgresql":
+        # Clave estable de 31 bits para pg_*advisory_lock(bigint).
+        return PostgresAdvisoryLock(engine, zlib.crc32(LEADER_LOCK_NAME.encode("utf-8")) & 0x7FFFFFFF)
+    return FileLeaderLock(lock_file or DEFAULT_LOCK_FILE)
+
+
+class LeaderElector:
+    """
+    Mantiene el rol de líder y llama ``on_elected``/``on_demoted`` al cambiar.
+    Antes de ``start`` (tests, scripts, elección deshabilitada) el proceso se
+    considera líder, igual que el comportamiento de un solo proceso.
+    """
+
+    def __init__(self) -> None:
+        self._lock_backend = None
+        self._retry_seconds = 10.0
+        self._on_elected: Optional[Callable[[], None]] = None
+        self._on_demoted: Optional[Callable[[], None]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._mutex = threading.Lock()
+        self._started = False
+        self._leader = False
+        self._term = 0
+        self._stats = {"elections": 0, "demotions": 0, "errors": 0}
+        self.last_error: Optional[str] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader or not self._started
+
+    @property
+    def term(self) -> int:
+        """Se incrementa en cada cambio de rol (para invalidar lo leído con el rol anterior)."""
+        return self._term
+
+    def start(
+        self,
+        lock,
+        *,
+        retry_seconds: float,
+        on_elected: Callable[[], None],
+        on_demoted: Callable[[], None],
+    ) -> None:
+        with self._mutex:
+            if self._started:
+                return
+            self._lock_backend = lock
+            self._retry_seconds = max(float(retry_seconds), 1.0)
+            self._on_elected = on_elected
+            self._on_demoted = on_demoted
+            self._stop.clear()
+            self._started = True
+        # Primer intento sincrónico: el rol queda definido antes de terminar el startup.
+        self._tick()
+        self._thread = threading.Thread(target=self._run, name="leader-elector", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._retry_seconds):
+            self._tick()
+
+    def _tick(self) -> None:
+        lock = self._lock_backend
+        try:
+            if not self._leader:
+                if lock.try_acquire():
+                    self._set_role(True)
+            elif not lock.check():
+                self._set_role(False)
+        except Exception as exc:
+            self._stats["errors"] += 1
+            self.last_error = str(exc)
+            logger.warning("Leader election attempt failed: %s", exc)
+
+    def _set_role(self, leader: bool) -> None:
+        self._leader = leader
+        self._term += 1
+        if leader:
+            self._stats["elections"] += 1
+            logger.info("Leader lock acquired (%s); starting background collection", self._lock_backend.backend)
+            callback = self._on_elected
+        else:
+            self._stats["demotions"] += 1
+            logger.warning("Leader lock lost; stopping background collection")
+            callback = self._on_demoted
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.exception("Leader role callback failed: %s", exc)
+
+    def stop(self) -> None:
+        """Libera el lock (para que otro proceso tome el rol); no llama ``on_demoted``."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        if self._lock_backend is not None:
+            self._lock_backend.release()
+        self._leader = False
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **self._stats,
+            "started": self._started,
+            "is_leader": self.is_leader,
+            "backend": getattr(self._lock_backend, "backend", None),
+            "pid": os.getpid(),
+            "retry_seconds": self._retry_seconds,
+            "last_error": self.last_error,
+        }
+
+
+leader_elector = LeaderElector()
+
+
+def ensure_leader(detail: str = "Refresh is handled by the leader worker; retry") -> None:
+    """503 + ``Retry-After`` en un seguidor (p.ej. el pod saliente de un rolling update)."""
+    if leader_elector.is_leader:
+        return
+    raise HTTPException(
+        status_code=503,
+        detail=detail,
+        headers={"Retry-After": str(int(leader_elector.stats()["retry_seconds"]))},
+    )
@@ -24,6 +24,7 @@ from app.notifications import router as notifications_router  # /api/notificatio
 from app.permissions.router import router as permissions_router  # /api/permissions
 from app.cedia.router import router as cedia_router  # /api/cedia
 from app.cedia.cedia_snapshot_router import router as cedia_snapshot_router  # /api/cedia snapshot/jobs
+from app.events.router import router as events_router  # /api/events (SSE)
 from app.admin.system_router import router as system_router  # /api/admin/system
 from app.admin.system_settings_router import router as system_settings_router  # /api/admin/system/settings
 from app.vms import vm_router  # /api/vms (VMware)
@@ -102,5 +103,6 @@ app.include_router(notifications_router, prefix="/api/notifications", tags=["not
 app.include_router(audit_router)  # /api/audit (Audit trail)
 app.include_router(cedia_router)  # /api/cedia (CEDIA VMs)
 app.include_router(cedia_snapshot_router)  # /api/cedia (snapshot/jobs)
+app.include_router(events_router)  # /api/events (SSE jobs/snapshots)
 app.include_router(system_router)  # /api/admin/system
 app.include_router(system_settings_router)  # /api/admin/system/settings
@@ -1,12 +1,15 @@
 # filepath: app/providers/hyperv/remote.py
 from __future__ import annotations
-import json, logging, os, subprocess, tempfile, time
+import functools, hashlib, json, logging, os, subprocess, tempfile
 from typing import List, Optional
 from dataclasses import dataclass
 
-import winrm  # pywinrm en requirements
 from requests.exceptions import RequestException
 
+from app.jobs import deadline as job_deadline
+from app.jobs.adaptive import AdaptiveLimiter, adaptive_limiters
+from app.providers.hyperv.winrm_pool import PooledSession, winrm_pool
+
 try:
     from app.main import TEST_MODE
 except Exception:
@@ -36,6 +39,13 @@ class RemoteCreds:
 PS_SCRIPT_BASENAME = "collect_hyperv_inventory.ps1"
 
 
+def _winrm_limiter(host: str) -> AdaptiveLimiter:
+    """Sesiones WinRM simultaneas contra un mismo host (inventario y acciones)."""
+    return adaptive_limiters.get(
+        f"winrm:{host.lower()}", initial=2, max_limit=winrm_pool.max_per_host, latency_aware=False
+    )
+
+
 def _compute_winrm_timeouts(read_timeout_sec: int, *, cap_operation_timeout_sec: int | None = None) -> tuple[int, int]:
     """
     Compute pywinrm timeouts.
@@ -50,6 +60,22 @@ def _compute_winrm_timeouts(read_timeout_sec: int, *, cap_operation_timeout_sec:
     read_timeout = op_timeout + 30
     return op_timeout, read_timeout
 
+
+def _pooled_session(creds: RemoteCreds, timeout_sec: float, *, cap_operation_timeout_sec: int | None = None):
+    """Shell WinRM del pool del host (se autentica solo al abrir uno nuevo)."""
+    op_timeout, read_timeout = _compute_winrm_timeouts(
+        int(timeout_sec), cap_operation_timeout_sec=cap_operation_timeout_sec
+    )
+    return winrm_pool.session(
+        f"{creds.scheme}://{creds.host}:{creds.port}/wsman",
+        creds.username,
+        creds.password,
+        creds.transport,
+        operation_timeout=op_timeout,
+        read_timeout=read_timeout,
+        wait_timeout=timeout_sec,
+    )
+
 
 def _run_local_powershell(
     ps_path: str,
@@ -180,96 +206,117 @@ def _extract_json_list(txt: str) -> Optional[List[dict]]:
 
 
 
-def _read_remote_text(session: winrm.Session, ps: str) -> str:
+def _read_remote_text(session: PooledSession, ps: str) -> str:
     r = session.run_ps(ps)
     if r.status_code != 0:
         return ""
     return _decode_bytes(r.std_out).strip()
 
 
-def _run_winrm_inline(
-    creds: RemoteCreds,
-    ps_content: str,
-    hvhost: str,
-    level: str,
-    vm_name: str | None,
-    skip_vhd: bool,
-    skip_measure: bool,
-    skip_kvp: bool,
-) -> str:
-    """
-    Sube el script al host remoto en chunks, lo ejecuta y devuelve stdout (texto).
-    Si stdout sale vacAo, aquA NO se lee archivo: eso lo maneja run_inventory().
-    """
-    import base64, uuid
-
-    endpoint = f"{creds.scheme}://{creds.host}:{creds.port}/wsman"
-    op_timeout, read_timeout = _compute_winrm_timeouts(creds.read_timeout)
-
-    session = winrm.Session(
-        target=endpoint,
-        auth=(creds.username or "", creds.password or ""),
-        transport=creds.transport,
-        read_timeout_sec=read_timeout,
-        operation_timeout_sec=op_timeout,
-    )
+# El collector queda instalado en el host bajo un nombre derivado de su SHA-256:
+# en regimen normal cada inventario es un solo run_ps (chequeo + ejecucion) y solo
+# se sube de nuevo cuando cambia el script.
+_COLLECTOR_DIR = "vm-inventory"
+_COLLECTOR_MISSING = "__VMINV_COLLECTOR_MISSING__"
+# Caracteres base64 por comando de subida: con el -EncodedCommand de run_ps
+# (UTF-16 + base64) queda por debajo del limite de ~8 KB de la linea de comandos.
+_UPLOAD_CHUNK = 2000
+# Sin BOM, Windows PowerShell 5.1 lee el .ps1 como ANSI y rompe los textos no ASCII.
+_UTF8_BOM = b"\xef\xbb\xbf"
 
-    guid = str(uuid.uuid4())
-    remote_file_name = f"collect_{guid}.ps1"
 
-    # 1) crear archivo vacAo en %TEMP%
-    init_cmd = rf"""
-$fname = '{remote_file_name}'
-$path  = Join-Path $env:TEMP $fname
-Remove-Item -LiteralPath $path -Force -ErrorAction SilentlyContinue
-New-Item -ItemType File -Path $path -Force | Out-Null
-$path
-"""
-    r = session.run_ps(init_cmd)
-    if r.status_code != 0:
-        err = _decode_bytes(r.std_err)
-        raise RuntimeError(f"WinRM init file error: {err[:500]}")
-
-    # 2) subir contenido en chunks
-    CHUNK = 512
-    encoded = base64.b64encode(ps_content.encode("utf-8")).decode("ascii")
-    for i in range(0, len(encoded), CHUNK):
-        part = encoded[i:i + CHUNK]
-        append_cmd = rf"""
-$fname='{remote_file_name}';$p=Join-Path $env:TEMP $fname;
-$bytes=[Convert]::FromBase64String("{part}");
-$txt=[Text.Encoding]::UTF8.GetString($bytes);
-[IO.File]::AppendAllText($p,$txt,[Text.Encoding]::UTF8)
-"""
-        r = session.run_ps(append_cmd)
+def _collector_bytes(ps_content: str) -> bytes:
+    """Contenido exacto del .ps1 en el host: UTF-8 con BOM (el hash se calcula sobre esto)."""
+    return _UTF8_BOM + ps_content.lstrip("\ufeff").encode("utf-8")
+
+
+@functools.lru_cache(maxsize=8)
+def _script_digest(ps_content: str) -> str:
+    return hashlib.sha256(_collector_bytes(ps_content)).hexdigest().upper()
+
+
+def _collector_name(digest: str) -> str:
+    return f"collect_{digest}.ps1"
+
+
+def _upload_collector(session: PooledSession, ps_content: str, digest: str) -> None:
+    """
+    Sube el script a un temporal en pocos comandos grandes, verifica el SHA-256
+    en el host y recien ahi lo publica con Move-Item (nunca queda uno a medias).
+    Borra las versiones anteriores del collector.
+    """
+    import base64, uuid
+
+    payload = base64.b64encode(_collector_bytes(ps_content)).decode("ascii")
+    tmp_name = f"upload_{uuid.uuid4().hex}.tmp"
+    for i in range(0, len(payload), _UPLOAD_CHUNK):
+        job_deadline.check_deadline()
+        part = payload[i:i + _UPLOAD_CHUNK]
+        r = session.run_ps(rf"""
+$d = Join-Path $env:TEMP '{_COLLECTOR_DIR}'; $t = Join-Path $d '{tmp_name}'
+New-Item -ItemType Directory -Path $d -Force | Out-Null
+$b = [Convert]::FromBase64String('{part}')
+$f = [IO.File]::Open($t, [IO.FileMode]::Append); try {{ $f.Write($b, 0, $b.Length) }} finally {{ $f.Close() }}
+""")
         if r.status_code != 0:
             err = _decode_bytes(r.std_err)
-            raise RuntimeError(f"WinRM append chunk error: {err[:500]}")
-
-    # 3) ejecutar
-    vm_arg = ""
-    if vm_name:
-        escaped_vm = vm_name.replace("'", "''")
-        vm_arg = f"-VMName '{escaped_vm}'"
-    flag_args = []
-    if skip_vhd:
-        flag_args.append("-SkipVhd")
-    if skip_measure:
-        flag_args.append("-SkipMeasure")
-    if skip_kvp:
-        flag_args.append("-SkipKvp")
-    flags_str = " ".join(flag_args)
-    run_cmd = rf"""
-$fname='{remote_file_name}';$p=Join-Path $env:TEMP $fname;
-& powershell -NoProfile -ExecutionPolicy Bypass -File $p -HVHost '{hvhost}' -Level '{level}' {vm_arg} {flags_str}
-"""
-    r = session.run_ps(run_cmd)
-
-    # 4) limpieza best-effort
-    session.run_ps(rf"""
-$fname='{remote_file_name}';$p=Join-Path $env:TEMP $fname;
-Remove-Item -LiteralPath $p -Force -ErrorAction SilentlyContinue
+            raise RuntimeError(f"WinRM upload chunk error: {err[:500]}")
+
+    name = _collector_name(digest)
+    r = session.run_ps(rf"""
+$d = Join-Path $env:TEMP '{_COLLECTOR_DIR}'; $t = Join-Path $d '{tmp_name}'
+if ((Get-FileHash -LiteralPath $t -Algorithm SHA256).Hash -ne '{digest}') {{
+  Remove-Item -LiteralPath $t -Force -ErrorAction SilentlyContinue
+  throw 'collector hash mismatch'
+}}
+Move-Item -LiteralPath $t -Destination (Join-Path $d '{name}') -Force
+Get-ChildItem -LiteralPath $d -Filter 'collect_*.ps1' | Where-Object {{ $_.Name -ne '{name}' }} | Remove-Item -Force -ErrorAction SilentlyContinue
 """)
+    if r.status_code != 0:
+        err = _decode_bytes(r.std_err)
+        raise RuntimeError(f"WinRM collector install error: {err[:500]}")
+    logger.info("Collector %s instalado en %s", digest[:12], session.url)
+
+
+def _run_winrm_inline(
+    creds: RemoteCreds,
+    ps_content: str,
+    hvhost: str,
+    level: str,
+    vm_name: str | None,
+    skip_vhd: bool,
+    skip_measure: bool,
+    skip_kvp: bool,
+) -> str:
+    """
+    Ejecuta el collector instalado en el host (un round trip) y devuelve stdout.
+    Si el host no tiene esa version del script, la sube una vez y reintenta.
+    Si stdout sale vacAo, aquA NO se lee archivo: eso lo maneja run_inventory().
+    """
+    digest = _script_digest(ps_content)
+    vm_arg = ""
+    if vm_name:
+        escaped_vm = vm_name.replace("'", "''")
+        vm_arg = f"-VMName '{escaped_vm}'"
+    flag_args = []
+    if skip_vhd:
+        flag_args.append("-SkipVhd")
+    if skip_measure:
+        flag_args.append("-SkipMeasure")
+    if skip_kvp:
+        flag_args.append("-SkipKvp")
+    flags_str = " ".join(flag_args)
+    run_cmd = rf"""
+$p = Join-Path (Join-Path $env:TEMP '{_COLLECTOR_DIR}') '{_collector_name(digest)}'
+if (-not (Test-Path -LiteralPath $p)) {{ '{_COLLECTOR_MISSING}'; exit 0 }}
+& powershell -NoProfile -ExecutionPolicy Bypass -File $p -HVHost '{hvhost}' -Level '{level}' {vm_arg} {flags_str}
+"""
+    with _pooled_session(creds, job_deadline.budget_timeout(creds.read_timeout)) as session:
+        r = session.run_ps(run_cmd)
+        if _decode_bytes(r.std_out).strip() == _COLLECTOR_MISSING:
+            _upload_collector(session, ps_content, digest)
+            job_deadline.check_deadline()
+            r = session.run_ps(run_cmd)
 
     if r.status_code != 0:
         # Nota: permitimos que siga si stdout trae algo (banner + JSON)
@@ -295,15 +342,18 @@ def run_inventory(
 ) -> List[dict]:
     """
     Ejecuta collect_hyperv_inventory en el host remoto (WinRM) o localmente.
-    Retorna una lista de dicts (cada VM) con el nivel indicado.
+    Retorna una lista de dicts (cada VM) con el nivel indicado. Con level="host"
+    el collector no recorre VMs: devuelve un unico dict con HostInfo, Switches,
+    Cluster y VMCount.
     """
     if TEST_MODE:
         return [{"test_mode": True, "results": []}]
     last_err = None
     level_norm = (level or "summary").lower()
-    sv = skip_vhd if skip_vhd is not None else level_norm == "summary"
-    sm = skip_measure if skip_measure is not None else level_norm == "summary"
-    sk = skip_kvp if skip_kvp is not None else level_norm == "summary"
+    light = level_norm in {"summary", "host"}
+    sv = skip_vhd if skip_vhd is not None else light
+    sm = skip_measure if skip_measure is not None else light
+    sk = skip_kvp if skip_kvp is not None else light
     if os.getenv("HV_DEBUG_VHD") == "1":
         logger.info(
             "HV_DEBUG run_inventory level=%s skip_vhd=%s skip_measure=%s skip_kvp=%s host=%s vm=%s use_winrm=%s",
@@ -322,16 +372,17 @@ def run_inventory(
             if creds.use_winrm:
                 if ps_content is None:
                     raise ValueError("ps_content requerido para WinRM inline")
-                raw = _run_winrm_inline(
-                    creds,
-                    ps_content,
-                    hvhost=creds.host,
-                    level=level_norm,
-                    vm_name=vm_name,
-                    skip_vhd=sv,
-                    skip_measure=sm,
-                    skip_kvp=sk,
-                )
+                with _winrm_limiter(creds.host).slot(timeout=job_deadline.budget_timeout(creds.read_timeout)):
+                    raw = _run_winrm_inline(
+                        creds,
+                        ps_content,
+                        hvhost=creds.host,
+                        level=level_norm,
+                        vm_name=vm_name,
+                        skip_vhd=sv,
+                        skip_measure=sm,
+                        skip_kvp=sk,
+                    )
             else:
                 if not ps_path_local:
                     if ps_content is None:
@@ -343,7 +394,7 @@ def run_inventory(
                     ps_path_local,
                     hvhost=creds.host,
                     level=level_norm,
-                    timeout=creds.read_timeout,
+                    timeout=job_deadline.budget_timeout(creds.read_timeout),
                     vm_name=vm_name,
                     skip_vhd=sv,
                     skip_measure=sm,
@@ -356,36 +407,28 @@ def run_inventory(
             data = _extract_json_list(raw)
 
             # 3) si no hay lista, abrir sesiA3n y probar archivo JSON/CSV remotos
-            if data is None and creds.use_winrm:
-                endpoint = f"{creds.scheme}://{creds.host}:{creds.port}/wsman"
-                op_timeout, read_timeout = _compute_winrm_timeouts(creds.read_timeout)
-                session = winrm.Session(
-                    target=endpoint,
-                    auth=(creds.username or "", creds.password or ""),
-                    transport=creds.transport,
-                    read_timeout_sec=read_timeout,
-                    operation_timeout_sec=op_timeout,
-                )
-
-                # 3.a JSON remoto
-                if creds.json_path:
-                    read_json_cmd = rf"""
+            # (los archivos remotos son inventario de VMs: no aplican al modo host)
+            if data is None and creds.use_winrm and level_norm != "host":
+                with _pooled_session(creds, job_deadline.budget_timeout(creds.read_timeout)) as session:
+                    # 3.a JSON remoto
+                    if creds.json_path:
+                        read_json_cmd = rf"""
 $p = '{creds.json_path}';
 if (Test-Path -LiteralPath $p) {{ Get-Content -LiteralPath $p -Raw }} else {{ '' }}
 """
-                    raw_json = _read_remote_text(session, read_json_cmd)
-                    data = _extract_json_list(raw_json)
+                        raw_json = _read_remote_text(session, read_json_cmd)
+                        data = _extract_json_list(raw_json)
 
-                # 3.b CSV remoto -> JSON si sigue sin datos
-                if data is None and creds.csv_path:
-                    read_csv_cmd = rf"""
+                    # 3.b CSV remoto -> JSON si sigue sin datos
+                    if data is None and creds.csv_path:
+                        read_csv_cmd = rf"""
 $p = '{creds.csv_path}';
 if (Test-Path -LiteralPath $p) {{
   Import-Csv -LiteralPath $p | ConvertTo-Json -Depth 6
 }} else {{ '' }}
 """
-                    raw_csv_json = _read_remote_text(session, read_csv_cmd)
-                    data = _extract_json_list(raw_csv_json)
+                        raw_csv_json = _read_remote_text(session, read_csv_cmd)
+                        data = _extract_json_list(raw_csv_json)
 
             if data is None:
                 snippet = (raw[:300] + "a") if raw else "<vacAo>"
@@ -401,7 +444,7 @@ if (Test-Path -LiteralPath $p) {{
                 attempt + 1, creds.retries + 1, creds.host, str(e)
             )
             if attempt < creds.retries:
-                time.sleep((attempt + 1) * creds.backoff_sec)
+                job_deadline.sleep((attempt + 1) * creds.backoff_sec)
             else:
                 break
 
@@ -456,19 +499,9 @@ try {{
         return (False, "WinRM disabled in test mode")
 
     try:
-        endpoint = f"{creds.scheme}://{creds.host}:{creds.port}/wsman"
-        op_timeout, read_timeout = _compute_winrm_timeouts(
-            creds.read_timeout,
-            cap_operation_timeout_sec=120,
-        )
-        session = winrm.Session(
-            target=endpoint,
-            auth=(creds.username or "", creds.password or ""),
-            transport=creds.transport,
-            read_timeout_sec=read_timeout,
-            operation_timeout_sec=op_timeout,
-        )
-        response = session.run_ps(script)
+        with _winrm_limiter(creds.host).slot(timeout=creds.read_timeout):
+            with _pooled_session(creds, creds.read_timeout, cap_operation_timeout_sec=120) as session:
+                response = session.run_ps(script)
     except Exception as exc:
         logger.error("WinRM power action failure for %s: %s", creds.host, exc)
         return (False, f"WinRM error: {exc}")
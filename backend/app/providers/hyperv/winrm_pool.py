@@ -0,0 +1,315 @@
+"""Pool de shells WinRM abiertos por host.
+
+``winrm.Session.run_ps`` abre y cierra un shell remoto por comando, y cada
+``winrm.Session`` nueva vuelve a autenticar (handshake NTLM/Kerberos en la
+primera request). El pool mantiene por host (endpoint + usuario + transporte)
+hasta ``WINRM_POOL_MAX_PER_HOST`` shells abiertos, cada uno con su propio
+``Protocol`` y su conexión HTTP ya autenticada, y los presta a inventario,
+detail, deep, lecturas de fallback y acciones de energía. Un shell sin uso por
+más de ``WINRM_POOL_IDLE_SECONDS`` se cierra; uno sin uso por más de
+``WINRM_POOL_HEALTH_CHECK_SECONDS`` se prueba con un comando trivial antes de
+prestarlo. Si un comando falla a nivel transporte el shell se descarta.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import winrm
+from winrm.protocol import Protocol
+
+from app.settings import settings
+
+logger = logging.getLogger("hyperv.winrm_pool")
+
+# (endpoint, usuario, transporte): credenciales distintas nunca comparten shell
+PoolKey = Tuple[str, str, str]
+
+_WAIT_SLICE_SECONDS = 0.2
+
+
+class WinRMPoolTimeout(RuntimeError):
+    """Todos los shells del host están prestados y no se liberó ninguno a tiempo."""
+
+
+class _PooledShell:
+    __slots__ = ("key", "protocol", "shell_id", "created_at", "last_used", "uses", "broken")
+
+    def __init__(self, key: PoolKey, protocol, shell_id: str) -> None:
+        self.key = key
+        self.protocol = protocol
+        self.shell_id = shell_id
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+        # un comando que no terminó limpio deja el shell en estado desconocido
+        self.broken = False
+
+
+class PooledSession(winrm.Session):
+    """
+    ``winrm.Session`` sobre un shell prestado: ``run_ps`` (y la limpieza de
+    errores CLIXML) son los de pywinrm, pero ``run_cmd`` no abre ni cierra shell.
+    """
+
+    def __init__(self, pool: "WinRMShellPool", shell: _PooledShell) -> None:
+        # No se llama a Session.__init__: el Protocol ya existe y está autenticado.
+        self.url = shell.key[0]
+        self.protocol = shell.protocol
+        self._pool = pool
+        self._shell = shell
+
+    def run_cmd(self, command: str, args=()) -> winrm.Response:
+        shell_id = self._shell.shell_id
+        self._shell.broken = True
+        command_id = self.protocol.run_command(shell_id, command, args)
+        rs = winrm.Response(self.protocol.get_command_output(shell_id, command_id))
+        self.protocol.cleanup_command(shell_id, command_id)
+        self._shell.broken = False
+        self._shell.uses += 1
+        self._pool._bump("commands")
+        return rs
+
+
+class WinRMShellPool:
+    """Shells abiertos por ``PoolKey`` (LIFO: se presta el más recién usado)."""
+
+    def __init__(
+        self,
+        *,
+        max_per_host: int,
+        idle_seconds: float,
+        health_check_seconds: float,
+        protocol_factory: Optional[Callable[..., Protocol]] = None,
+    ) -> None:
+        self.max_per_host = max(int(max_per_host), 1)
+        self.idle_seconds = max(float(idle_seconds), 1.0)
+        self.health_check_seconds = max(float(health_check_seconds), 0.0)
+        self._protocol_factory = protocol_factory or Protocol
+        self._cv = threading.Condition()
+        self._idle: Dict[PoolKey, List[_PooledShell]] = {}
+        self._open: Dict[PoolKey, int] = {}
+        self._stats = {
+            "handshakes": 0,
+            "reuses": 0,
+            "commands": 0,
+            "expired": 0,
+            "health_failures": 0,
+            "discarded": 0,
+            "waits": 0,
+            "wait_timeouts": 0,
+        }
+
+    def _bump(self, name: str, delta: int = 1) -> None:
+        with self._cv:
+            self._stats[name] += delta
+
+    @contextmanager
+    def session(
+        self,
+        endpoint: str,
+        username: Optional[str],
+        password: Optional[str],
+        transport: str,
+        *,
+        operation_timeout: int,
+        read_timeout: int,
+        wait_timeout: float,
+    ) -> Iterator[PooledSession]:
+        """
+        Presta un shell del host durante el bloque y lo devuelve al pool al salir,
+        salvo que un comando haya fallado a medias (en ese caso se cierra).
+        """
+        key: PoolKey = (endpoint, username or "", transport)
+        shell = self._acquire(key, password or "", wait_timeout, operation_timeout, read_timeout)
+        try:
+            yield PooledSession(self, shell)
+        finally:
+            if shell.broken:
+                self._discard(shell)
+            else:
+                self._release(shell)
+
+    # -- préstamo / devolución -------------------------------------------------
+
+    def _acquire(
+        self, key: PoolKey, password: str, wait_timeout: float, operation_timeout: int, read_timeout: int
+    ) -> _PooledShell:
+        until = time.monotonic() + max(float(wait_timeout), 0.0)
+        shell: Optional[_PooledShell] = None
+        waited = False
+        with self._cv:
+            expired = self._take_expired_locked()
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    shell = idle.pop()
+                    break
+                if self._open.get(key, 0) < self.max_per_host:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    break
+                left = until - time.monotonic()
+                if left <= 0:
+                    self._stats["wait_timeouts"] += 1
+                    raise WinRMPoolTimeout(f"{key[0]}: sin shells WinRM libres ({self.max_per_host} en uso)")
+                if not waited:
+                    waited = True
+                    self._stats["waits"] += 1
+                self._cv.wait(min(_WAIT_SLICE_SECONDS, left))
+        for old in expired:
+            self._close(old)
+
+        if shell is not None and time.monotonic() - shell.last_used > self.health_check_seconds:
+            if not self._healthy(shell):
+                self._bump("health_failures")
+                self._close(shell)
+                shell = None
+        if shell is not None:
+            self._bump("reuses")
+        else:
+            try:
+                shell = self._open_shell(key, password, operation_timeout, read_timeout)
+            except BaseException:
+                self._forget(key)
+                raise
+        self._apply_timeouts(shell, operation_timeout, read_timeout)
+        return shell
+
+    def _release(self, shell: _PooledShell) -> None:
+        shell.last_used = time.monotonic()
+        with self._cv:
+            self._idle.setdefault(shell.key, []).append(shell)
+            self._cv.notify()
+
+    def _discard(self, shell: _PooledShell) -> None:
+        self._bump("discarded")
+        self._close(shell)
+        self._forget(shell.key)
+
+    def _forget(self, key: PoolKey) -> None:
+        with self._cv:
+            left = self._open.get(key, 0) - 1
+            if left > 0:
+                self._open[key] = left
+            else:
+                self._open.pop(key, None)
+            self._cv.notify()
+
+    def _take_expired_locked(self) -> List[_PooledShell]:
+        now = time.monotonic()
+        expired: List[_PooledShell] = []
+        for key in list(self._idle):
+            keep = []
+            for shell in self._idle[key]:
+                (expired if now - shell.last_used > self.idle_seconds else keep).append(shell)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        for shell in expired:
+            left = self._open.get(shell.key, 0) - 1
+            if left > 0:
+                self._open[shell.key] = left
+            else:
+                self._open.pop(shell.key, None)
+        self._stats["expired"] += len(expired)
+        return expired
+
+    # -- shells ------------------------------------------------------------------
+
+    def _open_shell(self, key: PoolKey, password: str, operation_timeout: int, read_timeout: int) -> _PooledShell:
+        endpoint, username, transport = key
+        protocol = self._protocol_factory(
+            endpoint,
+            transport=transport,
+            username=username,
+            password=password,
+            read_timeout_sec=read_timeout,
+            operation_timeout_sec=operation_timeout,
+        )
+        # El host cierra por su cuenta los shells que este proceso deje huérfanos.
+        shell_id = protocol.open_shell(idle_timeout=f"PT{int(self.idle_seconds) + 60}S")
+        self._bump("handshakes")
+        return _PooledShell(key, protocol, shell_id)
+
+    @staticmethod
+    def _apply_timeouts(shell: _PooledShell, operation_timeout: int, read_timeout: int) -> None:
+        """Cada préstamo usa los timeouts del llamador (presupuesto del job incluido)."""
+        protocol = shell.protocol
+        protocol.operation_timeout_sec = operation_timeout
+        protocol.read_timeout_sec = read_timeout
+        transport = getattr(protocol, "transport", None)
+        if transport is not None:
+            transport.read_timeout_sec = read_timeout
+
+    def _healthy(self, shell: _PooledShell) -> bool:
+        protocol = shell.protocol
+        try:
+            command_id = protocol.run_command(shell.shell_id, "hostname")
+            _, _, status = protocol.get_command_output(shell.shell_id, command_id)
+            protocol.cleanup_command(shell.shell_id, command_id)
+        except Exception as exc:
+            logger.info("WinRM shell on %s failed health check: %s", shell.key[0], exc)
+            return False
+        return status == 0
+
+    @staticmethod
+    def _close(shell: _PooledShell) -> None:
+        try:
+            shell.protocol.close_shell(shell.shell_id)
+        except Exception as exc:
+            logger.debug("Failed to close WinRM shell on %s: %s", shell.key[0], exc)
+
+    # -- mantenimiento / observabilidad --------------------------------------------
+
+    def reap(self) -> int:
+        """Cierra los shells vencidos de todos los hosts; devuelve cuántos cerró."""
+        with self._cv:
+            expired = self._take_expired_locked()
+            self._cv.notify_all()
+        for shell in expired:
+            self._close(shell)
+        return len(expired)
+
+    def close_all(self) -> None:
+        """Cierra los shells libres (shutdown); los prestados se cierran al devolverse con error o vencer."""
+        with self._cv:
+            idle = [shell for shells in self._idle.values() for shell in shells]
+            for shell in idle:
+                self._open[shell.key] -= 1
+                if self._open[shell.key] <= 0:
+                    self._open.pop(shell.key, None)
+            self._idle.clear()
+            self._cv.notify_all()
+        for shell in idle:
+            self._close(shell)
+
+    def stats(self) -> Dict[str, object]:
+        with self._cv:
+            hosts = {}
+            for key, count in self._open.items():
+                idle = len(self._idle.get(key, ()))
+                entry = hosts.setdefault(key[0], {"open": 0, "idle": 0, "leased": 0})
+                entry["open"] += count
+                entry["idle"] += idle
+                entry["leased"] += count - idle
+            return {
+                **self._stats,
+                "open_shells": sum(self._open.values()),
+                "idle_shells": sum(len(shells) for shells in self._idle.values()),
+                "max_per_host": self.max_per_host,
+                "idle_seconds": self.idle_seconds,
+                "health_check_seconds": self.health_check_seconds,
+                "hosts": hosts,
+            }
+
+
+winrm_pool = WinRMShellPool(
+    max_per_host=settings.winrm_pool_max_per_host,
+    idle_seconds=settings.winrm_pool_idle_seconds,
+    health_check_seconds=settings.winrm_pool_health_check_seconds,
+)
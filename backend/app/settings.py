@@ -94,6 +94,24 @@ class Settings:
     vcenter_host: Optional[str]
     vcenter_user: Optional[str]
     vcenter_pass: Optional[str]
+    vcenter_http_pool_size: int
+    vcenter_keepalive_seconds: int
+    job_engine_workers: int
+    snapshot_write_behind_seconds: float
+    events_queue_size: int
+    events_heartbeat_seconds: float
+    leader_election_enabled: bool
+    leader_election_retry_seconds: float
+    leader_lock_file: Optional[str]
+    leader_follower_snapshot_ttl_seconds: float
+    shared_snapshot_dir: Optional[str]
+    adaptive_concurrency_enabled: bool
+    adaptive_concurrency_max: int
+    adaptive_latency_tolerance: float
+    adaptive_history_size: int
+    winrm_pool_max_per_host: int
+    winrm_pool_idle_seconds: float
+    winrm_pool_health_check_seconds: float
     vmware_job_max_global: int
     vmware_job_max_per_scope: int
     vmware_job_host_timeout: int
@@ -102,6 +120,16 @@ class Settings:
     vmware_hosts_job_host_timeout: int
     vmware_hosts_job_max_duration: int
     vmware_hosts_refresh_interval_minutes: int
+    vmware_inventory_engine: str
+    vmware_bulk_page_size: int
+    vmware_change_feed_enabled: bool
+    vmware_change_feed_reconcile_minutes: int
+    vmware_perf_sampler_enabled: bool
+    vmware_perf_sampler_interval_seconds: int
+    vmware_perf_history_minutes: int
+    vmware_perf_available_ttl_seconds: int
+    vmware_static_attrs_ttl_minutes: int
+    vmware_volatile_refresh_minutes: int
 
     # Cedia
     cedia_base: Optional[str]
@@ -134,6 +162,8 @@ class Settings:
     hyperv_inventory_backoff_sec: float
     hyperv_power_read_timeout: int
     hyperv_detail_timeout: int
+    hyperv_batch_window_ms: int
+    hyperv_batch_max_vms: int
     hyperv_refresh_interval_minutes: int
 
     # Notifications
@@ -226,6 +256,13 @@ def _build_settings() -> Settings:
 
     warmup_enabled = _as_bool_default_true(os.getenv("WARMUP_ENABLED"), name="WARMUP_ENABLED")
 
+    vmware_inventory_engine = (os.getenv("VMWARE_INVENTORY_ENGINE") or "bulk").strip().lower()
+    if vmware_inventory_engine not in {"bulk", "rest"}:
+        logger.warning(
+            "Invalid VMWARE_INVENTORY_ENGINE=%r; falling back to 'bulk'", vmware_inventory_engine
+        )
+        vmware_inventory_engine = "bulk"
+
     overrides = None
     if not testing and not test_mode:
         try:
@@ -261,6 +298,30 @@ def _build_settings() -> Settings:
         vcenter_host=vcenter_host,
         vcenter_user=vcenter_user,
         vcenter_pass=vcenter_pass,
+        vcenter_http_pool_size=max(_as_int(os.getenv("VCENTER_HTTP_POOL_SIZE"), 20), 1),
+        vcenter_keepalive_seconds=max(_as_int(os.getenv("VCENTER_KEEPALIVE_SECONDS"), 600), 0),
+        job_engine_workers=max(_as_int(os.getenv("JOB_ENGINE_WORKERS"), 8), 1),
+        snapshot_write_behind_seconds=max(_as_float(os.getenv("SNAPSHOT_WRITE_BEHIND_SECONDS"), 2.0), 0.0),
+        events_queue_size=max(_as_int(os.getenv("EVENTS_QUEUE_SIZE"), 256), 1),
+        events_heartbeat_seconds=max(_as_float(os.getenv("EVENTS_HEARTBEAT_SECONDS"), 15.0), 1.0),
+        leader_election_enabled=_as_bool_default_true(
+            os.getenv("LEADER_ELECTION_ENABLED"), name="LEADER_ELECTION_ENABLED"
+        ),
+        leader_election_retry_seconds=max(_as_float(os.getenv("LEADER_ELECTION_RETRY_SECONDS"), 10.0), 1.0),
+        leader_lock_file=(os.getenv("LEADER_LOCK_FILE") or "").strip() or None,
+        leader_follower_snapshot_ttl_seconds=max(
+            _as_float(os.getenv("LEADER_FOLLOWER_SNAPSHOT_TTL_SECONDS"), 15.0), 1.0
+        ),
+        shared_snapshot_dir=(os.getenv("SHARED_SNAPSHOT_DIR") or "").strip() or None,
+        adaptive_concurrency_enabled=_as_bool_default_true(
+            os.getenv("ADAPTIVE_CONCURRENCY_ENABLED"), name="ADAPTIVE_CONCURRENCY_ENABLED"
+        ),
+        adaptive_concurrency_max=max(_as_int(os.getenv("ADAPTIVE_CONCURRENCY_MAX"), 16), 1),
+        adaptive_latency_tolerance=max(_as_float(os.getenv("ADAPTIVE_LATENCY_TOLERANCE"), 2.0), 1.1),
+        adaptive_history_size=max(_as_int(os.getenv("ADAPTIVE_HISTORY_SIZE"), 120), 1),
+        winrm_pool_max_per_host=max(_as_int(os.getenv("WINRM_POOL_MAX_PER_HOST"), 4), 1),
+        winrm_pool_idle_seconds=max(_as_float(os.getenv("WINRM_POOL_IDLE_SECONDS"), 300.0), 1.0),
+        winrm_pool_health_check_seconds=max(_as_float(os.getenv("WINRM_POOL_HEALTH_CHECK_SECONDS"), 60.0), 0.0),
         vmware_job_max_global=_as_int(os.getenv("VMWARE_JOB_MAX_GLOBAL"), 4),
         vmware_job_max_per_scope=_as_int(os.getenv("VMWARE_JOB_MAX_PER_SCOPE"), 2),
         vmware_job_host_timeout=_as_int(os.getenv("VMWARE_JOB_HOST_TIMEOUT"), 150),
@@ -296,6 +357,22 @@ def _build_settings() -> Settings:
                 10,
             )
         ),
+        vmware_inventory_engine=vmware_inventory_engine,
+        vmware_bulk_page_size=max(_as_int(os.getenv("VMWARE_BULK_PAGE_SIZE"), 500), 1),
+        vmware_change_feed_enabled=_as_bool(os.getenv("VMWARE_CHANGE_FEED_ENABLED")),
+        vmware_change_feed_reconcile_minutes=max(
+            _as_int(os.getenv("VMWARE_CHANGE_FEED_RECONCILE_MINUTES"), 24 * 60), 10
+        ),
+        vmware_perf_sampler_enabled=_as_bool(os.getenv("VMWARE_PERF_SAMPLER_ENABLED")),
+        vmware_perf_sampler_interval_seconds=max(
+            _as_int(os.getenv("VMWARE_PERF_SAMPLER_INTERVAL_SECONDS"), 60), 20
+        ),
+        vmware_perf_history_minutes=max(_as_int(os.getenv("VMWARE_PERF_HISTORY_MINUTES"), 60), 5),
+        vmware_perf_available_ttl_seconds=max(
+            _as_int(os.getenv("VMWARE_PERF_AVAILABLE_TTL_SECONDS"), 1800), 60
+        ),
+        vmware_static_attrs_ttl_minutes=max(_as_int(os.getenv("VMWARE_STATIC_ATTRS_TTL_MINUTES"), 24 * 60), 10),
+        vmware_volatile_refresh_minutes=max(_as_int(os.getenv("VMWARE_VOLATILE_REFRESH_MINUTES"), 5), 0),
         cedia_base=cedia_base,
         cedia_user=cedia_user,
         cedia_pass=cedia_pass,
@@ -333,6 +410,8 @@ def _build_settings() -> Settings:
         hyperv_inventory_backoff_sec=_as_float(os.getenv("HYPERV_INVENTORY_BACKOFF_SEC"), 1.5),
         hyperv_power_read_timeout=_as_int(os.getenv("HYPERV_POWER_READ_TIMEOUT"), 60),
         hyperv_detail_timeout=_as_int(os.getenv("HYPERV_DETAIL_TIMEOUT"), 300),
+        hyperv_batch_window_ms=max(_as_int(os.getenv("HYPERV_BATCH_WINDOW_MS"), 150), 0),
+        hyperv_batch_max_vms=max(_as_int(os.getenv("HYPERV_BATCH_MAX_VMS"), 50), 1),
         hyperv_refresh_interval_minutes=(
             max(
                 int(overrides.get("hyperv_refresh_interval_minutes")), 10
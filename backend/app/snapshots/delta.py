@@ -0,0 +1,153 @@
+"""Change log acotado por snapshot para servir ``?since=<version>``.
+
+Los ``SnapshotStore`` registran qué hosts (o qué VMs de un host, en el change
+feed VMware) cambiaron en cada versión. ``build_delta`` arma, a partir del
+snapshot publicado (inmutable) y de las entradas posteriores a ``since``, la
+respuesta con solo lo agregado/cambiado/eliminado. Si ``since`` quedó fuera del
+log (eviccion, reinicio, snapshot reemplazado) el store devuelve None y el
+endpoint responde el payload completo.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+MAX_CHANGES_PER_SNAPSHOT = 2048
+
+
+@dataclass(frozen=True)
+class SnapshotChange:
+    version: int
+    host: str
+    kind: str  # host | vms | removed
+    upserted: Tuple[str, ...] = ()
+    removed: Tuple[str, ...] = ()
+
+
+class SnapshotChangeLog:
+    """Log por scope_key; no es thread-safe, se usa bajo el lock del store."""
+
+    def __init__(self, *, max_entries: int = MAX_CHANGES_PER_SNAPSHOT) -> None:
+        self._max_entries = max(int(max_entries), 1)
+        self._logs: Dict[Hashable, Deque[SnapshotChange]] = {}
+        # Version desde la cual el log esta completo (since >= floor es servible).
+        self._floors: Dict[Hashable, int] = {}
+
+    def reset(self, key: Hashable, version: int) -> None:
+        self._logs[key] = deque()
+        self._floors[key] = version
+
+    def discard(self, key: Hashable) -> None:
+        self._logs.pop(key, None)
+        self._floors.pop(key, None)
+
+    def _append(self, key: Hashable, change: SnapshotChange) -> None:
+        log = self._logs.get(key)
+        if log is None:
+            self.reset(key, change.version - 1)
+            log = self._logs[key]
+        if len(log) >= self._max_entries:
+            self._floors[key] = log.popleft().version
+        log.append(change)
+
+    def record_host(self, key: Hashable, version: int, host: str) -> None:
+        self._append(key, SnapshotChange(version=version, host=host, kind="host"))
+
+    def record_removed(self, key: Hashable, version: int, host: str) -> None:
+        self._append(key, SnapshotChange(version=version, host=host, kind="removed"))
+
+    def record_vms(
+        self,
+        key: Hashable,
+        version: int,
+        host: str,
+        *,
+        upserted: Iterable[str] = (),
+        removed: Iterable[str] = (),
+    ) -> None:
+        self._append(
+            key,
+            SnapshotChange(
+                version=version,
+                host=host,
+                kind="vms",
+                upserted=tuple(upserted),
+                removed=tuple(removed),
+            ),
+        )
+
+    def since(self, key: Hashable, since: int, current: int) -> Optional[List[SnapshotChange]]:
+        floor = self._floors.get(key)
+        if floor is None or since < floor or since > current:
+            return None
+        return [change for change in self._logs.get(key) or () if change.version > since]
+
+
+def _host_key(value) -> str:
+    return str(value or "").strip().lower()
+
+
+def _item_host(item) -> str:
+    if isinstance(item, dict):
+        return _host_key(item.get("host") or item.get("name"))
+    return _host_key(getattr(item, "host", None) or getattr(item, "name", None))
+
+
+def build_delta(snapshot, changes: List[SnapshotChange], since: int) -> dict:
+    """Respuesta delta: cabecera completa + ``changed``/``removed``/``vm_changes``."""
+    full_hosts: Set[str] = set()
+    removed_hosts: Set[str] = set()
+    vm_sets: Dict[str, Tuple[Set[str], Set[str]]] = {}
+    for change in changes:
+        if change.kind == "removed":
+            removed_hosts.add(change.host)
+            full_hosts.discard(change.host)
+            vm_sets.pop(change.host, None)
+        elif change.kind == "host":
+            full_hosts.add(change.host)
+            removed_hosts.discard(change.host)
+            vm_sets.pop(change.host, None)
+        elif change.host not in full_hosts:
+            upserted, removed = vm_sets.setdefault(change.host, (set(), set()))
+            upserted.update(change.upserted)
+            upserted.difference_update(change.removed)
+            removed.update(change.removed)
+            removed.difference_update(change.upserted)
+
+    data = snapshot.data
+    changed: Dict[str, object] = {}
+    vm_changes: Dict[str, dict] = {}
+    if isinstance(data, dict):
+        for host in full_hosts:
+            if host in data:
+                changed[host] = data[host]
+            else:
+                removed_hosts.add(host)
+        for host, (upserted, removed) in vm_sets.items():
+            vm_changes[host] = {
+                "upserted": [vm for vm in data.get(host) or [] if vm.get("id") in upserted],
+                "removed": sorted(removed),
+            }
+    elif isinstance(data, list):
+        by_host = {_item_host(item): item for item in data}
+        for host in full_hosts:
+            item = by_host.get(_host_key(host))
+            if item is not None:
+                changed[host] = item
+
+    header = jsonable_encoder(snapshot, exclude={"data"})
+    header.update(
+        {
+            "source": "memory",
+            "mode": "delta",
+            "since": since,
+            "changed": jsonable_encoder(changed),
+            "removed": sorted(removed_hosts),
+            "vm_changes": jsonable_encoder(vm_changes),
+        }
+    )
+    return header
@@ -0,0 +1,150 @@
+"""Snapshot responses serialized once per version.
+
+Each published snapshot version is encoded to JSON bytes (plus gzip and, when
+the ``brotli`` package is installed, br variants) the first time it is
+requested and tagged with a strong ETag derived from its version. Polls that
+send ``If-None-Match`` with the current tag get a bodyless 304, the rest get
+the cached bytes without running pydantic serialization again.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_MIN_COMPRESS_BYTES = 1024
+_MAX_ENTRIES = 64
+
+
+@dataclass(frozen=True)
+class EncodedSnapshot:
+    etag: str
+    body: bytes
+    variants: Dict[str, bytes]
+
+
+def snapshot_etag(provider: str, key: Hashable, snapshot) -> str:
+    """ETag fuerte: version + generated_at (la version se reinicia al reiniciar el proceso)."""
+    generated_at = getattr(snapshot, "generated_at", None)
+    raw = "|".join(
+        (
+            provider,
+            repr(key),
+            str(getattr(snapshot, "version", 0)),
+            generated_at.isoformat() if generated_at else "",
+            str(getattr(snapshot, "source", "") or ""),
+        )
+    )
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24] + '"'
+
+
+def _encode(snapshot) -> bytes:
+    if hasattr(snapshot, "model_dump_json"):
+        return snapshot.model_dump_json().encode("utf-8")
+    return snapshot.json().encode("utf-8")
+
+
+def _variants(body: bytes) -> Dict[str, bytes]:
+    if len(body) < _MIN_COMPRESS_BYTES:
+        return {}
+    variants = {"gzip": gzip.compress(body, compresslevel=6)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=5)
+    return variants
+
+
+def _accepted_encodings(header: Optional[str]) -> set:
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in {"q=0", "q=0.0"}:
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = {tag.strip() for tag in header.split(",")}
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+
+
+def encoded_response(request: Request, entry: EncodedSnapshot) -> Response:
+    """304 si el ETag coincide; si no, el cuerpo (o la variante comprimida aceptada) tal cual."""
+    headers = _headers(entry.etag)
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    accepted = _accepted_encodings(request.headers.get("accept-encoding"))
+    for encoding in ("br", "gzip"):
+        if encoding in accepted and encoding in entry.variants:
+            headers["Content-Encoding"] = encoding
+            return Response(content=entry.variants[encoding], media_type="application/json", headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+class EncodedSnapshotCache:
+    """Ultima version codificada por (provider, scope_key)."""
+
+    def __init__(self, *, max_entries: int = _MAX_ENTRIES) -> None:
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, Hashable], EncodedSnapshot]" = OrderedDict()
+        self._stats = {"encodes": 0, "hits": 0, "not_modified": 0}
+
+    def get(self, provider: str, key: Hashable, snapshot) -> EncodedSnapshot:
+        etag = snapshot_etag(provider, key, snapshot)
+        cache_key = (provider, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry.etag == etag:
+                self._entries.move_to_end(cache_key)
+                self._stats["hits"] += 1
+                return entry
+        body = _encode(snapshot)
+        entry = EncodedSnapshot(etag=etag, body=body, variants=_variants(body))
+        with self._lock:
+            self._stats["encodes"] += 1
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def response(self, request: Request, provider: str, key: Hashable, snapshot) -> Response:
+        """200 con los bytes cacheados (comprimidos si el cliente acepta) o 304 si el ETag coincide."""
+        etag = snapshot_etag(provider, key, snapshot)
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            with self._lock:
+                self._stats["not_modified"] += 1
+            return Response(status_code=304, headers=_headers(etag))
+        return encoded_response(request, self.get(provider, key, snapshot))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
+
+
+def delta_response(delta: dict) -> Response:
+    """Respuesta ``?since=``: solo los cambios, sin cache (la URL cambia con cada version)."""
+    return JSONResponse(delta, headers={"Cache-Control": "no-store"})
+
+
+encoded_snapshots = EncodedSnapshotCache()
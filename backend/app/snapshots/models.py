@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Optional
 
 from sqlalchemy import Column, JSON, UniqueConstraint
 from sqlmodel import Field, SQLModel
@@ -25,3 +25,28 @@ class SnapshotRecord(SQLModel, table=True):
     payload: dict = Field(sa_column=Column(JSON(none_as_null=True), nullable=False))
     created_at: datetime = Field(default_factory=utcnow, nullable=False)
     updated_at: datetime = Field(default_factory=utcnow, nullable=False)
+
+
+class SnapshotFragmentRecord(SQLModel, table=True):
+    """Fragmento por host de un snapshot; la fila de ``snapshots`` queda como cabecera."""
+
+    __tablename__ = "snapshot_fragments"
+    __table_args__ = (
+        UniqueConstraint(
+            "provider",
+            "scope",
+            "hosts_key",
+            "level",
+            "host",
+            name="uq_snapshot_fragments_provider_scope_hosts_level_host",
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    provider: str = Field(index=True)
+    scope: str = Field(index=True)
+    hosts_key: str = Field(index=True)
+    level: str = Field(index=True)
+    host: str = Field(index=True)
+    payload: Any = Field(default=None, sa_column=Column(JSON(none_as_null=True), nullable=True))
+    updated_at: datetime = Field(default_factory=utcnow, nullable=False)
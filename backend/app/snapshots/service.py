@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Dict, Iterable, Optional
 
 from sqlmodel import Session, select
 
-from app.snapshots.models import SnapshotRecord
+from app.snapshots.models import SnapshotFragmentRecord, SnapshotRecord
+
+# Claves de la cabecera cuando ``data`` vive en ``snapshot_fragments``.
+FRAGMENTS_KEY = "_fragments"
+FRAGMENT_FORMAT_KEY = "_fragment_format"
+LIST_FRAGMENT = "*"
 
 
 def make_hosts_key(hosts: list[str]) -> str:
@@ -64,4 +69,85 @@ def get_snapshot(
     ).first()
     if record is None:
         return None
-    return record.payload
+    payload = record.payload
+    if not isinstance(payload, dict) or FRAGMENT_FORMAT_KEY not in payload:
+        return payload
+    return _assemble_fragments(session, record, payload)
+
+
+def _fragments_query(provider: str, scope: str, hosts_key: str, level: str):
+    return select(SnapshotFragmentRecord).where(
+        SnapshotFragmentRecord.provider == provider,
+        SnapshotFragmentRecord.scope == scope,
+        SnapshotFragmentRecord.hosts_key == hosts_key,
+        SnapshotFragmentRecord.level == level,
+    )
+
+
+def _assemble_fragments(session: Session, record: SnapshotRecord, header: dict) -> dict:
+    by_host = {
+        row.host: row.payload
+        for row in session.exec(_fragments_query(record.provider, record.scope, record.hosts_key, record.level))
+    }
+    payload = {key: value for key, value in header.items() if key not in {FRAGMENTS_KEY, FRAGMENT_FORMAT_KEY}}
+    if header[FRAGMENT_FORMAT_KEY] == "list":
+        payload["data"] = by_host.get(LIST_FRAGMENT) or []
+    elif header[FRAGMENT_FORMAT_KEY] == "items":
+        # listas fragmentadas por item; la cabecera guarda el orden
+        payload["data"] = [by_host[key] for key in header.get(FRAGMENTS_KEY) or [] if key in by_host]
+    else:
+        payload["data"] = {host: by_host[host] for host in header.get(FRAGMENTS_KEY) or [] if host in by_host}
+    return payload
+
+
+def upsert_snapshot_fragments(
+    session: Session,
+    provider: str,
+    scope: str,
+    hosts_key: str,
+    level: str,
+    header: dict,
+    fragments: Dict[str, object],
+    *,
+    prune: bool = False,
+) -> None:
+    """
+    Escribe la cabecera (fila de ``snapshots`` sin ``data``) y solo los
+    fragmentos recibidos. Con ``prune`` borra los fragmentos que ya no figuran
+    en la cabecera.
+    """
+    upsert_snapshot(session, provider, scope, hosts_key, level, header)
+    now = datetime.now(timezone.utc)
+    query = _fragments_query(provider, scope, hosts_key, level)
+    existing = {}
+    if fragments:
+        existing = {
+            row.host: row
+            for row in session.exec(query.where(SnapshotFragmentRecord.host.in_(list(fragments))))
+        }
+    for host, data in fragments.items():
+        row = existing.get(host)
+        if row is None:
+            row = SnapshotFragmentRecord(
+                provider=provider,
+                scope=scope,
+                hosts_key=hosts_key,
+                level=level,
+                host=host,
+                payload=data,
+                updated_at=now,
+            )
+        else:
+            row.payload = data
+            row.updated_at = now
+        session.add(row)
+    if prune:
+        keep = list(_header_hosts(header))
+        for row in session.exec(query.where(SnapshotFragmentRecord.host.notin_(keep))):
+            session.delete(row)
+
+
+def _header_hosts(header: dict) -> Iterable[str]:
+    if header.get(FRAGMENT_FORMAT_KEY) == "list":
+        return [LIST_FRAGMENT]
+    return header.get(FRAGMENTS_KEY) or []
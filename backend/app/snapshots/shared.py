@@ -0,0 +1,185 @@
+"""Snapshots compartidos entre workers vía archivos mapeados en memoria.
+
+El proceso líder (el que recolecta) publica cada versión como un blob inmutable
+(cabecera + JSON + variantes comprimidas) en ``SHARED_SNAPSHOT_DIR``,
+idealmente un tmpfs como ``/dev/shm``. Se escribe a un temporal y se hace
+``os.replace``: los lectores que ya tenían mapeada la versión anterior la
+siguen viendo completa. Los demás workers mapean el archivo con ``mmap`` y
+sirven el memoryview directo, así que todos comparten las mismas páginas y la
+memoria no crece con la cantidad de workers.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.jobs.leader import leader_elector
+from app.settings import settings
+from app.snapshots.encoded import EncodedSnapshot, _encode, _variants, encoded_response, snapshot_etag
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"VMSS"
+_LAYOUT = 1
+# magic | layout | reservado | version | etag | len(body) | len(gzip) | len(br)
+_HEADER = struct.Struct("<4sHHQ32sQQQ")
+
+# (provider, scope, hosts_key, level), igual que la clave del SnapshotWriter
+SharedKey = Tuple[str, str, str, str]
+
+
+def shared_key(provider: str, scope_key) -> SharedKey:
+    from app.snapshots.service import make_hosts_key
+
+    scope = scope_key.scope
+    return (
+        provider,
+        scope.value if hasattr(scope, "value") else str(scope),
+        make_hosts_key(list(scope_key.hosts)),
+        scope_key.level,
+    )
+
+
+def _pack(version: int, entry: EncodedSnapshot) -> bytes:
+    gzip_body = entry.variants.get("gzip", b"")
+    br_body = entry.variants.get("br", b"")
+    header = _HEADER.pack(
+        _MAGIC,
+        _LAYOUT,
+        0,
+        int(version or 0),
+        entry.etag.encode("ascii"),
+        len(entry.body),
+        len(gzip_body),
+        len(br_body),
+    )
+    return b"".join((header, entry.body, gzip_body, br_body))
+
+
+def _unpack(buffer: memoryview) -> Optional[Tuple[int, EncodedSnapshot]]:
+    if len(buffer) < _HEADER.size:
+        return None
+    magic, layout, _, version, etag, body_len, gzip_len, br_len = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC or layout != _LAYOUT or _HEADER.size + body_len + gzip_len + br_len > len(buffer):
+        return None
+    offset = _HEADER.size
+    body = buffer[offset : offset + body_len]
+    offset += body_len
+    variants = {}
+    if gzip_len:
+        variants["gzip"] = buffer[offset : offset + gzip_len]
+    offset += gzip_len
+    if br_len:
+        variants["br"] = buffer[offset : offset + br_len]
+    return version, EncodedSnapshot(etag=etag.rstrip(b"\0").decode("ascii"), body=body, variants=variants)
+
+
+class SharedSnapshotSegment:
+    """Un archivo por snapshot; el líder escribe, el resto mapea y sirve."""
+
+    def __init__(self, directory: Optional[str]) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        # path -> ((inode, mtime_ns, size), version, entry)
+        self._mapped: Dict[str, Tuple[Tuple[int, int, int], int, EncodedSnapshot]] = {}
+        self._stats = {"published": 0, "hits": 0, "maps": 0, "misses": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, key: SharedKey) -> str:
+        digest = hashlib.sha1("|".join(key).encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.directory, f"{key[0]}-{digest}.snap")
+
+    def publish(self, key: SharedKey, snapshot) -> None:
+        shared = snapshot.model_copy(update={"source": "shared"})
+        body = _encode(shared)
+        entry = EncodedSnapshot(etag=snapshot_etag(key[0], key, shared), body=body, variants=_variants(body))
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(tmp_path, "wb") as fh:
+            fh.write(_pack(getattr(snapshot, "version", 0), entry))
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._stats["published"] += 1
+
+    def publish_batch(self, batch: Iterable[Tuple[SharedKey, object]]) -> None:
+        for key, snapshot in batch:
+            try:
+                self.publish(key, snapshot)
+            except Exception as exc:
+                with self._lock:
+                    self._stats["errors"] += 1
+                logger.warning("Failed to publish shared snapshot %s: %s", key, exc)
+
+    def read(self, key: SharedKey) -> Optional[Tuple[int, EncodedSnapshot]]:
+        """(version, bytes codificados) de la última versión publicada, o None."""
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._mapped.get(path)
+            if cached is not None and cached[0] == signature:
+                self._stats["hits"] += 1
+                return cached[1], cached[2]
+        try:
+            with open(path, "rb") as fh:
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as exc:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.warning("Failed to map shared snapshot %s: %s", path, exc)
+            return None
+        unpacked = _unpack(memoryview(mapped))
+        if unpacked is None:
+            with self._lock:
+                self._stats["errors"] += 1
+            return None
+        # No se cierra el mmap anterior: puede haber respuestas en curso usando su
+        # memoryview; se libera solo cuando deja de estar referenciado.
+        with self._lock:
+            self._stats["maps"] += 1
+            self._mapped[path] = (signature, unpacked[0], unpacked[1])
+        return unpacked
+
+    def response(self, request: Request, provider: str, scope_key) -> Optional[Response]:
+        """Respuesta desde el blob compartido en workers no líderes; None = usar el store local."""
+        if not self.enabled:
+            return None
+        if leader_elector.is_leader:
+            return None
+        found = self.read(shared_key(provider, scope_key))
+        if found is None:
+            return None
+        return encoded_response(request, found[1])
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {**self._stats, "enabled": self.enabled, "mapped": len(self._mapped)}
+
+
+shared_snapshots = SharedSnapshotSegment(settings.shared_snapshot_dir)
+
+
+def publish_shared(batch: Dict[Hashable, Tuple[object, object]]) -> None:
+    """Hook del SnapshotWriter: publica la última versión de cada clave escrita (solo el líder)."""
+    if not shared_snapshots.enabled:
+        return
+    if not leader_elector.is_leader:
+        return
+    shared_snapshots.publish_batch((key, snapshot) for key, (snapshot, _changed) in batch.items())
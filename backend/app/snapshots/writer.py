@@ -0,0 +1,227 @@
+"""Write-behind de snapshots: cabecera + fragmentos por host.
+
+Los ``SnapshotStore`` encolan el snapshot publicado (inmutable) junto con los
+hosts que cambiaron; un hilo de fondo espera ``delay_seconds`` para juntar las
+actualizaciones repetidas de la misma clave y luego serializa y escribe solo
+esos fragmentos en una única transacción. Si la escritura falla, el lote vuelve
+a la cola y se reintenta en la siguiente vuelta.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from app.settings import settings
+from app.snapshots.service import FRAGMENT_FORMAT_KEY, FRAGMENTS_KEY, LIST_FRAGMENT
+
+logger = logging.getLogger(__name__)
+
+# (provider, scope, hosts_key, level)
+SnapshotKey = Tuple[str, str, str, str]
+# snapshot publicado + hosts modificados (None = todos)
+PendingWrite = Tuple[object, Optional[Set[str]]]
+
+
+def _union_changed(previous: Optional[Set[str]], hosts: Optional[Set[str]]) -> Optional[Set[str]]:
+    if previous is None or hosts is None:
+        return None
+    return previous | hosts
+
+
+def _list_item_key(item) -> Optional[str]:
+    for attr in ("host", "name", "id"):
+        value = item.get(attr) if isinstance(item, dict) else getattr(item, attr, None)
+        if value not in (None, ""):
+            return str(value).strip().lower()
+    return None
+
+
+def snapshot_fragments(snapshot, changed: Optional[Iterable[str]] = None) -> Tuple[dict, Dict[str, object]]:
+    """
+    Divide ``snapshot`` en cabecera (sin ``data``) y fragmentos serializados de los hosts cambiados.
+    Las listas se fragmentan por item (``host``/``name``/``id``) y el orden queda en la cabecera;
+    si algún item no tiene clave única se guardan como un solo fragmento.
+    """
+    header = jsonable_encoder(snapshot, exclude={"data"})
+    data = getattr(snapshot, "data", None)
+    if isinstance(data, dict):
+        header[FRAGMENT_FORMAT_KEY] = "dict"
+        header[FRAGMENTS_KEY] = list(data)
+        hosts = list(data) if changed is None else [host for host in changed if host in data]
+        return header, {host: jsonable_encoder(data[host]) for host in hosts}
+    if isinstance(data, list):
+        keys = [_list_item_key(item) for item in data]
+        if None in keys or len(set(keys)) != len(keys):
+            header[FRAGMENT_FORMAT_KEY] = "list"
+            header[FRAGMENTS_KEY] = [LIST_FRAGMENT]
+            return header, {LIST_FRAGMENT: jsonable_encoder(data)}
+        header[FRAGMENT_FORMAT_KEY] = "items"
+        header[FRAGMENTS_KEY] = keys
+        wanted = None if changed is None else {str(host).strip().lower() for host in changed}
+        if wanted is not None and not wanted <= set(keys):
+            # un host cambiado ya no está (o no coincide con la clave): se reescribe todo
+            wanted = None
+        return header, {
+            key: jsonable_encoder(item) for key, item in zip(keys, data) if wanted is None or key in wanted
+        }
+    header["data"] = jsonable_encoder(data)
+    return header, {}
+
+
+def _write_batch(batch: Dict[SnapshotKey, PendingWrite]) -> None:
+    from sqlmodel import Session
+
+    from app.db import get_engine
+    from app.snapshots.service import upsert_snapshot, upsert_snapshot_fragments
+
+    with Session(get_engine()) as session:
+        try:
+            for (provider, scope, hosts_key, level), (snapshot, changed) in batch.items():
+                header, fragments = snapshot_fragments(snapshot, changed)
+                if FRAGMENT_FORMAT_KEY not in header:
+                    upsert_snapshot(session, provider, scope, hosts_key, level, header)
+                    continue
+                upsert_snapshot_fragments(
+                    session,
+                    provider,
+                    scope,
+                    hosts_key,
+                    level,
+                    header,
+                    fragments,
+                    prune=changed is None or len(fragments) == len(header[FRAGMENTS_KEY]),
+                )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+
+class SnapshotWriter:
+    """Cola de escrituras coalescidas por clave de snapshot."""
+
+    def __init__(
+        self,
+        *,
+        delay_seconds: float,
+        sink: Optional[Callable[[Dict[SnapshotKey, PendingWrite]], None]] = None,
+    ) -> None:
+        self._delay = max(float(delay_seconds), 0.0)
+        self._sink = sink or _write_batch
+        self._cv = threading.Condition()
+        self._pending: Dict[SnapshotKey, PendingWrite] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+        self._flush_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "coalesced": 0, "flushes": 0, "written": 0, "errors": 0}
+        self.last_error: Optional[str] = None
+
+    def enqueue(
+        self,
+        provider: str,
+        scope: str,
+        hosts_key: str,
+        level: str,
+        snapshot,
+        *,
+        changed: Optional[Iterable[str]] = None,
+    ) -> None:
+        key = (provider, scope, hosts_key, level)
+        hosts = None if changed is None else set(changed)
+        with self._cv:
+            self._stats["enqueued"] += 1
+            previous = self._pending.get(key)
+            if previous is not None:
+                self._stats["coalesced"] += 1
+                hosts = _union_changed(previous[1], hosts)
+            self._pending[key] = (snapshot, hosts)
+            if self._delay > 0 and not self._stop:
+                self._ensure_thread_locked()
+                self._cv.notify()
+                return
+        self.flush()
+
+    def _ensure_thread_locked(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cv:
+                while not self._pending and not self._stop:
+                    self._cv.wait()
+                if self._stop:
+                    return
+            # Ventana de coalescencia: las escrituras que lleguen mientras tanto se fusionan.
+            time.sleep(self._delay)
+            self.flush()
+
+    def flush(self) -> int:
+        """Escribe lo pendiente ahora mismo. Devuelve cuantos snapshots se escribieron."""
+        with self._flush_lock:
+            with self._cv:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            self._publish_shared(batch)
+            try:
+                self._sink(batch)
+            except Exception as exc:
+                self.last_error = str(exc)
+                with self._cv:
+                    self._stats["errors"] += 1
+                    self._requeue_locked(batch)
+                logger.exception("Failed to persist %d snapshot(s), will retry: %s", len(batch), exc)
+                return 0
+            with self._cv:
+                self._stats["flushes"] += 1
+                self._stats["written"] += len(batch)
+            return len(batch)
+
+    def _requeue_locked(self, batch: Dict[SnapshotKey, PendingWrite]) -> None:
+        # El lote fallido vuelve a la cola; si llegó un snapshot más nuevo para la
+        # misma clave se conserva ese, pero con la unión de los hosts por escribir.
+        for key, (snapshot, changed) in batch.items():
+            newer = self._pending.get(key)
+            if newer is None:
+                self._pending[key] = (snapshot, changed)
+            else:
+                self._pending[key] = (newer[0], _union_changed(changed, newer[1]))
+        if self._delay > 0 and not self._stop:
+            self._ensure_thread_locked()
+            self._cv.notify()
+
+    @staticmethod
+    def _publish_shared(batch: Dict[SnapshotKey, PendingWrite]) -> None:
+        # Blob compartido para los demás workers; independiente del resultado en la DB.
+        try:
+            from app.snapshots.shared import publish_shared
+
+            publish_shared(batch)
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.warning("Failed to publish shared snapshots: %s", exc)
+
+    def stop(self) -> None:
+        with self._cv:
+            self._stop = True
+            self._cv.notify_all()
+        self.flush()
+
+    def stats(self) -> Dict[str, object]:
+        with self._cv:
+            return {
+                **self._stats,
+                "pending": len(self._pending),
+                "delay_seconds": self._delay,
+                "last_error": self.last_error,
+            }
+
+
+snapshot_writer = SnapshotWriter(delay_seconds=settings.snapshot_write_behind_seconds)
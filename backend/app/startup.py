@@ -102,6 +102,182 @@ def _is_production_env() -> bool:
     return _app_env() in {"prod", "production"}
 
 
+def _register_job_providers() -> None:
+    """Registra los proveedores en el job engine para atender refresh on-demand."""
+    try:
+        from app.vms.hyperv_router import _kick_scheduler as _kick_hyperv_scheduler
+        from app.vms.vmware_router import _kick_scheduler as _kick_vmware_scheduler
+        from app.hosts.vmware_host_snapshot_router import _kick_scheduler as _kick_vmware_hosts_scheduler
+        from app.cedia.cedia_snapshot_router import _kick_scheduler as _kick_cedia_scheduler
+
+        _kick_hyperv_scheduler()
+        _kick_vmware_scheduler()
+        _kick_vmware_hosts_scheduler()
+        _kick_cedia_scheduler()
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to register job engine providers: %s", exc)
+
+
+def _start_background_collection(app: FastAPI) -> None:
+    """Warmups, change feed, perf sampler y scan de notificaciones (solo en el líder)."""
+    scheduler_enabled = settings.notif_sched_enabled
+    notification_scheduler = None
+    if scheduler_enabled:
+        try:
+            from app.notifications.scheduler import create_scheduler, schedule_scan_job
+
+            notification_scheduler = create_scheduler()
+            schedule_scan_job(notification_scheduler)
+            notification_scheduler.start()
+            logger.info(
+                "Notification scheduler started (dev_minutes=%s)",
+                settings.notif_sched_dev_minutes,
+            )
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.exception("Failed to start notification scheduler: %s", exc)
+            notification_scheduler = None
+    else:
+        logger.info("Notification scheduler disabled via NOTIF_SCHED_ENABLED")
+
+    app.state.notification_scheduler = notification_scheduler
+
+    logger.info(f"Warmup enabled: {settings.warmup_enabled}")
+    # ── Hyper-V warmup ──
+    try:
+        from app.vms.hyperv_router import _kick_warmup
+
+        if settings.warmup_enabled:
+            if not settings.hyperv_configured:
+                logger.info(
+                    "Warmup skipped for hyperv: not configured missing=%s",
+                    settings.hyperv_missing_envs or [],
+                )
+            elif settings.hyperv_enabled:
+                _kick_warmup()
+                logger.info("Hyper-V warmup scheduled on startup")
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to start Hyper-V warmup: %s", exc)
+    # ── VMware warmup ──
+    try:
+        from app.vms.vmware_router import _kick_warmup as _kick_vmware_warmup
+
+        if settings.warmup_enabled:
+            if not settings.vmware_configured:
+                logger.info(
+                    "Warmup skipped for vmware: not configured missing=%s",
+                    settings.vmware_missing_envs or [],
+                )
+            elif settings.vmware_enabled:
+                _kick_vmware_warmup()
+                logger.info("VMware warmup scheduled on startup")
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to start VMware warmup: %s", exc)
+    # ── VMware change feed ──
+    if settings.vmware_change_feed_enabled and settings.vmware_enabled and settings.vmware_configured:
+        try:
+            from app.vms.vmware_router import _start_change_feed
+
+            _start_change_feed()
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.exception("Failed to start VMware change feed: %s", exc)
+    # ── VMware perf sampler ──
+    if settings.vmware_perf_sampler_enabled and settings.vmware_enabled and settings.vmware_configured:
+        try:
+            from app.vms.vm_perf_service import start_perf_sampler
+
+            start_perf_sampler()
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.exception("Failed to start VMware perf sampler: %s", exc)
+    # ── VMware hosts warmup ──
+    try:
+        from app.hosts.vmware_host_snapshot_router import _kick_warmup as _kick_vmware_hosts_warmup
+
+        if settings.warmup_enabled:
+            if not settings.vmware_configured:
+                logger.info(
+                    "Warmup skipped for vmware-hosts: not configured missing=%s",
+                    settings.vmware_missing_envs or [],
+                )
+            elif settings.vmware_enabled:
+                _kick_vmware_hosts_warmup()
+                logger.info("VMware hosts warmup scheduled on startup")
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to start VMware hosts warmup: %s", exc)
+    # ── Cedia warmup ──
+    try:
+        from app.cedia.cedia_snapshot_router import _kick_warmup as _kick_cedia_warmup
+
+        if settings.warmup_enabled:
+            if not settings.cedia_configured:
+                logger.info(
+                    "Warmup skipped for cedia: not configured missing=%s",
+                    settings.cedia_missing_envs or [],
+                )
+            elif settings.cedia_enabled:
+                _kick_cedia_warmup()
+                logger.info("Cedia warmup scheduled on startup")
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to start Cedia warmup: %s", exc)
+
+
+def _stop_background_collection(app: FastAPI) -> None:
+    """Detiene lo que arrancó ``_start_background_collection`` (shutdown o pérdida del liderazgo)."""
+    scheduler = getattr(app.state, "notification_scheduler", None)
+    app.state.notification_scheduler = None
+    if scheduler is not None:
+        try:
+            scheduler.shutdown(wait=False)
+            logger.info("Notification scheduler stopped")
+        except Exception:  # pragma: no cover - defensive
+            logger.exception("Failed to stop notification scheduler")
+    # ── Hyper-V warmup stop ──
+    try:
+        from app.vms.hyperv_router import _stop_warmup
+
+        _stop_warmup()
+        logger.info("Hyper-V warmup stopped")
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to stop Hyper-V warmup: %s", exc)
+    # ── VMware warmup stop ──
+    try:
+        from app.vms.vmware_router import _stop_warmup as _stop_vmware_warmup
+
+        _stop_vmware_warmup()
+        logger.info("VMware warmup stopped")
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to stop VMware warmup: %s", exc)
+    # ── VMware change feed stop ──
+    try:
+        from app.vms.vmware_router import _stop_change_feed
+
+        _stop_change_feed()
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to stop VMware change feed: %s", exc)
+    # ── VMware perf sampler stop ──
+    try:
+        from app.vms.vm_perf_service import stop_perf_sampler
+
+        stop_perf_sampler()
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to stop VMware perf sampler: %s", exc)
+    # ── VMware hosts warmup stop ──
+    try:
+        from app.hosts.vmware_host_snapshot_router import _stop_warmup as _stop_vmware_hosts_warmup
+
+        _stop_vmware_hosts_warmup()
+        logger.info("VMware hosts warmup stopped")
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to stop VMware hosts warmup: %s", exc)
+    # ── Cedia warmup stop ──
+    try:
+        from app.cedia.cedia_snapshot_router import _stop_warmup as _stop_cedia_warmup
+
+        _stop_cedia_warmup()
+        logger.info("Cedia warmup stopped")
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.exception("Failed to stop Cedia warmup: %s", exc)
+
+
 def register_startup_events(app: FastAPI) -> None:
     """Attach startup hooks that validate configuration and warm system components."""
 
@@ -151,96 +327,29 @@ def register_startup_events(app: FastAPI) -> None:
             diagnostics.env_issues.extend(vc_issues)
             logger.error("vCenter configuration issues: %s", vc_issues)
 
-        scheduler_enabled = settings.notif_sched_enabled
-        notification_scheduler = None
-        if scheduler_enabled:
+        app.state.notification_scheduler = None
+        app.state.startup_diagnostics = diagnostics
+
+        # ── Job engine providers (solo el líder corre jobs; los seguidores rechazan el refresh) ──
+        _register_job_providers()
+        # ── Background collection: solo el líder ──
+        if settings.leader_election_enabled:
             try:
-                from app.notifications.scheduler import create_scheduler, schedule_scan_job
+                from app.jobs.leader import build_leader_lock, leader_elector
 
-                notification_scheduler = create_scheduler()
-                schedule_scan_job(notification_scheduler)
-                notification_scheduler.start()
-                logger.info(
-                    "Notification scheduler started (dev_minutes=%s)",
-                    settings.notif_sched_dev_minutes,
+                leader_elector.start(
+                    build_leader_lock(get_engine(), settings.leader_lock_file),
+                    retry_seconds=settings.leader_election_retry_seconds,
+                    on_elected=lambda: _start_background_collection(app),
+                    on_demoted=lambda: _stop_background_collection(app),
                 )
+                if not leader_elector.is_leader:
+                    logger.info("Leader election: follower; serving persisted snapshots")
             except Exception as exc:  # pragma: no cover - defensive
-                logger.exception("Failed to start notification scheduler: %s", exc)
-                notification_scheduler = None
+                logger.exception("Leader election failed to start, running as leader: %s", exc)
+                _start_background_collection(app)
         else:
-            logger.info("Notification scheduler disabled via NOTIF_SCHED_ENABLED")
-
-        app.state.notification_scheduler = notification_scheduler
-        app.state.startup_diagnostics = diagnostics
-
-        logger.info(f"Warmup enabled: {settings.warmup_enabled}")
-        # ── Hyper-V warmup ──
-        try:
-            from app.vms.hyperv_router import _kick_scheduler, _kick_warmup
-
-            _kick_scheduler()
-            if settings.warmup_enabled:
-                if not settings.hyperv_configured:
-                    logger.info(
-                        "Warmup skipped for hyperv: not configured missing=%s",
-                        settings.hyperv_missing_envs or [],
-                    )
-                elif settings.hyperv_enabled:
-                    _kick_warmup()
-                    logger.info("Hyper-V warmup scheduled on startup")
-        except Exception as exc:  # pragma: no cover - defensive
-            logger.exception("Failed to start Hyper-V warmup: %s", exc)
-        # ── VMware warmup ──
-        try:
-            from app.vms.vmware_router import _kick_scheduler as _kick_vmware_scheduler, _kick_warmup as _kick_vmware_warmup
-
-            _kick_vmware_scheduler()
-            if settings.warmup_enabled:
-                if not settings.vmware_configured:
-                    logger.info(
-                        "Warmup skipped for vmware: not configured missing=%s",
-                        settings.vmware_missing_envs or [],
-                    )
-                elif settings.vmware_enabled:
-                    _kick_vmware_warmup()
-                    logger.info("VMware warmup scheduled on startup")
-        except Exception as exc:  # pragma: no cover - defensive
-            logger.exception("Failed to start VMware warmup: %s", exc)
-        # ── VMware hosts warmup ──
-        try:
-            from app.hosts.vmware_host_snapshot_router import (
-                _kick_scheduler as _kick_vmware_hosts_scheduler,
-                _kick_warmup as _kick_vmware_hosts_warmup,
-            )
-
-            _kick_vmware_hosts_scheduler()
-            if settings.warmup_enabled:
-                if not settings.vmware_configured:
-                    logger.info(
-                        "Warmup skipped for vmware-hosts: not configured missing=%s",
-                        settings.vmware_missing_envs or [],
-                    )
-                elif settings.vmware_enabled:
-                    _kick_vmware_hosts_warmup()
-                    logger.info("VMware hosts warmup scheduled on startup")
-        except Exception as exc:  # pragma: no cover - defensive
-            logger.exception("Failed to start VMware hosts warmup: %s", exc)
-        # ── Cedia warmup ──
-        try:
-            from app.cedia.cedia_snapshot_router import _kick_scheduler as _kick_cedia_scheduler, _kick_warmup as _kick_cedia_warmup
-
-            _kick_cedia_scheduler()
-            if settings.warmup_enabled:
-                if not settings.cedia_configured:
-                    logger.info(
-                        "Warmup skipped for cedia: not configured missing=%s",
-                        settings.cedia_missing_envs or [],
-                    )
-                elif settings.cedia_enabled:
-                    _kick_cedia_warmup()
-                    logger.info("Cedia warmup scheduled on startup")
-        except Exception as exc:  # pragma: no cover - defensive
-            logger.exception("Failed to start Cedia warmup: %s", exc)
+            _start_background_collection(app)
 
         # ── Startup config logging (no secrets) ──
         logger.info(
@@ -281,42 +390,40 @@ def register_startup_events(app: FastAPI) -> None:
     async def on_shutdown() -> None:
         if TEST_MODE:
             return
-        scheduler = getattr(app.state, "notification_scheduler", None)
-        if scheduler is not None:
-            try:
-                scheduler.shutdown(wait=False)
-                logger.info("Notification scheduler stopped")
-            except Exception:  # pragma: no cover - defensive
-                logger.exception("Failed to stop notification scheduler")
-        # ── Hyper-V warmup stop ──
+        _stop_background_collection(app)
+        # ── Job engine stop ──
+        try:
+            from app.jobs.engine import job_engine
+
+            job_engine.stop()
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.exception("Failed to stop job engine: %s", exc)
+        # ── Snapshot write-behind flush ──
         try:
-            from app.vms.hyperv_router import _stop_warmup
+            from app.snapshots.writer import snapshot_writer
 
-            _stop_warmup()
-            logger.info("Hyper-V warmup stopped")
+            snapshot_writer.stop()
         except Exception as exc:  # pragma: no cover - defensive
-            logger.exception("Failed to stop Hyper-V warmup: %s", exc)
-        # ── VMware warmup stop ──
+            logger.exception("Failed to flush snapshot writer: %s", exc)
+        # ── Leader lock release (después del flush, para que el siguiente líder vea todo) ──
         try:
-            from app.vms.vmware_router import _stop_warmup as _stop_vmware_warmup
+            from app.jobs.leader import leader_elector
 
-            _stop_vmware_warmup()
-            logger.info("VMware warmup stopped")
+            leader_elector.stop()
         except Exception as exc:  # pragma: no cover - defensive
-            logger.exception("Failed to stop VMware warmup: %s", exc)
-        # ── VMware hosts warmup stop ──
+            logger.exception("Failed to release leader lock: %s", exc)
+        # ── WinRM shells abiertos (Hyper-V) ──
         try:
-            from app.hosts.vmware_host_snapshot_router import _stop_warmup as _stop_vmware_hosts_warmup
+            from app.providers.hyperv.winrm_pool import winrm_pool
 
-            _stop_vmware_hosts_warmup()
-            logger.info("VMware hosts warmup stopped")
+            winrm_pool.close_all()
         except Exception as exc:  # pragma: no cover - defensive
-            logger.exception("Failed to stop VMware hosts warmup: %s", exc)
-        # ── Cedia warmup stop ──
+            logger.exception("Failed to close WinRM shell pool: %s", exc)
+        # ── vCenter shared session logout ──
         try:
-            from app.cedia.cedia_snapshot_router import _stop_warmup as _stop_cedia_warmup
+            from app.vms.vm_service import vcenter_sessions
 
-            _stop_cedia_warmup()
-            logger.info("Cedia warmup stopped")
+            vcenter_sessions.close()
+            logger.info("vCenter shared session closed")
         except Exception as exc:  # pragma: no cover - defensive
-            logger.exception("Failed to stop Cedia warmup: %s", exc)
+            logger.exception("Failed to close vCenter session: %s", exc)
@@ -0,0 +1,126 @@
+"""Agrupa pedidos detail/deep de VMs de un mismo host en una sola corrida del colector.
+
+El primer pedido para (host, nivel, refresh) abre un batch y espera
+``HYPERV_BATCH_WINDOW_MS``; los pedidos que llegan mientras tanto se suman al
+mismo batch. Al cerrar la ventana (o al llegar a ``HYPERV_BATCH_MAX_VMS``) ese
+primer pedido corre el colector una vez con todas las VMs (``-VMName a,b,c``)
+y reparte el resultado entre los que esperaban.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+BatchKey = Tuple[str, str, bool]  # (host, nivel, refresh)
+# runner(host, level, vm_names, refresh) -> {vm_name: record | None}
+BatchRunner = Callable[[str, str, List[str], bool], Dict[str, Optional[object]]]
+# lookup(host, level, vm_names) -> {vm_name: record} solo con lo que ya está en cache
+CacheLookup = Callable[[str, str, List[str]], Dict[str, object]]
+
+
+class _Batch:
+    __slots__ = ("names", "full", "done", "results", "error")
+
+    def __init__(self) -> None:
+        self.names: Dict[str, None] = {}  # ordenado y sin duplicados
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results: Dict[str, Optional[object]] = {}
+        self.error: Optional[BaseException] = None
+
+
+class VMBatchCoalescer:
+    """Un batch abierto por (host, nivel, refresh); quien lo abre lo corre."""
+
+    def __init__(
+        self,
+        runner: BatchRunner,
+        *,
+        window_seconds: float,
+        max_vms: int,
+        lookup: Optional[CacheLookup] = None,
+    ) -> None:
+        self._runner = runner
+        self._lookup = lookup
+        self.window_seconds = max(float(window_seconds), 0.0)
+        self.max_vms = max(int(max_vms), 1)
+        self._lock = threading.Lock()
+        self._open: Dict[BatchKey, _Batch] = {}
+        self._stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "batches": 0, "vms_collected": 0, "errors": 0}
+
+    def fetch(
+        self,
+        host: str,
+        level: str,
+        vm_names: Iterable[str],
+        *,
+        refresh: bool = False,
+    ) -> Dict[str, Optional[object]]:
+        """
+        Registros de ``vm_names`` (None si el host no tiene esa VM). Lo que no está
+        en cache se suma al batch abierto del host o abre uno nuevo.
+        """
+        host_key = (host or "").strip().lower()
+        names = list(dict.fromkeys(n for n in vm_names if n))
+        results: Dict[str, Optional[object]] = {}
+        if not refresh and self._lookup is not None and names:
+            results.update(self._lookup(host_key, level, names))
+            names = [n for n in names if n not in results]
+        key: BatchKey = (host_key, level, refresh)
+
+        joined: List[_Batch] = []
+        leading: List[_Batch] = []
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["cache_hits"] += len(results)
+            for name in names:
+                batch = self._open.get(key)
+                if batch is None:
+                    batch = _Batch()
+                    self._open[key] = batch
+                    leading.append(batch)
+                elif batch not in leading and batch not in joined:
+                    self._stats["coalesced"] += 1
+                batch.names[name] = None
+                if len(batch.names) >= self.max_vms:
+                    batch.full.set()
+                    del self._open[key]
+                if batch not in joined:
+                    joined.append(batch)
+
+        for batch in leading:
+            self._run(key, batch)
+        for batch in joined:
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+            results.update({name: batch.results.get(name) for name in names if name in batch.names})
+        return results
+
+    def _run(self, key: BatchKey, batch: _Batch) -> None:
+        batch.full.wait(self.window_seconds)
+        with self._lock:
+            if self._open.get(key) is batch:
+                del self._open[key]
+            names = list(batch.names)
+            self._stats["batches"] += 1
+            self._stats["vms_collected"] += len(names)
+        try:
+            batch.results = self._runner(key[0], key[1], names, key[2])
+        except BaseException as exc:
+            batch.error = exc
+            with self._lock:
+                self._stats["errors"] += 1
+        finally:
+            batch.done.set()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                **self._stats,
+                "open_batches": len(self._open),
+                "window_ms": int(self.window_seconds * 1000),
+                "max_vms": self.max_vms,
+            }
+
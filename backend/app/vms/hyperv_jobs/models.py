@@ -119,6 +119,23 @@ class SnapshotPayload(BaseModel):
     hosts_status: Dict[str, SnapshotHostStatus] = Field(default_factory=dict)
     summary: Dict[str, int] = Field(default_factory=dict)
     data: object = None  # Sera dict host -> lista VM o lista de hosts
+    version: int = 0  # se incrementa en cada upsert
 
     def copy(self) -> "SnapshotPayload":
         return copy.deepcopy(self)
+
+    def fork(self) -> "SnapshotPayload":
+        """Copia superficial para copy-on-write: contenedores nuevos, data por host compartida."""
+        data = self.data
+        if isinstance(data, dict):
+            data = dict(data)
+        elif isinstance(data, list):
+            data = list(data)
+        return self.model_copy(
+            update={
+                "hosts": list(self.hosts),
+                "hosts_status": dict(self.hosts_status),
+                "summary": dict(self.summary),
+                "data": data,
+            }
+        )
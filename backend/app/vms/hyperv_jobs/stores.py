@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import copy
-import json
 import logging
 import threading
+import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional, Tuple
 
-from fastapi.encoders import jsonable_encoder
+from app.events.hub import publish_job, publish_snapshot
+from app.jobs.leader import leader_elector
+from app.settings import settings
+from app.snapshots.delta import SnapshotChangeLog, build_delta
 
 from .models import (
     HostJobState,
@@ -106,7 +109,10 @@ class JobStore:
     """
     Guarda estados de jobs en memoria con dedupe por ScopeKey.
     Implementa eviccion basica por max items y edad.
+    Copy-on-write: cada escritura publica un JobStatus nuevo y los lectores
+    reciben el objeto publicado sin copiarlo (tratarlo como solo lectura).
     """
+    _EVENTS_PROVIDER = "hyperv"
 
     def __init__(self) -> None:
         self._lock = threading.RLock()
@@ -144,11 +150,7 @@ class JobStore:
 
     def get(self, job_id: str) -> Optional[JobStatus]:
         with self._lock:
-            job = self._jobs.get(job_id)
-            if not job:
-                return None
-            self._recompute_progress(job)
-            return job.copy()
+            return self._jobs.get(job_id)
 
     def get_active_for_scope(self, scope_key: ScopeKey) -> Optional[JobStatus]:
         with self._lock:
@@ -160,8 +162,7 @@ class JobStore:
                 self._scope_index.pop(scope_key, None)
                 return None
             if job.status in {"pending", "running"}:
-                self._recompute_progress(job)
-                return job.copy()
+                return job
             self._scope_index.pop(scope_key, None)
             return None
 
@@ -179,54 +180,69 @@ class JobStore:
             self._recompute_progress(job)
             self._jobs[job.job_id] = job
             self._scope_index[scope_key] = job.job_id
-            return job.copy()
+        publish_job(self._EVENTS_PROVIDER, job)
+        return job
 
     def set_job(self, job: JobStatus) -> JobStatus:
+        job = job.copy()
+        self._recompute_progress(job)
         with self._lock:
             self._jobs[job.job_id] = job
-            self._recompute_progress(job)
-            return job.copy()
+        publish_job(self._EVENTS_PROVIDER, job)
+        return job
 
     def update_job(self, job_id: str, mutator) -> Optional[JobStatus]:
         """
-        mutator recibe el JobStatus y puede mutarlo in-place. Devuelve copia del resultado.
+        mutator recibe una copia privada del JobStatus y puede mutarla in-place;
+        la version publicada no se toca. Devuelve el nuevo JobStatus (solo lectura).
         """
         with self._lock:
-            job = self._jobs.get(job_id)
-            if job is None:
+            current = self._jobs.get(job_id)
+            if current is None:
                 return None
+            job = current.copy()
             mutator(job)
             self._recompute_progress(job)
             self._jobs[job_id] = job
-            return job.copy()
+        publish_job(self._EVENTS_PROVIDER, job)
+        return job
 
     def list_jobs_by_status(self, statuses: set[str]) -> list[JobStatus]:
         with self._lock:
-            results = [job.copy() for job in self._jobs.values() if job.status in statuses]
-        for job in results:
-            self._recompute_progress(job)
-        return results
+            return [job for job in self._jobs.values() if job.status in statuses]
 
     def mark_scope_finished(self, scope_key: ScopeKey, job: JobStatus) -> None:
+        published = None
         with self._lock:
             stored = self._jobs.get(job.job_id)
             if stored and stored.status in {"pending", "running"}:
+                job = job.copy()
+                self._recompute_progress(job)
                 self._jobs[job.job_id] = job
+                published = job
             if scope_key in self._scope_index and self._scope_index[scope_key] == job.job_id:
                 self._scope_index.pop(scope_key, None)
-            self._recompute_progress(job)
+        if published is not None:
+            publish_job(self._EVENTS_PROVIDER, published)
 
 
 class SnapshotStore:
     """
     Guarda snapshots in-memory (no dispara WinRM).
     Permite upsert por host para no perder data previa.
+    Los snapshots publicados son inmutables: cada escritura arma un objeto nuevo
+    (``SnapshotPayload.fork``) que comparte la data de los hosts sin cambios, y
+    los lectores reciben el objeto publicado sin deepcopy.
     """
     _PROVIDER = "hyperv"
+    _EVENTS_PROVIDER = "hyperv"
 
     def __init__(self) -> None:
         self._lock = threading.RLock()
         self._snapshots: Dict[ScopeKey, SnapshotPayload] = {}
+        self._changes = SnapshotChangeLog()
+        # scope -> (term de liderazgo, monotonic) de la última revalidación contra la DB
+        self._db_checked_at: Dict[ScopeKey, Tuple[int, float]] = {}
 
     @staticmethod
     def _normalize_host_key(value: Optional[str]) -> Optional[str]:
@@ -265,6 +281,8 @@ class SnapshotStore:
         for key, snap in list(self._snapshots.items()):
             if snap.generated_at < cutoff:
                 self._snapshots.pop(key, None)
+                self._changes.discard(key)
+                self._db_checked_at.pop(key, None)
 
     def init_snapshot(self, scope_key: ScopeKey) -> SnapshotPayload:
         snap = SnapshotPayload(
@@ -281,7 +299,8 @@ class SnapshotStore:
         with self._lock:
             self._prune_locked()
             self._snapshots[scope_key] = snap
-            result = snap.copy()
+            self._changes.reset(scope_key, snap.version)
+            result = snap
         self._persist_snapshot(scope_key, result)
         return result
 
@@ -289,13 +308,6 @@ class SnapshotStore:
         scope = scope_key.scope
         return scope.value if hasattr(scope, "value") else str(scope)
 
-    def _snapshot_to_payload(self, snapshot: SnapshotPayload) -> dict:
-        if hasattr(snapshot, "model_dump"):
-            return snapshot.model_dump(mode="json")
-        if hasattr(snapshot, "json"):
-            return json.loads(snapshot.json())
-        return jsonable_encoder(snapshot)
-
     def _payload_to_snapshot(self, payload: dict) -> SnapshotPayload:
         if hasattr(SnapshotPayload, "model_validate"):
             snapshot = SnapshotPayload.model_validate(payload)
@@ -305,44 +317,28 @@ class SnapshotStore:
             snapshot.data = self._dedupe_hosts_list(snapshot.data)
         return snapshot
 
-    def _persist_snapshot(self, scope_key: ScopeKey, snapshot: SnapshotPayload) -> None:
-        scope_value = self._scope_value(scope_key)
-        hosts_key = None
-        session = None
-        try:
-            from app.db import get_engine
-            from sqlmodel import Session
-            from app.snapshots.service import upsert_snapshot, make_hosts_key
-
-            payload = self._snapshot_to_payload(snapshot)
-            hosts_key = make_hosts_key(list(scope_key.hosts))
-            session = Session(get_engine())
-            upsert_snapshot(
-                session,
-                provider=self._PROVIDER,
-                scope=scope_value,
-                hosts_key=hosts_key,
-                level=scope_key.level,
-                payload=payload,
-            )
-            session.commit()
-        except Exception as exc:
-            if session is not None:
-                try:
-                    session.rollback()
-                except Exception:
-                    pass
-            logger.exception(
-                "Failed to persist Hyper-V snapshot provider=%s scope=%s hosts_key=%s level=%s: %s",
-                self._PROVIDER,
-                scope_value,
-                hosts_key,
-                scope_key.level,
-                exc,
-            )
-        finally:
-            if session is not None:
-                session.close()
+    def _persist_snapshot(
+        self,
+        scope_key: ScopeKey,
+        snapshot: SnapshotPayload,
+        *,
+        changed: Optional[Iterable[str]] = None,
+    ) -> None:
+        """Encola la escritura (cabecera + fragmentos de ``changed``; None = todos)."""
+        from app.snapshots.service import make_hosts_key
+        from app.snapshots.writer import snapshot_writer
+
+        scope = self._scope_value(scope_key)
+        hosts_key = make_hosts_key(list(scope_key.hosts))
+        snapshot_writer.enqueue(
+            self._PROVIDER,
+            scope,
+            hosts_key,
+            scope_key.level,
+            snapshot,
+            changed=changed,
+        )
+        publish_snapshot(self._EVENTS_PROVIDER, snapshot, scope=scope, hosts_key=hosts_key, level=scope_key.level)
 
     def set_snapshot(self, scope_key: ScopeKey, snapshot: SnapshotPayload) -> SnapshotPayload:
         payload = snapshot.copy()
@@ -350,7 +346,8 @@ class SnapshotStore:
         with self._lock:
             self._prune_locked()
             self._snapshots[scope_key] = payload
-            result = payload.copy()
+            self._changes.reset(scope_key, payload.version)
+            result = payload
         self._persist_snapshot(scope_key, result)
         return result
 
@@ -381,6 +378,8 @@ class SnapshotStore:
                     data={} if scope_key.scope == ScopeName.VMS else [],
                     summary={},
                 )
+            else:
+                snap = snap.fork()
             snap.generated_at = generated_at or datetime.utcnow()
             if scope_key.scope == ScopeName.VMS:
                 if not isinstance(snap.data, dict):
@@ -413,18 +412,43 @@ class SnapshotStore:
                 snap.stale = stale
             if stale_reason is not None:
                 snap.stale_reason = stale_reason
+            snap.version += 1
             self._snapshots[scope_key] = snap
-            result = snap.copy()
-        self._persist_snapshot(scope_key, result)
+            self._changes.record_host(scope_key, snap.version, host)
+            result = snap
+        self._persist_snapshot(scope_key, result, changed=[host])
         return result
 
+    def get_delta(self, scope_key: ScopeKey, since: int) -> Optional[dict]:
+        """Cambios posteriores a la version ``since``; None si hay que enviar el snapshot completo."""
+        with self._lock:
+            snap = self._snapshots.get(scope_key)
+            if snap is None:
+                return None
+            changes = self._changes.since(scope_key, since, snap.version)
+        if changes is None:
+            return None
+        return build_delta(snap, changes, since)
+
+    def _db_recheck_due_locked(self, scope_key: ScopeKey) -> bool:
+        """
+        En una replica seguidora el lider escribe en la DB: revalidar cada N segundos.
+        El lider revalida una vez por term: la memoria puede venir de cuando era seguidor.
+        """
+        now = time.monotonic()
+        term = leader_elector.term
+        checked = self._db_checked_at.get(scope_key)
+        if checked is not None and checked[0] == term:
+            if leader_elector.is_leader or now - checked[1] < settings.leader_follower_snapshot_ttl_seconds:
+                return False
+        self._db_checked_at[scope_key] = (term, now)
+        return True
+
     def get_snapshot(self, scope_key: ScopeKey) -> Optional[SnapshotPayload]:
         with self._lock:
             snap = self._snapshots.get(scope_key)
-            if snap:
-                result = snap.copy()
-                result.source = "memory"
-                return result
+            if snap and not self._db_recheck_due_locked(scope_key):
+                return snap.model_copy(update={"source": "memory"})
 
         try:
             from app.db import get_engine
@@ -442,14 +466,21 @@ class SnapshotStore:
                     level=scope_key.level,
                 )
             if payload is None:
-                return None
+                return snap.model_copy(update={"source": "memory"}) if snap else None
             snapshot = self._payload_to_snapshot(payload)
             with self._lock:
+                current = self._snapshots.get(scope_key)
+                # ``version`` es por proceso (se reinicia con el worker): se compara generated_at.
+                if current is not None and current.generated_at >= snapshot.generated_at:
+                    # Escrituras locales aun no persistidas: la memoria es igual o mas nueva.
+                    return current.model_copy(update={"source": "memory"})
+                if current is not None and snapshot.version <= current.version:
+                    # La version local sigue siendo monotona para ETags y deltas.
+                    snapshot.version = current.version + 1
                 self._prune_locked()
                 self._snapshots[scope_key] = snapshot
-                result = snapshot.copy()
-                result.source = "db"
-                return result
+                self._changes.reset(scope_key, snapshot.version)
+                return snapshot.model_copy(update={"source": "db"})
         except Exception as exc:
             logger.exception("Failed to load Hyper-V snapshot from DB: %s", exc)
-            return None
+            return snap.model_copy(update={"source": "memory"}) if snap else None
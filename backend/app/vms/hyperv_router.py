@@ -7,7 +7,6 @@ from concurrent.futures import ThreadPoolExecutor, as_completed, Future, Timeout
 from datetime import datetime, timedelta
 from pathlib import Path as FsPath
 import threading
-import time
 from typing import List, Optional, Dict
 
 from cachetools import TTLCache
@@ -22,7 +21,14 @@ from app.dependencies import require_permission, get_current_user
 from app.permissions.models import PermissionCode
 from app.providers.hyperv.remote import RemoteCreds, run_power_action
 from app.providers.hyperv.schema import VMRecord, VMRecordDetail, VMRecordSummary, VMRecordDeep
-from app.vms.hyperv_service import collect_hyperv_inventory_for_host, collect_hyperv_host_info
+from app.vms.hyperv_batcher import VMBatchCoalescer
+from app.vms.hyperv_service import (
+    cached_vm_records,
+    collect_hyperv_host_info,
+    collect_hyperv_inventory_for_host,
+    collect_hyperv_vms_batch,
+    highest_level,
+)
 from app.vms.hyperv_host_models import HyperVHostSummary
 from app.vms.hyperv_power_service import hyperv_power_action
 from app.vms.hyperv_jobs import (
@@ -38,6 +44,22 @@ from app.vms.hyperv_jobs import (
     SnapshotPayload,
     SnapshotStore,
 )
+from app.jobs.adaptive import LimiterTimeout, host_collection_limiter
+from app.jobs.deadline import (
+    ACTIVE_STATUSES,
+    CANCELLED_STATUS,
+    Deadline,
+    DeadlineExceeded,
+    JobCancelled,
+    job_cancellations,
+    request_cancel,
+    run_with_deadline,
+    start_job,
+)
+from app.jobs.engine import job_engine
+from app.jobs.leader import ensure_leader, leader_elector
+from app.snapshots.encoded import delta_response, encoded_snapshots
+from app.snapshots.shared import shared_snapshots
 from app.settings import settings
 
 router = APIRouter(prefix="/api/hyperv", tags=["hyperv"])
@@ -50,15 +72,12 @@ _SNAPSHOT_STORE = SnapshotStore()
 _HEALTH_STORE = HostHealthStore()
 _GLOBAL_HOST_LOCKS: Dict[str, threading.RLock] = {}
 _GLOBAL_LOCKS_LOCK = threading.RLock()
-_GLOBAL_CONCURRENCY = threading.Semaphore(settings.hyperv_job_max_global)
 MAX_CONCURRENCY_PER_SCOPE = settings.hyperv_job_max_per_scope
+_HOST_LIMITER = host_collection_limiter("hyperv", MAX_CONCURRENCY_PER_SCOPE)
 HOST_TIMEOUT_SECONDS = settings.hyperv_job_host_timeout
 JOB_MAX_DURATION_SECONDS = settings.hyperv_job_max_duration
-_SCHEDULER_CV = threading.Condition()
-_SCHEDULER_STARTED = False
-_SCHEDULER_STOP = False
 _WARMUP_STARTED = False
-_WARMUP_STOP = False
+_WARMUP_STOP = threading.Event()
 _LAST_VMS_HOSTS: List[str] = []
 
 
@@ -249,20 +268,25 @@ def _get_host_lock(host: str) -> threading.RLock:
 
 
 def _kick_scheduler() -> None:
-    global _SCHEDULER_STARTED
-    with _SCHEDULER_CV:
-        if not _SCHEDULER_STARTED:
-            t = threading.Thread(target=_scheduler_loop, name="hyperv-job-scheduler", daemon=True)
-            t.start()
-            _SCHEDULER_STARTED = True
-        _SCHEDULER_CV.notify_all()
+    # En un seguidor los jobs quedan pendientes: los corre el líder (ver ensure_leader).
+    if not leader_elector.is_leader:
+        return
+    job_engine.register(
+        "hyperv",
+        runner=_run_job,
+        pending=lambda: _JOB_STORE.list_jobs_by_status({"pending"}),
+        max_concurrency=settings.hyperv_job_max_global,
+    )
+    job_engine.kick("hyperv")
 
 
 def _kick_warmup() -> None:
-    global _WARMUP_STARTED
+    global _WARMUP_STARTED, _WARMUP_STOP
     if _WARMUP_STARTED:
         return
-    t = threading.Thread(target=_warmup_loop, name="hyperv-warmup", daemon=True)
+    # Evento nuevo por arranque: un loop detenido (p.ej. al perder el liderazgo) no revive.
+    _WARMUP_STOP = threading.Event()
+    t = threading.Thread(target=_warmup_loop, args=(_WARMUP_STOP,), name="hyperv-warmup", daemon=True)
     t.start()
     _WARMUP_STARTED = True
     logger.info("Hyper-V warmup thread started")
@@ -274,7 +298,12 @@ def list_hyperv_vms_batch(
         default=None,
         description="Lista de hosts separada por comas (overridea HYPERV_HOSTS).",
     ),
-    max_workers: int = Query(4, ge=1, le=16, description="Paralelismo de consultas"),
+    max_workers: Optional[int] = Query(
+        None,
+        ge=1,
+        le=16,
+        description="Tope de paralelismo; por defecto lo regula el limitador adaptativo de hosts",
+    ),
     refresh: bool = Query(False, description="Forzar refresco y omitir cache"),
     level: str = Query("summary", description="Nivel soportado solo summary en batch"),
     _user: User = Depends(require_permission(PermissionCode.JOBS_TRIGGER)),
@@ -295,17 +324,19 @@ def list_hyperv_vms_batch(
     # 3) función worker por host
     def _work(h: str):
         creds = _build_inventory_creds(h)
-        items = collect_hyperv_inventory_for_host(
-            creds, ps_content=ps_content, use_cache=not refresh, level=lvl
-        )
+        with _HOST_LIMITER.slot(timeout=HOST_TIMEOUT_SECONDS):
+            items = collect_hyperv_inventory_for_host(
+                creds, ps_content=ps_content, use_cache=not refresh, level=lvl
+            )
         # devolvemos lista ya validada (VMRecord -> dict)
         return h, [i.model_dump() for i in items]
 
     results: dict[str, list[dict]] = {}
     errors: dict[str, str] = {}
 
-    # 4) ejecución paralela (controlada)
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+    # 4) ejecución paralela (controlada por el limitador adaptativo)
+    pool_size = max(1, min(max_workers or _HOST_LIMITER.max_limit, len(host_list)))
+    with ThreadPoolExecutor(max_workers=pool_size) as ex:
         fut_map = {ex.submit(_work, h): h for h in host_list}
         for fut in as_completed(fut_map):
             h = fut_map[fut]
@@ -395,6 +426,42 @@ def _build_detail_creds(host: str) -> RemoteCreds:
         backoff_sec=0,
     )
 
+def _run_vm_batch(host: str, level: str, vm_names: List[str], refresh: bool) -> Dict[str, Optional[VMRecord]]:
+    """Runner del coalescer: una corrida del colector para todas las VMs del batch."""
+    # detail usa timeout corto para no colgar la UI si el host está muerto
+    creds = _build_detail_creds(host) if level == "detail" else _build_inventory_creds(host)
+    return collect_hyperv_vms_batch(
+        creds,
+        ps_content=_load_ps_content(),
+        vm_names=vm_names,
+        level=level,
+        use_cache=not refresh,
+    )
+
+
+_VM_BATCHER = VMBatchCoalescer(
+    _run_vm_batch,
+    window_seconds=settings.hyperv_batch_window_ms / 1000.0,
+    max_vms=settings.hyperv_batch_max_vms,
+    lookup=cached_vm_records,
+)
+
+
+def hyperv_vm_batch_stats() -> Dict[str, object]:
+    return _VM_BATCHER.stats()
+
+
+def _fetch_single_vm(hvhost: str, vm_name: str, level: str, refresh: bool):
+    try:
+        records = _VM_BATCHER.fetch(hvhost, level, [vm_name], refresh=refresh)
+    except Exception as exc:
+        _raise_hyperv_operational_error(exc, host=hvhost)
+    rec = records.get(vm_name)
+    if rec is None:
+        raise HTTPException(status_code=404, detail="VM no encontrada")
+    return rec
+
+
 @router.get("/vms/{hvhost}/{vm_name}/detail", response_model=VMRecordDetail)
 def hyperv_vm_detail(
     hvhost: str,
@@ -402,23 +469,7 @@ def hyperv_vm_detail(
     refresh: bool = Query(False, description="Forzar refresco"),
     _user: User = Depends(require_permission(PermissionCode.JOBS_TRIGGER)),
 ):
-    ps_content = _load_ps_content()
-    # Usamos timeout corto para no colgar la UI si el host está muerto
-    creds = _build_detail_creds(hvhost)
-    try:
-        records = collect_hyperv_inventory_for_host(
-            creds,
-            ps_content=ps_content,
-            level="detail",
-            vm_name=vm_name,
-            use_cache=not refresh,
-        )
-    except Exception as exc:
-        _raise_hyperv_operational_error(exc, host=hvhost)
-    for rec in records:
-        if rec.Name == vm_name:
-            return rec
-    raise HTTPException(status_code=404, detail="VM no encontrada")
+    return _fetch_single_vm(hvhost, vm_name, "detail", refresh)
 
 
 @router.get("/vms/{hvhost}/{vm_name}/deep", response_model=VMRecordDeep)
@@ -428,22 +479,59 @@ def hyperv_vm_deep(
     refresh: bool = Query(False, description="Forzar refresco"),
     _user: User = Depends(require_permission(PermissionCode.JOBS_TRIGGER)),
 ):
-    ps_content = _load_ps_content()
-    creds = _build_inventory_creds(hvhost)
-    try:
-        records = collect_hyperv_inventory_for_host(
-            creds,
-            ps_content=ps_content,
-            level="deep",
-            vm_name=vm_name,
-            use_cache=not refresh,
-        )
-    except Exception as exc:
-        _raise_hyperv_operational_error(exc, host=hvhost)
-    for rec in records:
-        if rec.Name == vm_name:
-            return rec
-    raise HTTPException(status_code=404, detail="VM no encontrada")
+    return _fetch_single_vm(hvhost, vm_name, "deep", refresh)
+
+
+class VMBatchRequest(BaseModel):
+    vms: Dict[str, List[str]] = Field(..., description="host -> nombres EXACTOS de VM")
+    level: str = "detail"
+    refresh: bool = False
+
+
+@router.post("/vms/records/batch")
+def hyperv_vms_records_batch(
+    payload: VMBatchRequest,
+    _user: User = Depends(require_permission(PermissionCode.JOBS_TRIGGER)),
+):
+    """
+    Detail/deep de varias VMs por host: una corrida del colector por host (se
+    suma a los pedidos puntuales que estén esperando para ese host).
+    Devuelve ``results[host][vm_name]`` con el registro o null si no existe.
+    """
+    lvl = _normalize_level(payload.level, {"detail", "deep"})
+    requested: Dict[str, List[str]] = {}
+    for host, names in payload.vms.items():
+        host_norm = (host or "").strip().lower()
+        if host_norm:
+            requested.setdefault(host_norm, []).extend(n for n in names if n)
+    if not requested:
+        raise HTTPException(status_code=400, detail="Debe especificar al menos un host con VMs")
+
+    results: Dict[str, Dict[str, Optional[dict]]] = {}
+    errors: Dict[str, str] = {}
+    pool_size = max(1, min(_HOST_LIMITER.max_limit, len(requested)))
+    with ThreadPoolExecutor(max_workers=pool_size) as ex:
+        fut_map = {
+            ex.submit(_VM_BATCHER.fetch, host, lvl, names, refresh=payload.refresh): host
+            for host, names in requested.items()
+        }
+        for fut in as_completed(fut_map):
+            host = fut_map[fut]
+            try:
+                records = fut.result()
+            except Exception as exc:
+                logger.warning("Error collecting Hyper-V VM batch for host '%s': %s", host, exc)
+                errors[host] = str(exc)
+                continue
+            results[host] = {name: (rec.model_dump() if rec is not None else None) for name, rec in records.items()}
+
+    return {
+        "ok": len(errors) == 0,
+        "level": lvl,
+        "total_vms": sum(1 for recs in results.values() for rec in recs.values() if rec is not None),
+        "results": results,
+        "hosts_error": errors,
+    }
 
 
 @router.get("/config")
@@ -470,9 +558,11 @@ def hyperv_config(
 
 @router.get("/snapshot")
 def get_hyperv_snapshot(
+    request: Request,
     scope: str = Query(..., description="Scope: vms|hosts"),
     hosts: str | None = Query(None, description="Lista de hosts separada por comas"),
     level: str = Query("summary", description="Nivel de detalle, solo summary"),
+    since: Optional[int] = Query(None, ge=0, description="Version conocida por el cliente; devuelve solo los cambios"),
 ):
     if not settings.hyperv_enabled or not settings.hyperv_configured:
         return Response(status_code=204)
@@ -485,10 +575,19 @@ def get_hyperv_snapshot(
     if not host_list:
         raise HTTPException(status_code=400, detail="Debe especificar ?hosts=host1,host2")
     scope_key = ScopeKey.from_parts(scope_name, host_list, lvl)
+    if since is None:
+        # Worker no líder: bytes publicados por el líder, sin cargar el snapshot en este proceso.
+        shared = shared_snapshots.response(request, "hyperv", scope_key)
+        if shared is not None:
+            return shared
     snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
     if snap is None:
         return Response(status_code=204)
-    return snap
+    if since is not None:
+        delta = _SNAPSHOT_STORE.get_delta(scope_key, since)
+        if delta is not None:
+            return delta_response(delta)
+    return encoded_snapshots.response(request, "hyperv", scope_key, snap)
 
 
 @router.get("/jobs/{job_id}")
@@ -502,6 +601,17 @@ def get_hyperv_job(
     return job
 
 
+@router.post("/jobs/{job_id}/cancel")
+def cancel_hyperv_job(
+    job_id: str,
+    _user: User = Depends(require_permission(PermissionCode.JOBS_TRIGGER)),
+):
+    job = request_cancel(_JOB_STORE, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job
+
+
 @router.post("/refresh")
 def trigger_hyperv_refresh(
     payload: RefreshRequest,
@@ -535,6 +645,8 @@ def trigger_hyperv_refresh(
 
     scope_key = ScopeKey.from_parts(scope_name, host_list, lvl)
 
+    ensure_leader()
+
     # dedupe: si hay job activo, devolverlo
     active = _JOB_STORE.get_active_for_scope(scope_key)
     if active:
@@ -575,32 +687,19 @@ def trigger_hyperv_refresh(
     return job
 
 
-def _scheduler_loop() -> None:
+def _run_job(job: JobStatus) -> None:
     """
-    Hilo liviano que toma jobs pendientes y los arranca si hay cupo global.
+    Runner registrado en el job engine: despacha segun el scope del job.
     """
-    while not _SCHEDULER_STOP:
-        with _SCHEDULER_CV:
-            pending_jobs = _JOB_STORE.list_jobs_by_status({"pending"})
-            if not pending_jobs:
-                _SCHEDULER_CV.wait(timeout=1.0)
-                continue
-        for job in pending_jobs:
-            # Intento tomar un slot global sin bloquear para no saturar
-            if not _GLOBAL_CONCURRENCY.acquire(blocking=False):
-                break
-            target = _run_job_scope_hosts if job.scope == ScopeName.HOSTS else _run_job_scope_vms
-            threading.Thread(
-                target=target,
-                args=(job,),
-                daemon=True,
-                name=f"hyperv-job-{job.job_id[:6]}",
-            ).start()
-        time.sleep(0.1)
+    if job.scope == ScopeName.HOSTS:
+        _run_job_scope_hosts(job)
+    else:
+        _run_job_scope_vms(job)
 
 
-def _job_deadline(start: datetime) -> datetime:
-    return start + timedelta(seconds=JOB_MAX_DURATION_SECONDS)
+def _job_budget(job_id: str) -> Deadline:
+    """Presupuesto total del job; los hosts corren con ``budget.narrow(HOST_TIMEOUT_SECONDS)``."""
+    return Deadline.after(JOB_MAX_DURATION_SECONDS, cancel_event=job_cancellations.event(job_id))
 
 
 def _get_existing_host_data(scope_key: ScopeKey, host: str):
@@ -621,6 +720,23 @@ def _get_existing_host_data(scope_key: ScopeKey, host: str):
     return None
 
 
+def _pending_level_for_host(host: str, level: str) -> str:
+    """
+    Nivel más alto que necesita algún job de VMs activo que todavía no procesó
+    ``host``. Una sola corrida del colector a ese nivel deja en cache lo que los
+    demás jobs van a pedir (los de scope hosts usan el modo host, aparte).
+    """
+    wanted = [level]
+    for other in _JOB_STORE.list_jobs_by_status(ACTIVE_STATUSES):
+        if other.scope != ScopeName.VMS:
+            continue
+        host_status = other.hosts_status.get(host)
+        if host_status is None or host_status.state not in {HostJobState.PENDING, HostJobState.RUNNING}:
+            continue
+        wanted.append(other.level)
+    return highest_level(*wanted)
+
+
 def _run_job_scope_vms(job: JobStatus) -> None:
     """
     Runner de jobs scope=vms (summary).
@@ -628,25 +744,19 @@ def _run_job_scope_vms(job: JobStatus) -> None:
     try:
         _run_job_scope_vms_inner(job)
     finally:
-        _GLOBAL_CONCURRENCY.release()
+        job_cancellations.discard(job.job_id)
 
 
 def _run_job_scope_vms_inner(job: JobStatus) -> None:
     scope_key = ScopeKey.from_parts(job.scope, job.hosts, job.level)
     start_ts = datetime.utcnow()
-    deadline = _job_deadline(start_ts)
+    if start_job(_JOB_STORE, job.job_id, start_ts) is None:
+        return  # cancelado mientras esperaba en la cola
+    budget = _job_budget(job.job_id)
 
     def update_job(fn):
         return _JOB_STORE.update_job(job.job_id, fn)
 
-    update_job(
-        lambda j: (
-            setattr(j, "status", "running"),
-            setattr(j, "started_at", start_ts),
-            setattr(j, "last_heartbeat_at", datetime.utcnow()),
-        )
-    )
-
     snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
     if snap is None:
         snap = _SNAPSHOT_STORE.init_snapshot(scope_key)
@@ -659,7 +769,7 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
     def _worker(host: str):
         nonlocal hosts_ok_this_job, hosts_error_this_job
         now = datetime.utcnow()
-        if now >= deadline:
+        if budget.expired or budget.cancelled:
             return
 
         health = _HEALTH_STORE.get(host)
@@ -703,6 +813,7 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
         state = SnapshotHostState.ERROR
         data = existing_data
         error_msg = None
+        cancelled = False
 
         with lock:
             try:
@@ -710,23 +821,37 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
                 level = (job.level or "summary").lower()
                 if level not in {"summary", "detail"}:
                     level = "summary"
-                items = collect_hyperv_inventory_for_host(
-                    creds,
-                    ps_content=ps_content,
-                    use_cache=False,
-                    level=level,
-                )
+                collect_level = _pending_level_for_host(host, level)
+                with _HOST_LIMITER.slot(deadline=budget):
+                    items = run_with_deadline(
+                        lambda: collect_hyperv_inventory_for_host(
+                            creds,
+                            ps_content=ps_content,
+                            use_cache=False,
+                            fresh_after=job.created_at,
+                            level=level,
+                            collect_level=collect_level,
+                        ),
+                        budget.narrow(HOST_TIMEOUT_SECONDS),
+                        name=f"hyperv-host-{host}",
+                    )
                 data = [i.model_dump() for i in items]
-                elapsed = (datetime.utcnow() - started).total_seconds()
-                if elapsed > HOST_TIMEOUT_SECONDS:
-                    state = SnapshotHostState.TIMEOUT
-                    error_msg = "host_timeout_exceeded"
-                    hosts_error_this_job += 1
-                    _HEALTH_STORE.record_failure(host, error_type="timeout", error_message=error_msg)
-                else:
-                    state = SnapshotHostState.OK
-                    hosts_ok_this_job += 1
-                    _HEALTH_STORE.record_success(host)
+                state = SnapshotHostState.OK
+                hosts_ok_this_job += 1
+                _HEALTH_STORE.record_success(host)
+            except LimiterTimeout:
+                # sin cupo en un limitador: el host no llegó a consultarse (sin timeout ni cooldown)
+                state = SnapshotHostState.ERROR
+                error_msg = "concurrency_limit_timeout"
+                hosts_error_this_job += 1
+            except DeadlineExceeded:
+                # el hilo de la llamada queda huérfano; el slot se libera ya
+                state = SnapshotHostState.TIMEOUT
+                error_msg = "host_timeout_exceeded"
+                hosts_error_this_job += 1
+                _HEALTH_STORE.record_failure(host, error_type="timeout", error_message=error_msg)
+            except JobCancelled:
+                cancelled = True
             except Exception as exc:
                 error_msg = str(exc)
                 hosts_error_this_job += 1
@@ -735,6 +860,9 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
             finally:
                 finished = datetime.utcnow()
 
+        if cancelled:
+            return
+
         health_after = _HEALTH_STORE.get(host)
         if state == SnapshotHostState.ERROR and health_after.last_success_at:
             if (datetime.utcnow() - health_after.last_success_at) > timedelta(minutes=REFRESH_INTERVAL_MINUTES):
@@ -775,7 +903,8 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
 
         update_job(mutator)
 
-    max_workers = max(1, min(MAX_CONCURRENCY_PER_SCOPE, len(hosts_pending)))
+    # el limitador adaptativo decide cuántos hosts corren a la vez; el pool solo pone el techo
+    max_workers = max(1, min(_HOST_LIMITER.max_limit, len(hosts_pending)))
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
         fut_map = {ex.submit(_worker, h): h for h in hosts_pending}
         for fut in as_completed(fut_map):
@@ -788,7 +917,10 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
     finished_ts = datetime.utcnow()
     final_status = "succeeded"
     message = None
-    if finished_ts >= deadline:
+    if budget.cancelled:
+        final_status = CANCELLED_STATUS
+        message = "cancelled_by_user"
+    elif budget.expired:
         final_status = "expired"
         message = "job_max_duration_reached"
     elif hosts_ok_this_job == 0:
@@ -820,28 +952,19 @@ def _run_job_scope_hosts(job: JobStatus) -> None:
     try:
         _run_job_scope_hosts_inner(job)
     finally:
-        _GLOBAL_CONCURRENCY.release()
+        job_cancellations.discard(job.job_id)
 
 
 def _run_job_scope_hosts_inner(job: JobStatus) -> None:
-    """
-    Lógica interna separada para garantizar release del slot global.
-    """
     scope_key = ScopeKey.from_parts(job.scope, job.hosts, job.level)
     start_ts = datetime.utcnow()
-    deadline = _job_deadline(start_ts)
+    if start_job(_JOB_STORE, job.job_id, start_ts) is None:
+        return  # cancelado mientras esperaba en la cola
+    budget = _job_budget(job.job_id)
 
     def update_job(fn):
         return _JOB_STORE.update_job(job.job_id, fn)
 
-    update_job(
-        lambda j: (
-            setattr(j, "status", "running"),
-            setattr(j, "started_at", start_ts),
-            setattr(j, "last_heartbeat_at", datetime.utcnow()),
-        )
-    )
-
     snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
     if snap is None:
         snap = _SNAPSHOT_STORE.init_snapshot(scope_key)
@@ -856,7 +979,7 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
     def _worker(host: str):
         nonlocal results, hosts_ok_this_job, hosts_error_this_job
         now = datetime.utcnow()
-        if now >= deadline:
+        if budget.expired or budget.cancelled:
             return ("expired", None, "job_expired", None)
 
         health = _HEALTH_STORE.get(host)
@@ -889,26 +1012,38 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
         state = SnapshotHostState.ERROR
         data = existing_data
         error_msg = None
+        cancelled = False
 
         with lock:
             try:
                 creds = _build_inventory_creds(host)
-                info = collect_hyperv_host_info(
-                    creds,
-                    ps_content=ps_content,
-                    use_cache=False,
-                )
+                with _HOST_LIMITER.slot(deadline=budget):
+                    info = run_with_deadline(
+                        lambda: collect_hyperv_host_info(
+                            creds,
+                            ps_content=ps_content,
+                            use_cache=False,
+                        ),
+                        budget.narrow(HOSTS_JOB_TIMEOUT_SECONDS),
+                        name=f"hyperv-hostinfo-{host}",
+                    )
                 data = info
-                elapsed = (datetime.utcnow() - started).total_seconds()
-                if elapsed > HOSTS_JOB_TIMEOUT_SECONDS:
-                    state = SnapshotHostState.TIMEOUT
-                    error_msg = "host_timeout_exceeded"
-                    hosts_error_this_job += 1
-                    _HEALTH_STORE.record_failure(host, error_type="timeout", error_message=error_msg)
-                else:
-                    state = SnapshotHostState.OK
-                    hosts_ok_this_job += 1
-                    _HEALTH_STORE.record_success(host)
+                state = SnapshotHostState.OK
+                hosts_ok_this_job += 1
+                _HEALTH_STORE.record_success(host)
+            except LimiterTimeout:
+                # sin cupo en un limitador: el host no llegó a consultarse (sin timeout ni cooldown)
+                state = SnapshotHostState.ERROR
+                error_msg = "concurrency_limit_timeout"
+                hosts_error_this_job += 1
+            except DeadlineExceeded:
+                # el hilo de la llamada queda huérfano; el slot se libera ya
+                state = SnapshotHostState.TIMEOUT
+                error_msg = "host_timeout_exceeded"
+                hosts_error_this_job += 1
+                _HEALTH_STORE.record_failure(host, error_type="timeout", error_message=error_msg)
+            except JobCancelled:
+                cancelled = True
             except Exception as exc:
                 error_msg = str(exc)
                 hosts_error_this_job += 1
@@ -917,6 +1052,9 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
             finally:
                 finished = datetime.utcnow()
 
+        if cancelled:
+            return
+
         health_after = _HEALTH_STORE.get(host)
         if state == SnapshotHostState.ERROR and health_after.last_success_at:
             # conservar datos previos, marcar stale si viejo
@@ -962,7 +1100,8 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
         update_job(mutator)
         return (state.value, data, error_msg, status)
 
-    max_workers = max(1, min(MAX_CONCURRENCY_PER_SCOPE, len(hosts_pending)))
+    # el limitador adaptativo decide cuántos hosts corren a la vez; el pool solo pone el techo
+    max_workers = max(1, min(_HOST_LIMITER.max_limit, len(hosts_pending)))
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
         fut_map = {ex.submit(_worker, h): h for h in hosts_pending}
         for fut in as_completed(fut_map):
@@ -975,7 +1114,10 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
     finished_ts = datetime.utcnow()
     final_status = "succeeded"
     message = None
-    if finished_ts >= deadline:
+    if budget.cancelled:
+        final_status = CANCELLED_STATUS
+        message = "cancelled_by_user"
+    elif budget.expired:
         final_status = "expired"
         message = "job_max_duration_reached"
     elif hosts_ok_this_job == 0:
@@ -999,7 +1141,6 @@ def _run_job_scope_hosts_inner(job: JobStatus) -> None:
         j.message = message
 
     update_job(finalize)
-    _GLOBAL_CONCURRENCY.release()
 
 
 def _should_warm(scope: ScopeName, level: str) -> bool:
@@ -1031,13 +1172,13 @@ def _should_warm_with_hosts(scope: ScopeName, level: str, hosts: list[str]) -> b
     return True
 
 
-def _warmup_loop() -> None:
+def _warmup_loop(stop: threading.Event) -> None:
     """
     Tarea interna periódica para asegurar que exista snapshot (vms y hosts) sin requerir clicks.
     No depende de permisos HTTP.
     """
     interval = max(REFRESH_INTERVAL_MINUTES, 10)
-    while not _WARMUP_STOP:
+    while not stop.is_set():
         try:
             for scope in (ScopeName.VMS, ScopeName.HOSTS):
                 if scope == ScopeName.VMS:
@@ -1053,12 +1194,13 @@ def _warmup_loop() -> None:
                     _kick_scheduler()
         except Exception as exc:
             logger.warning("Hyper-V warmup loop error: %s", exc)
-        time.sleep(interval * 60)
+        stop.wait(interval * 60)
 
 
 def _stop_warmup() -> None:
-    global _WARMUP_STOP
-    _WARMUP_STOP = True
+    global _WARMUP_STARTED
+    _WARMUP_STOP.set()
+    _WARMUP_STARTED = False
 
 
 @router.get("/hosts")
@@ -1,6 +1,7 @@
 # filepath: app/vms/hyperv_service.py
 from __future__ import annotations
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
 import logging
 from app.settings import settings
 
@@ -24,10 +25,102 @@ _CACHE_TTLS = {
     "detail": settings.hyperv_cache_ttl_detail,
     "deep": settings.hyperv_cache_ttl_deep,
 }
+# Entradas por host completo y por VM (detail/deep puntuales y batches)
+_CACHE_MAXSIZE = 512
 _HOST_CACHE: dict[str, TTLCache] = {
-    level: TTLCache(maxsize=64, ttl=ttl) for level, ttl in _CACHE_TTLS.items()
+    level: TTLCache(maxsize=_CACHE_MAXSIZE, ttl=ttl) for level, ttl in _CACHE_TTLS.items()
 }
 _HOST_INFO_CACHE = TTLCache(maxsize=64, ttl=settings.hyperv_cache_ttl_hosts)
+
+# deep ⊇ detail ⊇ summary: un resultado alimenta la cache de su nivel y de los inferiores
+_LEVELS = ("summary", "detail", "deep")
+_LEVEL_MODELS = {"summary": VMRecordSummary, "detail": VMRecordDetail, "deep": VMRecordDeep}
+
+
+class _CacheEntry(NamedTuple):
+    records: List[VMRecord]
+    collected_at: datetime  # inicio de la corrida del colector
+    level: str
+
+
+# Última corrida por (host, vm) al nivel en que se hizo: la usan los jobs
+# (``fresh_after``) aunque la cache de ese nivel ya haya vencido (deep dura poco).
+_LAST_RUN = TTLCache(maxsize=_CACHE_MAXSIZE, ttl=max(_CACHE_TTLS.values()))
+
+
+def level_rank(level: Optional[str]) -> int:
+    try:
+        return _LEVELS.index((level or "summary").lower())
+    except ValueError:
+        return 0
+
+
+def highest_level(*levels: Optional[str]) -> str:
+    """El nivel más alto pedido (el que satisface a todos los demás)."""
+    return _LEVELS[max((level_rank(level) for level in levels), default=0)]
+
+
+def project_records(records: List[VMRecord], level: str) -> List[VMRecord]:
+    """
+    Proyecta registros de un nivel superior al modelo de ``level`` (descarta los
+    campos que ese nivel no tiene). Los datos ya están validados: no se revalidan.
+    """
+    model = _LEVEL_MODELS.get(level, VMRecordSummary)
+    projected: List[VMRecord] = []
+    for rec in records:
+        if type(rec) is model:
+            projected.append(rec)
+            continue
+        values = {name: getattr(rec, name) for name in model.model_fields if hasattr(rec, name)}
+        projected.append(model.model_construct(**values))
+    return projected
+
+
+def _cache_lookup(
+    host_key: str,
+    level: str,
+    vm_name: Optional[str],
+    *,
+    fresh_after: Optional[datetime],
+) -> Optional[List[VMRecord]]:
+    """
+    Entrada del nivel pedido (para la VM o, si no, la del host completo filtrada).
+    Con ``fresh_after`` solo vale una corrida iniciada después de ese instante, a
+    ese nivel o a uno superior.
+    """
+    keys = [(host_key, vm_name or "")]
+    if vm_name:
+        keys.append((host_key, ""))
+    for key in keys:
+        if fresh_after is None:
+            entry = _HOST_CACHE[level].get(key)
+        else:
+            entry = _LAST_RUN.get(key)
+            if entry is None or entry.collected_at < fresh_after or level_rank(entry.level) < level_rank(level):
+                continue
+        if entry is None:
+            continue
+        records = project_records(entry.records, level) if entry.level != level else entry.records
+        if vm_name and not key[1]:
+            records = [rec for rec in records if rec.Name == vm_name]
+            if not records:
+                continue  # VM nueva o renombrada: que corra el colector
+        return records
+    return None
+
+
+def _cache_store(
+    host_key: str,
+    vm_name: Optional[str],
+    collected_level: str,
+    records: List[VMRecord],
+    collected_at: datetime,
+) -> None:
+    key = (host_key, vm_name or "")
+    for level in _LEVELS[: level_rank(collected_level) + 1]:
+        _HOST_CACHE[level][key] = _CacheEntry(project_records(records, level), collected_at, level)
+    _LAST_RUN[key] = _CacheEntry(records, collected_at, collected_level)
+
 
 # ─────────────────────────────────────────────
 # Helper para normalizar porcentajes
@@ -52,30 +145,110 @@ def collect_hyperv_inventory_for_host(
     level: str = "summary",
     vm_name: Optional[str] = None,
     use_cache: bool = True,
+    fresh_after: Optional[datetime] = None,
+    collect_level: Optional[str] = None,
 ) -> List[VMRecord]:
-    """
-    Ejecuta el colector de Hyper-V en el host indicado y valida el
-    resultado contra el esquema VMRecord. Devuelve una lista de VMRecord.
-    """
+    """
+    Ejecuta el colector de Hyper-V en el host indicado y valida el
+    resultado contra el esquema VMRecord. Devuelve una lista de VMRecord.
+
+    - ``fresh_after``: aun con ``use_cache=False`` acepta un resultado cacheado
+      cuyo colector arrancó después de ese instante (otro job ya lo corrió).
+    - ``collect_level``: corre el colector a ese nivel si es más alto que
+      ``level`` (para que otros consumidores pendientes lo encuentren en cache)
+      y devuelve la proyección al nivel pedido.
+    """
     level_norm = (level or "summary").lower()
-    cache = _HOST_CACHE.get(level_norm)
-    cache_key = ((creds.host or "").lower(), vm_name or "")
-    if use_cache and cache is not None and cache_key in cache:
-        logger.debug("HyperV cache hit para host %s level %s", creds.host, level_norm)
-        return cache[cache_key]
+    if level_norm not in _LEVEL_MODELS:
+        level_norm = "summary"
+    host_key = (creds.host or "").lower()
+    if use_cache or fresh_after is not None:
+        cached = _cache_lookup(host_key, level_norm, vm_name, fresh_after=None if use_cache else fresh_after)
+        if cached is not None:
+            logger.debug("HyperV cache hit para host %s level %s", creds.host, level_norm)
+            return cached
 
-    logger.debug("HyperV inventory miss para host %s level %s -> ejecutando colector", creds.host, level_norm)
+    run_level = highest_level(level_norm, collect_level)
+    collected_at = datetime.utcnow()
+    logger.debug(
+        "HyperV inventory miss para host %s level %s -> ejecutando colector (nivel %s)",
+        creds.host,
+        level_norm,
+        run_level,
+    )
     raw_items = run_inventory(
         creds,
         ps_content=ps_content,
-        level=level_norm,
+        level=run_level,
         vm_name=vm_name,
     )
     if vm_name:
         raw_items = [i for i in raw_items if i.get("Name") == vm_name]
 
+    validated = _validate_items(creds, raw_items, run_level)
+    _cache_store(host_key, vm_name, run_level, validated, collected_at)
+    if run_level != level_norm:
+        return project_records(validated, level_norm)
+    return validated
+
+
+def cached_vm_records(host: str, level: str, vm_names: Iterable[str]) -> Dict[str, VMRecord]:
+    """Registros en cache (por VM o del host completo) de las VMs pedidas; omite las que faltan."""
+    host_key = (host or "").lower()
+    found: Dict[str, VMRecord] = {}
+    for name in vm_names:
+        cached = _cache_lookup(host_key, level, name, fresh_after=None)
+        if cached:
+            found[name] = cached[0]
+    return found
+
+
+def collect_hyperv_vms_batch(
+    creds: RemoteCreds,
+    ps_content: str,
+    vm_names: Iterable[str],
+    *,
+    level: str = "detail",
+    use_cache: bool = True,
+) -> Dict[str, Optional[VMRecord]]:
+    """
+    Varias VMs de un mismo host en una sola corrida del colector (``-VMName a,b``).
+    Las que ya están en cache no se piden; cada VM encontrada queda en su propia
+    entrada de cache, igual que un pedido puntual. Devuelve nombre -> registro
+    (None si el host no tiene esa VM).
+    """
+    level_norm = (level or "detail").lower()
+    if level_norm not in _LEVEL_MODELS:
+        level_norm = "detail"
+    host_key = (creds.host or "").lower()
+    names = list(dict.fromkeys(n for n in vm_names if n))
+    results: Dict[str, Optional[VMRecord]] = dict(cached_vm_records(host_key, level_norm, names)) if use_cache else {}
+    missing = [name for name in names if name not in results]
+    if not missing:
+        return results
+
+    collected_at = datetime.utcnow()
+    logger.debug("HyperV batch %s level %s -> %s VMs en una corrida", creds.host, level_norm, len(missing))
+    raw_items = run_inventory(
+        creds,
+        ps_content=ps_content,
+        level=level_norm,
+        vm_name=",".join(missing),
+    )
+    wanted = set(missing)
+    raw_items = [i for i in raw_items if isinstance(i, dict) and i.get("Name") in wanted]
+    found = {rec.Name: rec for rec in _validate_items(creds, raw_items, level_norm)}
+    for name in missing:
+        rec = found.get(name)
+        if rec is not None:
+            _cache_store(host_key, name, level_norm, [rec], collected_at)
+        results[name] = rec
+    return results
+
+
+def _validate_items(creds: RemoteCreds, raw_items: List[dict], level: str) -> List[VMRecord]:
     validated: List[VMRecord] = []
-    dropped = 0
+    dropped = 0
 
     for idx, item in enumerate(raw_items):
         # ─── Normalizar porcentajes ───
@@ -88,21 +261,13 @@ def collect_hyperv_inventory_for_host(
 
         # ─── Validación con Pydantic ───
         try:
-            if level_norm == "deep":
-                validated.append(VMRecordDeep.model_validate(item))
-            elif level_norm == "detail":
-                validated.append(VMRecordDetail.model_validate(item))
-            else:
-                validated.append(VMRecordSummary.model_validate(item))
+            validated.append(_LEVEL_MODELS[level].model_validate(item))
         except ValidationError as ve:
             dropped += 1
             logger.warning("Descartada VM #%s de %s: %s", idx, creds.host, ve.errors())
 
     if dropped:
         logger.info("Host %s: %s VMs válidas, %s descartadas", creds.host, len(validated), dropped)
-
-    if cache is not None:
-        cache[cache_key] = validated
     return validated
 
 
@@ -123,6 +288,15 @@ def _dedupe_switches(raw_switches: Optional[List[dict]]) -> List[dict]:
     return deduped
 
 
+def _as_list(value) -> List[dict]:
+    """ConvertTo-Json serializa una lista de un elemento como objeto suelto."""
+    if isinstance(value, dict):
+        return [value]
+    if isinstance(value, list):
+        return [v for v in value if isinstance(v, dict)]
+    return []
+
+
 def collect_hyperv_host_info(
     creds: RemoteCreds,
     ps_content: str,
@@ -130,60 +304,35 @@ def collect_hyperv_host_info(
     use_cache: bool = True,
 ) -> HyperVHostSummary:
     """
-    Obtiene información del host Hyper-V ejecutando inventario nivel deep y
-    consolidando HostInfo/Switches. Cacha por host para evitar reejecuciones.
+    Obtiene información del host Hyper-V con el modo ``-Level host`` del
+    colector (HostInfo, switches, NICs, storage, cluster y cantidad de VMs, sin
+    inventariar cada VM). Cacha por host para evitar reejecuciones.
     """
     cache_key = creds.host.lower()
     if use_cache and cache_key in _HOST_INFO_CACHE:
         return _HOST_INFO_CACHE[cache_key]
 
-    records = collect_hyperv_inventory_for_host(
-        creds,
-        ps_content=ps_content,
-        level="deep",
-        use_cache=use_cache,
-    )
+    raw_items = run_inventory(creds, ps_content=ps_content, level="host")
+    item = next((i for i in raw_items if isinstance(i, dict) and i.get("Level") == "host"), None)
+    if item is None:
+        raise RuntimeError(f"El colector no devolvió datos de host para {creds.host}")
 
-    if not records:
-        raise RuntimeError(f"Inventario vacío en host {creds.host}")
-
-    host_info = None
-    switches: List[dict] = []
-    nics: List[dict] = []
-    storage: List[dict] = []
-    cluster = None
-
-    for rec in records:
-        if rec.HostInfo and not host_info:
-            host_info = rec.HostInfo
-        if rec.Switches:
-            switches.extend(rec.Switches)
-        if isinstance(rec.HostInfo, dict):
-            if rec.HostInfo.get("Nics"):
-                nics.extend(rec.HostInfo.get("Nics"))
-            if rec.HostInfo.get("Storage"):
-                storage.extend(rec.HostInfo.get("Storage"))
-        if not cluster and rec.Cluster:
-            cluster = rec.Cluster
-
-    switches = _dedupe_switches(switches)
+    host_info = item.get("HostInfo") if isinstance(item.get("HostInfo"), dict) else {}
 
     payload = HyperVHostSummary(
         host=creds.host,
-        cluster=cluster,
-        version=(host_info or {}).get("Version") if isinstance(host_info, dict) else None,
-        logical_processors=(host_info or {}).get("LogicalProcessorCount") if isinstance(host_info, dict) else None,
-        memory_capacity_bytes=(host_info or {}).get("MemoryCapacity") if isinstance(host_info, dict) else None,
-        uptime_seconds=(host_info or {}).get("UptimeSeconds") if isinstance(host_info, dict) else None,
-        cpu_usage_pct=(host_info or {}).get("CpuUsagePct") if isinstance(host_info, dict) else None,
-        memory_usage_pct=(host_info or {}).get("MemUsagePct") if isinstance(host_info, dict) else None,
-        virtual_machine_migration_enabled=(host_info or {}).get("VirtualMachineMigrationEnabled")
-        if isinstance(host_info, dict)
-        else None,
-        total_vms=len(records),
-        switches=switches or None,
-        nics=nics or None,
-        storage=storage or None,
+        cluster=item.get("Cluster"),
+        version=host_info.get("Version"),
+        logical_processors=host_info.get("LogicalProcessorCount"),
+        memory_capacity_bytes=host_info.get("MemoryCapacity"),
+        uptime_seconds=host_info.get("UptimeSeconds"),
+        cpu_usage_pct=host_info.get("CpuUsagePct"),
+        memory_usage_pct=host_info.get("MemUsagePct"),
+        virtual_machine_migration_enabled=host_info.get("VirtualMachineMigrationEnabled"),
+        total_vms=int(item.get("VMCount") or 0),
+        switches=_dedupe_switches(_as_list(item.get("Switches"))) or None,
+        nics=_as_list(host_info.get("Nics")) or None,
+        storage=_as_list(host_info.get("Storage")) or None,
     )
 
     _HOST_INFO_CACHE[cache_key] = payload
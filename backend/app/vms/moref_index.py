@@ -0,0 +1,52 @@
+"""O(1) managed-object lookups for VMware hosts.
+
+vCenter managed object IDs (``host-45``) are enough to build a reference bound
+to the current SOAP stub, so single-object endpoints no longer need a
+ContainerView walk. Existence is validated by reading ``name`` once per session
+and the result is remembered.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional, Tuple, Type
+
+from pyVmomi import vim, vmodl
+
+
+class MoRefIndex:
+    """Resolve managed object references by moId without scanning the inventory."""
+
+    def __init__(self, *, validate_ttl: int = 300) -> None:
+        self._lock = threading.Lock()
+        self._validate_ttl = validate_ttl
+        # (type name, moid) -> (stub, validated_at)
+        self._validated: Dict[Tuple[str, str], Tuple[object, float]] = {}
+
+    def _resolve(self, content, mo_type: Type[vim.ManagedEntity], moid: Optional[str]):
+        if not moid:
+            return None
+        stub = content.propertyCollector._stub
+        ref = mo_type(moid, stub)
+        key = (mo_type.__name__, moid)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._validated.get(key)
+        if cached is not None and cached[0] is stub and now - cached[1] < self._validate_ttl:
+            return ref
+        try:
+            ref.name
+        except vmodl.fault.ManagedObjectNotFound:
+            with self._lock:
+                self._validated.pop(key, None)
+            return None
+        with self._lock:
+            self._validated[key] = (stub, now)
+        return ref
+
+    def get_host(self, content, host_id: Optional[str]) -> Optional[vim.HostSystem]:
+        return self._resolve(content, vim.HostSystem, host_id)
+
+
+moref_index = MoRefIndex()
@@ -0,0 +1,328 @@
+"""Long-lived vCenter session shared by REST and SOAP callers.
+
+A single pooled ``requests.Session`` carries the cached REST token and a single
+pyVmomi ``ServiceInstance`` is reused across calls. Both are re-authenticated
+transparently when vCenter reports the session as expired (HTTP 401 /
+``NotAuthenticated``) and a background keepalive pings them before the idle
+timeout kicks in.
+"""
+
+from __future__ import annotations
+
+import logging
+import ssl
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+import requests
+from fastapi import HTTPException
+from pyVim.connect import Disconnect, SmartConnect
+from pyVmomi import vim
+from requests.adapters import HTTPAdapter
+
+from app.jobs.adaptive import adaptive_limiters
+from app.jobs.deadline import budget_timeout, check_deadline
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_SESSION_PATH = "/rest/com/vmware/cis/session"
+_TOKEN_HEADER = "vmware-api-session-id"
+_SOAP_QUEUE_TIMEOUT_SECONDS = 120
+
+
+class VCenterSessionManager:
+    """Keep one REST token and one SOAP ServiceInstance alive for the whole process."""
+
+    def __init__(
+        self,
+        resolve_config: Callable[[], Dict[str, Optional[str]]],
+        *,
+        pool_size: int = 20,
+        keepalive_seconds: int = 600,
+        soap_validate_after: int = 60,
+    ) -> None:
+        self._resolve_config = resolve_config
+        self._pool_size = max(int(pool_size), 1)
+        self._keepalive_seconds = max(int(keepalive_seconds), 0)
+        self._soap_validate_after = soap_validate_after
+
+        self._http: Optional[requests.Session] = None
+        self._token: Optional[str] = None
+        self._rest_lock = threading.Lock()
+
+        self._si = None
+        self._content = None
+        self._soap_validated_at = 0.0
+        self._soap_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            "rest_logins": 0,
+            "rest_reuses": 0,
+            "rest_reauths": 0,
+            "soap_logins": 0,
+            "soap_reuses": 0,
+            "soap_reauths": 0,
+            "keepalives": 0,
+            "keepalive_failures": 0,
+        }
+
+        self._keepalive_thread: Optional[threading.Thread] = None
+        self._keepalive_stop = threading.Event()
+
+    # ─────────────────────────────── helpers ───────────────────────────────
+
+    def _bump(self, name: str) -> None:
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _http_session(self) -> requests.Session:
+        if self._http is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = False
+            self._http = session
+        return self._http
+
+    def _ensure_keepalive(self) -> None:
+        if self._keepalive_seconds <= 0 or settings.test_mode:
+            return
+        if self._keepalive_thread is not None and self._keepalive_thread.is_alive():
+            return
+        self._keepalive_stop.clear()
+        self._keepalive_thread = threading.Thread(
+            target=self._keepalive_loop,
+            name="vcenter-keepalive",
+            daemon=True,
+        )
+        self._keepalive_thread.start()
+
+    # ─────────────────────────────── REST ───────────────────────────────
+
+    def _rest_login(self) -> str:
+        cfg = self._resolve_config()
+        if not cfg.get("host") or not cfg.get("user") or not cfg.get("password"):
+            raise HTTPException(status_code=500, detail="Configuración de vCenter incompleta")
+        try:
+            response = self._http_session().post(
+                f"{cfg['host']}{_SESSION_PATH}",
+                auth=(cfg["user"], cfg["password"]),
+                timeout=5,
+            )
+            response.raise_for_status()
+            token = response.json()["value"]
+        except Exception as exc:
+            logger.exception("Failed to obtain vCenter session token")
+            code = getattr(exc, "response", None) and exc.response.status_code or 500
+            raise HTTPException(status_code=code, detail=f"Auth failed: {exc}")
+        self._bump("rest_logins")
+        self._ensure_keepalive()
+        return token
+
+    def get_token(self, *, force: bool = False) -> str:
+        """Return the cached REST token, logging in only when missing or forced."""
+        with self._rest_lock:
+            if self._token and not force:
+                self._bump("rest_reuses")
+                return self._token
+            self._token = self._rest_login()
+            return self._token
+
+    def _reauth(self, stale_token: Optional[str]) -> str:
+        with self._rest_lock:
+            # Another thread may have already refreshed the token.
+            if self._token and self._token != stale_token:
+                return self._token
+            self._token = self._rest_login()
+            self._bump("rest_reauths")
+            return self._token
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Ejecuta una petición REST con la sesión compartida. Inyecta el token
+        vigente y, ante un 401, re-autentica una vez y reintenta. Dentro de un
+        job el timeout se recorta al presupuesto que le queda al host, y la
+        cantidad de peticiones en vuelo la regula el limitador ``vcenter.rest``.
+        """
+        kwargs.pop("verify", None)
+        if kwargs.get("timeout") is not None:
+            kwargs["timeout"] = budget_timeout(kwargs["timeout"])
+        limiter = adaptive_limiters.get("vcenter.rest", initial=min(8, self._pool_size), max_limit=self._pool_size)
+        with limiter.slot(timeout=kwargs.get("timeout")) as slot:
+            response = self._send(method, url, **kwargs)
+            if response.status_code >= 500 or response.status_code == 429:
+                slot.fail()
+        return response
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        headers = dict(kwargs.pop("headers", None) or {})
+        token = self.get_token()
+        headers[_TOKEN_HEADER] = token
+        response = self._http_session().request(method, url, headers=headers, **kwargs)
+        if response.status_code != 401:
+            return response
+        logger.info("vCenter REST session expired; re-authenticating")
+        headers[_TOKEN_HEADER] = self._reauth(token)
+        return self._http_session().request(method, url, headers=headers, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    # ─────────────────────────────── SOAP ───────────────────────────────
+
+    def _soap_login(self):
+        cfg = self._resolve_config()
+        if not cfg.get("soap_host") or not cfg.get("user") or not cfg.get("password"):
+            raise RuntimeError("Incomplete vCenter SOAP configuration")
+        si = SmartConnect(
+            host=cfg["soap_host"],
+            user=cfg["user"],
+            pwd=cfg["password"],
+            port=443,
+            sslContext=ssl._create_unverified_context(),
+        )
+        self._bump("soap_logins")
+        self._ensure_keepalive()
+        return si, si.RetrieveContent()
+
+    def _soap_session_alive(self) -> bool:
+        try:
+            return self._content.sessionManager.currentSession is not None
+        except vim.fault.NotAuthenticated:
+            return False
+        except Exception:
+            logger.debug("SOAP session validation failed", exc_info=True)
+            return False
+
+    def get_service_instance(self, *, force: bool = False) -> Tuple[object, object]:
+        """Return the shared (ServiceInstance, Content), reconnecting when expired."""
+        with self._soap_lock:
+            if self._si is not None and not force:
+                now = time.monotonic()
+                if now - self._soap_validated_at < self._soap_validate_after or self._soap_session_alive():
+                    self._soap_validated_at = now
+                    self._bump("soap_reuses")
+                    return self._si, self._content
+                logger.info("vCenter SOAP session expired; re-authenticating")
+                self._bump("soap_reauths")
+            self._replace_soap_session_locked()
+            return self._si, self._content
+
+    def _replace_soap_session_locked(self) -> None:
+        """Login nuevo; la sesión reemplazada se cierra (best effort) para no agotar el cupo por usuario."""
+        previous = self._si
+        self._si, self._content = self._soap_login()
+        self._soap_validated_at = time.monotonic()
+        if previous is not None:
+            try:
+                Disconnect(previous)
+            except Exception:
+                logger.debug("Error disconnecting replaced SOAP session", exc_info=True)
+
+    def invalidate_soap(self) -> None:
+        with self._soap_lock:
+            self._soap_validated_at = 0.0
+
+    def run_soap(self, func: Callable[[object], T]) -> T:
+        """Run ``func(content)`` retrying once with a fresh login on ``NotAuthenticated``."""
+        check_deadline()
+        limiter = adaptive_limiters.get("vcenter.soap", initial=4, max_limit=self._pool_size, latency_aware=False)
+        with limiter.slot(timeout=budget_timeout(_SOAP_QUEUE_TIMEOUT_SECONDS)):
+            return self._run_soap(func)
+
+    def _run_soap(self, func: Callable[[object], T]) -> T:
+        _, content = self.get_service_instance()
+        try:
+            return func(content)
+        except vim.fault.NotAuthenticated:
+            logger.info("vCenter SOAP call rejected (NotAuthenticated); retrying with a new session")
+            with self._soap_lock:
+                # Como _reauth: solo el primero en fallar con esta sesión hace login, el resto la reutiliza.
+                if self._content is content:
+                    self._bump("soap_reauths")
+                    self._replace_soap_session_locked()
+                content = self._content
+            return func(content)
+
+    # ─────────────────────────────── keepalive ───────────────────────────────
+
+    def _keepalive_once(self) -> None:
+        token = self._token
+        if token:
+            cfg = self._resolve_config()
+            try:
+                response = self._http_session().post(
+                    f"{cfg['host']}{_SESSION_PATH}",
+                    params={"~action": "get"},
+                    headers={_TOKEN_HEADER: token},
+                    timeout=5,
+                )
+                if response.status_code == 401:
+                    with self._rest_lock:
+                        if self._token == token:
+                            self._token = None
+                self._bump("keepalives")
+            except Exception:
+                self._bump("keepalive_failures")
+                logger.debug("vCenter REST keepalive failed", exc_info=True)
+
+        si = self._si
+        if si is not None:
+            try:
+                si.CurrentTime()
+                self._bump("keepalives")
+            except Exception:
+                self._bump("keepalive_failures")
+                self.invalidate_soap()
+                logger.debug("vCenter SOAP keepalive failed", exc_info=True)
+
+    def _keepalive_loop(self) -> None:
+        while not self._keepalive_stop.wait(self._keepalive_seconds):
+            self._keepalive_once()
+
+    # ─────────────────────────────── lifecycle / stats ───────────────────────────────
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            data: Dict[str, object] = dict(self._counters)
+        data["rest_session_active"] = self._token is not None
+        data["soap_session_active"] = self._si is not None
+        data["pool_size"] = self._pool_size
+        data["keepalive_seconds"] = self._keepalive_seconds
+        return data
+
+    def close(self) -> None:
+        """Stop the keepalive and log out both sessions (used on shutdown/reset)."""
+        self._keepalive_stop.set()
+        with self._soap_lock:
+            if self._si is not None:
+                try:
+                    Disconnect(self._si)
+                except Exception:  # pragma: no cover - defensive
+                    logger.debug("Error disconnecting SOAP session", exc_info=True)
+            self._si = None
+            self._content = None
+        with self._rest_lock:
+            if self._token and self._http is not None:
+                try:
+                    cfg = self._resolve_config()
+                    self._http.delete(
+                        f"{cfg['host']}{_SESSION_PATH}",
+                        headers={_TOKEN_HEADER: self._token},
+                        timeout=5,
+                    )
+                except Exception:  # pragma: no cover - defensive
+                    logger.debug("Error closing REST session", exc_info=True)
+            self._token = None
+            if self._http is not None:
+                self._http.close()
+                self._http = None
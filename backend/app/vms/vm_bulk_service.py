@@ -0,0 +1,472 @@
+"""Bulk VMware inventory engine based on the SOAP PropertyCollector.
+
+Instead of issuing several REST calls per VM, this module retrieves every
+property needed by ``VMBase`` for all VMs (plus host/cluster/network names)
+in a few paged ``RetrievePropertiesEx`` calls and builds the list in one pass.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pyVmomi import vim, vmodl
+
+from app.jobs.deadline import check_deadline
+from app.settings import settings
+from app.vms.vm_models import VMBase
+from app.vms.vm_service import (
+    COMPAT_MAP,
+    PlacementInfo,
+    SingleFlightTTLCache,
+    _format_disk_size,
+    _infer_generation_from_boot,
+    _normalize_boot_type,
+    _placement_from_quickstats,
+    infer_environment,
+    placement_cache,
+    vcenter_sessions,
+    vm_attribute_layers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Capa estática: cambia con reconfiguraciones (``config.changeVersion``).
+STATIC_VM_PROPERTIES = [
+    "config.changeVersion",
+    "config.guestId",
+    "config.version",
+    "config.firmware",
+    "config.hardware.numCPU",
+    "config.hardware.memoryMB",
+    "config.hardware.device",
+]
+# Capa volátil: se relee en cada pasada (incluye changeVersion para detectar cambios de config
+# y template para no listar templates de los que aún no hay capa estática).
+VOLATILE_VM_PROPERTIES = [
+    "name",
+    "config.changeVersion",
+    "config.template",
+    "runtime.powerState",
+    "runtime.host",
+    "runtime.maxCpuUsage",
+    "guest.ipAddress",
+    "summary.quickStats",
+]
+VM_PROPERTIES = list(dict.fromkeys(VOLATILE_VM_PROPERTIES + STATIC_VM_PROPERTIES))
+HOST_PROPERTIES = ["name", "parent"]
+NAME_PROPERTIES = ["name"]
+INVENTORY_VIEW_TYPES = [vim.VirtualMachine, vim.HostSystem, vim.ComputeResource, vim.Network]
+
+_POWER_STATE_MAP = {
+    "poweredOn": "POWERED_ON",
+    "poweredOff": "POWERED_OFF",
+    "suspended": "SUSPENDED",
+}
+
+_GUEST_ID_BOUNDARY = re.compile(r"(?<=[a-z])(?=[A-Z0-9])|(?<=[0-9])(?=[A-Z])")
+
+PropertyMap = Dict[str, Dict[str, object]]
+
+# Nombres de hosts/clusters/redes compartidos por las pasadas de cada shard de un mismo job.
+_INVENTORY_NAMES = SingleFlightTTLCache(maxsize=1, ttl=60, name="inventory_names")
+
+
+# ───────────────────────────────────────────────────────────────────────
+# Normalización SOAP → formato REST (mismo contrato que el motor REST)
+# ───────────────────────────────────────────────────────────────────────
+
+
+def _normalize_power_state(value: Optional[str]) -> str:
+    if not value:
+        return "unknown"
+    return _POWER_STATE_MAP.get(str(value), str(value).upper())
+
+
+def _normalize_guest_id(value: Optional[str]) -> Optional[str]:
+    """Convert a SOAP guestId (``windows9Server64Guest``) to the REST enum (``WINDOWS_9_SERVER_64``)."""
+    if not value:
+        return None
+    raw = str(value)
+    if raw.endswith("Guest"):
+        raw = raw[: -len("Guest")]
+    return _GUEST_ID_BOUNDARY.sub("_", raw).upper() or None
+
+
+def _normalize_hw_version(value: Optional[str]) -> str:
+    if not value:
+        return "<sin datos>"
+    return str(value).replace("-", "_").upper()
+
+
+def _moid(ref) -> Optional[str]:
+    return getattr(ref, "_moId", None) if ref is not None else None
+
+
+def _extract_devices(devices: Iterable, network_names: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+    """Return (disks, nics, networks) from ``config.hardware.device``."""
+    disks: List[str] = []
+    nics: List[str] = []
+    networks: List[str] = []
+    for device in devices or []:
+        if isinstance(device, vim.vm.device.VirtualDisk):
+            capacity = getattr(device, "capacityInBytes", None)
+            if not capacity:
+                capacity_kb = getattr(device, "capacityInKB", None)
+                capacity = capacity_kb * 1024 if capacity_kb else None
+            if isinstance(capacity, int):
+                disks.append(_format_disk_size(capacity))
+            continue
+        if not isinstance(device, vim.vm.device.VirtualEthernetCard):
+            continue
+
+        label = getattr(getattr(device, "deviceInfo", None), "label", None)
+        if label:
+            nics.append(label)
+
+        backing = getattr(device, "backing", None)
+        network_name: Optional[str] = None
+        if isinstance(backing, vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo):
+            portgroup_key = getattr(getattr(backing, "port", None), "portgroupKey", None)
+            if portgroup_key:
+                network_name = network_names.get(portgroup_key) or portgroup_key
+        elif backing is not None:
+            network_name = getattr(backing, "deviceName", None)
+            if not network_name:
+                network_id = _moid(getattr(backing, "network", None))
+                if network_id:
+                    network_name = network_names.get(network_id) or network_id
+        if network_name:
+            networks.append(network_name)
+    return disks, nics, networks
+
+
+def build_vms_from_properties(
+    vm_props: PropertyMap,
+    host_props: PropertyMap,
+    compute_names: Dict[str, str],
+    network_names: Dict[str, str],
+) -> Tuple[List[VMBase], Dict[str, PlacementInfo]]:
+    """
+    Construye la lista de ``VMBase`` y el mapa de placement a partir de las
+    propiedades agrupadas por tipo (claves = moId).
+    """
+    out: List[VMBase] = []
+    placements: Dict[str, PlacementInfo] = {}
+
+    for vm_id, props in vm_props.items():
+        if props.get("config.template"):
+            continue
+        vm_name = props.get("name") or f"<sin nombre {vm_id}>"
+
+        host_name = "<sin datos host>"
+        cluster_name = "<sin datos cluster>"
+        host_id = _moid(props.get("runtime.host"))
+        host_entry = host_props.get(host_id) if host_id else None
+        if host_entry:
+            host_name = host_entry.get("name") or host_name
+            parent_id = _moid(host_entry.get("parent"))
+            if parent_id and compute_names.get(parent_id):
+                cluster_name = compute_names[parent_id]
+
+        memory_mb = props.get("config.hardware.memoryMB")
+        placement = _placement_from_quickstats(
+            host_name,
+            cluster_name,
+            props.get("summary.quickStats"),
+            max_cpu_mhz=props.get("runtime.maxCpuUsage"),
+            memory_mb=memory_mb,
+        )
+        placements[vm_id] = placement
+
+        disks, nics, networks = _extract_devices(props.get("config.hardware.device"), network_names)
+        compat_code = _normalize_hw_version(props.get("config.version"))
+        boot_type = _normalize_boot_type(props.get("config.firmware"))
+        ip_address = props.get("guest.ipAddress")
+
+        out.append(
+            VMBase(
+                id=vm_id,
+                name=vm_name,
+                power_state=_normalize_power_state(props.get("runtime.powerState")),
+                cpu_count=props.get("config.hardware.numCPU") or 0,
+                memory_size_MiB=memory_mb or 0,
+                environment=infer_environment(vm_name),
+                guest_os=_normalize_guest_id(props.get("config.guestId")),
+                host=host_name,
+                cluster=cluster_name,
+                compatibility_code=compat_code,
+                compatibility_human=COMPAT_MAP.get(compat_code, compat_code),
+                networks=networks or ["<sin datos>"],
+                ip_addresses=[ip_address] if isinstance(ip_address, str) and ip_address else [],
+                disks=disks,
+                nics=nics,
+                cpu_usage_pct=placement.cpu_usage_pct,
+                ram_demand_mib=placement.ram_demand_mib,
+                ram_usage_pct=placement.ram_usage_pct,
+                compat_generation=_infer_generation_from_boot(boot_type) or boot_type,
+                boot_type=boot_type,
+            )
+        )
+
+    return out, placements
+
+
+# ───────────────────────────────────────────────────────────────────────
+# PropertyCollector
+# ───────────────────────────────────────────────────────────────────────
+
+
+def build_filter_spec(
+    view,
+    vm_properties: Optional[List[str]] = None,
+) -> vmodl.query.PropertyCollector.FilterSpec:
+    traversal = vmodl.query.PropertyCollector.TraversalSpec(
+        name="traverseView",
+        path="view",
+        skip=False,
+        type=vim.view.ContainerView,
+    )
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+    prop_specs = [
+        vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=vm_properties or VM_PROPERTIES),
+        vmodl.query.PropertyCollector.PropertySpec(type=vim.HostSystem, pathSet=HOST_PROPERTIES),
+        vmodl.query.PropertyCollector.PropertySpec(type=vim.ComputeResource, pathSet=NAME_PROPERTIES),
+        vmodl.query.PropertyCollector.PropertySpec(type=vim.Network, pathSet=NAME_PROPERTIES),
+    ]
+    return vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=prop_specs)
+
+
+def _retrieve_paged(collector, filter_spec, page_size: int) -> Iterator:
+    options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+    result = collector.RetrievePropertiesEx(specSet=[filter_spec], options=options)
+    pages = 0
+    while result is not None:
+        pages += 1
+        for obj_content in result.objects or []:
+            yield obj_content
+        token = getattr(result, "token", None)
+        if not token:
+            break
+        check_deadline()  # un job vencido/cancelado deja de paginar
+        result = collector.ContinueRetrievePropertiesEx(token=token)
+    logger.debug("PropertyCollector retrieved %d page(s)", pages)
+
+
+def object_kind(obj) -> Optional[str]:
+    """Classify a managed object reference as ``vm``/``host``/``compute``/``network``."""
+    if isinstance(obj, vim.VirtualMachine):
+        return "vm"
+    if isinstance(obj, vim.HostSystem):
+        return "host"
+    if isinstance(obj, vim.ComputeResource):
+        return "compute"
+    if isinstance(obj, vim.Network):
+        return "network"
+    return None
+
+
+def split_property_state(
+    state: Dict[str, PropertyMap],
+) -> Tuple[PropertyMap, PropertyMap, Dict[str, str], Dict[str, str]]:
+    """Turn ``{kind: {moid: props}}`` into the arguments of ``build_vms_from_properties``."""
+    compute_names = {moid: props.get("name") or moid for moid, props in state.get("compute", {}).items()}
+    network_names = {moid: props.get("name") or moid for moid, props in state.get("network", {}).items()}
+    return state.get("vm", {}), state.get("host", {}), compute_names, network_names
+
+
+def group_object_contents(
+    contents: Iterable,
+) -> Tuple[PropertyMap, PropertyMap, Dict[str, str], Dict[str, str]]:
+    """Group ``ObjectContent`` entries by managed object type."""
+    state: Dict[str, PropertyMap] = {"vm": {}, "host": {}, "compute": {}, "network": {}}
+    for obj_content in contents:
+        kind = object_kind(obj_content.obj)
+        if kind is None:
+            continue
+        state[kind][obj_content.obj._moId] = {prop.name: prop.val for prop in obj_content.propSet or []}
+    return split_property_state(state)
+
+
+def _subset(props: Dict[str, object], keys: List[str]) -> Dict[str, object]:
+    return {key: props[key] for key in keys if key in props}
+
+
+def _retrieve_static(content, vm_ids: List[str], page_size: int) -> PropertyMap:
+    """Lee la capa estática solo de ``vm_ids`` (ObjectSpec explícitos, sin vista)."""
+    stub = content.propertyCollector._stub
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=[
+            vmodl.query.PropertyCollector.ObjectSpec(obj=vim.VirtualMachine(vm_id, stub), skip=False)
+            for vm_id in vm_ids
+        ],
+        propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=STATIC_VM_PROPERTIES)],
+        reportMissingObjectsInResults=True,
+    )
+    return {
+        obj_content.obj._moId: {prop.name: prop.val for prop in obj_content.propSet or []}
+        for obj_content in _retrieve_paged(content.propertyCollector, filter_spec, page_size)
+        if obj_content.propSet
+    }
+
+
+def _retrieve_view(content, container, view_types: List, vm_properties: List[str], page_size: int):
+    view = None
+    try:
+        view = content.viewManager.CreateContainerView(container, view_types, True)
+        filter_spec = build_filter_spec(view, vm_properties)
+        return group_object_contents(_retrieve_paged(content.propertyCollector, filter_spec, page_size))
+    finally:
+        if view is not None:
+            try:
+                view.Destroy()
+            except Exception:  # pragma: no cover - defensive
+                logger.debug("Error destroying SOAP view", exc_info=True)
+
+
+def _stale_static(content, vm_props: PropertyMap, volatile_only: bool, page_size: int) -> Optional[PropertyMap]:
+    """En pasadas volátiles, relee la capa estática solo de las VMs que la necesitan."""
+    if not volatile_only:
+        return None
+    stale = vm_attribute_layers.stale_static_ids(vm_props)
+    return _retrieve_static(content, stale, page_size) if stale else {}
+
+
+def _store_layers(vm_props: PropertyMap, static_props: Optional[PropertyMap], *, shard: Optional[str] = None) -> int:
+    if static_props is None:
+        static_props = {vm_id: _subset(props, STATIC_VM_PROPERTIES) for vm_id, props in vm_props.items()}
+    vm_attribute_layers.update_static(static_props)
+    vm_attribute_layers.replace_volatile(
+        {vm_id: _subset(props, VOLATILE_VM_PROPERTIES) for vm_id, props in vm_props.items()},
+        shard=shard,
+    )
+    return len(static_props)
+
+
+def _inventory_names(content, page_size: int) -> Tuple[PropertyMap, Dict[str, str], Dict[str, str]]:
+    def _load():
+        _, host_props, compute_names, network_names = _retrieve_view(
+            content,
+            content.rootFolder,
+            [vim.HostSystem, vim.ComputeResource, vim.Network],
+            NAME_PROPERTIES,
+            page_size,
+        )
+        return host_props, compute_names, network_names
+
+    return _INVENTORY_NAMES.get_or_load("names", _load)
+
+
+def get_vms_bulk(*, page_size: Optional[int] = None, volatile_only: bool = False) -> List[VMBase]:
+    """
+    Retrieve the VM inventory through paged PropertyCollector calls.
+
+    ``volatile_only`` reads only the volatile properties of every VM and
+    refreshes the static layer just for VMs whose ``config.changeVersion``
+    changed (or whose static TTL expired). The first pass is always full.
+    """
+    if settings.test_mode:
+        return []
+    page_size = page_size or settings.vmware_bulk_page_size
+    volatile_only = volatile_only and vm_attribute_layers.has_static()
+    started = time.perf_counter()
+
+    def _collect(content):
+        vm_properties = VOLATILE_VM_PROPERTIES if volatile_only else VM_PROPERTIES
+        grouped = _retrieve_view(content, content.rootFolder, INVENTORY_VIEW_TYPES, vm_properties, page_size)
+        return grouped, _stale_static(content, grouped[0], volatile_only, page_size)
+
+    (vm_props, host_props, compute_names, network_names), static_props = vcenter_sessions.run_soap(_collect)
+    refreshed = _store_layers(vm_props, static_props)
+
+    vms, placements = build_vms_from_properties(
+        vm_attribute_layers.merged(),
+        host_props,
+        compute_names,
+        network_names,
+    )
+    for vm_id, placement in placements.items():
+        placement_cache[vm_id] = placement
+    logger.info(
+        "Bulk VMware inventory (%s): %d VMs in %.2fs (page_size=%d, static refreshed=%d)",
+        "volatile" if volatile_only else "full",
+        len(vms),
+        time.perf_counter() - started,
+        page_size,
+        refreshed,
+    )
+    return vms
+
+
+# ───────────────────────────────────────────────────────────────────────
+# Shards (un cluster / host standalone por shard)
+# ───────────────────────────────────────────────────────────────────────
+
+
+def shard_key(cluster_name: Optional[str]) -> str:
+    return (cluster_name or "").strip().lower()
+
+
+def discover_shards(*, page_size: Optional[int] = None) -> Dict[str, List[str]]:
+    """
+    ``{shard: [compute_resource_moid, ...]}`` con un shard por ``ComputeResource``
+    (cluster o host standalone). El nombre del shard coincide con ``VMBase.cluster``
+    en minúsculas; clusters homónimos en distintos datacenters comparten shard.
+    """
+    if settings.test_mode:
+        return {}
+    page_size = page_size or settings.vmware_bulk_page_size
+    _, compute_names, _ = vcenter_sessions.run_soap(lambda content: _inventory_names(content, page_size))
+    shards: Dict[str, List[str]] = {}
+    for moid, name in sorted(compute_names.items()):
+        key = shard_key(name)
+        if key:
+            shards.setdefault(key, []).append(moid)
+    return shards
+
+
+def get_vms_bulk_shard(
+    shard: str,
+    compute_ids: List[str],
+    *,
+    page_size: Optional[int] = None,
+    volatile_only: bool = False,
+) -> List[VMBase]:
+    """Inventario de las VMs de un shard (vista sobre sus ``ComputeResource``)."""
+    if settings.test_mode:
+        return []
+    page_size = page_size or settings.vmware_bulk_page_size
+    volatile_only = volatile_only and vm_attribute_layers.has_static()
+    started = time.perf_counter()
+
+    def _collect(content):
+        stub = content.propertyCollector._stub
+        vm_properties = VOLATILE_VM_PROPERTIES if volatile_only else VM_PROPERTIES
+        vm_props: PropertyMap = {}
+        for compute_id in compute_ids:
+            container = vim.ComputeResource(compute_id, stub)
+            vm_props.update(_retrieve_view(content, container, [vim.VirtualMachine], vm_properties, page_size)[0])
+        names = _inventory_names(content, page_size)
+        return vm_props, names, _stale_static(content, vm_props, volatile_only, page_size)
+
+    vm_props, (host_props, compute_names, network_names), static_props = vcenter_sessions.run_soap(_collect)
+    refreshed = _store_layers(vm_props, static_props, shard=shard)
+    vms, placements = build_vms_from_properties(
+        vm_attribute_layers.merged(vm_props.keys()),
+        host_props,
+        compute_names,
+        network_names,
+    )
+    for vm_id, placement in placements.items():
+        placement_cache[vm_id] = placement
+    logger.info(
+        "Bulk VMware shard '%s' (%s): %d VMs in %.2fs (static refreshed=%d)",
+        shard,
+        "volatile" if volatile_only else "full",
+        len(vms),
+        time.perf_counter() - started,
+        refreshed,
+    )
+    return vms
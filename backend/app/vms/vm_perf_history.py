@@ -0,0 +1,385 @@
+"""In-memory perf history for VMware VMs.
+
+A background sampler collects the ``vm_perf_service.METRICS`` set for every
+powered-on VM (through the batched ``QueryPerf`` path) and appends each sample
+to a fixed-size ring buffer per VM. Buffers are ``array('d')`` columns (one per
+metric plus timestamps, ``NaN`` for gaps) so memory stays constant and
+statistics run over contiguous doubles instead of lists of dicts.
+
+Only the leader samples. When ``SHARED_SNAPSHOT_DIR`` is set it also publishes
+the whole history after each pass (``SharedPerfHistory``) and the other workers
+of the node read it through ``mmap``, like the shared snapshot blobs.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_NAN = float("nan")
+
+
+def _percentile(ordered: Sequence[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile over an already sorted sequence."""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def series_stats(values: Iterable[float]) -> Dict[str, Optional[float]]:
+    """min/avg/max/p95 ignorando huecos (NaN)."""
+    present = sorted(value for value in values if value == value)
+    if not present:
+        return {"min": None, "avg": None, "max": None, "p95": None}
+    return {
+        "min": present[0],
+        "avg": math.fsum(present) / len(present),
+        "max": present[-1],
+        "p95": _percentile(present, 95),
+    }
+
+
+def _series_payload(
+    timestamps: Sequence[float],
+    columns: Mapping[str, Sequence[float]],
+    keys: Sequence[str],
+) -> Dict[str, object]:
+    selected = [key for key in keys if key in columns]
+    return {
+        "timestamps": [datetime.fromtimestamp(ts, tz=timezone.utc).isoformat() for ts in timestamps],
+        "series": {key: [value if value == value else None for value in columns[key]] for key in selected},
+        "stats": {key: series_stats(columns[key]) for key in selected},
+    }
+
+
+class PerfRingBuffer:
+    """Columnas circulares de tamaño fijo: timestamps + una por metrica."""
+
+    __slots__ = ("capacity", "keys", "_ts", "_columns", "_head", "_size")
+
+    def __init__(self, capacity: int, keys: Sequence[str]) -> None:
+        self.capacity = max(int(capacity), 1)
+        self.keys = tuple(keys)
+        self._ts = array("d", [_NAN]) * self.capacity
+        self._columns = {key: array("d", [_NAN]) * self.capacity for key in self.keys}
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, sample: Mapping[str, Optional[float]]) -> None:
+        slot = self._head
+        self._ts[slot] = timestamp
+        for key, column in self._columns.items():
+            value = sample.get(key)
+            column[slot] = float(value) if isinstance(value, (int, float)) else _NAN
+        self._head = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def _ordered(self, column: array) -> array:
+        if self._size < self.capacity:
+            return column[: self._size]
+        return column[self._head :] + column[: self._head]
+
+    def window(self, since: Optional[float] = None) -> Tuple[array, Dict[str, array]]:
+        """Devuelve (timestamps, {metrica: valores}) en orden cronologico desde ``since``."""
+        timestamps = self._ordered(self._ts)
+        start = bisect.bisect_left(timestamps, since) if since is not None else 0
+        columns = {key: self._ordered(column)[start:] for key, column in self._columns.items()}
+        return timestamps[start:], columns
+
+
+class PerfHistoryStore:
+    """Ring buffer por VM mas el ultimo resumen completo (para servir ``/perf`` desde memoria)."""
+
+    def __init__(self, *, capacity: int, keys: Sequence[str]) -> None:
+        self._capacity = max(int(capacity), 1)
+        self._keys = tuple(keys)
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, PerfRingBuffer] = {}
+        self._latest: Dict[str, Tuple[float, Dict[str, object]]] = {}
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def record(self, vm_id: str, summary: Dict[str, object], *, timestamp: Optional[float] = None) -> None:
+        ts = time.time() if timestamp is None else timestamp
+        with self._lock:
+            buffer = self._buffers.get(vm_id)
+            if buffer is None:
+                buffer = self._buffers[vm_id] = PerfRingBuffer(self._capacity, self._keys)
+            buffer.append(ts, summary)
+            self._latest[vm_id] = (ts, summary)
+
+    def latest(self, vm_id: str, *, max_age: float) -> Optional[Dict[str, object]]:
+        with self._lock:
+            entry = self._latest.get(vm_id)
+        if entry is None or time.time() - entry[0] > max_age:
+            return None
+        return entry[1]
+
+    def series(
+        self,
+        vm_id: str,
+        *,
+        minutes: int,
+        keys: Optional[Sequence[str]] = None,
+    ) -> Optional[Dict[str, object]]:
+        since = time.time() - minutes * 60
+        with self._lock:
+            buffer = self._buffers.get(vm_id)
+            if buffer is None:
+                return None
+            timestamps, columns = buffer.window(since)
+        return _series_payload(timestamps, columns, keys or self._keys)
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """Elimina el historial de VMs que ya no se muestrean (apagadas o borradas)."""
+        keep_ids = set(keep)
+        with self._lock:
+            stale = [vm_id for vm_id in self._buffers if vm_id not in keep_ids]
+            for vm_id in stale:
+                self._buffers.pop(vm_id, None)
+                self._latest.pop(vm_id, None)
+        return len(stale)
+
+    def export(self) -> List[Tuple[str, array, Dict[str, array], Tuple[float, Dict[str, object]]]]:
+        """Copia de (vm_id, timestamps, columnas, ultimo resumen) por VM, para publicarla."""
+        with self._lock:
+            exported = []
+            for vm_id, buffer in self._buffers.items():
+                timestamps, columns = buffer.window()
+                exported.append((vm_id, timestamps, columns, self._latest[vm_id]))
+            return exported
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            vms = len(self._buffers)
+        return {
+            "vms": vms,
+            "capacity": self._capacity,
+            "bytes_per_vm": self._capacity * 8 * (len(self._keys) + 1),
+        }
+
+
+_SHARED_MAGIC = b"VMPH"
+_SHARED_LAYOUT = 1
+# magic | layout | reservado | len(indice JSON); luego el indice y las columnas (doubles nativos)
+_SHARED_HEADER = struct.Struct("<4sHHQ")
+_DOUBLE = array("d").itemsize
+
+
+class SharedPerfHistory:
+    """
+    Historial publicado por el líder en ``directory`` para los demás workers del nodo.
+
+    El archivo se reemplaza entero (temporal + ``os.replace``) tras cada pasada
+    del sampler. Los lectores lo mapean una vez por versión y solo copian las
+    columnas de la VM y ventana pedidas.
+    """
+
+    _FILENAME = "vmware-perf-history.perf"
+
+    def __init__(self, directory: Optional[str], *, keys: Sequence[str]) -> None:
+        self.directory = directory
+        self._keys = tuple(keys)
+        self._lock = threading.Lock()
+        # ((inode, mtime_ns, size), indice, memoryview de las columnas)
+        self._mapped: Optional[Tuple[Tuple[int, int, int], Dict[str, object], memoryview]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self._FILENAME)
+
+    def publish(self, store: PerfHistoryStore) -> None:
+        vms: Dict[str, object] = {}
+        chunks: List[bytes] = []
+        offset = 0
+        for vm_id, timestamps, columns, (latest_ts, latest) in store.export():
+            vms[vm_id] = {"offset": offset, "count": len(timestamps), "latest_ts": latest_ts, "latest": latest}
+            for column in (timestamps, *(columns[key] for key in self._keys)):
+                chunks.append(column.tobytes())
+                offset += len(column) * _DOUBLE
+        index = json.dumps({"keys": list(self._keys), "vms": vms}, default=str).encode("utf-8")
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(_SHARED_HEADER.pack(_SHARED_MAGIC, _SHARED_LAYOUT, 0, len(index)))
+            fh.write(index)
+            fh.writelines(chunks)
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> Optional[Tuple[Dict[str, object], memoryview]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            mapped = self._mapped
+        if mapped is not None and mapped[0] == signature:
+            return mapped[1], mapped[2]
+        try:
+            with open(self.path, "rb") as fh:
+                buffer = memoryview(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+            magic, layout, _, index_len = _SHARED_HEADER.unpack_from(buffer)
+            if magic != _SHARED_MAGIC or layout != _SHARED_LAYOUT:
+                return None
+            start = _SHARED_HEADER.size
+            index = json.loads(bytes(buffer[start : start + index_len]))
+        except (OSError, ValueError, struct.error) as exc:
+            logger.warning("Failed to map shared perf history %s: %s", self.path, exc)
+            return None
+        data = buffer[_SHARED_HEADER.size + index_len :]
+        with self._lock:
+            self._mapped = (signature, index, data)
+        return index, data
+
+    def latest(self, vm_id: str, *, max_age: float) -> Optional[Dict[str, object]]:
+        loaded = self._load()
+        entry = loaded[0]["vms"].get(vm_id) if loaded else None
+        if entry is None or time.time() - entry["latest_ts"] > max_age:
+            return None
+        return entry["latest"]
+
+    def series(
+        self,
+        vm_id: str,
+        *,
+        minutes: int,
+        keys: Optional[Sequence[str]] = None,
+    ) -> Optional[Dict[str, object]]:
+        loaded = self._load()
+        entry = loaded[0]["vms"].get(vm_id) if loaded else None
+        if entry is None:
+            return None
+        index, data = loaded
+        count = entry["count"]
+        width = count * _DOUBLE
+
+        def column(position: int, start: int = 0) -> array:
+            values = array("d")
+            base = entry["offset"] + position * width
+            values.frombytes(data[base + start * _DOUBLE : base + width])
+            return values
+
+        timestamps = column(0)
+        start = bisect.bisect_left(timestamps, time.time() - minutes * 60)
+        wanted = keys or index["keys"]
+        columns = {
+            key: column(position + 1, start) for position, key in enumerate(index["keys"]) if key in wanted
+        }
+        return _series_payload(timestamps[start:], columns, wanted)
+
+
+class PerfSampler:
+    """
+    Hilo que cada ``interval_seconds`` muestrea las VMs encendidas.
+
+    ``list_vm_ids()`` devuelve los ids a muestrear y ``collect(ids)`` el
+    resultado de ``get_vm_perf_batch`` (``{"results": {vm_id: summary}}``).
+    ``publish(store)``, si se indica, corre al final de cada pasada.
+    """
+
+    def __init__(
+        self,
+        store: PerfHistoryStore,
+        *,
+        interval_seconds: int,
+        list_vm_ids: Callable[[], List[str]],
+        collect: Callable[[List[str]], Dict[str, object]],
+        batch_size: int = 500,
+        publish: Optional[Callable[[PerfHistoryStore], None]] = None,
+    ) -> None:
+        self._store = store
+        self._publish = publish
+        self._interval = max(int(interval_seconds), 1)
+        self._list_vm_ids = list_vm_ids
+        self._collect = collect
+        self._batch_size = max(int(batch_size), 1)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.last_run_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def interval_seconds(self) -> int:
+        return self._interval
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        # Evento propio por arranque: un hilo anterior detenido a mitad de
+        # ``sample_once`` termina su pasada y sale, no sigue en paralelo al nuevo.
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="vmware-perf-sampler", daemon=True)
+        self._thread.start()
+        logger.info("VMware perf sampler started (interval=%ss)", self._interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                self._sample(stop)
+                self.last_error = None
+            except Exception as exc:
+                self.last_error = str(exc)
+                logger.warning("VMware perf sampler error: %s", exc)
+            stop.wait(max(self._interval - (time.monotonic() - started), 1))
+
+    def sample_once(self) -> int:
+        return self._sample(self._stop)
+
+    def _sample(self, stop: threading.Event) -> int:
+        started = time.monotonic()
+        vm_ids = list(dict.fromkeys(self._list_vm_ids()))
+        recorded = 0
+        for start in range(0, len(vm_ids), self._batch_size):
+            if stop.is_set():
+                break
+            payload = self._collect(vm_ids[start : start + self._batch_size])
+            if stop.is_set():
+                break
+            now = time.time()
+            for vm_id, summary in (payload.get("results") or {}).items():
+                self._store.record(vm_id, summary, timestamp=now)
+                recorded += 1
+        self._store.prune(vm_ids)
+        if self._publish is not None:
+            try:
+                self._publish(self._store)
+            except Exception as exc:
+                logger.warning("VMware perf sampler: failed to publish shared history: %s", exc)
+        self.samples += recorded
+        self.last_run_at = time.time()
+        self.last_duration = time.monotonic() - started
+        logger.debug("VMware perf sampler: %d VM(s) sampled in %.2fs", recorded, self.last_duration)
+        return recorded
@@ -2,23 +2,45 @@
 from __future__ import annotations
 
 import logging
+import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Callable, Dict, List, Optional, Tuple
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from fastapi import HTTPException
-from pyVim.connect import Disconnect
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 
+from app.jobs.leader import ensure_leader, leader_elector
+from app.settings import settings
 from app.vms import vm_service
+from app.vms.vm_bulk_service import _retrieve_paged
+from app.vms.vm_perf_history import PerfHistoryStore, PerfSampler, SharedPerfHistory
 
 logger = logging.getLogger(__name__)
 
-_COUNTER_CACHE = vm_service.ThreadSafeTTLCache(maxsize=128, ttl=3600)
-_RESULT_CACHE = vm_service.ThreadSafeTTLCache(maxsize=512, ttl=30)
+_COUNTER_CACHE = vm_service.SingleFlightTTLCache(maxsize=8, ttl=24 * 3600, name="perf_counters")
+_AVAILABLE_CACHE = vm_service.SingleFlightTTLCache(
+    maxsize=4096,
+    ttl=settings.vmware_perf_available_ttl_seconds,
+    name="perf_available",
+)
+_RESULT_CACHE = vm_service.SingleFlightTTLCache(maxsize=512, ttl=90, soft_ttl=30, name="perf_results")
 
 _REALTIME_INTERVAL = 20  # seconds
 _ROLLUP_INTERVAL = 300  # seconds (5 minutes)
+_MAX_WINDOW_SECONDS = 1800
+
+BATCH_MAX_VMS = 500
+_BATCH_CHUNK_SIZE = 50
+_VM_PERF_PROPERTIES = [
+    "config.changeVersion",
+    "runtime.host",
+    "summary.quickStats",
+    "summary.runtime.maxCpuUsage",
+    "summary.config.memorySizeMB",
+    "config.hardware.device",
+]
 
 
 @dataclass(frozen=True)
@@ -88,40 +110,77 @@ METRICS: Dict[str, MetricConfig] = {
 PERCENT_METRICS: set[str] = {"cpu_usage_pct", "mem_usage_pct"}
 
 
-def _get_counter_id(perf_manager: vim.PerformanceManager, config: MetricConfig) -> Optional[int]:
-    cache_key = f"{config.group}:{config.name}:{config.rollup}"
-    cached = _COUNTER_CACHE.get(cache_key)
-    if cached is not None:
-        return cached
+CounterCatalog = Dict[Tuple[str, str, str], int]
+AvailableMetrics = Dict[int, Tuple[str, ...]]
 
-    for counter in perf_manager.perfCounter:
-        if (
-            counter.groupInfo.key == config.group
-            and counter.nameInfo.key == config.name
-            and counter.rollupType == config.rollup
-        ):
-            _COUNTER_CACHE[cache_key] = counter.key
-            return counter.key
 
-    logger.warning("Metric %s.%s (%s) not found in vCenter counters", config.group, config.name, config.rollup)
-    _COUNTER_CACHE[cache_key] = None
-    return None
+def _counter_catalog(perf_manager: vim.PerformanceManager) -> CounterCatalog:
+    """``(group, name, rollup) -> counterId``; ``perfCounter`` se descarga una vez por sesion."""
+    session_key = f"catalog:{id(getattr(perf_manager, '_stub', None))}"
 
+    def _load() -> CounterCatalog:
+        catalog: CounterCatalog = {}
+        for counter in perf_manager.perfCounter or []:
+            catalog[(counter.groupInfo.key, counter.nameInfo.key, str(counter.rollupType))] = counter.key
+        logger.info("Perf counter catalog loaded (%d counters)", len(catalog))
+        return catalog
 
-def _find_vm(content: vim.ServiceInstanceContent, vm_id: str) -> Optional[vim.VirtualMachine]:
-    view = None
-    try:
-        view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-        for vm in view.view:
-            if vm._moId == vm_id:
-                return vm
-    finally:
-        if view is not None:
-            try:
-                view.Destroy()
-            except Exception:  # pragma: no cover - defensive
-                logger.debug("Error destroying VM container view while searching for %s", vm_id)
-    return None
+    return _COUNTER_CACHE.get_or_load(session_key, _load)
+
+
+def _available_metrics(
+    perf_manager: vim.PerformanceManager,
+    vm_ref: vim.VirtualMachine,
+    change_version: Optional[str],
+) -> AvailableMetrics:
+    """
+    ``counterId -> instancias`` disponibles en tiempo real para la VM.
+
+    La clave incluye ``config.changeVersion``: agregar o quitar discos cambia la
+    version y fuerza una nueva consulta sin esperar al TTL.
+    """
+    cache_key = f"{vm_ref._moId}:{change_version or ''}"
+
+    def _load() -> AvailableMetrics:
+        grouped: Dict[int, List[str]] = {}
+        for metric in perf_manager.QueryAvailablePerfMetric(entity=vm_ref, intervalId=_REALTIME_INTERVAL) or []:
+            grouped.setdefault(metric.counterId, []).append(metric.instance or "")
+        return {counter_id: tuple(instances) for counter_id, instances in grouped.items()}
+
+    return _AVAILABLE_CACHE.get_or_load(cache_key, _load)
+
+
+def plan_metric_query(
+    catalog: CounterCatalog,
+    keys: Iterable[str],
+    available: AvailableMetrics,
+) -> Tuple[List[vim.PerformanceManager.MetricId], Dict[Tuple[int, str], str], List[str]]:
+    """
+    Deriva los ``MetricId`` a consultar para ``keys``.
+
+    Se usa la instancia agregada ("") si ``available`` la tiene y, si no, todas
+    las instancias disponibles (p.ej. latencias de disco, que son por dispositivo).
+    Devuelve (metric_ids, (counterId, instancia) -> metrica, metricas faltantes).
+    """
+    metric_ids: List[vim.PerformanceManager.MetricId] = []
+    counter_to_key: Dict[Tuple[int, str], str] = {}
+    missing: List[str] = []
+    for key in keys:
+        config = METRICS[key]
+        counter_id = catalog.get((config.group, config.name, config.rollup))
+        if counter_id is None:
+            missing.append(key)
+            continue
+        instances: Sequence[str] = available.get(counter_id, ())
+        if not instances:
+            missing.append(key)
+            continue
+        if "" in instances:
+            instances = ("",)
+        for instance in instances:
+            metric_ids.append(vim.PerformanceManager.MetricId(counterId=counter_id, instance=instance))
+            counter_to_key[(counter_id, instance)] = key
+    return metric_ids, counter_to_key, missing
 
 
 def _process_results(
@@ -294,6 +353,15 @@ def _build_disk_capacity_map(
     return mapping
 
 
+def _disk_capacity_total(mapping: Dict[str, Dict[str, Optional[float]]]) -> Optional[float]:
+    if not mapping:
+        return None
+    # cada disco aparece una vez por alias: se suma por disco (``_key``)
+    disks = {info.get("_key"): info for info in mapping.values()}
+    capacities = [info.get("capacity_kb") for info in disks.values() if info.get("capacity_kb") is not None]
+    return sum(capacities) if capacities else None
+
+
 def _summarize_disk_capacity_map(mapping: Dict[str, Dict[str, Optional[float]]]) -> List[Dict[str, object]]:
     grouped: Dict[str, Dict[str, object]] = {}
     for alias, info in mapping.items():
@@ -315,6 +383,14 @@ def _summarize_disk_capacity_map(mapping: Dict[str, Dict[str, Optional[float]]])
         entry["aliases"] = sorted(entry["aliases"])  # type: ignore[assignment]
     return sorted(grouped.values(), key=lambda x: x["key"])
 
+def _clamp_window(window_seconds: int) -> int:
+    return max(_REALTIME_INTERVAL, min(int(window_seconds), _MAX_WINDOW_SECONDS))
+
+
+def _result_cache_key(vm_id: str, window_seconds: int, idle_to_zero: bool, by_disk: bool) -> str:
+    return f"{vm_id}:{window_seconds}:{int(idle_to_zero)}:{int(by_disk)}"
+
+
 def get_vm_perf_summary(
     vm_id: str,
     *,
@@ -322,58 +398,112 @@ def get_vm_perf_summary(
     idle_to_zero: bool = False,
     by_disk: bool = False,
 ) -> Dict[str, Optional[float]]:
-    if window_seconds < _REALTIME_INTERVAL:
-        window_seconds = _REALTIME_INTERVAL
-    if window_seconds > 1800:
-        window_seconds = 1800
-
-    cache_key = f"{vm_id}:{window_seconds}:{int(idle_to_zero)}:{int(by_disk)}"
-    cached_summary = _RESULT_CACHE.get(cache_key)
-    if cached_summary is not None:
-        return cached_summary
-
-    si = None
-    missing_metrics: List[str] = []
-    last_timestamp: Optional[datetime] = None
-    disk_instance_values: Optional[Dict[str, Dict[str, List[float]]]] = {} if by_disk else None
-    disk_capacity_map: Dict[str, Dict[str, Optional[float]]] = {}
-    metrics_unavailable = False
+    window_seconds = _clamp_window(window_seconds)
+    # El sampler solo sirve pedidos de su misma ventana; otras ventanas van a vCenter.
+    if not by_disk and window_seconds == sampler_window_seconds():
+        sampled = _history_source().latest(vm_id, max_age=settings.vmware_perf_sampler_interval_seconds * 2)
+        if sampled is not None:
+            if not idle_to_zero:
+                return sampled
+            summary = dict(sampled, _sources=dict(sampled["_sources"]))
+            _apply_idle_zero(summary)
+            return summary
 
-    try:
-        si, content = vm_service._soap_connect()
-    except Exception as exc:  # pragma: no cover - defensive
-        logger.error("Unable to connect to vCenter SOAP API: %s", exc)
-        raise HTTPException(status_code=503, detail="no se pudo conectar al vCenter para metricas") from exc
+    cache_key = _result_cache_key(vm_id, window_seconds, idle_to_zero, by_disk)
+    return _RESULT_CACHE.get_or_load(
+        cache_key,
+        lambda: _collect_vm_perf_summary(
+            vm_id,
+            window_seconds=window_seconds,
+            idle_to_zero=idle_to_zero,
+            by_disk=by_disk,
+        ),
+    )
 
-    try:
-        vm_ref = _find_vm(content, vm_id)
-        if vm_ref is None:
-            raise HTTPException(status_code=404, detail=f"VM {vm_id} no encontrada en vCenter")
 
-        uuid_to_canonical = _build_lun_uuid_map(getattr(vm_ref.runtime, "host", None))
-        disk_capacity_map = _build_disk_capacity_map(vm_ref, uuid_to_canonical)
+def _assemble_summary(
+    vm_ref: object,
+    collected_values: Dict[str, List[float]],
+    *,
+    realtime_sources: set[str],
+    rollup_sources: set[str],
+    missing_metrics: List[str],
+    metrics_unavailable: bool,
+    last_timestamp: Optional[datetime],
+    idle_to_zero: bool,
+) -> Dict[str, Optional[float]]:
+    """Agrega las muestras recogidas y aplica los fallbacks (quickStats / idle_zero)."""
+    summary: Dict[str, Optional[float]] = {key: None for key in METRICS}
+    summary["_interval_seconds"] = _REALTIME_INTERVAL
+    summary["_collected_at"] = (last_timestamp or datetime.now(timezone.utc)).isoformat()
+    summary["missing_metrics"] = sorted(set(missing_metrics))
+    summary["_sources"] = {key: "none" for key in METRICS}
+    summary["_metrics_available"] = not metrics_unavailable
 
-        perf_manager: vim.PerformanceManager = content.perfManager
-        available = perf_manager.QueryAvailablePerfMetric(entity=vm_ref, intervalId=_REALTIME_INTERVAL)
+    for key, values in collected_values.items():
+        aggregated = METRICS[key].aggregate(values)
+        if aggregated is not None:
+            if key in PERCENT_METRICS:
+                aggregated = round(aggregated, 2)
+            summary[key] = aggregated
+            if key in realtime_sources:
+                summary["_sources"][key] = "realtime"
+            elif key in rollup_sources:
+                summary["_sources"][key] = "rollup"
 
-        metric_ids: List[vim.PerformanceManager.MetricId] = []
-        counter_to_key: Dict[Tuple[int, str], str] = {}
-
-        for key, config in METRICS.items():
-            counter_id = _get_counter_id(perf_manager, config)
-            if counter_id is None:
-                missing_metrics.append(key)
-                continue
+    for key, config in METRICS.items():
+        if summary[key] is None and config.quickstat is not None:
+            quick_value = config.quickstat(vm_ref)
+            if quick_value is not None:
+                if key in PERCENT_METRICS:
+                    quick_value = round(quick_value, 2)
+                summary[key] = quick_value
+                summary["_sources"][key] = "quickstats"
 
-            instances = [metric.instance or "" for metric in available if metric.counterId == counter_id]
-            if not instances:
-                missing_metrics.append(key)
-                continue
+    if idle_to_zero:
+        _apply_idle_zero(summary)
 
-            selected_instances = [""] if "" in instances else instances
-            for instance in selected_instances:
-                metric_ids.append(vim.PerformanceManager.MetricId(counterId=counter_id, instance=instance))
-                counter_to_key[(counter_id, instance)] = key
+    for key in summary["missing_metrics"]:
+        summary["_sources"][key] = "missing_metric"
+
+    return summary
+
+
+def _apply_idle_zero(summary: Dict[str, object]) -> None:
+    for key, config in METRICS.items():
+        if summary.get(key) is None and key not in summary["missing_metrics"] and config.zero_when_idle:
+            summary[key] = 0.0
+            summary["_sources"][key] = "idle_zero"
+
+
+def _collect_vm_perf_summary(
+    vm_id: str,
+    *,
+    window_seconds: int,
+    idle_to_zero: bool,
+    by_disk: bool,
+) -> Dict[str, Optional[float]]:
+    def _query(content):
+        # Todo lo que toca vCenter va dentro: run_soap puede reintentarlo completo.
+        last_timestamp: Optional[datetime] = None
+        disk_instance_values: Optional[Dict[str, Dict[str, List[float]]]] = {} if by_disk else None
+        metrics_unavailable = False
+
+        props = _fetch_vm_properties(content, [vm_id]).get(vm_id)
+        if props is None:
+            raise HTTPException(status_code=404, detail=f"VM {vm_id} no encontrada en vCenter")
+        vm_ref = vim.VirtualMachine(vm_id, content.propertyCollector._stub)
+        vm_view = _vm_properties_view(props)
+
+        uuid_to_canonical = _build_lun_uuid_map(props.get("runtime.host"))
+        disk_capacity_map = _build_disk_capacity_map(vm_view, uuid_to_canonical)
+
+        perf_manager: vim.PerformanceManager = content.perfManager
+        metric_ids, counter_to_key, missing_metrics = plan_metric_query(
+            _counter_catalog(perf_manager),
+            METRICS,
+            _available_metrics(perf_manager, vm_ref, props.get("config.changeVersion")),
+        )
 
         if not metric_ids:
             metrics_unavailable = True
@@ -438,59 +568,26 @@ def get_vm_perf_summary(
                         last_timestamp = rollup_timestamp
                 except Exception as exc:  # pragma: no cover - defensive
                     logger.debug("No se pudo obtener metrics rollup para VM %s: %s", vm_id, exc)
+        summary = _assemble_summary(
+            vm_view,
+            collected_values,
+            realtime_sources=realtime_sources,
+            rollup_sources=rollup_sources,
+            missing_metrics=missing_metrics,
+            metrics_unavailable=metrics_unavailable,
+            last_timestamp=last_timestamp,
+            idle_to_zero=idle_to_zero,
+        )
+        summary["disk_capacity_kb_total"] = _disk_capacity_total(disk_capacity_map)
+        return summary, disk_capacity_map, disk_instance_values
+
+    try:
+        summary, disk_capacity_map, disk_instance_values = vm_service._run_soap(_query)
     except HTTPException:
         raise
     except Exception as exc:
         logger.error("Error consultando metricas de VM %s: %s", vm_id, exc)
         raise HTTPException(status_code=502, detail="error consultando metricas en vCenter") from exc
-    finally:
-        if si is not None:
-            try:
-                Disconnect(si)
-            except Exception:  # pragma: no cover - defensive
-                pass
-
-    summary: Dict[str, Optional[float]] = {key: None for key in METRICS}
-    summary["_interval_seconds"] = _REALTIME_INTERVAL
-    summary["_collected_at"] = (last_timestamp or datetime.now(timezone.utc)).isoformat()
-    summary["missing_metrics"] = sorted(set(missing_metrics))
-    summary["_sources"] = {key: "none" for key in METRICS}
-    summary["_metrics_available"] = not metrics_unavailable
-
-    for key, values in collected_values.items():
-        aggregated = METRICS[key].aggregate(values)
-        if aggregated is not None:
-            if key in PERCENT_METRICS:
-                aggregated = round(aggregated, 2)
-            summary[key] = aggregated
-            if key in realtime_sources:
-                summary["_sources"][key] = "realtime"
-            elif key in rollup_sources:
-                summary["_sources"][key] = "rollup"
-
-    for key, config in METRICS.items():
-        if summary[key] is None and config.quickstat is not None:
-            quick_value = config.quickstat(vm_ref)
-            if quick_value is not None:
-                if key in PERCENT_METRICS:
-                    quick_value = round(quick_value, 2)
-                summary[key] = quick_value
-                summary["_sources"][key] = "quickstats"
-
-    if idle_to_zero:
-        for key, config in METRICS.items():
-            if summary[key] is None and key not in summary["missing_metrics"] and config.zero_when_idle:
-                summary[key] = 0.0
-                summary["_sources"][key] = "idle_zero"
-
-    for key in summary["missing_metrics"]:
-        summary["_sources"][key] = "missing_metric"
-
-    if disk_capacity_map:
-        capacities = [info.get("capacity_kb") for info in disk_capacity_map.values() if info.get("capacity_kb") is not None]
-        summary["disk_capacity_kb_total"] = sum(capacities) if capacities else None
-    else:
-        summary["disk_capacity_kb_total"] = None
 
     if by_disk and isinstance(disk_instance_values, dict):
         metric_instances_debug: Dict[str, Dict[str, int]] = {}
@@ -617,5 +714,349 @@ def get_vm_perf_summary(
             "merged_entries": debug_entries,
         }
 
-    _RESULT_CACHE[cache_key] = summary
     return summary
+
+
+# ─────────────────────────────── batch ───────────────────────────────
+
+
+def _normalize_metric_keys(metrics: Optional[List[str]]) -> List[str]:
+    if not metrics:
+        return list(METRICS)
+    unknown = sorted({key for key in metrics if key not in METRICS})
+    if unknown:
+        raise ValueError(f"metricas desconocidas: {', '.join(unknown)}")
+    return [key for key in METRICS if key in set(metrics)]
+
+
+def _select_metrics(summary: Dict[str, object], keys: List[str]) -> Dict[str, object]:
+    if len(keys) == len(METRICS):
+        return summary
+    wanted = set(keys)
+    selected = {key: summary.get(key) for key in keys}
+    for meta in ("_interval_seconds", "_collected_at", "_metrics_available", "disk_capacity_kb_total"):
+        selected[meta] = summary.get(meta)
+    selected["missing_metrics"] = [key for key in summary.get("missing_metrics") or [] if key in wanted]
+    selected["_sources"] = {key: value for key, value in (summary.get("_sources") or {}).items() if key in wanted}
+    return selected
+
+
+def _vm_properties_view(props: Dict[str, object]) -> SimpleNamespace:
+    """Imita la forma de ``vim.VirtualMachine`` que usan los quickstats y el mapa de discos."""
+    return SimpleNamespace(
+        summary=SimpleNamespace(
+            quickStats=props.get("summary.quickStats"),
+            runtime=SimpleNamespace(maxCpuUsage=props.get("summary.runtime.maxCpuUsage")),
+            config=SimpleNamespace(memorySizeMB=props.get("summary.config.memorySizeMB")),
+        ),
+        config=SimpleNamespace(hardware=SimpleNamespace(device=props.get("config.hardware.device") or [])),
+    )
+
+
+def _fetch_vm_properties(content, vm_ids: List[str]) -> Dict[str, Dict[str, object]]:
+    """Lee quickStats y discos de varias VMs en un solo RetrievePropertiesEx; omite las inexistentes."""
+    stub = content.propertyCollector._stub
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=[
+            vmodl.query.PropertyCollector.ObjectSpec(obj=vim.VirtualMachine(vm_id, stub), skip=False)
+            for vm_id in vm_ids
+        ],
+        propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=_VM_PERF_PROPERTIES)],
+        reportMissingObjectsInResults=True,
+    )
+    props: Dict[str, Dict[str, object]] = {}
+    for obj_content in _retrieve_paged(content.propertyCollector, filter_spec, len(vm_ids)):
+        missing = [
+            item for item in obj_content.missingSet or []
+            if isinstance(getattr(item, "fault", None), vmodl.fault.ManagedObjectNotFound)
+        ]
+        if missing and not obj_content.propSet:
+            continue
+        props[obj_content.obj._moId] = {prop.name: prop.val for prop in obj_content.propSet or []}
+    return props
+
+
+def _apply_batch_results(
+    results: List[vim.PerformanceManager.EntityMetricBase],
+    counter_maps: Dict[str, Dict[Tuple[int, str], str]],
+    collected: Dict[str, Dict[str, List[float]]],
+    interval: int,
+    sources: Dict[str, set[str]],
+    timestamps: Dict[str, Optional[datetime]],
+    allowed_keys: Optional[Dict[str, set[str]]] = None,
+) -> None:
+    by_entity: Dict[str, List[vim.PerformanceManager.EntityMetricBase]] = {}
+    for entity_metric in results or []:
+        entity = getattr(entity_metric, "entity", None)
+        moid = getattr(entity, "_moId", None)
+        if moid in collected:
+            by_entity.setdefault(moid, []).append(entity_metric)
+
+    for vm_id, entity_results in by_entity.items():
+        timestamp = _process_results(
+            entity_results,
+            counter_maps[vm_id],
+            collected[vm_id],
+            interval,
+            sources[vm_id],
+            allowed_keys.get(vm_id) if allowed_keys is not None else None,
+        )
+        if timestamp and (timestamps[vm_id] is None or timestamp > timestamps[vm_id]):
+            timestamps[vm_id] = timestamp
+
+
+def _collect_batch_chunk(
+    content,
+    vm_ids: List[str],
+    keys: List[str],
+    *,
+    window_seconds: int,
+    idle_to_zero: bool,
+) -> Tuple[Dict[str, Dict[str, object]], Dict[str, str]]:
+    """
+    Un bloque del lote: un RetrievePropertiesEx y un QueryPerf multi-entidad. Cada
+    VM consulta las mismas instancias que ``_collect_vm_perf_summary`` (la
+    agregada si existe; si no, las de cada disco), segun ``_available_metrics``.
+    """
+    perf_manager: vim.PerformanceManager = content.perfManager
+    stub = content.propertyCollector._stub
+    catalog = _counter_catalog(perf_manager)
+    props = _fetch_vm_properties(content, vm_ids)
+    errors = {vm_id: "VM no encontrada en vCenter" for vm_id in vm_ids if vm_id not in props}
+    refs = {vm_id: vim.VirtualMachine(vm_id, stub) for vm_id in vm_ids if vm_id in props}
+    plans = {
+        vm_id: plan_metric_query(
+            catalog,
+            keys,
+            _available_metrics(perf_manager, ref, props[vm_id].get("config.changeVersion")),
+        )
+        for vm_id, ref in refs.items()
+    }
+    counter_maps = {vm_id: plan[1] for vm_id, plan in plans.items()}
+    queried = [vm_id for vm_id, plan in plans.items() if plan[0]]
+
+    collected = {vm_id: {key: [] for key in METRICS} for vm_id in refs}
+    realtime_sources: Dict[str, set[str]] = {vm_id: set() for vm_id in refs}
+    rollup_sources: Dict[str, set[str]] = {vm_id: set() for vm_id in refs}
+    timestamps: Dict[str, Optional[datetime]] = {vm_id: None for vm_id in refs}
+
+    if queried:
+        start_time = datetime.now(timezone.utc) - timedelta(seconds=window_seconds)
+        realtime_specs = [
+            vim.PerformanceManager.QuerySpec(
+                entity=refs[vm_id],
+                intervalId=_REALTIME_INTERVAL,
+                startTime=start_time,
+                metricId=plans[vm_id][0],
+            )
+            for vm_id in queried
+        ]
+        _apply_batch_results(
+            perf_manager.QueryPerf(querySpec=realtime_specs),
+            counter_maps,
+            collected,
+            _REALTIME_INTERVAL,
+            realtime_sources,
+            timestamps,
+        )
+
+        pending = {
+            vm_id: {key for key in set(counter_maps[vm_id].values()) if not collected[vm_id][key]}
+            for vm_id in queried
+        }
+        pending = {vm_id: keys_left for vm_id, keys_left in pending.items() if keys_left}
+        if pending:
+            try:
+                rollup_specs = [
+                    vim.PerformanceManager.QuerySpec(
+                        entity=refs[vm_id],
+                        intervalId=_ROLLUP_INTERVAL,
+                        maxSample=1,
+                        metricId=plans[vm_id][0],
+                    )
+                    for vm_id in pending
+                ]
+                _apply_batch_results(
+                    perf_manager.QueryPerf(querySpec=rollup_specs),
+                    counter_maps,
+                    collected,
+                    _ROLLUP_INTERVAL,
+                    rollup_sources,
+                    timestamps,
+                    pending,
+                )
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.debug("No se pudo obtener metrics rollup para %d VM(s): %s", len(pending), exc)
+
+    summaries: Dict[str, Dict[str, object]] = {}
+    for vm_id in refs:
+        view = _vm_properties_view(props[vm_id])
+        metric_ids, _, missing_metrics = plans[vm_id]
+        summary = _assemble_summary(
+            view,
+            collected[vm_id],
+            realtime_sources=realtime_sources[vm_id],
+            rollup_sources=rollup_sources[vm_id],
+            missing_metrics=missing_metrics,
+            metrics_unavailable=not metric_ids,
+            last_timestamp=timestamps[vm_id],
+            idle_to_zero=idle_to_zero,
+        )
+        summary["disk_capacity_kb_total"] = _disk_capacity_total(_build_disk_capacity_map(view, {}))
+        summaries[vm_id] = summary
+    return summaries, errors
+
+
+def get_vm_perf_batch(
+    vm_ids: List[str],
+    *,
+    window_seconds: int = 60,
+    idle_to_zero: bool = False,
+    metrics: Optional[List[str]] = None,
+    refresh: bool = False,
+) -> Dict[str, object]:
+    """
+    Resumen de metricas para varias VMs con un QueryPerf multi-entidad por bloque.
+
+    Cada VM consulta las mismas instancias que el resumen individual (metricas
+    disponibles cacheadas por ``config.changeVersion``), asi que los resumenes
+    completos se guardan en ``_RESULT_CACHE`` con la misma clave que
+    ``get_vm_perf_summary`` (sin ``by_disk``) y el detalle de una VM reutiliza lo
+    calculado aqui; ``refresh`` ignora esas entradas y vuelve a consultar vCenter.
+    """
+    window_seconds = _clamp_window(window_seconds)
+    keys = _normalize_metric_keys(metrics)
+    full_set = len(keys) == len(METRICS)
+    ids = list(dict.fromkeys(str(vm_id).strip() for vm_id in vm_ids if vm_id and str(vm_id).strip()))
+    if len(ids) > BATCH_MAX_VMS:
+        raise ValueError(f"maximo {BATCH_MAX_VMS} VMs por lote")
+
+    results: Dict[str, Dict[str, object]] = {}
+    errors: Dict[str, str] = {}
+    pending: List[str] = []
+    for vm_id in ids:
+        cached = None if refresh else _RESULT_CACHE.get(_result_cache_key(vm_id, window_seconds, idle_to_zero, False))
+        if cached is not None:
+            results[vm_id] = _select_metrics(cached, keys)
+        else:
+            pending.append(vm_id)
+    cached_count = len(results)
+
+    if pending:
+        started = time.perf_counter()
+
+        def _query_chunk(chunk: List[str]):
+            return vm_service._run_soap(
+                lambda content: _collect_batch_chunk(
+                    content,
+                    chunk,
+                    keys,
+                    window_seconds=window_seconds,
+                    idle_to_zero=idle_to_zero,
+                )
+            )
+
+        try:
+            for start in range(0, len(pending), _BATCH_CHUNK_SIZE):
+                summaries, chunk_errors = _query_chunk(pending[start:start + _BATCH_CHUNK_SIZE])
+                for vm_id, summary in summaries.items():
+                    if full_set:
+                        _RESULT_CACHE[_result_cache_key(vm_id, window_seconds, idle_to_zero, False)] = summary
+                    results[vm_id] = _select_metrics(summary, keys)
+                errors.update(chunk_errors)
+        except Exception as exc:
+            logger.error("Error consultando metricas en lote (%d VMs): %s", len(pending), exc)
+            raise HTTPException(status_code=502, detail="error consultando metricas en vCenter") from exc
+        logger.info(
+            "Perf batch: %d VM(s) consultadas en %.2fs (%d desde cache, %d errores)",
+            len(pending),
+            time.perf_counter() - started,
+            cached_count,
+            len(errors),
+        )
+
+    return {
+        "window_seconds": window_seconds,
+        "idle_to_zero": idle_to_zero,
+        "metrics": keys,
+        "results": results,
+        "errors": errors,
+        "cached": cached_count,
+    }
+
+
+# ─────────────────────────────── history ───────────────────────────────
+
+perf_history = PerfHistoryStore(
+    capacity=settings.vmware_perf_history_minutes * 60 // settings.vmware_perf_sampler_interval_seconds,
+    keys=list(METRICS),
+)
+shared_perf_history = SharedPerfHistory(settings.shared_snapshot_dir, keys=list(METRICS))
+_PERF_SAMPLER: Optional[PerfSampler] = None
+
+
+def _history_source():
+    """Solo el líder muestrea: los seguidores leen el historial que publica en ``SHARED_SNAPSHOT_DIR``."""
+    if shared_perf_history.enabled and not leader_elector.is_leader:
+        return shared_perf_history
+    return perf_history
+
+
+def _powered_on_vm_ids() -> List[str]:
+    return [vm.id for vm in vm_service.get_vms() if (vm.power_state or "").upper() == "POWERED_ON"]
+
+
+def sampler_window_seconds() -> int:
+    """Ventana (ya acotada) con la que el sampler consulta cada muestra."""
+    return _clamp_window(settings.vmware_perf_sampler_interval_seconds)
+
+
+def _sample_batch(vm_ids: List[str]) -> Dict[str, object]:
+    return get_vm_perf_batch(
+        vm_ids,
+        window_seconds=sampler_window_seconds(),
+        refresh=True,
+    )
+
+
+def start_perf_sampler() -> PerfSampler:
+    global _PERF_SAMPLER
+    if _PERF_SAMPLER is None:
+        _PERF_SAMPLER = PerfSampler(
+            perf_history,
+            interval_seconds=settings.vmware_perf_sampler_interval_seconds,
+            list_vm_ids=_powered_on_vm_ids,
+            collect=_sample_batch,
+            batch_size=BATCH_MAX_VMS,
+            publish=shared_perf_history.publish if shared_perf_history.enabled else None,
+        )
+    _PERF_SAMPLER.start()
+    return _PERF_SAMPLER
+
+
+def stop_perf_sampler() -> None:
+    if _PERF_SAMPLER is not None:
+        _PERF_SAMPLER.stop()
+
+
+def get_vm_perf_history(
+    vm_id: str,
+    *,
+    minutes: int = 15,
+    metrics: Optional[List[str]] = None,
+) -> Optional[Dict[str, object]]:
+    """Series del sampler para los ultimos ``minutes`` con min/avg/max/p95; None si no hay historial."""
+    keys = _normalize_metric_keys(metrics)
+    if not shared_perf_history.enabled:
+        # Sin SHARED_SNAPSHOT_DIR el historial solo existe en la memoria del líder.
+        ensure_leader("Perf history is kept by the leader worker; retry")
+    history = _history_source().series(vm_id, minutes=minutes, keys=keys)
+    if history is None:
+        return None
+    return {
+        "vm_id": vm_id,
+        "minutes": minutes,
+        "interval_seconds": settings.vmware_perf_sampler_interval_seconds,
+        "points": len(history["timestamps"]),
+        **history,
+    }
@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Path, Query
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 from sqlmodel import Session
 
 from app.audit.service import log_audit
@@ -16,28 +17,41 @@ from app.dependencies import (
 from app.permissions.models import PermissionCode
 from app.utils.text import normalize_text
 from app.vms.vm_models import VMBase, VMDetail
-from app.vms.vm_perf_service import get_vm_perf_summary
+from app.vms.vm_perf_service import BATCH_MAX_VMS, get_vm_perf_batch, get_vm_perf_history, get_vm_perf_summary
 from app.vms.vm_service import get_vm_detail, get_vms, power_action
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+class PerfBatchRequest(BaseModel):
+    vm_ids: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_VMS)
+    window: int = Field(60, ge=20, le=1800)
+    idle_to_zero: bool = False
+    metrics: Optional[List[str]] = None
+
+
 @router.get("/vms", response_model=List[VMBase])
 def list_vms(
     name: Optional[str] = Query(None, description="Filtrar por nombre parcial"),
     environment: Optional[str] = Query(None, description="Filtrar por ambiente"),
-    refresh: bool = Query(False, description="Forzar refresco del inventario de VMware"),
-    current_user: User = Depends(require_permission(PermissionCode.VMS_VIEW)),
-):
+    refresh: bool = Query(False, description="Forzar refresco del inventario de VMware"),
+    engine: Optional[str] = Query(
+        None,
+        pattern="^(bulk|rest)$",
+        description="Motor de inventario (bulk | rest); por defecto VMWARE_INVENTORY_ENGINE",
+    ),
+    current_user: User = Depends(require_permission(PermissionCode.VMS_VIEW)),
+):
     logger.info(
-        "GET /api/vms requested by '%s' (refresh=%s)",
+        "GET /api/vms requested by '%s' (refresh=%s, engine=%s)",
         current_user.username,
         refresh,
+        engine or "default",
     )
 
     try:
-        vms = get_vms(refresh=refresh)
+        vms = get_vms(refresh=refresh, engine=engine)
     except Exception:
         logger.exception("Error while retrieving VMs")
         raise HTTPException(status_code=500, detail="Error interno al obtener VMs")
@@ -87,6 +101,29 @@ def vm_power_action(
     return result
 
 
+@router.post("/vms/perf:batch")
+def vm_perf_batch(
+    payload: PerfBatchRequest,
+    current_user: User = Depends(require_permission(PermissionCode.VMS_VIEW)),
+):
+    logger.debug(
+        "Fetching batch perf metrics for %d VM(s) requested by '%s' (window=%s, metrics=%s)",
+        len(payload.vm_ids),
+        current_user.username,
+        payload.window,
+        payload.metrics or "all",
+    )
+    try:
+        return get_vm_perf_batch(
+            payload.vm_ids,
+            window_seconds=payload.window,
+            idle_to_zero=payload.idle_to_zero,
+            metrics=payload.metrics,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
 @router.get("/vms/{vm_id}/perf")
 def vm_perf_summary(
     vm_id: str = Path(..., description="ID de la VM"),
@@ -116,6 +153,28 @@ def vm_perf_summary(
         by_disk=by_disk,
     )
 
+@router.get("/vms/{vm_id}/perf/history")
+def vm_perf_history(
+    vm_id: str = Path(..., description="ID de la VM"),
+    minutes: int = Query(15, ge=1, le=1440, description="Minutos de historial a devolver."),
+    metrics: Optional[List[str]] = Query(None, description="Subconjunto de metricas (por defecto todas)."),
+    current_user: User = Depends(require_permission(PermissionCode.VMS_VIEW)),
+):
+    logger.debug(
+        "Fetching perf history for VM '%s' requested by '%s' (minutes=%s)",
+        vm_id,
+        current_user.username,
+        minutes,
+    )
+    try:
+        history = get_vm_perf_history(vm_id, minutes=minutes, metrics=metrics)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"Sin historial de metricas para la VM {vm_id}")
+    return history
+
+
 @router.get("/vms/{vm_id}", response_model=VMDetail)
 def vm_detail(
     vm_id: str = Path(..., description="ID de la VM"),
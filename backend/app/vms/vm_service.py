@@ -3,23 +3,24 @@
 from __future__ import annotations
 
 import logging
-import ssl
+import time
 from datetime import datetime, timezone
 from dataclasses import dataclass
-from threading import Lock
-from typing import Dict, Iterable, List, Optional
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
 
-import requests
 import urllib3
 from cachetools import TTLCache
 from fastapi import HTTPException
-from pyVim.connect import Disconnect, SmartConnect  # SOAP client
-from pyVmomi import vim  # vSphere SDK types
+from pyVmomi import vim  # vSphere SDK types
 
 from app.config import VCENTER_HOST, VCENTER_PASS, VCENTER_USER
 from app.settings import settings
+from app.vms.vcenter_session import VCenterSessionManager
 from app.vms.vm_models import VMBase, VMDetail
 logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 # ───────────────────────────────────────────────────────────────────────
 # Configuración global y mapeos
@@ -74,13 +75,252 @@ class ThreadSafeTTLCache:
             self._cache.clear()
 
 
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self) -> None:
+        self.event = Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlightTTLCache(ThreadSafeTTLCache):
+    """
+    ThreadSafeTTLCache con carga single-flight y stale-while-revalidate.
+
+    - ``ttl`` es el TTL duro: pasado ese tiempo la entrada expira y el llamador espera la carga.
+    - ``soft_ttl`` (<= ttl): pasado ese tiempo se sirve el último valor y se refresca en background.
+    - Fallos concurrentes de la misma clave comparten una única llamada al loader.
+    """
+
+    def __init__(self, *, maxsize: int, ttl: int, soft_ttl: Optional[int] = None, name: str = "") -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.name = name
+        self._soft_ttl = min(soft_ttl, ttl) if soft_ttl is not None else ttl
+        self._flights: Dict[object, _Flight] = {}
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "stale_served": 0, "load_errors": 0}
+        if name:
+            _CACHE_REGISTRY[name] = self
+
+    # Las entradas se guardan como (valor, monotonic al cargar).
+    def __getitem__(self, key):
+        with self._lock:
+            return self._cache[key][0]
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            self._cache[key] = (value, time.monotonic())
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._cache.get(key)
+        return entry[0] if entry is not None else default
+
+    def setdefault(self, key, default):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self._cache[key] = (default, time.monotonic())
+                return default
+            return entry[0]
+
+    def _run_flight(self, key, flight: _Flight, loader: Callable[[], object], *, store: bool = True, flight_key=None):
+        flight_key = key if flight_key is None else flight_key
+        try:
+            value = loader()
+            if store:
+                self[key] = value
+            flight.value = value
+            return value
+        except BaseException as exc:
+            flight.error = exc
+            with self._lock:
+                self._counters["load_errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(flight_key, None)
+            flight.event.set()
+
+    def _refresh_in_background(self, key, flight: _Flight, loader: Callable[[], object], flight_key) -> None:
+        def _target() -> None:
+            try:
+                self._run_flight(key, flight, loader, flight_key=flight_key)
+            except Exception:
+                logger.warning("Background refresh failed for cache %s key=%s", self.name or "?", key, exc_info=True)
+
+        Thread(target=_target, name=f"cache-refresh-{self.name or 'anon'}", daemon=True).start()
+
+    def single_flight(self, key, loader: Callable[[], object]):
+        """Ejecuta ``loader`` una sola vez para llamadas concurrentes de ``key`` (sin leer ni guardar en caché)."""
+        return self._join_or_lead(key, loader, store=False)
+
+    def _join_or_lead(self, key, loader: Callable[[], object], *, store: bool, flight_key=None):
+        flight_key = key if flight_key is None else flight_key
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[flight_key] = flight
+            else:
+                self._counters["coalesced"] += 1
+        if leader:
+            return self._run_flight(key, flight, loader, store=store, flight_key=flight_key)
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def get_or_load(self, key, loader: Callable[[], object], *, refresh: bool = False, variant=None):
+        """
+        Devuelve el valor cacheado o lo carga con ``loader`` (single-flight + SWR).
+        Cargas de la misma clave con distinto ``variant`` (loaders que no son
+        intercambiables) no se comparten, aunque guarden en la misma entrada.
+        """
+        flight_key = key if variant is None else (key, variant)
+        if not refresh:
+            background: Optional[_Flight] = None
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None:
+                    value, loaded_at = entry
+                    if time.monotonic() - loaded_at < self._soft_ttl:
+                        self._counters["hits"] += 1
+                        return value
+                    self._counters["stale_served"] += 1
+                    if flight_key not in self._flights:
+                        background = _Flight()
+                        self._flights[flight_key] = background
+                else:
+                    self._counters["misses"] += 1
+            if entry is not None:
+                if background is not None:
+                    self._refresh_in_background(key, background, loader, flight_key)
+                return value
+        return self._join_or_lead(key, loader, store=True, flight_key=flight_key)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            data: Dict[str, object] = dict(self._counters)
+            data["size"] = len(self._cache)
+            data["inflight"] = len(self._flights)
+        data["ttl"] = self._cache.ttl
+        data["soft_ttl"] = self._soft_ttl
+        return data
+
+
+_CACHE_REGISTRY: Dict[str, SingleFlightTTLCache] = {}
+
+
+def cache_stats() -> Dict[str, Dict[str, object]]:
+    """Counters (hits/misses/coalesced/stale_served) of every named SingleFlightTTLCache."""
+    return {name: cache.stats() for name, cache in sorted(_CACHE_REGISTRY.items())}
+
+
+class VMAttributeLayers:
+    """
+    Propiedades de VMs separadas por frecuencia de cambio (motor ``bulk``).
+
+    - Capa estática: ``config.*`` (hardware, firmware, discos, NICs). Se
+      conserva ``static_ttl_seconds`` y se invalida antes si cambia
+      ``config.changeVersion``.
+    - Capa volátil: power state, quickStats, IP, host; se reemplaza en cada pasada.
+
+    ``merged()`` combina ambas capas (la volátil tiene prioridad) para construir ``VMBase``.
+    Una VM sin capa estática (lectura fallida o vacía) se devuelve igual, con los
+    datos parciales de la volátil, y se relee en la próxima pasada.
+    Las pasadas por shard (cluster) solo reemplazan las VMs de ese shard.
+    """
+
+    def __init__(self, *, static_ttl_seconds: int) -> None:
+        self._lock = Lock()
+        self._static_ttl = static_ttl_seconds
+        self._static: Dict[str, Tuple[Dict[str, object], float]] = {}
+        self._volatile: Dict[str, Dict[str, object]] = {}
+        self._shard_of: Dict[str, str] = {}
+        self.static_refreshed = 0
+        self.volatile_passes = 0
+
+    def has_static(self) -> bool:
+        with self._lock:
+            return bool(self._static)
+
+    def stale_static_ids(self, volatile_props: Dict[str, Dict[str, object]]) -> List[str]:
+        """VMs sin capa estática, con ``config.changeVersion`` distinto o con TTL vencido."""
+        now = time.monotonic()
+        stale: List[str] = []
+        with self._lock:
+            for vm_id, props in volatile_props.items():
+                entry = self._static.get(vm_id)
+                if (
+                    entry is None
+                    or now - entry[1] > self._static_ttl
+                    or entry[0].get("config.changeVersion") != props.get("config.changeVersion")
+                ):
+                    stale.append(vm_id)
+        return stale
+
+    def update_static(self, props_by_id: Dict[str, Dict[str, object]]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for vm_id, props in props_by_id.items():
+                self._static[vm_id] = (props, now)
+            self.static_refreshed += len(props_by_id)
+
+    def replace_volatile(self, props_by_id: Dict[str, Dict[str, object]], *, shard: Optional[str] = None) -> None:
+        with self._lock:
+            if shard is None:
+                self._volatile = dict(props_by_id)
+                self._shard_of = {}
+            else:
+                gone = [vm_id for vm_id, owner in self._shard_of.items() if owner == shard and vm_id not in props_by_id]
+                for vm_id in gone:
+                    self._volatile.pop(vm_id, None)
+                    self._shard_of.pop(vm_id, None)
+                self._volatile.update(props_by_id)
+                self._shard_of.update({vm_id: shard for vm_id in props_by_id})
+            for vm_id in [vm_id for vm_id in self._static if vm_id not in self._volatile]:
+                self._static.pop(vm_id, None)
+            self.volatile_passes += 1
+
+    def merged(self, vm_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            ids = self._volatile.keys() if vm_ids is None else vm_ids
+            merged: Dict[str, Dict[str, object]] = {}
+            for vm_id in ids:
+                volatile = self._volatile.get(vm_id)
+                if volatile is None:
+                    continue
+                static = self._static.get(vm_id)
+                merged[vm_id] = {**static[0], **volatile} if static is not None else dict(volatile)
+            return merged
+
+    def clear(self) -> None:
+        with self._lock:
+            self._static.clear()
+            self._volatile.clear()
+            self._shard_of.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "static_entries": len(self._static),
+                "volatile_entries": len(self._volatile),
+                "static_refreshed": self.static_refreshed,
+                "volatile_passes": self.volatile_passes,
+            }
+
+
 # CACHÉS de datos para evitar llamadas repetidas
-vm_cache = ThreadSafeTTLCache(maxsize=1, ttl=300)        # listado de VMs
-identity_cache = ThreadSafeTTLCache(maxsize=1000, ttl=300)  # guest identity
-network_cache = ThreadSafeTTLCache(maxsize=2000, ttl=300)   # nombres de red individuales
-net_list_cache = ThreadSafeTTLCache(maxsize=1, ttl=300)     # mapeo completo de redes
-host_cache = ThreadSafeTTLCache(maxsize=200, ttl=300)       # nombres de host
-placement_cache = ThreadSafeTTLCache(maxsize=2000, ttl=300)  # host/cluster + quickstats (SOAP)
+# listado de VMs (una entrada por motor): fresco 5 min, se sirve stale hasta 15 min mientras refresca
+vm_cache = SingleFlightTTLCache(maxsize=2, ttl=900, soft_ttl=300, name="vms")
+identity_cache = SingleFlightTTLCache(maxsize=1000, ttl=300, name="guest_identity")  # guest identity
+network_cache = SingleFlightTTLCache(maxsize=2000, ttl=300, name="network_names")    # nombres de red individuales
+net_list_cache = SingleFlightTTLCache(maxsize=1, ttl=300, name="network_map")        # mapeo completo de redes
+host_cache = ThreadSafeTTLCache(maxsize=200, ttl=300)       # nombres de host
+placement_cache = SingleFlightTTLCache(maxsize=2000, ttl=300, name="placement")  # host/cluster + quickstats (SOAP)
+vm_attribute_layers = VMAttributeLayers(static_ttl_seconds=settings.vmware_static_attrs_ttl_minutes * 60)
 
 # ───────────────────────────────────────────────────────────────────────
 # Utilidades de configuración / estado
@@ -91,6 +331,7 @@ def reset_caches() -> None:
     """Clear all caches to keep startup deterministic and avoid stale data."""
     for cache in (vm_cache, identity_cache, network_cache, net_list_cache, host_cache, placement_cache):
         cache.clear()
+    vm_attribute_layers.clear()
 
 
 def _resolve_vcenter_settings() -> Dict[str, Optional[str]]:
@@ -109,6 +350,13 @@ def _resolve_vcenter_settings() -> Dict[str, Optional[str]]:
     }
 
 
+vcenter_sessions = VCenterSessionManager(
+    _resolve_vcenter_settings,
+    pool_size=settings.vcenter_http_pool_size,
+    keepalive_seconds=settings.vcenter_keepalive_seconds,
+)
+
+
 def validate_vcenter_configuration() -> List[str]:
     """Return a list of issues if essential vCenter credentials are missing."""
     if settings.test_mode:
@@ -133,40 +381,66 @@ def validate_vcenter_configuration() -> List[str]:
 # ───────────────────────────────────────────────────────────────────────
 
 
-def _soap_connect():
+def _run_soap(func: Callable[[object], T]) -> T:
     """
-    Crea una conexión no verificada al vCenter via pyVmomi
-    y devuelve el ServiceInstance y su Content.
+    Corre ``func(content)`` sobre la sesión SOAP compartida (``vcenter_sessions``):
+    pasa por el limitador ``vcenter.soap`` y reintenta una vez ante
+    ``NotAuthenticated``. La sesión es de larga duración: no desconectarla.
     """
-    if settings.test_mode:
-        return None, None
-    vcenter_cfg = _resolve_vcenter_settings()
-    if not vcenter_cfg["soap_host"] or not vcenter_cfg["user"] or not vcenter_cfg["password"]:
-        raise RuntimeError("Incomplete vCenter SOAP configuration")
-
-    ctx = ssl._create_unverified_context()
-    si = SmartConnect(
-        host=vcenter_cfg["soap_host"],
-        user=vcenter_cfg["user"],
-        pwd=vcenter_cfg["password"],
-        port=443,
-        sslContext=ctx,
+    return vcenter_sessions.run_soap(func)
+
+
+def _placement_from_quickstats(
+    host_name: str,
+    cluster_name: str,
+    quick_stats,
+    *,
+    max_cpu_mhz=None,
+    memory_mb=None,
+) -> PlacementInfo:
+    """Build a PlacementInfo computing CPU/RAM percentages from VM quickStats."""
+    cpu_usage_pct: Optional[float] = None
+    ram_demand_mib: Optional[int] = None
+    ram_usage_pct: Optional[float] = None
+
+    if quick_stats:
+        guest_mem = getattr(quick_stats, "guestMemoryUsage", None)
+        if isinstance(guest_mem, (int, float)):
+            ram_demand_mib = int(guest_mem)
+        if isinstance(guest_mem, (int, float)) and isinstance(memory_mb, (int, float)) and memory_mb > 0:
+            ram_usage_pct = round((float(guest_mem) / float(memory_mb)) * 100.0, 2)
+
+        cpu_usage_mhz = getattr(quick_stats, "overallCpuUsage", None)
+        if (
+            isinstance(cpu_usage_mhz, (int, float))
+            and isinstance(max_cpu_mhz, (int, float))
+            and max_cpu_mhz > 0
+        ):
+            cpu_usage_pct = round((float(cpu_usage_mhz) / float(max_cpu_mhz)) * 100.0, 2)
+
+    return PlacementInfo(
+        host=host_name,
+        cluster=cluster_name,
+        cpu_usage_pct=cpu_usage_pct,
+        ram_demand_mib=ram_demand_mib,
+        ram_usage_pct=ram_usage_pct,
     )
-    return si, si.RetrieveContent()
 
 
 def _build_placement_map() -> Dict[str, PlacementInfo]:
     """Load host/cluster and quickstat information for all VMs in a single SOAP pass."""
     if settings.test_mode:
         return {}
-    results: Dict[str, PlacementInfo] = {}
     try:
-        si, content = _soap_connect()
+        return _run_soap(_collect_placement_map)
     except Exception as exc:  # pragma: no cover - defensive
         logger.warning("Unable to build placement map via SOAP: %s", exc)
-        return results
-
-    view = None
+        return {}
+
+
+def _collect_placement_map(content) -> Dict[str, PlacementInfo]:
+    results: Dict[str, PlacementInfo] = {}
+    view = None
     try:
         view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
         for vm in view.view:
@@ -179,55 +453,32 @@ def _build_placement_map() -> Dict[str, PlacementInfo]:
             if cluster_obj and getattr(cluster_obj, "name", None):
                 cluster_name = cluster_obj.name
 
-            cpu_usage_pct: Optional[float] = None
-            ram_demand_mib: Optional[int] = None
-            ram_usage_pct: Optional[float] = None
-
+            placement = PlacementInfo(host=host_name, cluster=cluster_name)
             try:
                 summary = getattr(vm, "summary", None)
                 runtime_info = getattr(summary, "runtime", None) if summary else None
                 config_info = getattr(summary, "config", None) if summary else None
-                quick_stats = getattr(summary, "quickStats", None) if summary else None
-
-                if quick_stats:
-                    guest_mem = getattr(quick_stats, "guestMemoryUsage", None)
-                    if isinstance(guest_mem, (int, float)):
-                        ram_demand_mib = int(guest_mem)
-
-                    total_mem = getattr(config_info, "memorySizeMB", None) if config_info else None
-                    if isinstance(guest_mem, (int, float)) and isinstance(total_mem, (int, float)) and total_mem > 0:
-                        ram_usage_pct = round((float(guest_mem) / float(total_mem)) * 100.0, 2)
-
-                    cpu_usage_mhz = getattr(quick_stats, "overallCpuUsage", None)
-                    max_cpu_mhz = getattr(runtime_info, "maxCpuUsage", None) if runtime_info else None
-                    if (
-                        isinstance(cpu_usage_mhz, (int, float))
-                        and isinstance(max_cpu_mhz, (int, float))
-                        and max_cpu_mhz > 0
-                    ):
-                        cpu_usage_pct = round((float(cpu_usage_mhz) / float(max_cpu_mhz)) * 100.0, 2)
+                placement = _placement_from_quickstats(
+                    host_name,
+                    cluster_name,
+                    getattr(summary, "quickStats", None) if summary else None,
+                    max_cpu_mhz=getattr(runtime_info, "maxCpuUsage", None) if runtime_info else None,
+                    memory_mb=getattr(config_info, "memorySizeMB", None) if config_info else None,
+                )
             except Exception:  # pragma: no cover - defensive
                 logger.debug("Unable to compute quickstats for VM %s", getattr(vm, "_moId", "?"), exc_info=True)
 
-            results[vm._moId] = PlacementInfo(
-                host=host_name,
-                cluster=cluster_name,
-                cpu_usage_pct=cpu_usage_pct,
-                ram_demand_mib=ram_demand_mib,
-                ram_usage_pct=ram_usage_pct,
-            )
+            results[vm._moId] = placement
+    except vim.fault.NotAuthenticated:
+        raise  # run_soap re-autentica y reintenta
     except Exception as exc:  # pragma: no cover - defensive
         logger.exception("Failed to build placement view")
     finally:
-        if view is not None:
-            try:
+        if view is not None:
+            try:
                 view.Destroy()
             except Exception:  # pragma: no cover - defensive
                 logger.debug("Error destroying SOAP view", exc_info=True)
-        try:
-            Disconnect(si)
-        except Exception:  # pragma: no cover - defensive
-            logger.debug("Error disconnecting SOAP session", exc_info=True)
 
     return results
 
@@ -258,9 +509,12 @@ def get_host_cluster_soap(vm_id: str) -> PlacementInfo:
     if cached is not None:
         return _normalize_placement(cached)
 
-    placement_map = _build_placement_map()
-    for key, value in placement_map.items():
-        placement_cache[key] = value
+    def _scan() -> None:
+        for key, value in _build_placement_map().items():
+            placement_cache[key] = value
+
+    # Fallos concurrentes comparten un único escaneo SOAP.
+    placement_cache.single_flight("__placement_scan__", _scan)
 
     cached = placement_cache.get(vm_id)
     return _normalize_placement(cached)
@@ -271,28 +525,12 @@ def get_host_cluster_soap(vm_id: str) -> PlacementInfo:
 # ───────────────────────────────────────────────────────────────────────
 
 
-def get_session_token() -> str:
-    """
-    Autentica contra la API REST de vCenter para obtener un token de sesión.
-    Lanza HTTPException en caso de fallo.
-    """
-    settings = _resolve_vcenter_settings()
-    if not settings["host"] or not settings["user"] or not settings["password"]:
-        raise HTTPException(status_code=500, detail="Configuración de vCenter incompleta")
-
-    try:
-        response = requests.post(
-            f"{settings['host']}/rest/com/vmware/cis/session",
-            auth=(settings["user"], settings["password"]),
-            verify=False,
-            timeout=5,
-        )
-        response.raise_for_status()
-        return response.json()["value"]
-    except Exception as exc:
-        logger.exception("Failed to obtain vCenter session token")
-        code = getattr(exc, "response", None) and exc.response.status_code or 500
-        raise HTTPException(status_code=code, detail=f"Auth failed: {exc}")
+def get_session_token() -> str:
+    """
+    Devuelve el token de sesión REST de vCenter (cacheado en ``vcenter_sessions``;
+    solo autentica si no hay sesión vigente). Lanza HTTPException en caso de fallo.
+    """
+    return vcenter_sessions.get_token()
 
 
 def get_hosts_raw() -> dict:
@@ -303,7 +541,7 @@ def get_hosts_raw() -> dict:
     token = get_session_token()
     headers = {"vmware-api-session-id": token}
 
-    response = requests.get(
+    response = vcenter_sessions.get(
         _network_endpoint("/rest/vcenter/host"),
         headers=headers,
         verify=False,
@@ -340,25 +578,21 @@ def load_network_map(headers: dict) -> Dict[str, str]:
     Carga el mapeo completo de IDs de red → nombres legibles.
     Utiliza cache para evitar llamadas REST repetidas.
     """
-    cached = net_list_cache.get("net_map")
-    if cached is not None:
-        return cached
-
-    try:
-        response = requests.get(
-            _network_endpoint("/rest/vcenter/network"),
-            headers=headers,
-            verify=False,
-            timeout=10,
-        )
-        response.raise_for_status()
-        mapping = {item["network"]: item["name"] for item in response.json().get("value", [])}
-    except Exception as exc:
-        logger.debug("load_network_map fail → %s", exc)
-        mapping = {}
+    def _load() -> Dict[str, str]:
+        try:
+            response = vcenter_sessions.get(
+                _network_endpoint("/rest/vcenter/network"),
+                headers=headers,
+                verify=False,
+                timeout=10,
+            )
+            response.raise_for_status()
+            return {item["network"]: item["name"] for item in response.json().get("value", [])}
+        except Exception as exc:
+            logger.debug("load_network_map fail → %s", exc)
+            return {}
 
-    net_list_cache["net_map"] = mapping
-    return mapping
+    return net_list_cache.get_or_load("net_map", _load)
 
 
 def get_network_name(network_id: str, headers: dict) -> str:
@@ -366,22 +600,21 @@ def get_network_name(network_id: str, headers: dict) -> str:
     Consulta el nombre de una red específica por su ID via REST,
     con caching local para mejorar rendimiento.
     """
-    if network_id in network_cache:
-        return network_cache[network_id]
-    try:
-        response = requests.get(
-            _network_endpoint(f"/rest/vcenter/network/{network_id}"),
-            headers=headers,
-            verify=False,
-            timeout=5,
-        )
-        response.raise_for_status()
-        name = response.json().get("value", {}).get("name", "<sin nombre>")
-    except Exception as exc:
-        logger.debug("get_network_name %s fail → %s", network_id, exc)
-        name = "<error>"
-    network_cache[network_id] = name
-    return name
+    def _load() -> str:
+        try:
+            response = vcenter_sessions.get(
+                _network_endpoint(f"/rest/vcenter/network/{network_id}"),
+                headers=headers,
+                verify=False,
+                timeout=5,
+            )
+            response.raise_for_status()
+            return response.json().get("value", {}).get("name", "<sin nombre>")
+        except Exception as exc:
+            logger.debug("get_network_name %s fail → %s", network_id, exc)
+            return "<error>"
+
+    return network_cache.get_or_load(network_id, _load)
 
 
 def fetch_guest_identity(vm_id: str, headers: dict) -> dict:
@@ -389,21 +622,20 @@ def fetch_guest_identity(vm_id: str, headers: dict) -> dict:
     Obtiene información de identidad del guest OS via REST.
     Guarda en cache los resultados para reuso.
     """
-    if vm_id in identity_cache:
-        return identity_cache[vm_id]
-    try:
-        response = requests.get(
-            _network_endpoint(f"/rest/vcenter/vm/{vm_id}/guest/identity"),
-            headers=headers,
-            verify=False,
-            timeout=5,
-        )
-        value = response.json().get("value", {}) if response.status_code == 200 else {}
-    except Exception as exc:  # pragma: no cover - defensive
-        logger.debug("fetch_guest_identity %s failed: %s", vm_id, exc)
-        value = {}
-    identity_cache[vm_id] = value
-    return value
+    def _load() -> dict:
+        try:
+            response = vcenter_sessions.get(
+                _network_endpoint(f"/rest/vcenter/vm/{vm_id}/guest/identity"),
+                headers=headers,
+                verify=False,
+                timeout=5,
+            )
+            return response.json().get("value", {}) if response.status_code == 200 else {}
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.debug("fetch_guest_identity %s failed: %s", vm_id, exc)
+            return {}
+
+    return identity_cache.get_or_load(vm_id, _load)
 
 
 def _extract_ip_list(identity_payload: dict) -> List[str]:
@@ -415,16 +647,19 @@ def _extract_ip_list(identity_payload: dict) -> List[str]:
     return []
 
 
+def _format_disk_size(capacity_bytes: int) -> str:
+    gib = capacity_bytes / (1024 ** 3)
+    if gib.is_integer():
+        return f"{int(gib)} GiB"
+    return f"{gib:.2f} GiB"
+
+
 def _extract_disk_sizes(disks_payload: Iterable[dict]) -> List[str]:
     disk_sizes: List[str] = []
     for disk in disks_payload:
         capacity = disk.get("value", {}).get("capacity")
         if isinstance(capacity, int):
-            gib = capacity / (1024 ** 3)
-            if gib.is_integer():
-                disk_sizes.append(f"{int(gib)} GiB")
-            else:
-                disk_sizes.append(f"{gib:.2f} GiB")
+            disk_sizes.append(_format_disk_size(capacity))
     return disk_sizes
 
 
@@ -445,7 +680,7 @@ def _resolve_networks(
 ) -> List[str]:
     networks: List[str] = []
     try:
-        ether_resp = requests.get(
+        ether_resp = vcenter_sessions.get(
             _network_endpoint(f"/rest/vcenter/vm/{vm_id}/hardware/ethernet"),
             headers=headers,
             verify=False,
@@ -507,7 +742,59 @@ def _infer_generation_from_boot(boot_type: Optional[str]) -> Optional[str]:
 # ───────────────────────────────────────────────────────────────────────
 
 
-def get_vms(*, refresh: bool = False) -> List[VMBase]:
+VM_INVENTORY_ENGINES = ("bulk", "rest")
+
+
+def get_vms(
+    *,
+    refresh: bool = False,
+    engine: Optional[str] = None,
+    volatile_only: bool = False,
+) -> List[VMBase]:
+    """
+    Recupera la lista de VMs con el motor indicado (``VMWARE_INVENTORY_ENGINE`` por defecto):
+      - ``bulk``: PropertyCollector paginado (ver ``vm_bulk_service``); si falla, cae a REST.
+      - ``rest``: fan-out REST por VM (motor original).
+    Cada motor cachea su resultado por separado para poder compararlos. Las llamadas
+    concurrentes comparten una única carga y, pasado el TTL suave, se sirve el último
+    inventario mientras se refresca en background.
+    Con ``volatile_only`` el motor ``bulk`` solo relee la capa volátil (y la
+    estática de las VMs cuya configuración cambió); en ``rest`` no tiene efecto.
+    """
+    engine = (engine or settings.vmware_inventory_engine or "bulk").strip().lower()
+    if engine not in VM_INVENTORY_ENGINES:
+        raise ValueError(f"Unknown VMware inventory engine: {engine}")
+    return vm_cache.get_or_load(
+        f"vms:{engine}",
+        lambda: _load_vms(engine, volatile_only=volatile_only),
+        refresh=refresh,
+        # un refresh completo no se une a una carga solo-volátil en curso (ni al revés)
+        variant="volatile" if volatile_only else "full",
+    )
+
+
+def _load_vms(engine: str, *, volatile_only: bool = False) -> List[VMBase]:
+    started = time.perf_counter()
+    if engine == "bulk":
+        from app.vms.vm_bulk_service import get_vms_bulk
+
+        try:
+            out = get_vms_bulk(volatile_only=volatile_only)
+        except Exception as exc:
+            logger.warning("Bulk VMware inventory failed (%s); falling back to REST engine", exc)
+            out = _get_vms_rest()
+    else:
+        out = _get_vms_rest()
+    logger.info(
+        "VMware inventory (%s engine): %d VMs in %.2fs",
+        engine,
+        len(out),
+        time.perf_counter() - started,
+    )
+    return out
+
+
+def _get_vms_rest() -> List[VMBase]:
     """
     Recupera y construye la lista de máquinas virtuales:
       1. Autentica y obtiene token de sesión.
@@ -518,18 +805,12 @@ def get_vms(*, refresh: bool = False) -> List[VMBase]:
          - Obtiene host y cluster por SOAP.
          - Extrae IPs, discos y NICs.
          - Resuelve nombres de redes primarias y fallback.
-      5. Cachea el resultado completo.
     """
-    if refresh:
-        vm_cache.clear()
-    elif "vms" in vm_cache:
-        return vm_cache["vms"]
-
     token = get_session_token()
     headers = {"vmware-api-session-id": token}
     net_map = load_network_map(headers)
 
-    response = requests.get(
+    response = vcenter_sessions.get(
         _network_endpoint("/rest/vcenter/vm"),
         headers=headers,
         verify=False,
@@ -543,7 +824,7 @@ def get_vms(*, refresh: bool = False) -> List[VMBase]:
         vm_name = vm["name"] or f"<sin nombre {vm_id}>"
         env = infer_environment(vm_name)
 
-        summary_resp = requests.get(
+        summary_resp = vcenter_sessions.get(
             _network_endpoint(f"/rest/vcenter/vm/{vm_id}"),
             headers=headers,
             verify=False,
@@ -552,7 +833,7 @@ def get_vms(*, refresh: bool = False) -> List[VMBase]:
         summary_data = summary_resp.json().get("value", {}) if summary_resp.status_code == 200 else {}
         guest_os = summary_data.get("guest_OS")
 
-        hardware_resp = requests.get(
+        hardware_resp = vcenter_sessions.get(
             _network_endpoint(f"/rest/vcenter/vm/{vm_id}/hardware"),
             headers=headers,
             verify=False,
@@ -566,7 +847,7 @@ def get_vms(*, refresh: bool = False) -> List[VMBase]:
         boot_type: Optional[str] = None
         compat_generation: Optional[str] = None
         try:
-            boot_resp = requests.get(
+            boot_resp = vcenter_sessions.get(
                 _network_endpoint(f"/rest/vcenter/vm/{vm_id}/hardware/boot"),
                 headers=headers,
                 verify=False,
@@ -615,8 +896,7 @@ def get_vms(*, refresh: bool = False) -> List[VMBase]:
                 boot_type=boot_type,
             )
         )
-
-    vm_cache["vms"] = out
+
     return out
 
 
@@ -649,7 +929,7 @@ def power_action(vm_id: str, action: str) -> dict:
     token = get_session_token()
     headers = {"vmware-api-session-id": token}
 
-    response = requests.post(
+    response = vcenter_sessions.post(
         _network_endpoint(f"/rest/vcenter/vm/{vm_id}/power/{action}"),
         headers=headers,
         verify=False,
@@ -670,7 +950,7 @@ def get_vm_detail(vm_id: str) -> VMDetail:
     token = get_session_token()
     headers = {"vmware-api-session-id": token}
 
-    summary_resp = requests.get(
+    summary_resp = vcenter_sessions.get(
         _network_endpoint(f"/rest/vcenter/vm/{vm_id}"),
         headers=headers,
         verify=False,
@@ -680,7 +960,7 @@ def get_vm_detail(vm_id: str) -> VMDetail:
         raise HTTPException(status_code=summary_resp.status_code, detail=summary_resp.text)
     summary = summary_resp.json().get("value", {})
 
-    hardware_resp = requests.get(
+    hardware_resp = vcenter_sessions.get(
         _network_endpoint(f"/rest/vcenter/vm/{vm_id}/hardware"),
         headers=headers,
         verify=False,
@@ -693,7 +973,7 @@ def get_vm_detail(vm_id: str) -> VMDetail:
     boot_type: Optional[str] = None
     compat_generation: Optional[str] = None
     try:
-        boot_resp = requests.get(
+        boot_resp = vcenter_sessions.get(
             _network_endpoint(f"/rest/vcenter/vm/{vm_id}/hardware/boot"),
             headers=headers,
             verify=False,
@@ -0,0 +1,216 @@
+"""Change feed for the VMware inventory based on ``WaitForUpdatesEx``.
+
+A dedicated PropertyCollector watches the same properties as the bulk engine
+(``vm_bulk_service``). The first update set carries the full inventory; later
+ones only carry changed properties, which are applied incrementally to the
+in-memory VMware snapshot (bumping its ``version``). Periodic full refreshes are
+then only needed for reconciliation.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from pyVmomi import vmodl
+
+from app.vms.vm_bulk_service import (
+    INVENTORY_VIEW_TYPES,
+    PropertyMap,
+    build_filter_spec,
+    build_vms_from_properties,
+    object_kind,
+    split_property_state,
+)
+
+logger = logging.getLogger(__name__)
+
+_PERSIST_INTERVAL_SECONDS = 60
+_RETRY_BACKOFF_SECONDS = (5, 15, 30, 60, 120)
+
+
+def new_property_state() -> Dict[str, PropertyMap]:
+    return {"vm": {}, "host": {}, "compute": {}, "network": {}}
+
+
+def apply_update_set(
+    state: Dict[str, PropertyMap],
+    filter_sets: Iterable,
+) -> Tuple[Set[str], Set[str], bool]:
+    """
+    Aplica un ``UpdateSet.filterSet`` sobre ``state`` ({kind: {moid: props}}).
+    Devuelve (vm_ids cambiadas, vm_ids eliminadas, hubo cambios en host/cluster/red).
+    """
+    changed: Set[str] = set()
+    removed: Set[str] = set()
+    names_changed = False
+
+    for filter_update in filter_sets or []:
+        for update in filter_update.objectSet or []:
+            kind = object_kind(update.obj)
+            if kind is None:
+                continue
+            moid = update.obj._moId
+            bucket = state[kind]
+            if update.kind == "leave":
+                bucket.pop(moid, None)
+                if kind == "vm":
+                    removed.add(moid)
+                    changed.discard(moid)
+                else:
+                    names_changed = True
+                continue
+
+            props = bucket.setdefault(moid, {})
+            for change in update.changeSet or []:
+                if change.op in ("remove", "indirectRemove"):
+                    props.pop(change.name, None)
+                else:
+                    props[change.name] = change.val
+            if kind == "vm":
+                changed.add(moid)
+                removed.discard(moid)
+            else:
+                names_changed = True
+
+    return changed, removed, names_changed
+
+
+def _release(*releases: Callable[[], None]) -> None:
+    for release in releases:
+        try:
+            release()
+        except Exception:  # pragma: no cover - defensive
+            logger.debug("Error releasing change feed resources", exc_info=True)
+
+
+class VMwareChangeFeed:
+    """
+    Hilo que mantiene un filtro de PropertyCollector y publica cambios via ``publish``.
+
+    ``run_soap(func)`` corre ``func(content)`` sobre la sesion SOAP compartida
+    (``vcenter_sessions.run_soap``); solo se usa para crear el filtro, la espera
+    larga de ``WaitForUpdatesEx`` no ocupa cupo del limitador ``vcenter.soap``.
+    ``publish(upserts, removed, replace_all)`` recibe VMs serializadas (dict) y se
+    invoca una vez por UpdateSet; ``persist`` se llama como maximo cada
+    ``_PERSIST_INTERVAL_SECONDS`` para guardar el snapshot en DB.
+    """
+
+    def __init__(
+        self,
+        *,
+        run_soap: Callable[[Callable[[Any], Any]], Any],
+        publish: Callable[[list, Set[str], bool], Optional[int]],
+        persist: Callable[[], None],
+        max_wait_seconds: int = 30,
+    ) -> None:
+        self._run_soap = run_soap
+        self._publish = publish
+        self._persist = persist
+        self._max_wait_seconds = max_wait_seconds
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_persist = 0.0
+        self._dirty = False
+        self.updates_applied = 0
+        self.last_update_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        # Evento propio por arranque: un hilo anterior ya detenido que siga en
+        # WaitForUpdatesEx termina solo y no publica (ver ``_watch``).
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="vmware-change-feed", daemon=True)
+        self._thread.start()
+        logger.info("VMware change feed started")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, stop: threading.Event) -> None:
+        failures = 0
+        while not stop.is_set():
+            try:
+                self._watch(stop)
+                failures = 0
+            except Exception as exc:
+                delay = _RETRY_BACKOFF_SECONDS[min(failures, len(_RETRY_BACKOFF_SECONDS) - 1)]
+                failures += 1
+                logger.warning("VMware change feed error (%s); retrying in %ss", exc, delay)
+                stop.wait(delay)
+
+    @staticmethod
+    def _open_filter(content) -> Tuple[Any, Any, Any]:
+        collector = content.propertyCollector.CreatePropertyCollector()
+        view = None
+        try:
+            view = content.viewManager.CreateContainerView(content.rootFolder, INVENTORY_VIEW_TYPES, True)
+            prop_filter = collector.CreateFilter(build_filter_spec(view), partialUpdates=False)
+        except Exception:
+            if view is not None:
+                _release(view.Destroy)
+            _release(collector.DestroyPropertyCollector)
+            raise
+        return collector, view, prop_filter
+
+    def _watch(self, stop: threading.Event) -> None:
+        collector, view, prop_filter = self._run_soap(self._open_filter)
+        try:
+            options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=self._max_wait_seconds)
+            state = new_property_state()
+            version = ""
+            initial = True
+            while not stop.is_set():
+                update_set = collector.WaitForUpdatesEx(version=version, options=options)
+                if stop.is_set():
+                    break
+                if update_set is not None:
+                    version = update_set.version
+                    self._handle(state, update_set.filterSet, initial=initial)
+                    initial = False
+                self._maybe_persist()
+        finally:
+            _release(prop_filter.DestroyPropertyFilter, view.Destroy, collector.DestroyPropertyCollector)
+
+    def _handle(self, state: Dict[str, PropertyMap], filter_sets, *, initial: bool) -> None:
+        changed, removed, names_changed = apply_update_set(state, filter_sets)
+        vm_props, host_props, compute_names, network_names = split_property_state(state)
+        replace_all = initial or names_changed
+        targets = vm_props if replace_all else {vm_id: vm_props[vm_id] for vm_id in changed if vm_id in vm_props}
+        if not targets and not removed and not replace_all:
+            return
+        vms, _ = build_vms_from_properties(targets, host_props, compute_names, network_names)
+        built_ids = {vm.id for vm in vms}
+        # VMs convertidas a template desaparecen del inventario.
+        removed |= set(targets) - built_ids
+        version = self._publish([vm.model_dump() for vm in vms], removed, replace_all)
+        if version is None:
+            return
+        self._dirty = True
+        self.updates_applied += 1
+        self.last_update_at = time.time()
+        logger.debug(
+            "VMware change feed: %d VM(s) updated, %d removed (replace_all=%s) -> version %s",
+            len(vms),
+            len(removed),
+            replace_all,
+            version,
+        )
+
+    def _maybe_persist(self) -> None:
+        now = time.monotonic()
+        if not self._dirty or now - self._last_persist < _PERSIST_INTERVAL_SECONDS:
+            return
+        self._last_persist = now
+        self._dirty = False
+        try:
+            self._persist()
+        except Exception:  # pragma: no cover - defensive
+            logger.exception("VMware change feed: failed to persist snapshot")
@@ -89,6 +89,7 @@ class JobStatus(BaseModel):
     scope: ScopeName
     hosts: List[str]
     level: str = "summary"
+    mode: str = "full"  # full | volatile (solo power state / quickStats / IPs)
     status: str = "pending"
     created_at: datetime = Field(default_factory=datetime.utcnow)
     started_at: Optional[datetime] = None
@@ -117,6 +118,23 @@ class SnapshotPayload(BaseModel):
     hosts_status: Dict[str, SnapshotHostStatus] = Field(default_factory=dict)
     summary: Dict[str, int] = Field(default_factory=dict)
     data: object = None  # Sera dict host -> lista VM o lista de hosts
+    version: int = 0  # se incrementa en cada cambio (refresh completo o change feed)
 
     def copy(self) -> "SnapshotPayload":
         return copy.deepcopy(self)
+
+    def fork(self) -> "SnapshotPayload":
+        """Copia superficial para copy-on-write: contenedores nuevos, data por host compartida."""
+        data = self.data
+        if isinstance(data, dict):
+            data = dict(data)
+        elif isinstance(data, list):
+            data = list(data)
+        return self.model_copy(
+            update={
+                "hosts": list(self.hosts),
+                "hosts_status": dict(self.hosts_status),
+                "summary": dict(self.summary),
+                "data": data,
+            }
+        )
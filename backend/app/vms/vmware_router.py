@@ -2,20 +2,21 @@ from __future__ import annotations
 
 import logging
 import threading
-import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, List, Optional, Set
 
-from fastapi import APIRouter, Depends, HTTPException, Response, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, Request
 from sqlmodel import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.auth.user_model import User
 from app.dependencies import require_permission, get_current_user
 from app.db import get_session
 from app.permissions.models import PermissionCode
-from app.vms import vm_service
+from app.vms import vm_bulk_service, vm_service
+from app.vms.vm_models import VMBase
+from app.vms.vmware_change_feed import VMwareChangeFeed
 from app.vms.vmware_jobs import (
     HostHealthStore,
     HostJobState,
@@ -29,6 +30,21 @@ from app.vms.vmware_jobs import (
     SnapshotPayload,
     SnapshotStore,
 )
+from app.jobs.adaptive import LimiterTimeout, host_collection_limiter
+from app.jobs.deadline import (
+    CANCELLED_STATUS,
+    Deadline,
+    DeadlineExceeded,
+    JobCancelled,
+    job_cancellations,
+    request_cancel,
+    run_with_deadline,
+    start_job,
+)
+from app.jobs.engine import job_engine
+from app.jobs.leader import ensure_leader, leader_elector
+from app.snapshots.encoded import delta_response, encoded_snapshots
+from app.snapshots.shared import shared_snapshots
 from app.settings import settings
 
 router = APIRouter(prefix="/api/vmware", tags=["vmware"])
@@ -41,16 +57,16 @@ _SNAPSHOT_STORE = SnapshotStore()
 _HEALTH_STORE = HostHealthStore()
 _GLOBAL_HOST_LOCKS: Dict[str, threading.RLock] = {}
 _GLOBAL_LOCKS_LOCK = threading.RLock()
-_GLOBAL_CONCURRENCY = threading.Semaphore(settings.vmware_job_max_global)
 MAX_CONCURRENCY_PER_SCOPE = settings.vmware_job_max_per_scope
+_HOST_LIMITER = host_collection_limiter("vmware", MAX_CONCURRENCY_PER_SCOPE)
 HOST_TIMEOUT_SECONDS = settings.vmware_job_host_timeout
 JOB_MAX_DURATION_SECONDS = settings.vmware_job_max_duration
 REFRESH_INTERVAL_MINUTES = settings.vmware_refresh_interval_minutes
-_SCHEDULER_CV = threading.Condition()
-_SCHEDULER_STARTED = False
-_SCHEDULER_STOP = False
 _WARMUP_STARTED = False
-_WARMUP_STOP = False
+_WARMUP_STOP = threading.Event()
+_CHANGE_FEED: Optional[VMwareChangeFeed] = None
+_LAST_FULL_REFRESH_AT: Optional[datetime] = None
+_LAST_SHARDS: Dict[str, List[str]] = {}
 
 
 _REQUIRE_SUPERADMIN = require_permission(PermissionCode.JOBS_TRIGGER)
@@ -58,6 +74,7 @@ _REQUIRE_SUPERADMIN = require_permission(PermissionCode.JOBS_TRIGGER)
 
 class RefreshRequest(BaseModel):
     force: bool = False
+    mode: str = Field("full", pattern="^(full|volatile)$")
 
 
 def _get_host_lock(host: str) -> threading.RLock:
@@ -71,20 +88,25 @@ def _get_host_lock(host: str) -> threading.RLock:
 
 
 def _kick_scheduler() -> None:
-    global _SCHEDULER_STARTED
-    with _SCHEDULER_CV:
-        if not _SCHEDULER_STARTED:
-            t = threading.Thread(target=_scheduler_loop, name="vmware-job-scheduler", daemon=True)
-            t.start()
-            _SCHEDULER_STARTED = True
-        _SCHEDULER_CV.notify_all()
+    # En un seguidor los jobs quedan pendientes: los corre el líder (ver ensure_leader).
+    if not leader_elector.is_leader:
+        return
+    job_engine.register(
+        "vmware",
+        runner=_run_job_scope_vms,
+        pending=lambda: _JOB_STORE.list_jobs_by_status({"pending"}),
+        max_concurrency=settings.vmware_job_max_global,
+    )
+    job_engine.kick("vmware")
 
 
 def _kick_warmup() -> None:
-    global _WARMUP_STARTED
+    global _WARMUP_STARTED, _WARMUP_STOP
     if _WARMUP_STARTED:
         return
-    t = threading.Thread(target=_warmup_loop, name="vmware-warmup", daemon=True)
+    # Evento nuevo por arranque: un loop detenido (p.ej. al perder el liderazgo) no revive.
+    _WARMUP_STOP = threading.Event()
+    t = threading.Thread(target=_warmup_loop, args=(_WARMUP_STOP,), name="vmware-warmup", daemon=True)
     t.start()
     _WARMUP_STARTED = True
     logger.info("VMware warmup thread started")
@@ -112,20 +134,80 @@ def _get_existing_host_data(scope_key: ScopeKey, host: str):
     return None
 
 
-def _job_deadline(start: datetime) -> datetime:
-    return start + timedelta(seconds=JOB_MAX_DURATION_SECONDS)
+def _discover_shards() -> Dict[str, List[str]]:
+    """
+    Particiones del job ``{shard: [compute_resource_moid]}``: una por cluster con el
+    motor ``bulk``; con ``rest`` (o sin clusters) el pseudo-host ``vmware`` de siempre.
+    """
+    global _LAST_SHARDS
+    if settings.vmware_inventory_engine != "bulk":
+        return {VMWARE_HOST_KEY: []}
+    try:
+        shards = vm_bulk_service.discover_shards()
+    except Exception as exc:
+        logger.warning("VMware shard discovery failed (%s); reusing previous shards", exc)
+        return _LAST_SHARDS or {VMWARE_HOST_KEY: []}
+    if not shards:
+        return {VMWARE_HOST_KEY: []}
+    _LAST_SHARDS = shards
+    return shards
+
+
+def _set_job_shards(job: JobStatus, shards: List[str]) -> None:
+    job.hosts = list(shards)
+    job.hosts_status = {
+        shard: job.hosts_status.get(shard) or HostJobStatus(state=HostJobState.PENDING) for shard in shards
+    }
+
+
+def _group_by_shard(vms: list, shards: List[str]) -> Dict[str, list]:
+    """
+    Agrupa VMs serializadas por shard según ``cluster``. Las que no coinciden con
+    ningún shard van al shard ``vmware``, el mismo fallback de ``_discover_shards``.
+    """
+    known = set(shards)
+    grouped: Dict[str, list] = {}
+    for vm in vms:
+        key = vm_bulk_service.shard_key(vm.get("cluster"))
+        grouped.setdefault(key if key in known else VMWARE_HOST_KEY, []).append(vm)
+    return grouped
+
+
+def _sync_vm_cache(scope_key: ScopeKey) -> None:
+    """Publica el inventario combinado de los shards en la cache de ``get_vms`` (motor bulk)."""
+    snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
+    if snap is None or not isinstance(snap.data, dict):
+        return
+    vms = [VMBase.model_validate(vm) for shard_vms in snap.data.values() for vm in shard_vms or []]
+    vm_service.vm_cache["vms:bulk"] = vms
+
+
+def _job_budget(job_id: str) -> Deadline:
+    """Presupuesto total del job; los hosts corren con ``budget.narrow(HOST_TIMEOUT_SECONDS)``."""
+    return Deadline.after(JOB_MAX_DURATION_SECONDS, cancel_event=job_cancellations.event(job_id))
 
 
 @router.get("/snapshot")
 def get_vmware_snapshot(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0, description="Version conocida por el cliente; devuelve solo los cambios"),
 ):
     if not settings.vmware_enabled or not settings.vmware_configured:
         return Response(status_code=204)
     scope_key = _scope_key()
+    if since is None:
+        # Worker no líder: bytes publicados por el líder, sin cargar el snapshot en este proceso.
+        shared = shared_snapshots.response(request, "vmware", scope_key)
+        if shared is not None:
+            return shared
     snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
     if snap is None:
         return Response(status_code=204)
-    return snap
+    if since is not None:
+        delta = _SNAPSHOT_STORE.get_delta(scope_key, since)
+        if delta is not None:
+            return delta_response(delta)
+    return encoded_snapshots.response(request, "vmware", scope_key, snap)
 
 
 @router.get("/jobs/{job_id}")
@@ -139,6 +221,17 @@ def get_vmware_job(
     return job
 
 
+@router.post("/jobs/{job_id}/cancel")
+def cancel_vmware_job(
+    job_id: str,
+    _user: User = Depends(require_permission(PermissionCode.JOBS_TRIGGER)),
+):
+    job = request_cancel(_JOB_STORE, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job
+
+
 @router.post("/refresh")
 def trigger_vmware_refresh(
     payload: RefreshRequest,
@@ -162,6 +255,8 @@ def trigger_vmware_refresh(
     _REQUIRE_SUPERADMIN(current_user=current_user, session=session)
     scope_key = _scope_key()
 
+    ensure_leader()
+
     # dedupe: si hay job activo, devolverlo
     active = _JOB_STORE.get_active_for_scope(scope_key)
     if active:
@@ -169,15 +264,19 @@ def trigger_vmware_refresh(
 
     now = datetime.utcnow()
     snapshot = _SNAPSHOT_STORE.get_snapshot(scope_key)
+    cooldown_minutes = (
+        settings.vmware_volatile_refresh_minutes if payload.mode == "volatile" else REFRESH_INTERVAL_MINUTES
+    )
     if not payload.force and snapshot:
         delta = now - snapshot.generated_at
-        if delta < timedelta(minutes=REFRESH_INTERVAL_MINUTES):
-            cooldown_until = snapshot.generated_at + timedelta(minutes=REFRESH_INTERVAL_MINUTES)
+        if delta < timedelta(minutes=cooldown_minutes):
+            cooldown_until = snapshot.generated_at + timedelta(minutes=cooldown_minutes)
             # cooldown activo -> no crear job nuevo, devolvemos estado terminal amigable
             job = JobStatus(
                 scope=scope_key.scope,
                 hosts=list(scope_key.hosts),
                 level=scope_key.level,
+                mode=payload.mode,
                 status="succeeded",
                 message="cooldown_active",
                 snapshot_key=f"{scope_key.scope.value}:{','.join(scope_key.hosts)}",
@@ -197,34 +296,11 @@ def trigger_vmware_refresh(
             job.progress.done = len(scope_key.hosts)
             return job
 
-    job = _JOB_STORE.create_job(scope_key)
+    job = _JOB_STORE.create_job(scope_key, mode=payload.mode)
     _kick_scheduler()
     return job
 
 
-def _scheduler_loop() -> None:
-    """
-    Hilo liviano que toma jobs pendientes y los arranca si hay cupo global.
-    """
-    while not _SCHEDULER_STOP:
-        with _SCHEDULER_CV:
-            pending_jobs = _JOB_STORE.list_jobs_by_status({"pending"})
-            if not pending_jobs:
-                _SCHEDULER_CV.wait(timeout=1.0)
-                continue
-        for job in pending_jobs:
-            # Intento tomar un slot global sin bloquear para no saturar
-            if not _GLOBAL_CONCURRENCY.acquire(blocking=False):
-                break
-            threading.Thread(
-                target=_run_job_scope_vms,
-                args=(job,),
-                daemon=True,
-                name=f"vmware-job-{job.job_id[:6]}",
-            ).start()
-        time.sleep(0.1)
-
-
 def _run_job_scope_vms(job: JobStatus) -> None:
     """
     Runner de jobs scope=vms (summary).
@@ -232,37 +308,35 @@ def _run_job_scope_vms(job: JobStatus) -> None:
     try:
         _run_job_scope_vms_inner(job)
     finally:
-        _GLOBAL_CONCURRENCY.release()
+        job_cancellations.discard(job.job_id)
 
 
 def _run_job_scope_vms_inner(job: JobStatus) -> None:
     scope_key = _scope_key()
     start_ts = datetime.utcnow()
-    deadline = _job_deadline(start_ts)
+    if start_job(_JOB_STORE, job.job_id, start_ts) is None:
+        return  # cancelado mientras esperaba en la cola
+    budget = _job_budget(job.job_id)
 
     def update_job(fn):
         return _JOB_STORE.update_job(job.job_id, fn)
 
-    update_job(
-        lambda j: (
-            setattr(j, "status", "running"),
-            setattr(j, "started_at", start_ts),
-            setattr(j, "last_heartbeat_at", datetime.utcnow()),
-        )
-    )
-
     snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
     if snap is None:
         _SNAPSHOT_STORE.init_snapshot(scope_key)
+    shards = _discover_shards()
+    _SNAPSHOT_STORE.set_shards(scope_key, list(shards), seed=snap)
+    update_job(lambda j: _set_job_shards(j, list(shards)))
+    volatile_only = job.mode == "volatile"
 
-    hosts_pending = list(scope_key.hosts)
+    hosts_pending = list(shards)
     hosts_ok_this_job = 0
     hosts_error_this_job = 0
 
     def _worker(host: str):
         nonlocal hosts_ok_this_job, hosts_error_this_job
         now = datetime.utcnow()
-        if now >= deadline:
+        if budget.expired or budget.cancelled:
             return
 
         health = _HEALTH_STORE.get(host)
@@ -308,21 +382,42 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
         state = SnapshotHostState.ERROR
         data = existing_data
         error_msg = None
+        cancelled = False
 
         with lock:
             try:
-                vms = vm_service.get_vms(refresh=True)
+                compute_ids = shards.get(host)
+                with _HOST_LIMITER.slot(deadline=budget):
+                    host_budget = budget.narrow(HOST_TIMEOUT_SECONDS)
+                    if compute_ids:
+                        vms = run_with_deadline(
+                            lambda: vm_bulk_service.get_vms_bulk_shard(host, compute_ids, volatile_only=volatile_only),
+                            host_budget,
+                            name=f"vmware-shard-{host}",
+                        )
+                    else:
+                        vms = run_with_deadline(
+                            lambda: vm_service.get_vms(refresh=True, volatile_only=volatile_only),
+                            host_budget,
+                            name="vmware-inventory",
+                        )
                 data = [vm.model_dump() for vm in vms]
-                elapsed = (datetime.utcnow() - started).total_seconds()
-                if elapsed > HOST_TIMEOUT_SECONDS:
-                    state = SnapshotHostState.TIMEOUT
-                    error_msg = "host_timeout_exceeded"
-                    hosts_error_this_job += 1
-                    _HEALTH_STORE.record_failure(host, error_type="timeout", error_message=error_msg)
-                else:
-                    state = SnapshotHostState.OK
-                    hosts_ok_this_job += 1
-                    _HEALTH_STORE.record_success(host)
+                state = SnapshotHostState.OK
+                hosts_ok_this_job += 1
+                _HEALTH_STORE.record_success(host)
+            except LimiterTimeout:
+                # sin cupo en un limitador: el host no llegó a consultarse (sin timeout ni cooldown)
+                state = SnapshotHostState.ERROR
+                error_msg = "concurrency_limit_timeout"
+                hosts_error_this_job += 1
+            except DeadlineExceeded:
+                # el hilo de la llamada queda huérfano; el slot se libera ya
+                state = SnapshotHostState.TIMEOUT
+                error_msg = "host_timeout_exceeded"
+                hosts_error_this_job += 1
+                _HEALTH_STORE.record_failure(host, error_type="timeout", error_message=error_msg)
+            except JobCancelled:
+                cancelled = True
             except Exception as exc:
                 error_msg = str(exc)
                 hosts_error_this_job += 1
@@ -331,6 +426,9 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
             finally:
                 finished = datetime.utcnow()
 
+        if cancelled:
+            return
+
         health_after = _HEALTH_STORE.get(host)
         if state == SnapshotHostState.ERROR and health_after.last_success_at:
             if (datetime.utcnow() - health_after.last_success_at) > timedelta(minutes=REFRESH_INTERVAL_MINUTES):
@@ -371,7 +469,8 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
 
         update_job(mutator)
 
-    max_workers = max(1, min(MAX_CONCURRENCY_PER_SCOPE, len(hosts_pending)))
+    # el limitador adaptativo decide cuántos hosts corren a la vez; el pool solo pone el techo
+    max_workers = max(1, min(_HOST_LIMITER.max_limit, len(hosts_pending)))
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
         fut_map = {ex.submit(_worker, h): h for h in hosts_pending}
         for fut in as_completed(fut_map):
@@ -381,10 +480,22 @@ def _run_job_scope_vms_inner(job: JobStatus) -> None:
             except Exception as exc:
                 logger.warning("Host worker '%s' error: %s", h, exc)
 
+    if hosts_ok_this_job:
+        if not volatile_only and hosts_error_this_job == 0:
+            _mark_full_refresh()
+        if any(shards.values()):
+            try:
+                _sync_vm_cache(scope_key)
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.warning("Could not sync VM cache from VMware shards: %s", exc)
+
     finished_ts = datetime.utcnow()
     final_status = "succeeded"
     message = None
-    if finished_ts >= deadline:
+    if budget.cancelled:
+        final_status = CANCELLED_STATUS
+        message = "cancelled_by_user"
+    elif budget.expired:
         final_status = "expired"
         message = "job_max_duration_reached"
     elif hosts_ok_this_job == 0:
@@ -414,38 +525,128 @@ def _vmware_configured() -> bool:
     return not issues
 
 
-def _should_warm() -> bool:
+def _refresh_interval_minutes() -> int:
+    """Con el change feed activo el refresh completo solo reconcilia."""
+    if _CHANGE_FEED is not None and _CHANGE_FEED.running:
+        return settings.vmware_change_feed_reconcile_minutes
+    return REFRESH_INTERVAL_MINUTES
+
+
+def _mark_full_refresh() -> None:
+    global _LAST_FULL_REFRESH_AT
+    _LAST_FULL_REFRESH_AT = datetime.utcnow()
+
+
+def _warmup_mode() -> Optional[str]:
+    """
+    Devuelve el tipo de job que corresponde crear ("full" / "volatile") o None.
+    Las pasadas volátiles se omiten con el change feed activo (ya aplica esos cambios).
+    """
     if not _vmware_configured():
-        return False
+        return None
     scope_key = _scope_key()
+    if _JOB_STORE.get_active_for_scope(scope_key):
+        return None
     snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
+    if snap is None:
+        return "full"
     now = datetime.utcnow()
-    if snap and (now - snap.generated_at) < timedelta(minutes=REFRESH_INTERVAL_MINUTES):
-        return False
-    active = _JOB_STORE.get_active_for_scope(scope_key)
-    if active:
-        return False
-    return True
+    last_full = _LAST_FULL_REFRESH_AT or snap.generated_at
+    if (now - last_full) >= timedelta(minutes=_refresh_interval_minutes()):
+        return "full"
+    volatile_minutes = settings.vmware_volatile_refresh_minutes
+    feed_running = _CHANGE_FEED is not None and _CHANGE_FEED.running
+    if volatile_minutes and not feed_running and (now - snap.generated_at) >= timedelta(minutes=volatile_minutes):
+        return "volatile"
+    return None
 
 
-def _warmup_loop() -> None:
+def _warmup_loop(stop: threading.Event) -> None:
     """
     Tarea interna periódica para asegurar que exista snapshot (vms) sin requerir clicks.
     No depende de permisos HTTP.
     """
     interval = max(REFRESH_INTERVAL_MINUTES, 10)
-    while not _WARMUP_STOP:
+    if settings.vmware_volatile_refresh_minutes:
+        interval = min(interval, settings.vmware_volatile_refresh_minutes)
+    while not stop.is_set():
         try:
-            if _should_warm():
+            mode = _warmup_mode()
+            if mode:
                 scope_key = _scope_key()
-                logger.info("VMware warmup: creando job para scope %s", scope_key.scope.value)
-                _JOB_STORE.create_job(scope_key)
+                logger.info("VMware warmup: creando job %s para scope %s", mode, scope_key.scope.value)
+                _JOB_STORE.create_job(scope_key, mode=mode)
                 _kick_scheduler()
         except Exception as exc:
             logger.warning("VMware warmup loop error: %s", exc)
-        time.sleep(interval * 60)
+        stop.wait(interval * 60)
 
 
 def _stop_warmup() -> None:
-    global _WARMUP_STOP
-    _WARMUP_STOP = True
+    global _WARMUP_STARTED
+    _WARMUP_STOP.set()
+    _WARMUP_STARTED = False
+
+
+def _publish_feed_changes(upserts: list, removed: Set[str], replace_all: bool) -> Optional[int]:
+    scope_key = _scope_key()
+    snap = _SNAPSHOT_STORE.get_snapshot(scope_key)
+    shards = list(snap.hosts) if snap is not None and snap.hosts else [VMWARE_HOST_KEY]
+    grouped = _group_by_shard(upserts, shards)
+    if VMWARE_HOST_KEY in grouped and VMWARE_HOST_KEY not in shards:
+        # cluster creado después del último descubrimiento: shard propio hasta el próximo job
+        shards.append(VMWARE_HOST_KEY)
+        if snap is not None:
+            _SNAPSHOT_STORE.set_shards(scope_key, list(shards))
+    version: Optional[int] = None
+    if replace_all:
+        for shard in shards:
+            shard_vms = grouped.get(shard)
+            if shard_vms:
+                health = _HEALTH_STORE.record_success(shard)
+                status = SnapshotHostStatus(state=SnapshotHostState.OK, last_success_at=health.last_success_at)
+            else:
+                # el feed no trajo VMs de este shard: se vacía sin darlo por recolectado
+                previous = snap.hosts_status.get(shard) if snap is not None else None
+                status = previous or SnapshotHostStatus(state=SnapshotHostState.PENDING)
+            version = _SNAPSHOT_STORE.upsert_host(
+                scope_key,
+                shard,
+                data=shard_vms or [],
+                status=status,
+                generated_at=datetime.utcnow(),
+            ).version
+        return version
+    if snap is None:
+        return None
+    for shard in shards:
+        shard_upserts = grouped.get(shard, [])
+        # Una VM que cambió de cluster se quita del shard anterior.
+        moved = {vm.get("id") for other, vms in grouped.items() if other != shard for vm in vms}
+        if not shard_upserts and not removed and not moved:
+            continue
+        version = _SNAPSHOT_STORE.apply_vm_changes(
+            scope_key,
+            shard,
+            upserts=shard_upserts,
+            removed=set(removed) | moved,
+        ) or version
+    return version
+
+
+def _start_change_feed() -> None:
+    global _CHANGE_FEED
+    if not settings.vmware_change_feed_enabled:
+        return
+    if _CHANGE_FEED is None:
+        _CHANGE_FEED = VMwareChangeFeed(
+            run_soap=vm_service._run_soap,
+            publish=_publish_feed_changes,
+            persist=lambda: _SNAPSHOT_STORE.persist_current(_scope_key()),
+        )
+    _CHANGE_FEED.start()
+
+
+def _stop_change_feed() -> None:
+    if _CHANGE_FEED is not None:
+        _CHANGE_FEED.stop()
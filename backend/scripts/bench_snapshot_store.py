@@ -0,0 +1,95 @@
+"""Micro-benchmark del SnapshotStore de Hyper-V: lectura y upsert por host.
+
+Compara el costo actual (copy-on-write, sin deepcopy) contra el patron previo,
+que hacia ``copy.deepcopy`` del snapshot completo en cada lectura y upsert.
+
+Uso (desde backend/):
+    python scripts/bench_snapshot_store.py --vms 5000 --hosts 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# Sin overrides de system_settings: el benchmark no toca la base configurada.
+os.environ.setdefault("TEST_MODE", "1")
+
+from app.vms.hyperv_jobs.models import ScopeKey, ScopeName, SnapshotHostState, SnapshotHostStatus  # noqa: E402
+from app.vms.hyperv_jobs.stores import SnapshotStore  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de lectura/upsert del SnapshotStore.")
+    parser.add_argument("--vms", type=int, default=5000, help="VMs totales (por defecto: %(default)s).")
+    parser.add_argument("--hosts", type=int, default=20, help="Hosts Hyper-V (por defecto: %(default)s).")
+    parser.add_argument("--rounds", type=int, default=50, help="Iteraciones por medicion (por defecto: %(default)s).")
+    return parser.parse_args()
+
+
+def _vm(host: str, idx: int) -> dict:
+    return {
+        "id": f"{host}-vm-{idx}",
+        "name": f"P-APP-{idx:05d}",
+        "host": host,
+        "state": "Running",
+        "cpu_count": 4,
+        "memory_mb": 8192,
+        "ip_addresses": [f"10.0.{idx // 250}.{idx % 250}"],
+        "disks": [{"path": f"C:\\VMs\\{idx}.vhdx", "size_gb": 120.0, "used_gb": 48.5}],
+        "networks": [{"switch": "vSwitch-Prod", "vlan": 120}],
+        "notes": "benchmark",
+    }
+
+
+def _timed(rounds: int, fn: Callable[[int], object]) -> float:
+    started = time.perf_counter()
+    for idx in range(rounds):
+        fn(idx)
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def main() -> None:
+    args = parse_args()
+    hosts = [f"p-hyp-{idx:02d}" for idx in range(args.hosts)]
+    per_host = max(args.vms // max(len(hosts), 1), 1)
+    data = {host: [_vm(host, idx) for idx in range(per_host)] for host in hosts}
+    scope_key = ScopeKey.from_parts(ScopeName.VMS, hosts, "summary")
+    ok = SnapshotHostStatus(state=SnapshotHostState.OK)
+
+    store = SnapshotStore()
+    # Solo memoria: sin escrituras ni revalidación contra la DB (que app.db no tenga tablas no importa).
+    store._persist_snapshot = lambda *args, **kwargs: None
+    store._db_recheck_due_locked = lambda scope_key: False
+    for host in hosts:
+        store.upsert_host(scope_key, host, data=data[host], status=ok)
+
+    def read_cow(_):
+        return store.get_snapshot(scope_key)
+
+    def read_legacy(_):
+        return store.get_snapshot(scope_key).copy()
+
+    def upsert_cow(idx):
+        host = hosts[idx % len(hosts)]
+        return store.upsert_host(scope_key, host, data=data[host], status=ok)
+
+    def upsert_legacy(idx):
+        # Antes: upsert in-place + deepcopy del snapshot completo para devolverlo/persistirlo.
+        return upsert_cow(idx).copy()
+
+    total = per_host * len(hosts)
+    print(f"Snapshot Hyper-V: {len(hosts)} hosts, {total} VMs, {args.rounds} rondas")
+    print(f"{'operacion':<10} {'deepcopy (ms)':>14} {'cow (ms)':>10} {'speedup':>9}")
+    for name, legacy, cow in (("read", read_legacy, read_cow), ("upsert", upsert_legacy, upsert_cow)):
+        before = _timed(args.rounds, legacy)
+        after = _timed(args.rounds, cow)
+        print(f"{name:<10} {before:>14.3f} {after:>10.3f} {before / max(after, 1e-9):>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
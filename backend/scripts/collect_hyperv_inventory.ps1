@@ -1,7 +1,7 @@
 # backend/scripts/collect_hyperv_inventory.ps1
 param(
     [Parameter(Mandatory=$true)][string]$HVHost,
-    [ValidateSet('summary','detail','deep')][string]$Level = 'summary',
+    [ValidateSet('summary','detail','deep','host')][string]$Level = 'summary',
     [string]$VMName = $null,
     [switch]$SkipVhd,
     [switch]$SkipMeasure,
@@ -15,7 +15,8 @@ Import-Module Hyper-V -ErrorAction Stop
 Import-Module FailoverClusters -ErrorAction SilentlyContinue
 
 # Defaults by level (switches win if explicitly passed)
-if ($Level -eq 'summary') {
+# 'host' devuelve solo datos del host (sin recorrer VMs): ningun dato por VM
+if ($Level -eq 'summary' -or $Level -eq 'host') {
   $SkipVhd = $true
   $SkipMeasure = $true
   $SkipKvp = $true
@@ -74,14 +75,15 @@ function Get-VhdSizeSafe {
   }
 }
 
-# Datos de host/switch para deep
+# Datos de host/switch para deep y host
+$HostData = $Level -eq 'deep' -or $Level -eq 'host'
 $globalSwitches = @()
-if ($Level -eq 'deep') {
+if ($HostData) {
   try { $globalSwitches = Get-VMSwitch | Select-Object Name, Notes, SwitchType, NetAdapterInterfaceDescription } catch {}
 }
 
 $globalHostInfo = $null
-if ($Level -eq 'deep') {
+if ($HostData) {
   try {
     $vmHost = Get-VMHost -ComputerName $HVHost -ErrorAction SilentlyContinue | Select-Object Name, LogicalProcessorCount, MemoryCapacity, VirtualMachineMigrationEnabled, Version
     # Uptime y uso CPU/Mem
@@ -140,10 +142,28 @@ $clusterName = $null; $vmOwnerMap = @{}
 try {
   $cluster = Get-Cluster -ErrorAction Stop
   $clusterName = $cluster.Name
-  $vmGroups = Get-ClusterGroup | Where-Object GroupType -eq "VirtualMachine"
-  foreach ($g in $vmGroups) { $vmOwnerMap[$g.Name] = $g.OwnerNode.Name }
+  if ($Level -ne 'host') {
+    $vmGroups = Get-ClusterGroup | Where-Object GroupType -eq "VirtualMachine"
+    foreach ($g in $vmGroups) { $vmOwnerMap[$g.Name] = $g.OwnerNode.Name }
+  }
 } catch {}
 
+# --- Modo host: un solo objeto con datos del host, sin inventariar VMs ---
+if ($Level -eq 'host') {
+  $vmCount = $null
+  try { $vmCount = @(Get-VM -ComputerName $HVHost -ErrorAction Stop).Count } catch {}
+  $hostItem = [pscustomobject]@{
+    HVHost   = $HVHost
+    Level    = 'host'
+    Cluster  = $clusterName
+    VMCount  = $vmCount
+    HostInfo = $globalHostInfo
+    Switches = $globalSwitches
+  }
+  ConvertTo-Json -InputObject @($hostItem) -Depth 6
+  return
+}
+
 # --- SO desde KVP (local) ---
 function Get-HVGuestOSFromKVP {
   param([Microsoft.HyperV.PowerShell.VirtualMachine]$VM)
@@ -362,7 +382,9 @@ try {
   $vmFilter = $null
   if ($VMName) { $vmFilter = $VMName -split ',' }
   if ($vmFilter) {
-    $vms = Get-VM -ComputerName $HVHost -Name $vmFilter -ErrorAction Stop
+    # Filtro exacto sobre la lista del host: una VM inexistente en un batch
+    # (-VMName a,b,c) no hace fallar a las demas.
+    $vms = Get-VM -ComputerName $HVHost -ErrorAction Stop | Where-Object { $vmFilter -contains $_.Name }
   } else {
     $vms = Get-VM -ComputerName $HVHost -ErrorAction Stop
   }
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from app.jobs.adaptive import AdaptiveLimiter, LimiterTimeout
+from app.jobs.deadline import Deadline, DeadlineExceeded, JobCancelled
+
+
+def _saturate(limiter, n, *, ok=True, latency=0.01):
+    for _ in range(n):
+        limiter.acquire(timeout=1)
+    for _ in range(n):
+        limiter.release(latency, ok=ok)
+
+
+def test_additive_increase_and_multiplicative_decrease():
+    limiter = AdaptiveLimiter("test", initial=2, max_limit=4, tolerance=2.0)
+    for _ in range(10):
+        _saturate(limiter, limiter.limit)
+    assert limiter.limit == 4  # crece mientras va saturado, hasta el techo
+
+    _saturate(limiter, 1, ok=False)
+    assert limiter.limit == 2  # 4 * 0.7
+    _saturate(limiter, 1, ok=False)
+    assert limiter.limit == 2  # una sola reducción por ventana
+
+    reasons = [entry["reason"] for entry in limiter.stats()["history"]]
+    assert reasons[0] == "initial" and "increase" in reasons and reasons[-1] == "error"
+
+
+def test_latency_spike_counts_as_congestion():
+    limiter = AdaptiveLimiter("test", initial=3, max_limit=4, tolerance=2.0)
+    limiter.acquire()
+    limiter.release(0.01, ok=True)
+    limiter.acquire()
+    limiter.release(0.5, ok=True)
+    stats = limiter.stats()
+    assert stats["congested"] == 1
+    assert limiter.limit == 2
+
+
+def test_acquire_waits_for_a_slot_and_honours_timeout_and_cancel():
+    limiter = AdaptiveLimiter("test", initial=1, max_limit=1)
+    limiter.acquire()
+    with pytest.raises(LimiterTimeout):
+        limiter.acquire(timeout=0.1)
+
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(JobCancelled):
+        limiter.acquire(deadline=Deadline.after(5, cancel_event=cancel))
+
+    threading.Timer(0.1, limiter.release, args=(0.01,), kwargs={"ok": True}).start()
+    with limiter.slot(timeout=2):
+        assert limiter.stats()["in_flight"] == 1
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_limiter_timeout_is_not_a_host_deadline_and_is_neutral_for_outer_slots():
+    host = AdaptiveLimiter("host", initial=2, max_limit=2)
+    soap = AdaptiveLimiter("soap", initial=1, max_limit=1)
+    soap.acquire()
+    expired = Deadline.after(0)
+    with pytest.raises(LimiterTimeout) as exc_info:
+        with host.slot():
+            soap.acquire(deadline=expired)
+    assert not isinstance(exc_info.value, DeadlineExceeded)
+    # La espera en el limitador anidado no cuenta como error del destino exterior.
+    assert host.stats()["errors"] == 0 and host.stats()["in_flight"] == 0
+    assert soap.stats()["timeouts"] == 1
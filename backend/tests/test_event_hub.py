@@ -0,0 +1,51 @@
+import asyncio
+
+from app.events.hub import EventHub, event_hub
+from app.vms.hyperv_jobs.models import ScopeKey, ScopeName
+from app.vms.hyperv_jobs.stores import JobStore
+
+
+def test_subscription_coalesces_by_key_and_bounds_the_queue():
+    async def scenario():
+        hub = EventHub()
+        sub = hub.subscribe({"hyperv.jobs"}, max_queue=2)
+        hub.publish("hyperv.jobs", "job", {"progress": 1}, key="job-a")
+        hub.publish("hyperv.jobs", "job", {"progress": 2}, key="job-a")
+        hub.publish("vmware.jobs", "job", {"progress": 9}, key="job-x")
+        events, dropped = await sub.next_batch(0.1)
+        assert [event.data for event in events] == [{"progress": 2}]
+        assert dropped == 0
+
+        for name in ("b", "c", "d"):
+            hub.publish("hyperv.jobs", "job", {"job": name}, key=name)
+        events, dropped = await sub.next_batch(0.1)
+        assert [event.data["job"] for event in events] == ["c", "d"]
+        assert dropped == 1
+
+        hub.unsubscribe(sub)
+        assert not hub.has_subscribers("hyperv.jobs")
+        assert hub.publish("hyperv.jobs", "job", {}, key="e") == 0
+
+    asyncio.run(scenario())
+
+
+def test_job_store_updates_are_pushed_to_subscribers():
+    async def scenario():
+        store = JobStore()
+        sub = event_hub.subscribe({"hyperv.jobs"}, max_queue=8)
+        try:
+            job = store.create_job(ScopeKey.from_parts(ScopeName.VMS, ["h1"], "summary"))
+
+            def mark_running(current):
+                current.status = "running"
+
+            store.update_job(job.job_id, mark_running)
+            events, _ = await sub.next_batch(0.1)
+        finally:
+            event_hub.unsubscribe(sub)
+        assert len(events) == 1
+        assert events[0].type == "job"
+        assert events[0].data["job_id"] == job.job_id
+        assert events[0].data["status"] == "running"
+
+    asyncio.run(scenario())
@@ -0,0 +1,85 @@
+import base64
+
+from app.providers.hyperv import remote
+from app.providers.hyperv.winrm_pool import WinRMShellPool
+
+
+class FakeHost:
+    """Simula el %TEMP% del host: guarda lo que se sube y cuenta los run_ps."""
+
+    def __init__(self):
+        self.installed = set()
+        self.calls = []
+
+    def protocol(self, endpoint, **_kwargs):
+        host = self
+
+        class Protocol:
+            def open_shell(self, **_kwargs):
+                return "shell-1"
+
+            def run_command(self, shell_id, command, args=()):
+                host.calls.append(base64.b64decode(command.split()[-1]).decode("utf-16-le"))
+                return "cmd"
+
+            def get_command_output(self, shell_id, command_id):
+                script = host.calls[-1]
+                if "Move-Item" in script:
+                    host.installed.add(script.split("'collect_")[1].split(".ps1'")[0])
+                elif "Test-Path" in script:
+                    digest = script.split("'collect_")[1].split(".ps1'")[0]
+                    if digest not in host.installed:
+                        return remote._COLLECTOR_MISSING.encode(), b"", 0
+                    return b'[{"Name": "vm1"}]', b"", 0
+                return b"", b"", 0
+
+            def cleanup_command(self, shell_id, command_id):
+                pass
+
+            def close_shell(self, shell_id, close_session=True):
+                pass
+
+        return Protocol()
+
+
+def test_collector_is_uploaded_once_then_runs_in_one_round_trip(monkeypatch):
+    host = FakeHost()
+    pool = WinRMShellPool(max_per_host=2, idle_seconds=300, health_check_seconds=60, protocol_factory=host.protocol)
+    monkeypatch.setattr(remote, "winrm_pool", pool)
+    creds = remote.RemoteCreds(host="hv01")
+    script = "param([string]$HVHost)\n" + "# padding\n" * 1000
+
+    def run():
+        return remote._run_winrm_inline(creds, script, "hv01", "summary", None, True, True, True)
+
+    assert run() == '[{"Name": "vm1"}]'
+    first_call = len(host.calls)
+    assert first_call < 12  # probe + pocos chunks grandes + install + run
+    assert remote._script_digest(script) in host.installed
+
+    host.calls.clear()
+    assert run() == '[{"Name": "vm1"}]'
+    assert len(host.calls) == 1
+
+    host.calls.clear()
+    run_changed = remote._run_winrm_inline(creds, script + "# v2\n", "hv01", "summary", None, True, True, True)
+    assert run_changed == '[{"Name": "vm1"}]'
+    assert len(host.calls) > 1  # otro hash: se vuelve a subir
+    assert pool.stats()["handshakes"] == 1
+
+
+def test_uploaded_collector_has_bom_and_matches_digest(monkeypatch):
+    import hashlib
+
+    host = FakeHost()
+    pool = WinRMShellPool(max_per_host=2, idle_seconds=300, health_check_seconds=60, protocol_factory=host.protocol)
+    monkeypatch.setattr(remote, "winrm_pool", pool)
+    script = 'Write-Warning "Get-VM falló"\n'
+
+    remote._run_winrm_inline(remote.RemoteCreds(host="hv01"), script, "hv01", "summary", None, True, True, True)
+
+    chunks = [call.split("FromBase64String('")[1].split("')")[0] for call in host.calls if "FromBase64String" in call]
+    uploaded = base64.b64decode("".join(chunks))
+    assert uploaded.startswith(b"\xef\xbb\xbf")
+    assert uploaded[3:].decode("utf-8") == script
+    assert hashlib.sha256(uploaded).hexdigest().upper() == remote._script_digest(script)
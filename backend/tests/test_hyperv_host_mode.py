@@ -0,0 +1,43 @@
+from app.providers.hyperv.remote import RemoteCreds
+from app.vms import hyperv_service
+
+
+def test_host_info_uses_host_only_collector(monkeypatch):
+    calls = []
+
+    def fake_run_inventory(creds, *, ps_content, level, vm_name=None):
+        calls.append(level)
+        return [
+            {
+                "HVHost": "hv01",
+                "Level": "host",
+                "Cluster": "CL01",
+                "VMCount": 57,
+                "HostInfo": {
+                    "Version": "10.0.17763",
+                    "LogicalProcessorCount": 64,
+                    "MemoryCapacity": 549755813888,
+                    "UptimeSeconds": 3600,
+                    "CpuUsagePct": 12.5,
+                    "MemUsagePct": 40.1,
+                    "Nics": {"Name": "NIC1", "Status": "Up"},  # ConvertTo-Json de un solo elemento
+                    "Storage": [{"FriendlyName": "SSD0"}],
+                },
+                "Switches": [{"Name": "vSwitch"}, {"Name": "vSwitch"}],
+            }
+        ]
+
+    monkeypatch.setattr(hyperv_service, "run_inventory", fake_run_inventory)
+    hyperv_service._HOST_INFO_CACHE.clear()
+    creds = RemoteCreds(host="HV01")
+
+    info = hyperv_service.collect_hyperv_host_info(creds, ps_content="")
+    assert calls == ["host"]
+    assert info.cluster == "CL01"
+    assert info.total_vms == 57
+    assert info.logical_processors == 64
+    assert info.nics == [{"Name": "NIC1", "Status": "Up"}]
+    assert info.switches == [{"Name": "vSwitch"}]
+
+    assert hyperv_service.collect_hyperv_host_info(creds, ps_content="") is info
+    assert calls == ["host"]
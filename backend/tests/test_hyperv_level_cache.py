@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.providers.hyperv.remote import RemoteCreds
+from app.providers.hyperv.schema import VMRecordDeep, VMRecordDetail, VMRecordSummary
+from app.vms import hyperv_service
+
+
+def _vm(name):
+    return {
+        "HVHost": "hv01",
+        "Name": name,
+        "State": "Running",
+        "OwnerNode": "hv01",
+        "HostInfo": {"Version": "10.0", "LogicalProcessorCount": 32},
+        "Switches": [{"Name": "vSwitch"}],
+    }
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    calls = []
+
+    def fake_run_inventory(creds, *, ps_content, level, vm_name=None):
+        calls.append(level)
+        return [_vm("vm1"), _vm("vm2")]
+
+    monkeypatch.setattr(hyperv_service, "run_inventory", fake_run_inventory)
+    for cache in (*hyperv_service._HOST_CACHE.values(), hyperv_service._LAST_RUN):
+        cache.clear()
+    return calls
+
+
+def test_deep_run_feeds_detail_and_summary_caches(runs):
+    creds = RemoteCreds(host="HV01")
+    deep = hyperv_service.collect_hyperv_inventory_for_host(creds, ps_content="", level="deep")
+    assert deep[0].HostInfo["LogicalProcessorCount"] == 32
+    assert runs == ["deep"]
+
+    summary = hyperv_service.collect_hyperv_inventory_for_host(creds, ps_content="", level="summary")
+    assert [type(rec) for rec in summary] == [VMRecordSummary, VMRecordSummary]
+    assert not hasattr(summary[0], "HostInfo")
+
+    detail = hyperv_service.collect_hyperv_inventory_for_host(creds, ps_content="", level="detail", vm_name="vm2")
+    assert [(type(rec), rec.Name, rec.OwnerNode) for rec in detail] == [(VMRecordDetail, "vm2", "hv01")]
+    assert runs == ["deep"]
+
+
+def test_refresh_job_collects_at_highest_pending_level(runs):
+    creds = RemoteCreds(host="hv01")
+    job_created = datetime.utcnow() - timedelta(seconds=1)
+
+    items = hyperv_service.collect_hyperv_inventory_for_host(
+        creds, ps_content="", use_cache=False, fresh_after=job_created, level="summary", collect_level="deep"
+    )
+    assert runs == ["deep"]
+    assert all(type(rec) is VMRecordSummary for rec in items)
+
+    # otro job creado antes de la corrida la reutiliza aunque refresque y aunque
+    # la cache deep ya haya vencido
+    hyperv_service._HOST_CACHE["deep"].clear()
+    deep = hyperv_service.collect_hyperv_inventory_for_host(
+        creds, ps_content="", use_cache=False, fresh_after=job_created, level="deep"
+    )
+    assert deep[0].Switches == [{"Name": "vSwitch"}]
+    assert runs == ["deep"]
+
+    # un refresh pedido después de la corrida vuelve a correr el colector
+    hyperv_service.collect_hyperv_inventory_for_host(
+        creds, ps_content="", use_cache=False, fresh_after=datetime.utcnow(), level="detail"
+    )
+    assert runs == ["deep", "detail"]
+
+
+def test_lower_level_result_does_not_satisfy_higher_level(runs):
+    creds = RemoteCreds(host="hv01")
+    hyperv_service.collect_hyperv_inventory_for_host(creds, ps_content="", level="summary")
+    deep = hyperv_service.collect_hyperv_inventory_for_host(creds, ps_content="", level="deep")
+    assert runs == ["summary", "deep"]
+    assert all(type(rec) is VMRecordDeep for rec in deep)
+    assert hyperv_service.highest_level("summary", None, "detail") == "detail"
@@ -39,3 +39,65 @@ def test_upsert_host_replaces_dict_items():
     assert isinstance(snap.data, list)
     assert len(snap.data) == 1
     assert snap.data[0]["total_vms"] == 2
+
+
+def test_upsert_publishes_new_version_sharing_unchanged_hosts():
+    store = SnapshotStore()
+    store._persist_snapshot = lambda *args, **kwargs: None
+    scope_key = ScopeKey.from_parts(ScopeName.VMS, ["p-hyp-01", "p-hyp-02"], "summary")
+    store.upsert_host(scope_key, "p-hyp-01", data=[{"id": "a"}], status=_ok_status())
+    before = store.get_snapshot(scope_key)
+
+    after = store.upsert_host(scope_key, "p-hyp-02", data=[{"id": "b"}], status=_ok_status())
+
+    assert after.version == before.version + 1
+    assert "p-hyp-02" not in before.data
+    assert after.data["p-hyp-01"] is before.data["p-hyp-01"]
+    assert store.get_snapshot(scope_key).data["p-hyp-02"] == [{"id": "b"}]
+
+
+def test_db_snapshot_is_compared_by_generated_at_not_process_version(monkeypatch):
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import create_engine
+
+    import app.db
+    import app.snapshots.service
+    from app.jobs.leader import leader_elector
+    from app.vms.hyperv_jobs.models import SnapshotPayload
+
+    store = SnapshotStore()
+    store._persist_snapshot = lambda *args, **kwargs: None
+    scope_key = ScopeKey.from_parts(ScopeName.VMS, ["p-hyp-01"], "summary")
+    for idx in range(3):
+        store.upsert_host(scope_key, "p-hyp-01", data=[{"id": f"old-{idx}"}], status=_ok_status())
+    local = store._snapshots[scope_key]
+
+    # El líder se reinició: su version vuelve a empezar pero el snapshot es más nuevo.
+    persisted = SnapshotPayload(
+        scope=ScopeName.VMS,
+        hosts=["p-hyp-01"],
+        level="summary",
+        data={"p-hyp-01": [{"id": "new"}]},
+        generated_at=local.generated_at + timedelta(seconds=5),
+        version=1,
+    )
+    engine = create_engine("sqlite://")
+    monkeypatch.setattr(app.db, "get_engine", lambda: engine)
+    monkeypatch.setattr(app.snapshots.service, "get_snapshot", lambda session, **kwargs: {"stub": True})
+    monkeypatch.setattr(store, "_payload_to_snapshot", lambda payload: persisted.model_copy(deep=True))
+    monkeypatch.setattr(leader_elector, "_started", True)
+    monkeypatch.setattr(leader_elector, "_leader", False)
+
+    snap = store.get_snapshot(scope_key)
+    assert snap.source == "db"
+    assert snap.data["p-hyp-01"] == [{"id": "new"}]
+    assert snap.version > local.version
+
+    # Al asumir el rol, el líder revalida una vez contra la DB y luego sirve memoria.
+    monkeypatch.setattr(leader_elector, "_leader", True)
+    monkeypatch.setattr(leader_elector, "_term", leader_elector.term + 1)
+    newer = persisted.model_copy(update={"generated_at": datetime.utcnow() + timedelta(minutes=1)}, deep=True)
+    monkeypatch.setattr(store, "_payload_to_snapshot", lambda payload: newer.model_copy(deep=True))
+    assert store.get_snapshot(scope_key).source == "db"
+    assert store.get_snapshot(scope_key).source == "memory"
@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from app.providers.hyperv.remote import RemoteCreds
+from app.providers.hyperv.schema import VMRecordDetail
+from app.vms import hyperv_service
+from app.vms.hyperv_batcher import VMBatchCoalescer
+
+
+def _vm(name):
+    return {"HVHost": "hv01", "Name": name, "State": "Running"}
+
+
+@pytest.fixture
+def inventory(monkeypatch):
+    calls = []
+
+    def fake_run_inventory(creds, *, ps_content, level, vm_name=None):
+        calls.append((level, vm_name))
+        wanted = (vm_name or "").split(",")
+        return [_vm(name) for name in wanted if name in {"vm1", "vm2", "vm3"}]
+
+    monkeypatch.setattr(hyperv_service, "run_inventory", fake_run_inventory)
+    for cache in (*hyperv_service._HOST_CACHE.values(), hyperv_service._LAST_RUN):
+        cache.clear()
+    return calls
+
+
+def test_batch_runs_collector_once_and_fills_per_vm_cache(inventory):
+    creds = RemoteCreds(host="HV01")
+    records = hyperv_service.collect_hyperv_vms_batch(creds, "", ["vm1", "vm2", "ghost"], level="detail")
+    assert inventory == [("detail", "vm1,vm2,ghost")]
+    assert records["ghost"] is None
+    assert type(records["vm2"]) is VMRecordDetail and records["vm2"].Name == "vm2"
+
+    # cada VM quedó en su propia entrada de cache detail
+    detail = hyperv_service.collect_hyperv_inventory_for_host(creds, ps_content="", level="detail", vm_name="vm1")
+    assert [rec.Name for rec in detail] == ["vm1"]
+    assert hyperv_service.cached_vm_records("hv01", "detail", ["vm1", "vm3"]).keys() == {"vm1"}
+
+    again = hyperv_service.collect_hyperv_vms_batch(creds, "", ["vm1", "vm3"], level="detail")
+    assert inventory[-1] == ("detail", "vm3")
+    assert again["vm1"].Name == "vm1" and again["vm3"].Name == "vm3"
+
+
+def test_concurrent_fetches_are_coalesced():
+    calls = []
+    started = threading.Barrier(3)
+
+    def runner(host, level, names, refresh):
+        calls.append((host, level, list(names), refresh))
+        return {name: f"{level}:{name}" for name in names}
+
+    batcher = VMBatchCoalescer(runner, window_seconds=0.5, max_vms=10)
+    results = {}
+
+    def fetch(name):
+        started.wait(5)
+        results.update(batcher.fetch("HV01", "detail", [name]))
+
+    workers = [threading.Thread(target=fetch, args=(f"vm{i}",)) for i in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(5)
+
+    assert len(calls) == 1
+    assert calls[0][0] == "hv01" and sorted(calls[0][2]) == ["vm0", "vm1", "vm2"]
+    assert results == {f"vm{i}": f"detail:vm{i}" for i in range(3)}
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["coalesced"] == 2 and stats["open_batches"] == 0
+
+
+def test_cache_hits_skip_batch_and_errors_propagate():
+    calls = []
+
+    def runner(host, level, names, refresh):
+        calls.append(list(names))
+        raise RuntimeError("winrm down")
+
+    batcher = VMBatchCoalescer(
+        runner, window_seconds=0, max_vms=1, lookup=lambda host, level, names: {"vm1": "cached"}
+    )
+    assert batcher.fetch("hv01", "deep", ["vm1"]) == {"vm1": "cached"}
+    assert calls == []
+
+    with pytest.raises(RuntimeError):
+        batcher.fetch("hv01", "deep", ["vm1"], refresh=True)
+    assert calls == [["vm1"]]
+    assert batcher.stats()["errors"] == 1
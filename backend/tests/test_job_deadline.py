@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from app.jobs.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    JobCancelled,
+    budget_timeout,
+    job_cancellations,
+    request_cancel,
+    run_with_deadline,
+    start_job,
+)
+from app.vms.hyperv_jobs.models import ScopeKey, ScopeName
+from app.vms.hyperv_jobs.stores import JobStore
+
+
+def test_hung_call_releases_the_caller_at_the_deadline():
+    release = threading.Event()
+    seen = {}
+
+    def hung_call():
+        seen["timeout"] = budget_timeout(60)
+        release.wait(5)
+        return "late"
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        run_with_deadline(hung_call, Deadline.after(0.3))
+    release.set()
+
+    assert time.monotonic() - started < 2
+    assert seen["timeout"] <= 1.0  # el presupuesto restante llega al timeout de la llamada
+    assert budget_timeout(60) == 60  # fuera de un job no se toca
+    assert run_with_deadline(lambda: "ok", Deadline.after(5)) == "ok"
+
+
+def test_cancel_pending_and_running_jobs():
+    store = JobStore()
+    queued = store.create_job(ScopeKey.from_parts(ScopeName.VMS, ["h1"], "summary"))
+    assert request_cancel(store, queued.job_id).status == "cancelled"
+    assert start_job(store, queued.job_id, None) is None
+    assert store.get_active_for_scope(ScopeKey.from_parts(ScopeName.VMS, ["h1"], "summary")) is None
+
+    running = store.create_job(ScopeKey.from_parts(ScopeName.VMS, ["h2"], "summary"))
+    assert start_job(store, running.job_id, None).status == "running"
+    budget = Deadline.after(30, cancel_event=job_cancellations.event(running.job_id))
+    try:
+        timer = threading.Timer(0.2, request_cancel, args=(store, running.job_id))
+        timer.start()
+        started = time.monotonic()
+        with pytest.raises(JobCancelled):
+            run_with_deadline(lambda: threading.Event().wait(5), budget.narrow(30))
+        assert time.monotonic() - started < 2
+        assert store.get(running.job_id).message == "cancel_requested"
+    finally:
+        job_cancellations.discard(running.job_id)
+    assert request_cancel(store, "missing") is None
@@ -0,0 +1,115 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from app.jobs.engine import JobEngine
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_provider_budget_limits_concurrency_and_dedupes_jobs():
+    engine = JobEngine(workers=4)
+    release = threading.Event()
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def runner(job):
+        with lock:
+            running.append(job.job_id)
+            peak.append(len(running))
+        release.wait(timeout=2)
+        with lock:
+            running.remove(job.job_id)
+
+    jobs = [SimpleNamespace(job_id=f"job-{idx}") for idx in range(3)]
+    engine.register("vmware", runner=runner, pending=lambda: jobs, max_concurrency=1)
+
+    assert engine.kick("vmware") == 3
+    # Los jobs ya encolados o en ejecucion no se duplican en un nuevo kick.
+    assert engine.kick("vmware") == 0
+    assert _wait_for(lambda: engine.stats()["providers"]["vmware"]["running"] == 1)
+    assert engine.stats()["providers"]["vmware"]["queued"] == 2
+
+    release.set()
+    assert _wait_for(lambda: engine.stats()["providers"]["vmware"]["started"] == 3)
+    assert _wait_for(lambda: engine.stats()["queued"] == 0 and not running)
+    assert max(peak) == 1
+    engine.stop()
+
+
+def test_busy_provider_does_not_block_others_and_failures_are_counted():
+    engine = JobEngine(workers=2)
+    release = threading.Event()
+    done = threading.Event()
+
+    def slow(job):
+        release.wait(timeout=2)
+
+    def failing(job):
+        done.set()
+        raise RuntimeError("boom")
+
+    engine.register("hyperv", runner=slow, pending=lambda: [], max_concurrency=1)
+    engine.register("cedia", runner=failing, pending=lambda: [], max_concurrency=1)
+    engine.submit("hyperv", SimpleNamespace(job_id="h1"))
+    engine.submit("hyperv", SimpleNamespace(job_id="h2"))
+    engine.submit("cedia", SimpleNamespace(job_id="c1"))
+
+    assert done.wait(timeout=2)
+    assert _wait_for(lambda: engine.stats()["providers"]["cedia"]["failed"] == 1)
+    assert engine.stats()["providers"]["hyperv"]["running"] == 1
+    release.set()
+    assert _wait_for(lambda: engine.stats()["providers"]["hyperv"]["started"] == 2)
+    engine.stop()
+
+
+def test_engine_restarts_workers_after_stop():
+    engine = JobEngine(workers=1)
+    ran = []
+    engine.register("vmware", runner=lambda job: ran.append(job.job_id), pending=lambda: [], max_concurrency=1)
+
+    engine.submit("vmware", SimpleNamespace(job_id="before"))
+    assert _wait_for(lambda: ran == ["before"])
+    old_workers = list(engine._threads)
+    engine.stop()
+    for thread in old_workers:
+        thread.join(timeout=2)
+    assert not any(thread.is_alive() for thread in old_workers)
+
+    # Un submit despues de stop() (p.ej. un nuevo lifespan) vuelve a levantar el pool.
+    assert engine.submit("vmware", SimpleNamespace(job_id="after"))
+    assert _wait_for(lambda: ran == ["before", "after"])
+    engine.stop()
+
+
+def test_stop_with_a_job_still_queued_resumes_on_next_kick():
+    engine = JobEngine(workers=1)
+    release = threading.Event()
+    ran = []
+
+    def runner(job):
+        ran.append(job.job_id)
+        if job.job_id == "a":
+            release.wait(timeout=2)
+
+    jobs = [SimpleNamespace(job_id="a"), SimpleNamespace(job_id="b")]
+    pending = lambda: [job for job in jobs if job.job_id not in ran]
+    engine.register("vmware", runner=runner, pending=pending, max_concurrency=1)
+    assert engine.kick("vmware") == 2
+    assert _wait_for(lambda: ran == ["a"])
+
+    engine.stop()
+    release.set()
+    # "b" sigue en cola (e inflight): el kick no lo re-encola pero levanta workers nuevos.
+    assert engine.kick("vmware") == 0
+    assert _wait_for(lambda: ran == ["a", "b"])
+    assert _wait_for(lambda: engine.stats()["queued"] == 0)
+    engine.stop()
@@ -0,0 +1,50 @@
+from app.jobs.leader import FileLeaderLock, LeaderElector
+
+
+def test_file_lock_elects_one_leader_and_fails_over(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    events = []
+    first = LeaderElector()
+    second = LeaderElector()
+    assert first.is_leader  # sin arrancar se comporta como proceso unico
+
+    first.start(
+        FileLeaderLock(path),
+        retry_seconds=60,
+        on_elected=lambda: events.append("first-elected"),
+        on_demoted=lambda: events.append("first-demoted"),
+    )
+    second.start(
+        FileLeaderLock(path),
+        retry_seconds=60,
+        on_elected=lambda: events.append("second-elected"),
+        on_demoted=lambda: events.append("second-demoted"),
+    )
+    try:
+        assert first.is_leader
+        assert not second.is_leader
+
+        first.stop()
+        second._tick()
+        assert second.is_leader
+        assert events == ["first-elected", "second-elected"]
+        assert second.stats()["backend"] == "file"
+    finally:
+        first.stop()
+        second.stop()
+
+
+def test_followers_reject_on_demand_refresh(monkeypatch):
+    import pytest
+    from fastapi import HTTPException
+
+    from app.jobs import leader
+
+    leader.ensure_leader()  # sin eleccion arrancada: proceso unico, se permite
+
+    monkeypatch.setattr(leader.leader_elector, "_started", True)
+    monkeypatch.setattr(leader.leader_elector, "_leader", False)
+    with pytest.raises(HTTPException) as exc_info:
+        leader.ensure_leader()
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "10"
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from pyVmomi import vim, vmodl
+
+from app.vms.moref_index import MoRefIndex
+
+
+class _Stub:
+    def __init__(self, names):
+        self.names = names
+        self.calls = []
+
+    def InvokeAccessor(self, mo, info):
+        self.calls.append((mo._moId, info.name))
+        if mo._moId not in self.names:
+            raise vmodl.fault.ManagedObjectNotFound(obj=mo)
+        return self.names[mo._moId]
+
+
+def _content(stub):
+    return SimpleNamespace(propertyCollector=SimpleNamespace(_stub=stub))
+
+
+def test_get_host_builds_reference_and_caches_validation():
+    stub = _Stub({"host-1": "esx01.local"})
+    index = MoRefIndex()
+    content = _content(stub)
+
+    ref = index.get_host(content, "host-1")
+    assert isinstance(ref, vim.HostSystem)
+    assert ref._moId == "host-1"
+    assert index.get_host(content, "host-1")._moId == "host-1"
+    assert stub.calls == [("host-1", "name")]
+
+
+def test_missing_objects_return_none():
+    index = MoRefIndex()
+    content = _content(_Stub({}))
+    assert index.get_host(content, "host-404") is None
+    assert index.get_host(content, "") is None
+
+
+def test_new_session_stub_revalidates():
+    index = MoRefIndex()
+    first = _Stub({"host-7": "esx07.local"})
+    index.get_host(_content(first), "host-7")
+    second = _Stub({})
+    assert index.get_host(_content(second), "host-7") is None
+    assert second.calls == [("host-7", "name")]
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from app.vms.vm_service import SingleFlightTTLCache
+
+
+def test_concurrent_misses_share_one_loader_call():
+    cache = SingleFlightTTLCache(maxsize=4, ttl=60)
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(timeout=2)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert calls == [1]
+    assert results == ["value"] * 5
+    stats = cache.stats()
+    assert stats["coalesced"] == 4
+    assert cache.get_or_load("k", loader) == "value"
+    assert cache.stats()["hits"] == 1
+
+
+def test_stale_value_is_served_while_refreshing():
+    cache = SingleFlightTTLCache(maxsize=4, ttl=60, soft_ttl=0)
+    cache["k"] = "old"
+    refreshed = threading.Event()
+
+    def loader():
+        refreshed.set()
+        return "new"
+
+    assert cache.get_or_load("k", loader) == "old"
+    assert refreshed.wait(timeout=2)
+    for _ in range(50):
+        if cache.get("k") == "new":
+            break
+        time.sleep(0.01)
+    assert cache.get("k") == "new"
+    assert cache.stats()["stale_served"] == 1
+
+
+def test_loader_error_propagates_and_is_not_cached():
+    cache = SingleFlightTTLCache(maxsize=4, ttl=60)
+
+    def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("k", failing)
+    assert "k" not in cache
+    assert cache.stats()["load_errors"] == 1
+    assert cache.get_or_load("k", lambda: None) is None
+    assert "k" in cache
+
+
+def test_different_variants_do_not_share_a_flight():
+    cache = SingleFlightTTLCache(maxsize=4, ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def loader(kind):
+        def _load():
+            calls.append(kind)
+            release.wait(timeout=2)
+            return kind
+
+        return _load
+
+    results = {}
+    volatile = threading.Thread(
+        target=lambda: results.setdefault("volatile", cache.get_or_load("k", loader("volatile"), refresh=True, variant="volatile"))
+    )
+    volatile.start()
+    time.sleep(0.05)
+    full = threading.Thread(
+        target=lambda: results.setdefault("full", cache.get_or_load("k", loader("full"), refresh=True, variant="full"))
+    )
+    full.start()
+    time.sleep(0.05)
+    release.set()
+    volatile.join(timeout=2)
+    full.join(timeout=2)
+
+    assert sorted(calls) == ["full", "volatile"]
+    assert results == {"volatile": "volatile", "full": "full"}
+    assert cache.stats()["coalesced"] == 0
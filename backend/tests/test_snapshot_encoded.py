@@ -0,0 +1,57 @@
+import gzip
+import json
+
+from starlette.requests import Request
+
+from app.snapshots.encoded import EncodedSnapshotCache, encoded_response
+from app.snapshots.shared import SharedSnapshotSegment, shared_key
+from app.vms.hyperv_jobs.models import ScopeKey, ScopeName, SnapshotPayload
+
+
+def _request(**headers) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_snapshot_is_encoded_once_per_version_and_revalidated_with_etag():
+    cache = EncodedSnapshotCache()
+    key = ScopeKey.from_parts(ScopeName.VMS, ["h1"], "summary")
+    snap = SnapshotPayload(scope=ScopeName.VMS, hosts=["h1"], data={"h1": [{"id": f"vm-{i}"} for i in range(100)]})
+
+    first = cache.response(_request(accept_encoding="gzip, deflate"), "hyperv", key, snap)
+    assert first.status_code == 200
+    assert first.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(first.body))["data"]["h1"][0] == {"id": "vm-0"}
+
+    etag = first.headers["etag"]
+    cached = cache.response(_request(if_none_match=etag), "hyperv", key, snap)
+    assert cached.status_code == 304
+    assert cached.body == b""
+
+    changed = snap.model_copy(update={"version": snap.version + 1})
+    fresh = cache.response(_request(if_none_match=etag), "hyperv", key, changed)
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+    assert cache.stats()["encodes"] == 2
+
+
+def test_shared_segment_serves_published_version_from_mmap(tmp_path):
+    segment = SharedSnapshotSegment(str(tmp_path))
+    key = shared_key("hyperv", ScopeKey.from_parts(ScopeName.VMS, ["h1"], "summary"))
+    snap = SnapshotPayload(scope=ScopeName.VMS, hosts=["h1"], data={"h1": [{"id": "vm-0"}]}, version=3)
+    assert segment.read(key) is None
+
+    segment.publish_batch([(key, snap)])
+    version, entry = segment.read(key)
+    assert version == 3
+    assert isinstance(entry.body, memoryview)
+    assert json.loads(bytes(entry.body))["source"] == "shared"
+    assert segment.read(key)[1] is entry  # mismo mapeo mientras el archivo no cambie
+
+    response = encoded_response(_request(), entry)
+    assert json.loads(bytes(response.body))["data"] == {"h1": [{"id": "vm-0"}]}
+    assert encoded_response(_request(if_none_match=entry.etag), entry).status_code == 304
+
+    segment.publish(key, snap.model_copy(update={"version": 4}))
+    assert segment.read(key)[0] == 4
+    assert segment.stats()["maps"] == 2
@@ -0,0 +1,115 @@
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.snapshots.models import SnapshotFragmentRecord
+from app.snapshots.service import get_snapshot, upsert_snapshot_fragments
+from app.snapshots.writer import SnapshotWriter, snapshot_fragments
+from app.vms.hyperv_jobs.models import ScopeName, SnapshotPayload
+
+
+def _snapshot(data) -> SnapshotPayload:
+    return SnapshotPayload(scope=ScopeName.VMS, hosts=list(data), data=data, version=len(data))
+
+
+def test_writer_coalesces_updates_for_the_same_key():
+    batches = []
+    writer = SnapshotWriter(delay_seconds=60, sink=batches.append)
+    key = ("hyperv", "vms", "h1,h2", "summary")
+    first = _snapshot({"h1": [{"id": "a"}]})
+    latest = _snapshot({"h1": [{"id": "a"}], "h2": [{"id": "b"}]})
+
+    writer.enqueue(*key, first, changed=["h1"])
+    writer.enqueue(*key, latest, changed=["h2"])
+    assert writer.flush() == 1
+
+    assert len(batches) == 1
+    snapshot, changed = batches[0][key]
+    assert snapshot is latest
+    assert changed == {"h1", "h2"}
+    assert writer.stats()["coalesced"] == 1
+    writer.stop()
+
+
+def test_failed_batch_is_requeued_and_merged_with_newer_writes():
+    batches = []
+    failures = [RuntimeError("database is locked")]
+
+    def sink(batch):
+        if failures:
+            raise failures.pop()
+        batches.append(batch)
+
+    writer = SnapshotWriter(delay_seconds=60, sink=sink)
+    key = ("hyperv", "vms", "h1,h2", "summary")
+    first = _snapshot({"h1": [{"id": "a"}]})
+    latest = _snapshot({"h1": [{"id": "a"}], "h2": [{"id": "b"}]})
+
+    writer.enqueue(*key, first, changed=["h1"])
+    assert writer.flush() == 0
+    assert writer.stats()["pending"] == 1 and writer.stats()["errors"] == 1
+
+    writer.enqueue(*key, latest, changed=["h2"])
+    assert writer.flush() == 1
+    snapshot, changed = batches[0][key]
+    assert snapshot is latest
+    # h1 no llegó a escribirse en el intento fallido: sigue en el lote
+    assert changed == {"h1", "h2"}
+    assert writer.stats()["pending"] == 0
+    writer.stop()
+
+
+def test_fragments_are_written_per_host_and_reassembled():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    key = ("hyperv", "vms", "h1,h2", "summary")
+
+    with Session(engine) as session:
+        header, fragments = snapshot_fragments(_snapshot({"h1": [{"id": "a"}], "h2": [{"id": "b"}]}))
+        upsert_snapshot_fragments(session, *key, header, fragments, prune=True)
+        session.commit()
+
+        header, fragments = snapshot_fragments(_snapshot({"h1": [{"id": "a2"}], "h2": [{"id": "b"}]}), ["h1"])
+        assert list(fragments) == ["h1"]
+        upsert_snapshot_fragments(session, *key, header, fragments)
+        session.commit()
+
+        payload = get_snapshot(session, *key)
+        assert payload["data"] == {"h1": [{"id": "a2"}], "h2": [{"id": "b"}]}
+        assert payload["version"] == 2
+        assert "_fragments" not in payload
+
+        header, fragments = snapshot_fragments(_snapshot({"h2": [{"id": "b"}]}))
+        upsert_snapshot_fragments(session, *key, header, fragments, prune=True)
+        session.commit()
+        assert [row.host for row in session.exec(select(SnapshotFragmentRecord))] == ["h2"]
+        assert SnapshotPayload.model_validate(get_snapshot(session, *key)).data == {"h2": [{"id": "b"}]}
+
+
+def test_list_snapshots_are_fragmented_per_item_and_keep_order():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    key = ("hyperv", "hosts", "h1,h2,h3", "summary")
+
+    def hosts_snapshot(items):
+        return SnapshotPayload(scope=ScopeName.HOSTS, hosts=["h1", "h2", "h3"], data=items, version=1)
+
+    with Session(engine) as session:
+        items = [{"host": "h2", "total_vms": 1}, {"host": "h1", "total_vms": 2}, {"host": "h3", "total_vms": 3}]
+        header, fragments = snapshot_fragments(hosts_snapshot(items))
+        upsert_snapshot_fragments(session, *key, header, fragments, prune=True)
+        session.commit()
+
+        items[1] = {"host": "h1", "total_vms": 9}
+        header, fragments = snapshot_fragments(hosts_snapshot(items), ["H1"])
+        assert list(fragments) == ["h1"]
+        upsert_snapshot_fragments(session, *key, header, fragments)
+        session.commit()
+        assert get_snapshot(session, *key)["data"] == items
+
+        # Items sin clave única: un solo fragmento, como antes.
+        header, fragments = snapshot_fragments(hosts_snapshot([{"total_vms": 1}, {"total_vms": 2}]), ["h1"])
+        assert list(fragments) == ["*"]
+        upsert_snapshot_fragments(session, *key, header, fragments, prune=True)
+        session.commit()
+        assert get_snapshot(session, *key)["data"] == [{"total_vms": 1}, {"total_vms": 2}]
+        assert [row.host for row in session.exec(select(SnapshotFragmentRecord))] == ["*"]
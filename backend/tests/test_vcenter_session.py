@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+from pyVmomi import vim
+
+from app.vms.vcenter_session import VCenterSessionManager
+
+
+def _config():
+    return {"host": "https://vc.local", "user": "svc", "password": "secret", "soap_host": "vc.local"}
+
+
+class _FakeHttp:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.logins = 0
+        self.seen_tokens = []
+
+    def post(self, url, **kwargs):
+        self.logins += 1
+        token = f"token-{self.logins}"
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {"value": token})
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.seen_tokens.append(headers["vmware-api-session-id"])
+        return SimpleNamespace(status_code=self.statuses.pop(0))
+
+
+def _manager(http):
+    manager = VCenterSessionManager(_config, keepalive_seconds=0)
+    manager._http_session = lambda: http
+    return manager
+
+
+def test_rest_token_is_reused_across_requests():
+    http = _FakeHttp([200, 200, 200])
+    manager = _manager(http)
+
+    for _ in range(3):
+        assert manager.get("https://vc.local/rest/vcenter/vm").status_code == 200
+
+    stats = manager.stats()
+    assert http.logins == 1
+    assert stats["rest_logins"] == 1
+    assert stats["rest_reuses"] == 2
+    assert http.seen_tokens == ["token-1"] * 3
+
+
+def test_rest_reauthenticates_once_on_401():
+    http = _FakeHttp([401, 200])
+    manager = _manager(http)
+
+    response = manager.get("https://vc.local/rest/vcenter/vm", headers={"vmware-api-session-id": "old"})
+
+    assert response.status_code == 200
+    assert http.seen_tokens == ["token-1", "token-2"]
+    assert manager.stats()["rest_reauths"] == 1
+
+
+def test_run_soap_retries_on_not_authenticated():
+    manager = VCenterSessionManager(_config, keepalive_seconds=0)
+    logins = []
+
+    def fake_login():
+        logins.append(1)
+        return object(), f"content-{len(logins)}"
+
+    manager._soap_login = fake_login
+    calls = []
+
+    def work(content):
+        calls.append(content)
+        if len(calls) == 1:
+            raise vim.fault.NotAuthenticated()
+        return content
+
+    assert manager.run_soap(work) == "content-2"
+    assert calls == ["content-1", "content-2"]
+    assert manager.stats()["soap_reauths"] == 1
+
+
+def test_concurrent_not_authenticated_logs_in_once_and_disconnects_old_session(monkeypatch):
+    from app.vms import vcenter_session
+
+    disconnected = []
+    monkeypatch.setattr(vcenter_session, "Disconnect", disconnected.append)
+    manager = VCenterSessionManager(_config, keepalive_seconds=0)
+    logins = []
+
+    def fake_login():
+        logins.append(1)
+        return f"si-{len(logins)}", f"content-{len(logins)}"
+
+    manager._soap_login = fake_login
+
+    def work(content):
+        if content == "content-1":
+            raise vim.fault.NotAuthenticated()
+        return content
+
+    _, stale = manager.get_service_instance()
+    assert manager.run_soap(work) == "content-2"
+    # Otra llamada que empezó con la sesión vieja reutiliza la nueva sin otro login.
+    manager.get_service_instance = lambda: ("si-1", stale)
+    assert manager.run_soap(work) == "content-2"
+    assert len(logins) == 2
+    assert disconnected == ["si-1"]
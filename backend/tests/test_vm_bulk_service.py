@@ -0,0 +1,144 @@
+from types import SimpleNamespace
+
+from pyVmomi import vim
+
+from app.vms.vm_bulk_service import (
+    _normalize_guest_id,
+    build_vms_from_properties,
+    group_object_contents,
+)
+from app.vms.vm_service import VMAttributeLayers
+
+
+def _content(obj, **props):
+    prop_set = [SimpleNamespace(name=name.replace("__", "."), val=val) for name, val in props.items()]
+    return SimpleNamespace(obj=obj, propSet=prop_set)
+
+
+def _disk(capacity_bytes: int) -> vim.vm.device.VirtualDisk:
+    return vim.vm.device.VirtualDisk(key=2000, capacityInBytes=capacity_bytes)
+
+
+def _nic(label: str, backing) -> vim.vm.device.VirtualVmxnet3:
+    return vim.vm.device.VirtualVmxnet3(
+        key=4000,
+        deviceInfo=vim.Description(label=label, summary=""),
+        backing=backing,
+    )
+
+
+def _sample_contents():
+    standard = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(deviceName="VM Network")
+    dvs = vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo(
+        port=vim.dvs.PortConnection(portgroupKey="dvportgroup-7", switchUuid="uuid")
+    )
+    quick_stats = SimpleNamespace(guestMemoryUsage=1024, overallCpuUsage=500)
+    return [
+        _content(
+            vim.VirtualMachine("vm-1"),
+            name="P-APP-01",
+            config__guestId="windows9Server64Guest",
+            config__version="vmx-19",
+            config__firmware="efi",
+            config__hardware__numCPU=4,
+            config__hardware__memoryMB=4096,
+            config__hardware__device=[
+                _disk(40 * 1024 ** 3),
+                _nic("Network adapter 1", standard),
+                _nic("Network adapter 2", dvs),
+            ],
+            runtime__powerState="poweredOn",
+            runtime__host=vim.HostSystem("host-1"),
+            runtime__maxCpuUsage=2000,
+            guest__ipAddress="10.0.0.5",
+            summary__quickStats=quick_stats,
+        ),
+        _content(vim.VirtualMachine("vm-2"), name="T-TEMPLATE", config__template=True),
+        _content(vim.HostSystem("host-1"), name="esx01.local", parent=vim.ClusterComputeResource("domain-c8")),
+        _content(vim.ClusterComputeResource("domain-c8"), name="CL-PROD"),
+        _content(vim.DistributedVirtualPortgroup("dvportgroup-7"), name="DPG-BACKEND"),
+    ]
+
+
+def test_normalize_guest_id_matches_rest_enum():
+    assert _normalize_guest_id("windows9Server64Guest") == "WINDOWS_9_SERVER_64"
+    assert _normalize_guest_id("rhel7_64Guest") == "RHEL_7_64"
+    assert _normalize_guest_id("otherLinux64Guest") == "OTHER_LINUX_64"
+    assert _normalize_guest_id("windows2019srv_64Guest") == "WINDOWS_2019SRV_64"
+    assert _normalize_guest_id(None) is None
+
+
+def test_build_vms_from_properties_maps_all_fields():
+    vms, placements = build_vms_from_properties(*group_object_contents(_sample_contents()))
+
+    assert [vm.id for vm in vms] == ["vm-1"]
+    vm = vms[0]
+    assert vm.name == "P-APP-01"
+    assert vm.environment == "producción"
+    assert vm.power_state == "POWERED_ON"
+    assert vm.cpu_count == 4
+    assert vm.memory_size_MiB == 4096
+    assert vm.guest_os == "WINDOWS_9_SERVER_64"
+    assert vm.compatibility_code == "VMX_19"
+    assert vm.boot_type == "UEFI"
+    assert vm.compat_generation == "2"
+    assert vm.host == "esx01.local"
+    assert vm.cluster == "CL-PROD"
+    assert vm.disks == ["40 GiB"]
+    assert vm.nics == ["Network adapter 1", "Network adapter 2"]
+    assert vm.networks == ["VM Network", "DPG-BACKEND"]
+    assert vm.ip_addresses == ["10.0.0.5"]
+    assert vm.cpu_usage_pct == 25.0
+    assert vm.ram_demand_mib == 1024
+    assert vm.ram_usage_pct == 25.0
+    assert placements["vm-1"].cluster == "CL-PROD"
+
+
+def test_build_vms_from_properties_handles_missing_data():
+    contents = [_content(vim.VirtualMachine("vm-9"), name=None)]
+    vms, _ = build_vms_from_properties(*group_object_contents(contents))
+
+    vm = vms[0]
+    assert vm.name == "<sin nombre vm-9>"
+    assert vm.power_state == "unknown"
+    assert vm.host == "<sin datos host>"
+    assert vm.cluster == "<sin datos cluster>"
+    assert vm.compatibility_code == "<sin datos>"
+    assert vm.networks == ["<sin datos>"]
+    assert vm.ip_addresses == []
+    assert vm.cpu_usage_pct is None
+
+
+def test_attribute_layers_refresh_static_only_on_change_version():
+    layers = VMAttributeLayers(static_ttl_seconds=3600)
+    layers.update_static({"vm-1": {"config.changeVersion": "a", "config.hardware.numCPU": 2}})
+    layers.replace_volatile({"vm-1": {"config.changeVersion": "a", "runtime.powerState": "poweredOn"}})
+
+    assert layers.stale_static_ids({"vm-1": {"config.changeVersion": "a"}, "vm-2": {}}) == ["vm-2"]
+    assert layers.stale_static_ids({"vm-1": {"config.changeVersion": "b"}}) == ["vm-1"]
+    assert layers.merged() == {
+        "vm-1": {"config.changeVersion": "a", "config.hardware.numCPU": 2, "runtime.powerState": "poweredOn"}
+    }
+
+    layers.replace_volatile({})
+    assert layers.stats()["static_entries"] == 0
+
+
+def test_attribute_layers_keep_vms_without_static_entry():
+    layers = VMAttributeLayers(static_ttl_seconds=3600)
+    layers.update_static({"vm-1": {"config.changeVersion": "a", "config.hardware.numCPU": 2}})
+    # vm-2: la relectura estática falló o vino vacía
+    layers.replace_volatile(
+        {
+            "vm-1": {"config.changeVersion": "a", "name": "app-01"},
+            "vm-2": {"config.changeVersion": "x", "name": "app-02", "runtime.powerState": "poweredOn"},
+        }
+    )
+
+    merged = layers.merged()
+    assert merged["vm-2"] == {"config.changeVersion": "x", "name": "app-02", "runtime.powerState": "poweredOn"}
+    assert merged["vm-1"]["config.hardware.numCPU"] == 2
+    assert layers.stale_static_ids({"vm-2": {"config.changeVersion": "x"}}) == ["vm-2"]
+
+    vms, _ = build_vms_from_properties(merged, {}, {}, {})
+    assert sorted(vm.name for vm in vms) == ["app-01", "app-02"]
@@ -0,0 +1,172 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from pyVmomi import vmodl
+
+from app.vms import vm_perf_service
+
+_COUNTERS = {key: idx for idx, key in enumerate(vm_perf_service.METRICS)}
+# Contadores que vCenter solo expone por dispositivo a nivel VM.
+_PER_DEVICE = {_COUNTERS["iops_read"], _COUNTERS["lat_read_ms"], _COUNTERS["lat_write_ms"]}
+_DISKS = ("scsi0:0", "scsi0:1")
+
+
+class _PerfManager:
+    """``realtime``/``rollup``: {vm_id: {(counterId, instance): valor}}; sin entrada -> 100."""
+
+    def __init__(self):
+        self.queries = []
+        self.realtime = {}
+        self.rollup = {}
+        self.perfCounter = [
+            SimpleNamespace(key=idx, groupInfo=SimpleNamespace(key=c.group), nameInfo=SimpleNamespace(key=c.name), rollupType=c.rollup)
+            for idx, c in enumerate(vm_perf_service.METRICS.values())
+        ]
+
+    def QueryAvailablePerfMetric(self, entity, intervalId):
+        metrics = []
+        for counter_id in _COUNTERS.values():
+            instances = _DISKS if counter_id in _PER_DEVICE else ("",)
+            metrics.extend(SimpleNamespace(counterId=counter_id, instance=inst) for inst in instances)
+        return metrics
+
+    def QueryPerf(self, querySpec):
+        interval = querySpec[0].intervalId
+        self.queries.append((interval, [spec.entity._moId for spec in querySpec]))
+        table = self.realtime if interval == vm_perf_service._REALTIME_INTERVAL else self.rollup
+        results = []
+        for spec in querySpec:
+            values = table.get(spec.entity._moId)
+            if values is None and table is self.rollup:
+                continue
+            series = []
+            for metric_id in spec.metricId:
+                value = 100 if values is None else values.get((metric_id.counterId, metric_id.instance))
+                if value is not None:
+                    series.append(SimpleNamespace(id=metric_id, value=[value]))
+            results.append(
+                SimpleNamespace(
+                    entity=spec.entity,
+                    sampleInfo=[SimpleNamespace(interval=interval, sampleTime=datetime.now(timezone.utc))],
+                    value=series,
+                )
+            )
+        return results
+
+
+class _Collector:
+    _stub = None
+
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.retrieves = []
+
+    def RetrievePropertiesEx(self, specSet, options):
+        ids = [spec.obj._moId for spec in specSet[0].objectSet]
+        self.retrieves.append(ids)
+        objects = []
+        for vm_id, spec in zip(ids, specSet[0].objectSet):
+            if vm_id in self.missing:
+                fault = vmodl.fault.ManagedObjectNotFound()
+                objects.append(SimpleNamespace(obj=spec.obj, propSet=[], missingSet=[SimpleNamespace(fault=fault)]))
+            else:
+                prop = SimpleNamespace(name="config.changeVersion", val="1")
+                objects.append(SimpleNamespace(obj=spec.obj, propSet=[prop], missingSet=[]))
+        return SimpleNamespace(objects=objects, token=None)
+
+
+@pytest.fixture
+def vcenter(monkeypatch):
+    perf_manager = _PerfManager()
+    collector = _Collector()
+    content = SimpleNamespace(perfManager=perf_manager, propertyCollector=collector)
+    monkeypatch.setattr(vm_perf_service.vm_service, "_run_soap", lambda func: func(content))
+    for cache in (vm_perf_service._COUNTER_CACHE, vm_perf_service._AVAILABLE_CACHE, vm_perf_service._RESULT_CACHE):
+        cache.clear()
+    return SimpleNamespace(perf=perf_manager, collector=collector)
+
+
+def _realtime_calls(perf_manager):
+    return [entities for interval, entities in perf_manager.queries if interval == vm_perf_service._REALTIME_INTERVAL]
+
+
+def test_batch_splits_entities_across_chunks_and_reports_missing_vms(vcenter, monkeypatch):
+    monkeypatch.setattr(vm_perf_service, "_BATCH_CHUNK_SIZE", 2)
+    vcenter.collector.missing = {"vm-4"}
+
+    batch = vm_perf_service.get_vm_perf_batch(["vm-1", "vm-2", "vm-3", "vm-4", "vm-5", "vm-1"])
+
+    assert vcenter.collector.retrieves == [["vm-1", "vm-2"], ["vm-3", "vm-4"], ["vm-5"]]
+    assert _realtime_calls(vcenter.perf) == [["vm-1", "vm-2"], ["vm-3"], ["vm-5"]]
+    assert sorted(batch["results"]) == ["vm-1", "vm-2", "vm-3", "vm-5"]
+    assert batch["errors"] == {"vm-4": "VM no encontrada en vCenter"}
+    assert batch["cached"] == 0
+
+
+def test_batch_queries_per_device_instances_like_single_vm_path(vcenter):
+    values = {(counter_id, ""): 100 for counter_id in _COUNTERS.values() if counter_id not in _PER_DEVICE}
+    values.update({(_COUNTERS["lat_read_ms"], "scsi0:0"): 4, (_COUNTERS["lat_read_ms"], "scsi0:1"): 6})
+    values.update({(_COUNTERS["iops_read"], "scsi0:0"): 10, (_COUNTERS["iops_read"], "scsi0:1"): 5})
+    vcenter.perf.realtime["vm-1"] = values
+
+    batch = vm_perf_service.get_vm_perf_batch(["vm-1"], idle_to_zero=True)["results"]["vm-1"]
+    single = vm_perf_service._collect_vm_perf_summary("vm-1", window_seconds=60, idle_to_zero=True, by_disk=False)
+
+    assert batch["lat_read_ms"] == 5.0
+    assert batch["iops_read"] == 15.0
+    assert batch["_sources"]["lat_read_ms"] == "realtime"
+    # lat_write_ms no trajo datos en ninguna instancia: idle_zero igual que en el detalle
+    assert batch["_sources"]["lat_write_ms"] == "idle_zero"
+    drop = lambda summary: {k: v for k, v in summary.items() if k != "_collected_at"}
+    assert drop(batch) == drop(single)
+    cached = vm_perf_service._RESULT_CACHE.get(vm_perf_service._result_cache_key("vm-1", 60, True, False))
+    assert cached is not None and cached["lat_read_ms"] == 5.0
+
+
+def test_rollup_fallback_only_queries_vms_with_pending_keys(vcenter):
+    cpu = _COUNTERS["cpu_usage_pct"]
+    mem = _COUNTERS["mem_usage_pct"]
+    vcenter.perf.realtime["vm-1"] = {(cpu, ""): 2500}
+    vcenter.perf.rollup["vm-1"] = {(cpu, ""): 9900, (mem, ""): 4000}
+
+    results = vm_perf_service.get_vm_perf_batch(["vm-1", "vm-2"])["results"]
+
+    rollups = [entities for interval, entities in vcenter.perf.queries if interval == vm_perf_service._ROLLUP_INTERVAL]
+    assert rollups == [["vm-1"]]
+    assert results["vm-1"]["cpu_usage_pct"] == 25.0  # el rollup no pisa lo que ya trajo realtime
+    assert results["vm-1"]["_sources"]["cpu_usage_pct"] == "realtime"
+    assert results["vm-1"]["mem_usage_pct"] == 40.0
+    assert results["vm-1"]["_sources"]["mem_usage_pct"] == "rollup"
+    assert results["vm-2"]["_sources"]["mem_usage_pct"] == "realtime"
+
+
+def test_metric_subset_is_not_cached_for_single_vm_endpoint(vcenter):
+    batch = vm_perf_service.get_vm_perf_batch(["vm-1"], metrics=["mem_usage_pct", "cpu_usage_pct"])
+
+    assert batch["metrics"] == ["cpu_usage_pct", "mem_usage_pct"]
+    summary = batch["results"]["vm-1"]
+    assert set(summary) == {
+        "cpu_usage_pct",
+        "mem_usage_pct",
+        "_interval_seconds",
+        "_collected_at",
+        "_metrics_available",
+        "disk_capacity_kb_total",
+        "missing_metrics",
+        "_sources",
+    }
+    assert set(summary["_sources"]) == {"cpu_usage_pct", "mem_usage_pct"}
+    assert vm_perf_service._RESULT_CACHE.stats()["size"] == 0
+
+    with pytest.raises(ValueError):
+        vm_perf_service.get_vm_perf_batch(["vm-1"], metrics=["nope"])
+
+
+def test_batch_rejects_more_than_max_vms(vcenter):
+    ids = [f"vm-{idx}" for idx in range(vm_perf_service.BATCH_MAX_VMS + 1)]
+    with pytest.raises(ValueError):
+        vm_perf_service.get_vm_perf_batch(ids)
+    assert vcenter.perf.queries == []
+    # duplicados no cuentan para el limite
+    vm_perf_service.get_vm_perf_batch(ids[:-1] + ids[:1])
@@ -0,0 +1,104 @@
+import math
+import threading
+import time
+
+from app.vms.vm_perf_history import PerfHistoryStore, PerfRingBuffer, PerfSampler, SharedPerfHistory, series_stats
+
+
+def test_ring_buffer_wraps_and_keeps_chronological_order():
+    buffer = PerfRingBuffer(3, ["cpu"])
+    for ts in range(1, 6):
+        buffer.append(float(ts), {"cpu": ts * 10})
+
+    timestamps, columns = buffer.window()
+    assert list(timestamps) == [3.0, 4.0, 5.0]
+    assert list(columns["cpu"]) == [30.0, 40.0, 50.0]
+
+    timestamps, columns = buffer.window(since=4.0)
+    assert list(timestamps) == [4.0, 5.0]
+    assert len(buffer) == 3
+
+
+def test_series_stats_ignore_gaps():
+    stats = series_stats([1.0, float("nan"), 3.0, 2.0])
+    assert stats == {"min": 1.0, "avg": 2.0, "max": 3.0, "p95": 3.0}
+    assert series_stats([math.nan])["avg"] is None
+
+
+def test_sampler_records_and_prunes():
+    store = PerfHistoryStore(capacity=10, keys=["cpu_usage_pct"])
+    powered_on = ["vm-1", "vm-2"]
+    sampler = PerfSampler(
+        store,
+        interval_seconds=20,
+        list_vm_ids=lambda: list(powered_on),
+        collect=lambda ids: {"results": {vm_id: {"cpu_usage_pct": 12.5} for vm_id in ids}},
+    )
+
+    assert sampler.sample_once() == 2
+    assert store.latest("vm-1", max_age=60) == {"cpu_usage_pct": 12.5}
+
+    powered_on.remove("vm-2")
+    sampler.sample_once()
+    assert store.series("vm-2", minutes=5) is None
+    history = store.series("vm-1", minutes=5)
+    assert history["series"]["cpu_usage_pct"] == [12.5, 12.5]
+    assert history["stats"]["cpu_usage_pct"]["p95"] == 12.5
+
+
+def test_sampler_restart_does_not_revive_stopped_run():
+    store = PerfHistoryStore(capacity=10, keys=["cpu_usage_pct"])
+    entered = threading.Semaphore(0)
+    release = threading.Event()
+    collectors = []
+
+    def collect(ids):
+        collectors.append(threading.current_thread())
+        entered.release()
+        release.wait(5)
+        return {"results": {vm_id: {"cpu_usage_pct": 1.0} for vm_id in ids}}
+
+    sampler = PerfSampler(store, interval_seconds=60, list_vm_ids=lambda: ["vm-1"], collect=collect)
+    sampler.start()
+    first = sampler._thread
+    assert entered.acquire(timeout=5)
+    sampler.stop()
+    sampler.start()
+    assert entered.acquire(timeout=5)
+
+    release.set()
+    first.join(5)
+    assert not first.is_alive()
+    assert sampler.running
+    assert collectors == [first, sampler._thread]
+    deadline = time.monotonic() + 5
+    while sampler.samples == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # la pasada detenida no graba: solo la del hilo nuevo
+    assert len(store.series("vm-1", minutes=5)["timestamps"]) == 1
+    sampler.stop()
+    sampler._thread.join(5)
+
+
+def test_shared_history_matches_leader_store(tmp_path):
+    keys = ["cpu_usage_pct", "mem_usage_pct"]
+    store = PerfHistoryStore(capacity=4, keys=keys)
+    now = time.time()
+    for idx in range(6):
+        store.record("vm-1", {"cpu_usage_pct": float(idx), "mem_usage_pct": None}, timestamp=now - 50 + idx * 10)
+    store.record("vm-2", {"cpu_usage_pct": 7.0, "mem_usage_pct": 40.0, "_sources": {"cpu_usage_pct": "realtime"}})
+
+    leader = SharedPerfHistory(str(tmp_path), keys=keys)
+    leader.publish(store)
+    follower = SharedPerfHistory(str(tmp_path), keys=keys)
+
+    assert follower.series("vm-1", minutes=5) == store.series("vm-1", minutes=5)
+    assert follower.series("vm-1", minutes=5, keys=["cpu_usage_pct"])["series"] == {"cpu_usage_pct": [2.0, 3.0, 4.0, 5.0]}
+    assert follower.latest("vm-2", max_age=60)["_sources"] == {"cpu_usage_pct": "realtime"}
+    assert follower.series("vm-3", minutes=5) is None
+
+    # Una nueva publicacion se ve sin reiniciar el seguidor.
+    store.prune(["vm-2"])
+    leader.publish(store)
+    assert follower.series("vm-1", minutes=5) is None
+    assert follower.latest("vm-2", max_age=60)["mem_usage_pct"] == 40.0
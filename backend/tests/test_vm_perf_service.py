@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app.vms import vm_perf_service
+
+
+class _PerfManager:
+    def __init__(self):
+        self.catalog_reads = 0
+        self.available_calls = 0
+        self._counters = [
+            SimpleNamespace(key=idx, groupInfo=SimpleNamespace(key=c.group), nameInfo=SimpleNamespace(key=c.name), rollupType=c.rollup)
+            for idx, c in enumerate(vm_perf_service.METRICS.values())
+        ]
+
+    @property
+    def perfCounter(self):
+        self.catalog_reads += 1
+        return self._counters
+
+    def QueryAvailablePerfMetric(self, entity, intervalId):
+        self.available_calls += 1
+        return [SimpleNamespace(counterId=0, instance=""), SimpleNamespace(counterId=5, instance="scsi0:0")]
+
+    def QueryPerf(self, querySpec):
+        if querySpec[0].intervalId != vm_perf_service._REALTIME_INTERVAL:
+            return []
+        return [
+            SimpleNamespace(
+                entity=spec.entity,
+                sampleInfo=[SimpleNamespace(interval=20, timestamp=datetime.now(timezone.utc))],
+                value=[SimpleNamespace(id=SimpleNamespace(counterId=0, instance=""), value=[2500])],
+            )
+            for spec in querySpec
+        ]
+
+
+class _Collector:
+    _stub = None
+
+    def __init__(self, change_version="1"):
+        self.change_version = change_version
+
+    def RetrievePropertiesEx(self, specSet, options):
+        objects = [
+            SimpleNamespace(
+                obj=spec.obj,
+                propSet=[SimpleNamespace(name="config.changeVersion", val=self.change_version)],
+                missingSet=[],
+            )
+            for spec in specSet[0].objectSet
+        ]
+        return SimpleNamespace(objects=objects, token=None)
+
+
+def test_plan_metric_query_prefers_aggregate_instance():
+    catalog = {("cpu", "usage", "average"): 1, ("disk", "read", "average"): 2}
+    metric_ids, counter_to_key, missing = vm_perf_service.plan_metric_query(
+        catalog,
+        ["cpu_usage_pct", "disk_read_kbps", "mem_usage_pct"],
+        {1: ("", "0"), 2: ("naa.1", "naa.2")},
+    )
+    assert [(m.counterId, m.instance) for m in metric_ids] == [(1, ""), (2, "naa.1"), (2, "naa.2")]
+    assert counter_to_key[(2, "naa.2")] == "disk_read_kbps"
+    assert missing == ["mem_usage_pct"]
+
+
+def test_catalog_and_available_metrics_are_cached(monkeypatch):
+    perf_manager = _PerfManager()
+    collector = _Collector()
+    content = SimpleNamespace(perfManager=perf_manager, propertyCollector=collector)
+    monkeypatch.setattr(vm_perf_service.vm_service, "_run_soap", lambda func: func(content))
+    vm_perf_service._COUNTER_CACHE.clear()
+    vm_perf_service._AVAILABLE_CACHE.clear()
+
+    def collect():
+        return vm_perf_service._collect_vm_perf_summary("vm-1", window_seconds=60, idle_to_zero=False, by_disk=False)
+
+    summary = collect()
+    assert summary["cpu_usage_pct"] == 25.0
+    collect()
+    assert perf_manager.catalog_reads == 1
+    assert perf_manager.available_calls == 1
+
+    collector.change_version = "2"
+    collect()
+    assert perf_manager.available_calls == 2
+
+
+def test_summary_uses_sampler_only_for_its_window(monkeypatch):
+    sampled = {"cpu_usage_pct": 1.0, "_sources": {"cpu_usage_pct": "realtime"}}
+    monkeypatch.setattr(vm_perf_service.perf_history, "latest", lambda vm_id, max_age: sampled)
+    collected = []
+
+    def collect(vm_id, *, window_seconds, idle_to_zero, by_disk):
+        collected.append(window_seconds)
+        return {"cpu_usage_pct": 2.0}
+
+    monkeypatch.setattr(vm_perf_service, "_collect_vm_perf_summary", collect)
+    vm_perf_service._RESULT_CACHE.clear()
+    window = vm_perf_service.sampler_window_seconds()
+
+    assert vm_perf_service.get_vm_perf_summary("vm-1", window_seconds=window) is sampled
+    assert vm_perf_service.get_vm_perf_summary("vm-1", window_seconds=1800) == {"cpu_usage_pct": 2.0}
+    assert collected == [1800]
@@ -0,0 +1,208 @@
+import threading
+from types import SimpleNamespace
+
+from pyVmomi import vim
+
+from app.vms import vmware_change_feed, vmware_router
+from app.vms.vmware_change_feed import VMwareChangeFeed, apply_update_set, new_property_state
+from app.vms.vmware_jobs.models import ScopeKey, ScopeName, SnapshotHostState, SnapshotHostStatus
+from app.vms.vmware_jobs.stores import HostHealthStore, SnapshotStore
+
+
+def _update(obj, kind="modify", **changes):
+    change_set = [
+        SimpleNamespace(name=name.replace("__", "."), op="assign", val=val) for name, val in changes.items()
+    ]
+    return SimpleNamespace(obj=obj, kind=kind, changeSet=change_set)
+
+
+def _filter_sets(*updates):
+    return [SimpleNamespace(objectSet=list(updates))]
+
+
+def test_apply_update_set_tracks_changed_and_removed_vms():
+    state = new_property_state()
+    changed, removed, names_changed = apply_update_set(
+        state,
+        _filter_sets(
+            _update(vim.VirtualMachine("vm-1"), kind="enter", name="P-APP-01", runtime__powerState="poweredOn"),
+            _update(vim.VirtualMachine("vm-2"), kind="enter", name="P-APP-02"),
+            _update(vim.HostSystem("host-1"), kind="enter", name="esx01"),
+        ),
+    )
+    assert changed == {"vm-1", "vm-2"}
+    assert removed == set()
+    assert names_changed is True
+
+    changed, removed, names_changed = apply_update_set(
+        state,
+        _filter_sets(
+            _update(vim.VirtualMachine("vm-1"), runtime__powerState="poweredOff"),
+            SimpleNamespace(obj=vim.VirtualMachine("vm-2"), kind="leave", changeSet=[]),
+        ),
+    )
+    assert changed == {"vm-1"}
+    assert removed == {"vm-2"}
+    assert names_changed is False
+    assert state["vm"]["vm-1"] == {"name": "P-APP-01", "runtime.powerState": "poweredOff"}
+    assert "vm-2" not in state["vm"]
+
+
+def test_store_apply_vm_changes_patches_and_bumps_version():
+    store = SnapshotStore()
+    store._persist_snapshot = lambda *args, **kwargs: None
+    scope_key = ScopeKey.from_parts(ScopeName.VMS, ["vmware"], "summary")
+    base = store.upsert_host(
+        scope_key,
+        "vmware",
+        data=[{"id": "vm-1", "power_state": "POWERED_ON"}, {"id": "vm-2", "power_state": "POWERED_ON"}],
+        status=SnapshotHostStatus(state=SnapshotHostState.OK),
+    )
+
+    version = store.apply_vm_changes(
+        scope_key,
+        "vmware",
+        upserts=[{"id": "vm-1", "power_state": "POWERED_OFF"}, {"id": "vm-3", "power_state": "POWERED_ON"}],
+        removed={"vm-2"},
+    )
+
+    assert version == base.version + 1
+    snap = store.get_snapshot(scope_key)
+    assert snap.version == version
+    assert snap.data["vmware"] == [
+        {"id": "vm-1", "power_state": "POWERED_OFF"},
+        {"id": "vm-3", "power_state": "POWERED_ON"},
+    ]
+
+
+def test_store_apply_vm_changes_requires_snapshot():
+    store = SnapshotStore()
+    scope_key = ScopeKey.from_parts(ScopeName.VMS, ["vmware"], "summary")
+    assert store.apply_vm_changes(scope_key, "vmware", upserts=[]) is None
+
+
+def test_store_set_shards_keeps_known_shards_and_drops_missing():
+    store = SnapshotStore()
+    store._persist_snapshot = lambda *args, **kwargs: None
+    scope_key = ScopeKey.from_parts(ScopeName.VMS, ["vmware"], "summary")
+    store.set_shards(scope_key, ["cl-a", "cl-b"])
+    store.upsert_host(
+        scope_key,
+        "cl-a",
+        data=[{"id": "vm-1"}],
+        status=SnapshotHostStatus(state=SnapshotHostState.OK),
+    )
+    store.upsert_host(
+        scope_key,
+        "cl-b",
+        data=[{"id": "vm-2"}],
+        status=SnapshotHostStatus(state=SnapshotHostState.OK),
+    )
+
+    store.set_shards(scope_key, ["cl-a", "cl-c"])
+
+    snap = store.get_snapshot(scope_key)
+    assert snap.hosts == ["cl-a", "cl-c"]
+    assert snap.total_hosts == 2
+    assert snap.data == {"cl-a": [{"id": "vm-1"}]}
+    assert snap.hosts_status["cl-c"].state == SnapshotHostState.PENDING
+
+
+def test_store_get_delta_returns_only_changes_since_version():
+    store = SnapshotStore()
+    store._persist_snapshot = lambda *args, **kwargs: None
+    scope_key = ScopeKey.from_parts(ScopeName.VMS, ["vmware"], "summary")
+    store.set_shards(scope_key, ["cl-a", "cl-b"])
+    ok = SnapshotHostStatus(state=SnapshotHostState.OK)
+    store.upsert_host(scope_key, "cl-a", data=[{"id": "vm-1"}, {"id": "vm-2"}], status=ok)
+    base = store.upsert_host(scope_key, "cl-b", data=[{"id": "vm-9"}], status=ok)
+
+    store.apply_vm_changes(scope_key, "cl-a", upserts=[{"id": "vm-1", "name": "x"}], removed={"vm-2"})
+    store.set_shards(scope_key, ["cl-a"])
+
+    delta = store.get_delta(scope_key, base.version)
+    assert delta["mode"] == "delta"
+    assert delta["version"] == base.version + 2
+    assert delta["changed"] == {}
+    assert delta["removed"] == ["cl-b"]
+    assert delta["vm_changes"] == {"cl-a": {"upserted": [{"id": "vm-1", "name": "x"}], "removed": ["vm-2"]}}
+    assert store.get_delta(scope_key, delta["version"])["vm_changes"] == {}
+    # Versiones desconocidas -> el endpoint cae al snapshot completo.
+    assert store.get_delta(scope_key, delta["version"] + 5) is None
+
+
+def test_feed_vms_without_known_cluster_get_fallback_shard(monkeypatch):
+    store = SnapshotStore()
+    store._persist_snapshot = lambda *args, **kwargs: None
+    health = HostHealthStore()
+    monkeypatch.setattr(vmware_router, "_SNAPSHOT_STORE", store)
+    monkeypatch.setattr(vmware_router, "_HEALTH_STORE", health)
+    scope_key = vmware_router._scope_key()
+    store.set_shards(scope_key, ["cl-a", "cl-b"])
+
+    vmware_router._publish_feed_changes(
+        [{"id": "vm-1", "cluster": "CL-A"}, {"id": "vm-2", "cluster": "cl-nuevo"}],
+        set(),
+        True,
+    )
+
+    snap = store.get_snapshot(scope_key)
+    assert snap.hosts == ["cl-a", "cl-b", "vmware"]
+    assert snap.data == {"cl-a": [{"id": "vm-1", "cluster": "CL-A"}], "cl-b": [], "vmware": [{"id": "vm-2", "cluster": "cl-nuevo"}]}
+    assert snap.hosts_status["cl-a"].state == SnapshotHostState.OK
+    # sin VMs en el feed: no cuenta como recolectado
+    assert snap.hosts_status["cl-b"].state == SnapshotHostState.PENDING
+    assert health.get("cl-b").last_success_at is None
+    assert health.get("vmware").last_success_at is not None
+
+
+def test_feed_restart_does_not_revive_stopped_thread(monkeypatch):
+    monkeypatch.setattr(vmware_change_feed, "build_filter_spec", lambda view: None)
+    release = threading.Event()
+    waiting = threading.Semaphore(0)
+    seen = threading.local()
+
+    def wait_for_updates(version, options):
+        if getattr(seen, "done", False):
+            release.wait(0.05)
+            return None
+        seen.done = True
+        waiting.release()
+        release.wait(5)
+        return SimpleNamespace(version="1", filterSet=[])
+
+    collector = SimpleNamespace(
+        CreateFilter=lambda spec, partialUpdates: SimpleNamespace(DestroyPropertyFilter=lambda: None),
+        WaitForUpdatesEx=wait_for_updates,
+        DestroyPropertyCollector=lambda: None,
+    )
+    content = SimpleNamespace(
+        propertyCollector=SimpleNamespace(CreatePropertyCollector=lambda: collector),
+        viewManager=SimpleNamespace(CreateContainerView=lambda *args: SimpleNamespace(Destroy=lambda: None)),
+        rootFolder=None,
+    )
+    published = []
+    handled = threading.Event()
+
+    def publish(upserts, removed, replace_all):
+        published.append(threading.current_thread())
+        handled.set()
+        return 1
+
+    feed = VMwareChangeFeed(run_soap=lambda func: func(content), publish=publish, persist=lambda: None)
+
+    feed.start()
+    first = feed._thread
+    assert waiting.acquire(timeout=5)
+    feed.stop()
+    feed.start()
+    assert feed._thread is not first
+    assert waiting.acquire(timeout=5)
+
+    release.set()
+    first.join(5)
+    assert not first.is_alive()
+    assert handled.wait(5)
+    feed.stop()
+    feed._thread.join(5)
+    assert published == [feed._thread]
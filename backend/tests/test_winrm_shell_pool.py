@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+from app.providers.hyperv.winrm_pool import WinRMPoolTimeout, WinRMShellPool
+
+
+class FakeProtocols:
+    """Cuenta shells abiertos/cerrados; ``fail_next`` hace fallar el próximo comando."""
+
+    def __init__(self):
+        self.opened = 0
+        self.closed = []
+        self.commands = []
+        self.fail_next = False
+
+    def __call__(self, endpoint, **kwargs):
+        fake = self
+
+        class Protocol:
+            def __init__(self):
+                self.read_timeout_sec = kwargs["read_timeout_sec"]
+                self.operation_timeout_sec = kwargs["operation_timeout_sec"]
+
+            def open_shell(self, **_kwargs):
+                fake.opened += 1
+                return f"shell-{fake.opened}"
+
+            def run_command(self, shell_id, command, args=()):
+                if fake.fail_next:
+                    fake.fail_next = False
+                    raise ConnectionError("reset by peer")
+                fake.commands.append((shell_id, command))
+                return "cmd"
+
+            def get_command_output(self, shell_id, command_id):
+                return b"ok", b"", 0
+
+            def cleanup_command(self, shell_id, command_id):
+                pass
+
+            def close_shell(self, shell_id, close_session=True):
+                fake.closed.append(shell_id)
+
+        return Protocol()
+
+
+def _lease(pool, user="svc", wait_timeout=5.0):
+    return pool.session(
+        "http://hv01:5985/wsman", user, "pw", "ntlm", operation_timeout=20, read_timeout=50, wait_timeout=wait_timeout
+    )
+
+
+def _pool(protocols, **overrides):
+    options = {"max_per_host": 2, "idle_seconds": 300, "health_check_seconds": 60}
+    options.update(overrides)
+    return WinRMShellPool(protocol_factory=protocols, **options)
+
+
+def test_shells_are_reused_across_operations():
+    protocols = FakeProtocols()
+    pool = _pool(protocols)
+
+    for _ in range(3):
+        with _lease(pool) as session:
+            assert session.run_ps("Get-VM").std_out == b"ok"
+
+    stats = pool.stats()
+    assert protocols.opened == 1
+    assert stats["handshakes"] == 1
+    assert stats["reuses"] == 2
+    assert stats["commands"] == 3
+    assert stats["hosts"]["http://hv01:5985/wsman"] == {"open": 1, "idle": 1, "leased": 0}
+
+    with _lease(pool, user="otro"):
+        pass
+    assert protocols.opened == 2  # otras credenciales: otro shell
+
+
+def test_broken_shell_is_discarded_and_replaced():
+    protocols = FakeProtocols()
+    pool = _pool(protocols)
+    with _lease(pool) as session:
+        session.run_ps("Get-VM")
+
+    protocols.fail_next = True
+    with pytest.raises(ConnectionError):
+        with _lease(pool) as session:
+            session.run_ps("Get-VM")
+    assert protocols.closed == ["shell-1"]
+
+    with _lease(pool) as session:
+        session.run_ps("Get-VM")
+    assert protocols.opened == 2
+    assert pool.stats()["discarded"] == 1
+
+
+def test_idle_expiry_and_health_check():
+    protocols = FakeProtocols()
+    pool = _pool(protocols, health_check_seconds=0)
+    with _lease(pool):
+        pass
+
+    protocols.fail_next = True  # el chequeo de salud falla: se abre otro
+    with _lease(pool):
+        pass
+    assert pool.stats()["health_failures"] == 1
+    assert protocols.closed == ["shell-1"]
+
+    pool.idle_seconds = 0
+    assert pool.reap() == 1
+    assert pool.stats()["open_shells"] == 0
+
+
+def test_max_per_host_blocks_until_release():
+    protocols = FakeProtocols()
+    pool = _pool(protocols, max_per_host=1)
+    leased = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with _lease(pool):
+            leased.set()
+            release.wait(5)
+
+    worker = threading.Thread(target=hold)
+    worker.start()
+    leased.wait(5)
+    with pytest.raises(WinRMPoolTimeout):
+        with _lease(pool, wait_timeout=0.1):
+            pass
+
+    release.set()
+    with _lease(pool, wait_timeout=5):
+        pass
+    worker.join(5)
+    assert protocols.opened == 1
+    assert pool.stats()["wait_timeouts"] == 1
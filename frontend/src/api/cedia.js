@@ -1,4 +1,5 @@
 import api from "./axios";
+import { getSnapshotWithDelta } from "./snapshotDelta";
 
 export function cediaLogin() {
   return api.get("/cedia/login");
@@ -9,11 +10,7 @@ export function listCediaVms() {
 }
 
 export async function getCediaSnapshot() {
-  const response = await api.get("/cedia/snapshot");
-  if (response.status === 204) {
-    return { empty: true };
-  }
-  return response.data;
+  return getSnapshotWithDelta("/cedia/snapshot");
 }
 
 export function getCediaVm(vmId) {
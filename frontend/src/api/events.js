@@ -0,0 +1,101 @@
+// —————— Stream SSE de jobs y snapshots (/api/events) ——————
+// Se usa fetch en lugar de EventSource para poder enviar el header Authorization.
+import api from "./axios";
+
+const RETRY_MS = 5000;
+
+function parseBlock(block) {
+  let type = "message";
+  const data = [];
+  block.split("\n").forEach((line) => {
+    if (line.startsWith("event:")) type = line.slice(6).trim();
+    else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+  });
+  if (!data.length) return null;
+  try {
+    return { type, payload: JSON.parse(data.join("\n")) };
+  } catch {
+    return null;
+  }
+}
+
+// Abre el stream y llama onEvent(type, payload). Devuelve una función para cerrarlo.
+// onError se invoca si el stream no se puede abrir (p.ej. proxy sin soporte) para que
+// el llamador vuelva al polling.
+export function subscribeEvents(topics, onEvent, { onError } = {}) {
+  const controller = new AbortController();
+  let closed = false;
+
+  const connect = async () => {
+    const token = localStorage.getItem("token");
+    const base = api.defaults.baseURL.replace(/\/$/, "");
+    const response = await fetch(`${base}/events?topics=${encodeURIComponent(topics.join(","))}`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+      signal: controller.signal,
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`SSE no disponible (${response.status})`);
+    }
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = "";
+    while (!closed) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value.replace(/\r\n/g, "\n");
+      let idx = buffer.indexOf("\n\n");
+      while (idx >= 0) {
+        const event = parseBlock(buffer.slice(0, idx));
+        buffer = buffer.slice(idx + 2);
+        if (event) onEvent(event.type, event.payload);
+        idx = buffer.indexOf("\n\n");
+      }
+    }
+  };
+
+  const run = async () => {
+    let failures = 0;
+    while (!closed) {
+      try {
+        await connect();
+        failures = 0;
+      } catch (err) {
+        if (closed) return;
+        failures += 1;
+        if (failures >= 3) {
+          onError?.(err);
+          return;
+        }
+      }
+      if (!closed) await new Promise((resolve) => setTimeout(resolve, RETRY_MS));
+    }
+  };
+
+  run();
+  return () => {
+    closed = true;
+    controller.abort();
+  };
+}
+
+// Sigue un job: onUpdate(job) con el estado empujado, u onUpdate() cuando hay que
+// pedirlo (al conectar o tras un "resync"). Mientras el stream está activo se mantiene
+// un poll lento de respaldo; si el stream falla se vuelve al intervalo normal.
+export function watchJob(provider, jobId, onUpdate, pollMs = 2500) {
+  let pollId = setInterval(() => onUpdate(), pollMs * 6);
+  const startPolling = () => {
+    clearInterval(pollId);
+    pollId = setInterval(() => onUpdate(), pollMs);
+  };
+  const unsubscribe = subscribeEvents(
+    [`${provider}.jobs`],
+    (type, payload) => {
+      if (type === "ready" || type === "resync") onUpdate();
+      else if (type === "job" && payload?.data?.job_id === jobId) onUpdate(payload.data);
+    },
+    { onError: startPolling }
+  );
+  return () => {
+    unsubscribe();
+    clearInterval(pollId);
+  };
+}
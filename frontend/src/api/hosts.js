@@ -1,4 +1,5 @@
 import api from "./axios";
+import { getSnapshotWithDelta } from "./snapshotDelta";
 
 export async function getHosts(params = {}) {
   const { data } = await api.get("/hosts/", { params });
@@ -6,11 +7,7 @@ export async function getHosts(params = {}) {
 }
 
 export async function getVmwareHostsSnapshot() {
-  const response = await api.get("/vmware/hosts/snapshot");
-  if (response.status === 204) {
-    return { empty: true };
-  }
-  return response.data;
+  return getSnapshotWithDelta("/vmware/hosts/snapshot");
 }
 
 export async function postVmwareHostsRefresh(body = { force: false }) {
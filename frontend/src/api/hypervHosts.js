@@ -1,4 +1,5 @@
 import api from "./axios";
+import { getSnapshotWithDelta } from "./snapshotDelta";
 
 export async function getHypervHosts(params = {}) {
   const { data } = await api.get("/hyperv/hosts", { params });
@@ -12,8 +13,8 @@ export async function getHypervHostDetail(host, params = {}) {
 
 export async function getHypervSnapshot(scope, hosts, level = "summary") {
   const params = { scope, hosts: hosts.join(","), level };
-  const { data } = await api.get("/hyperv/snapshot", { params });
-  return data;
+  const data = await getSnapshotWithDelta("/hyperv/snapshot", params);
+  return data?.empty ? null : data;
 }
 
 export async function postHypervRefresh(body) {
@@ -0,0 +1,70 @@
+// —————— Snapshots incrementales (?since=<version>) ——————
+// Guarda el último snapshot por endpoint y, en los siguientes polls, pide solo los
+// cambios; el backend responde `mode: "delta"` o el payload completo si ya no
+// tiene esa versión en su log. Los llamadores siempre reciben el snapshot completo.
+import api from "./axios";
+
+const lastSnapshots = new Map();
+
+if (typeof window !== "undefined") {
+  window.addEventListener("auth:logout", () => lastSnapshots.clear());
+}
+
+const hostKey = (item) => String(item?.host || item?.name || "").trim().toLowerCase();
+
+export function applySnapshotDelta(base, delta) {
+  const { mode, since, changed = {}, removed = [], vm_changes: vmChanges = {}, ...header } = delta;
+  if (Array.isArray(base.data)) {
+    const data = [...base.data];
+    Object.entries(changed).forEach(([host, item]) => {
+      const idx = data.findIndex((existing) => hostKey(existing) === host.toLowerCase());
+      if (idx >= 0) data[idx] = item;
+      else data.push(item);
+    });
+    const removedKeys = new Set(removed.map((host) => host.toLowerCase()));
+    return { ...base, ...header, data: data.filter((item) => !removedKeys.has(hostKey(item))) };
+  }
+
+  const data = { ...(base.data || {}) };
+  removed.forEach((host) => {
+    delete data[host];
+  });
+  Object.assign(data, changed);
+  Object.entries(vmChanges).forEach(([host, { upserted = [], removed: removedIds = [] }]) => {
+    const gone = new Set(removedIds);
+    const updates = new Map(upserted.map((vm) => [vm.id, vm]));
+    const vms = (data[host] || [])
+      .filter((vm) => !gone.has(vm.id))
+      .map((vm) => {
+        const next = updates.get(vm.id) || vm;
+        updates.delete(vm.id);
+        return next;
+      });
+    data[host] = [...vms, ...updates.values()];
+  });
+  return { ...base, ...header, data };
+}
+
+export async function getSnapshotWithDelta(path, params = {}) {
+  const key = `${path}?${new URLSearchParams(params).toString()}`;
+  const previous = lastSnapshots.get(key);
+  const query = previous ? { ...params, since: previous.version } : params;
+  const response = await api.get(path, { params: query });
+  if (response.status === 204) {
+    lastSnapshots.delete(key);
+    return { empty: true };
+  }
+  let snapshot = response.data;
+  if (snapshot?.mode === "delta") {
+    snapshot = previous ? applySnapshotDelta(previous, snapshot) : null;
+  }
+  if (!snapshot) {
+    // Delta sin base local (p.ej. tras logout): pedir el snapshot completo.
+    lastSnapshots.delete(key);
+    return getSnapshotWithDelta(path, params);
+  }
+  if (typeof snapshot.version === "number") {
+    lastSnapshots.set(key, snapshot);
+  }
+  return snapshot;
+}
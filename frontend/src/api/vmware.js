@@ -1,11 +1,8 @@
 import api from "./axios";
+import { getSnapshotWithDelta } from "./snapshotDelta";
 
 export async function getVmwareSnapshot() {
-  const response = await api.get("/vmware/snapshot");
-  if (response.status === 204) {
-    return { empty: true };
-  }
-  return response.data;
+  return getSnapshotWithDelta("/vmware/snapshot");
 }
 
 export async function postVmwareRefresh(body = { force: false }) {
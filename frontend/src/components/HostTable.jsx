@@ -2,6 +2,7 @@ import { useCallback, useEffect, useMemo, useRef, useState } from 'react'
 import { IoServerSharp, IoPulse, IoSwapHorizontalSharp } from 'react-icons/io5'
 import { MdOutlinePower } from 'react-icons/md'
 import { getVmwareHostsJob, getVmwareHostsSnapshot, postVmwareHostsRefresh } from '../api/hosts'
+import { watchJob } from '../api/events'
 import { normalizeHostSummary } from '../lib/normalizeHost'
 import { useInventoryState } from './VMTable/useInventoryState'
 import HostDetailModal from './HostDetailModal'
@@ -201,10 +202,10 @@ export default function HostTable() {
 
   useEffect(() => {
     if (!refreshJobId || !refreshPolling) return undefined
-    const tick = async () => {
+    const tick = async (pushed) => {
       try {
-        const job = await getVmwareHostsJob(refreshJobId)
-        const terminal = ['succeeded', 'failed', 'expired'].includes(job.status)
+        const job = pushed || (await getVmwareHostsJob(refreshJobId))
+        const terminal = ['succeeded', 'failed', 'expired', 'cancelled'].includes(job.status)
         const isPartial = job.message === 'partial'
         if (terminal) {
           setRefreshPolling(false)
@@ -227,9 +228,9 @@ export default function HostTable() {
       }
     }
     tick()
-    const id = setInterval(tick, 2500)
-    pollRef.current = id
-    return () => clearInterval(id)
+    const stop = watchJob('vmware_hosts', refreshJobId, tick, 2500)
+    pollRef.current = stop
+    return stop
   }, [refreshJobId, refreshPolling, fetchVm])
 
   const kpiCards = [
@@ -4,6 +4,7 @@ import { getHypervHosts, getHypervSnapshot, postHypervRefresh, getHypervConfig }
 import { normalizeHypervHostSummary } from '../lib/normalizeHypervHost'
 import { useInventoryState } from './VMTable/useInventoryState'
 import api from '../api/axios'
+import { watchJob } from '../api/events'
 import { useAuth } from '../context/AuthContext'
 import InventoryMetaBar from './common/InventoryMetaBar'
 
@@ -315,10 +316,10 @@ const discoverHosts = useCallback(async () => {
 
   useEffect(() => {
     if (!jobId || !polling) return undefined
-    const tick = async () => {
+    const tick = async (pushed) => {
       try {
-        const { data } = await api.get(`/hyperv/jobs/${jobId}`)
-        const terminal = ['succeeded', 'failed', 'expired'].includes(data.status)
+        const data = pushed || (await api.get(`/hyperv/jobs/${jobId}`)).data
+        const terminal = ['succeeded', 'failed', 'expired', 'cancelled'].includes(data.status)
         const errors = []
         Object.entries(data.hosts_status || {}).forEach(([h, st]) => {
           if (st?.state && st.state !== 'ok') errors.push(`${h}: ${st.state}`)
@@ -344,9 +345,9 @@ const discoverHosts = useCallback(async () => {
       }
     }
     tick()
-    const id = setInterval(tick, 2500)
-    pollRef.current = id
-    return () => clearInterval(id)
+    const stop = watchJob('hyperv', jobId, tick, 2500)
+    pollRef.current = stop
+    return stop
   }, [jobId, polling, fetchVm])
 
   useEffect(() => {
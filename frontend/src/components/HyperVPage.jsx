@@ -1,6 +1,7 @@
 import React, { useCallback, useEffect, useMemo, useRef, useState } from 'react'
 
 import api from '../api/axios'
+import { watchJob } from '../api/events'
 import { normalizeHyperV } from '../lib/normalize'
 import { exportInventoryCsv } from '../lib/exportCsv'
 import HyperVTable from './HyperVTable'
@@ -375,10 +376,10 @@ export default function HyperVPage() {
 
   useEffect(() => {
     if (!jobId || !polling) return undefined
-    const tick = async () => {
+    const tick = async (pushed) => {
       try {
-        const { data } = await api.get(`/hyperv/jobs/${jobId}`)
-        const terminal = ['succeeded', 'failed', 'expired'].includes(data.status)
+        const data = pushed || (await api.get(`/hyperv/jobs/${jobId}`)).data
+        const terminal = ['succeeded', 'failed', 'expired', 'cancelled'].includes(data.status)
         const errors = []
         Object.entries(data.hosts_status || {}).forEach(([h, st]) => {
           if (st.state && st.state !== 'ok') errors.push(`${h}: ${st.state}`)
@@ -404,9 +405,9 @@ export default function HyperVPage() {
       }
     }
     tick()
-    const id = setInterval(tick, POLL_MS)
-    pollRef.current = id
-    return () => clearInterval(id)
+    const stop = watchJob('hyperv', jobId, tick, POLL_MS)
+    pollRef.current = stop
+    return stop
   }, [jobId, polling, fetchSnapshot])
 
   const handleExport = useCallback(
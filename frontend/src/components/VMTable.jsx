@@ -1,5 +1,6 @@
 import React, { useCallback, useMemo, useDeferredValue, useState, useEffect, useRef } from 'react'
 import { getVmwareSnapshot, getVmwareJob, postVmwareRefresh } from '../api/vmware'
+import { watchJob } from '../api/events'
 import { useInventoryState } from './VMTable/useInventoryState'
 import VMSummaryCards from './VMTable/VMSummaryCards'
 import VMFiltersPanel from './VMTable/VMFiltersPanel'
@@ -55,7 +56,8 @@ export default function VMTable() {
     setSnapshotStaleReason(snapshot?.stale_reason || null)
     setSnapshotLoadedFromSnapshot(true)
     const payload = snapshot?.data || {}
-    return Array.isArray(payload?.vmware) ? payload.vmware : []
+    // El snapshot VMware viene particionado por cluster: { [shard]: VM[] }
+    return Object.values(payload).filter(Array.isArray).flat()
   }, [])
   const { state, actions } = useInventoryState({
     provider: 'vmware',
@@ -189,10 +191,10 @@ export default function VMTable() {
 
   useEffect(() => {
     if (!refreshJobId || !refreshPolling) return undefined
-    const tick = async () => {
+    const tick = async (pushed) => {
       try {
-        const job = await getVmwareJob(refreshJobId)
-        const terminal = ['succeeded', 'failed', 'expired'].includes(job.status)
+        const job = pushed || (await getVmwareJob(refreshJobId))
+        const terminal = ['succeeded', 'failed', 'expired', 'cancelled'].includes(job.status)
         const isPartial = job.message === 'partial'
         if (terminal) {
           setRefreshPolling(false)
@@ -215,9 +217,9 @@ export default function VMTable() {
       }
     }
     tick()
-    const id = setInterval(tick, 2500)
-    pollRef.current = id
-    return () => clearInterval(id)
+    const stop = watchJob('vmware', refreshJobId, tick, 2500)
+    pollRef.current = stop
+    return stop
   }, [refreshJobId, refreshPolling, fetchVm])
 
   const handleRowClick = useCallback(
@@ -118,7 +118,13 @@ const defaultFetch = async ({ provider, refresh } = {}) => {
       return { empty: true }
     }
     const payload = snapshot?.data || snapshot
-    return Array.isArray(payload?.vmware) ? payload.vmware : []
+    // El snapshot VMware viene particionado por cluster: { [shard]: VM[] }
+    return payload && typeof payload === 'object'
+      ? Object.values(payload)
+          .filter(Array.isArray)
+          .flat()
+          .filter((vm) => vm && typeof vm === 'object')
+      : []
   } else {
     const { data } = await api.get('/vms', { params })
     return Array.isArray(data) ? data : data.results || []